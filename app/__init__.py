@@ -16,6 +16,75 @@ app.config['UPLOAD_FOLDER'] = os.path.join(tempfile.gettempdir(), 'pg_lineage')
 if not os.path.exists(app.config['UPLOAD_FOLDER']):
     os.makedirs(app.config['UPLOAD_FOLDER'])
 
+# Persistent catalog metadata cache shared between analyses
+app.config['CATALOG_CACHE_DIR'] = os.path.join(app.config['UPLOAD_FOLDER'], 'catalog_cache')
+
+# Memoized lineage parse results keyed by queryid and query text hash
+app.config['PARSE_CACHE_FILE'] = os.path.join(app.config['UPLOAD_FOLDER'], 'parse_cache.json')
+app.config['PARSE_CACHE_SIZE'] = 10000
+
+# Default lineage parser backend: 'sqlparse' or the single-pass 'fast' lexer
+app.config['LINEAGE_PARSER'] = 'sqlparse'
+
+# Per-statement sqlparse budget; statements over it use the keyword scanner
+app.config['PARSE_MAX_BYTES'] = 64 * 1024
+app.config['PARSE_MAX_SECONDS'] = 2.0
+
+# Rank pg_stat_statements without query texts and fetch texts for the top N only
+app.config['TWO_PHASE_FETCH'] = True
+
+# Workload snapshots used to analyze a recent window instead of cumulative stats
+app.config['SNAPSHOT_DB'] = os.path.join(app.config['UPLOAD_FOLDER'], 'workload.sqlite3')
+
+# Background workload collector, started per connection target on /connect
+# when COLLECTOR_INTERVAL (seconds) is non-zero. COLLECTOR_RETENTION_SECONDS
+# also bounds the snapshots stored by windowed analyses.
+app.config['COLLECTOR_INTERVAL'] = 0
+app.config['COLLECTOR_RETENTION_SECONDS'] = 7 * 86400
+app.config['COLLECTOR_DOWNSAMPLE_AFTER'] = 86400
+app.config['COLLECTOR_DOWNSAMPLE_BUCKET'] = 3600
+
+# Finished analyses kept in memory for the result views; over this many
+# bytes the least recently used ones are spilled to RESULT_SPILL_DIR
+app.config['RESULT_STORE_MAX_BYTES'] = 256 * 1024 * 1024
+app.config['RESULT_SPILL_DIR'] = os.path.join(app.config['UPLOAD_FOLDER'], 'results')
+
+# Update the lineage graph of the previous analysis of a connection target
+# instead of rebuilding it; statements unseen for LINEAGE_MERGE_MAX_AGE
+# seconds are dropped from it
+app.config['LINEAGE_INCREMENTAL'] = False
+app.config['LINEAGE_GRAPH_DIR'] = os.path.join(app.config['UPLOAD_FOLDER'], 'graphs')
+app.config['LINEAGE_MERGE_MAX_AGE'] = 7 * 86400
+
+# Lineage graph representation: 'networkx', or 'arrays' for the compact
+# array-backed graph meant for very large workloads
+app.config['LINEAGE_GRAPH_ENGINE'] = 'networkx'
+
+# Graphs with more nodes than this open the lineage view on a schema summary
+# (or on one focus node with ?focus=) and load groups and neighbourhoods of
+# at most LINEAGE_NEIGHBOURHOOD_MAX_NODES nodes as the user expands it,
+# instead of the whole graph
+app.config['LINEAGE_FOCUS_THRESHOLD'] = 1500
+app.config['LINEAGE_NEIGHBOURHOOD_MAX_NODES'] = 200
+
+# Lineage graph node positions, laid out once per graph and reused by the
+# PNG drawn on first download
+app.config['LAYOUT_CACHE_DIR'] = os.path.join(app.config['UPLOAD_FOLDER'], 'layouts')
+
+# Pooled connections per connection target: size, idle timeout and the
+# idle time after which a connection is checked before reuse
+app.config['POOL_MAX_SIZE'] = 5
+app.config['POOL_IDLE_TIMEOUT'] = 300
+app.config['POOL_HEALTH_CHECK_AFTER'] = 30
+
+# Analyses running at the same time, and finished jobs kept for status lookups
+app.config['ANALYSIS_WORKERS'] = 2
+app.config['ANALYSIS_JOBS_RETAINED'] = 50
+
+# Worker processes for lineage extraction on large statement sets. Parsing
+# stays serial by default until parallel parsing is shown to pay off.
+app.config['PARSE_WORKERS'] = 1
+
 # Maximum content length for file uploads (16MB)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 
@@ -17,25 +17,277 @@ from sqlparse import parse, tokens
 from sqlparse.sql import IdentifierList, Identifier
 from datetime import datetime
 import os
+import time
+import signal
 import tempfile
+import threading
+from contextlib import contextmanager
+
+from app.artifacts import artifact_suffix, write_table
+from app.catalog import CatalogCache, CatalogSnapshot, TableNameIndex, split_table_name
+from app.graph_store import query_node_id, statement_digest
+from app.graph_arrays import ArrayGraph
+from app.graph_layout import layered_layout
+from app.jobs import JobCancelled
+from app.lexer import extract_relations
+from app.lineage_payload import write_payload
+from app.parse_pool import ParsePool, ParseTimeout
+from app.pool import ConnectionPool
+from app.server_profile import SORT_COLUMNS, STALE_PROFILE_ERRORS, connection_target, probe_server
+from app.snapshots import compute_delta, take_snapshot
+
+# Available backends for extracting table dependencies from query text
+LINEAGE_PARSERS = ('sqlparse', 'fast')
+
+# Lineage graph representations, see app.graph_arrays
+GRAPH_ENGINES = ('networkx', 'arrays')
+
+
+def _alarm_available():
+    """Whether SIGALRM can interrupt a call on the current thread"""
+    return hasattr(signal, 'setitimer') and threading.current_thread() is threading.main_thread()
+
+
+def _call_with_timeout(seconds, func, *args):
+    """
+    Call func(*args) on the main thread, interrupting it with SIGALRM and
+    raising ParseTimeout if it runs longer than seconds. Other threads
+    use ParsePool.call(), which runs the call on a worker process.
+    """
+    def expire(signum, frame):
+        raise ParseTimeout()
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        return func(*args)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+# Parser used by _sqlparse_dependencies() in a budget worker process
+_worker_lineage = None
+
+
+def _sqlparse_dependencies(query_text):
+    """Budget worker entry point: run the sqlparse extraction on one query"""
+    global _worker_lineage
+    if _worker_lineage is None:
+        _worker_lineage = PostgresQueryLineage({})
+    return _worker_lineage._sqlparse_table_dependencies(query_text)
+
+
+def _parse_dependencies_chunk(query_texts, options):
+    """
+    Process pool entry point: parse a chunk of queries in a worker process.
+    
+    Args:
+        query_texts (list): SQL query texts
+        options (dict): Parser keyword arguments for PostgresQueryLineage
+        
+    Returns:
+        list: (source_tables, destination_tables, fallback_reason) per query,
+            in input order
+    """
+    lineage = PostgresQueryLineage({}, **options)
+    return [lineage._parse_table_dependencies(text) for text in query_texts]
+
+
+# pyplot keeps global state, so figures are drawn one at a time
+_plot_lock = threading.Lock()
+
+
+def render_lineage_image(G, output_file=None, positions=None):
+    """
+    Draw a lineage graph as a PNG.
+    
+    Args:
+        G (networkx.DiGraph): Lineage graph
+        output_file (str, optional): File path to save the image to
+        positions (dict, optional): Node id to (x, y), see
+            app.graph_layout.layered_layout(), which is used if not given
+    
+    Returns:
+        str: output_file, or the base64 encoded image if output_file is None
+    """
+    if positions is None:
+        positions = layered_layout(G)
+    
+    # Define node colors based on type
+    node_colors = []
+    for node in G.nodes():
+        if G.nodes[node].get('type') == 'query':
+            node_colors.append('lightblue')
+        else:
+            node_colors.append('lightgreen')
+    
+    # Define node sizes based on query statistics if available
+    node_sizes = []
+    for node in G.nodes():
+        if G.nodes[node].get('type') == 'query':
+            # Scale by total_time
+            total_time = G.nodes[node].get('total_time', 0)
+            node_sizes.append(100 + min(total_time / 10, 1000))
+        else:
+            node_sizes.append(300)
+    
+    # Create labels
+    labels = {}
+    for node in G.nodes():
+        if G.nodes[node].get('type') == 'query':
+            # Short representation for queries
+            text = G.nodes[node].get('text', '')
+            text = text.replace('\n', ' ')
+            labels[node] = f"{node}\n({text[:30]}...)" if len(text) > 30 else f"{node}\n({text})"
+        else:
+            labels[node] = node
+    
+    # Table-to-table shortcuts would cross the query layer they go through
+    edges = [(u, v) for u, v, via_query in G.edges(data='via_query') if via_query is None]
+    
+    with _plot_lock:
+        plt.figure(figsize=(15, 10))
+        
+        nx.draw_networkx_nodes(G, positions, node_size=node_sizes, node_color=node_colors, alpha=0.8)
+        nx.draw_networkx_edges(G, positions, edgelist=edges, width=1.0, alpha=0.5, edge_color='gray',
+                               arrowsize=15)
+        nx.draw_networkx_labels(G, positions, labels=labels, font_size=8)
+        
+        plt.title("PostgreSQL Data Lineage Graph")
+        plt.axis('off')
+        
+        if output_file:
+            plt.savefig(output_file, bbox_inches='tight')
+            plt.close()
+            return output_file
+        else:
+            # Return as base64 encoded image
+            img_data = BytesIO()
+            plt.savefig(img_data, format='png', bbox_inches='tight')
+            plt.close()
+            img_data.seek(0)
+            return base64.b64encode(img_data.read()).decode('utf-8')
 
 
 class PostgresQueryLineage:
-    def __init__(self, connection_params):
+    # Below this many uncached statements a process pool costs more than it saves
+    PARALLEL_MIN_QUERIES = 256
+    
+    # Ranked candidates are fetched in windows of this many rows per requested
+    # query (at least TWO_PHASE_MIN_WINDOW) so text filters leave enough rows
+    TWO_PHASE_OVERFETCH = 4
+    TWO_PHASE_MIN_WINDOW = 100
+    
+    # Collected deltas must reach this close to now (or 10% of the window)
+    # to answer a windowed analysis without querying the server
+    COLLECTED_MAX_LAG = 300
+    
+    def __init__(self, connection_params, catalog_cache_dir=None, parse_cache=None,
+                 parse_workers=1, parse_chunk_size=100, parser='sqlparse',
+                 max_parse_bytes=None, max_parse_seconds=None, two_phase_fetch=False,
+                 server_profiles=None, snapshot_store=None, connection_pools=None,
+                 graph_store=None, merge_max_age=7 * 86400, graph_engine='networkx',
+                 layout_cache=None, parse_pool=None, snapshot_retention=7 * 86400):
         """
         Initialize the PostgreSQL connection for query analysis and lineage tracking.
         
         Args:
             connection_params (dict): Connection parameters for PostgreSQL
                 (host, database, user, password, port)
+            catalog_cache_dir (str, optional): Directory for the persistent
+                catalog cache. Column metadata is fetched fresh every time if
+                not given.
+            parse_cache (ParseCache, optional): Shared cache of table
+                dependency parse results
+            parse_workers (int): Number of worker processes used to parse
+                large statement sets when no parse_pool is given. 1 parses
+                serially in this process.
+            parse_chunk_size (int): Number of statements sent to a worker
+                per task
+            parser (str): Lineage parser backend, 'sqlparse' for the sqlparse
+                token tree or 'fast' for the single-pass lexer in app.lexer
+            max_parse_bytes (int, optional): Statements longer than this are
+                not given to sqlparse but to the streaming keyword scanner
+            max_parse_seconds (float, optional): sqlparse time budget per
+                statement before falling back to the keyword scanner
+            two_phase_fetch (bool): Rank pg_stat_statements entries without
+                their text first and fetch texts only for the top candidates
+            server_profiles (ServerProfileCache, optional): Shared server
+                capability profiles, so a server is only probed once
+            snapshot_store (SnapshotStore, optional): Workload snapshots used
+                to rank queries over a recent window
+            snapshot_retention (float): Seconds snapshots and collected
+                workload are kept in the snapshot store. Older ones are
+                pruned whenever an analysis stores a snapshot.
+            connection_pools (ConnectionPools, optional): Shared connection
+                pools. Without them the analyzer keeps a private pool that
+                disconnect() closes.
+            graph_store (LineageGraphStore, optional): Persisted lineage
+                graphs. With it each analysis updates the graph of the
+                previous one for the same connection target incrementally.
+            merge_max_age (float): Seconds a statement stays in an
+                incrementally updated graph after it was last seen
+            graph_engine (str): 'networkx' to keep the lineage graph as a
+                networkx DiGraph, or 'arrays' for the compact ArrayGraph in
+                app.graph_arrays, meant for very large workloads
+            layout_cache (LayoutCache, optional): Shared node positions per
+                graph fingerprint, so a graph is only laid out once
+            parse_pool (ParsePool, optional): Shared long-lived parse worker
+                processes. Without it the analyzer keeps a private pool of
+                parse_workers processes that disconnect() stops.
         """
+        if parser not in LINEAGE_PARSERS:
+            raise ValueError(f"Unknown lineage parser '{parser}', expected one of {LINEAGE_PARSERS}")
+        if graph_engine not in GRAPH_ENGINES:
+            raise ValueError(f"Unknown graph engine '{graph_engine}', expected one of {GRAPH_ENGINES}")
+        
         self.connection_params = connection_params
         self.conn = None
         self.cursor = None
+        if connection_pools is not None:
+            self.pool = connection_pools.get(connection_params)
+            self._owns_pool = False
+        else:
+            self.pool = ConnectionPool(connection_params)
+            self._owns_pool = True
         self.lineage_graph = nx.DiGraph()
+        self.catalog = CatalogSnapshot()
+        self.catalog_cache = CatalogCache(catalog_cache_dir) if catalog_cache_dir else None
+        self._database_identity = None
+        self.parse_cache = parse_cache
+        if parse_pool is not None:
+            self.parse_pool = parse_pool
+            self._owns_parse_pool = False
+        else:
+            self.parse_pool = ParsePool(parse_workers)
+            self._owns_parse_pool = True
+        self.parse_chunk_size = max(1, parse_chunk_size)
+        self.parser = parser
+        self.max_parse_bytes = max_parse_bytes
+        self.max_parse_seconds = max_parse_seconds
+        self.parse_fallbacks = {}
+        self.two_phase_fetch = two_phase_fetch
+        self.server_profiles = server_profiles
+        self.server_profile = None
+        self.snapshot_store = snapshot_store
+        self.snapshot_retention = snapshot_retention
+        self.workload_window = None
+        self.graph_store = graph_store
+        self.merge_max_age = merge_max_age
+        self.graph_engine = graph_engine
+        self.layout_cache = layout_cache
+        self.progress = None
+    
+    def _report_progress(self, stage):
+        """Tell the progress callback, if any, that a stage is starting"""
+        if self.progress is not None:
+            self.progress(stage)
     
     def connect(self):
-        """Establish connection to PostgreSQL database"""
+        """
+        Open a dedicated connection to PostgreSQL. While it is open every
+        operation uses it instead of borrowing pooled connections.
+        """
         try:
             self.conn = psycopg2.connect(**self.connection_params)
             self.cursor = self.conn.cursor()
@@ -44,31 +296,79 @@ class PostgresQueryLineage:
             return False, f"Error connecting to PostgreSQL database: {str(e)}"
     
     def disconnect(self):
-        """Close connection to PostgreSQL database"""
+        """Close the dedicated connection and, if the analyzer owns it, the pool"""
         if self.cursor:
             self.cursor.close()
+            self.cursor = None
         if self.conn:
             self.conn.close()
+        if self._owns_pool:
+            self.pool.close()
+        if self._owns_parse_pool:
+            self.parse_pool.shutdown()
+    
+    @contextmanager
+    def _cursor(self):
+        """
+        Yield a cursor for one database operation.
+        
+        The cursor of the dedicated connection is used while connect() has
+        one open; otherwise a connection is borrowed from the pool and
+        returned when the operation ends, so concurrent operations never
+        share a cursor.
+        """
+        if self.cursor is not None:
+            try:
+                yield self.cursor
+            except Exception:
+                if self.conn is not None and not self.conn.closed:
+                    self.conn.rollback()
+                raise
+            return
+        
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+    
+    def check_connection(self):
+        """
+        Verify the database is reachable with a pooled connection, which
+        stays open for the operations that follow.
+        
+        Returns:
+            tuple: (success, message)
+        """
+        try:
+            with self._cursor() as cursor:
+                cursor.execute("SELECT 1")
+                cursor.fetchone()
+            return True, "Connected to PostgreSQL database successfully."
+        except Exception as e:
+            return False, f"Error connecting to PostgreSQL database: {str(e)}"
     
     def check_pg_stat_statements(self):
         """Check if pg_stat_statements extension is installed and available"""
         try:
-            self.cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_stat_statements'")
-            if not self.cursor.fetchone():
-                return False, "pg_stat_statements extension is not installed. Run 'CREATE EXTENSION pg_stat_statements;' as a superuser."
-            
-            # Check if current user has access to pg_stat_statements
-            try:
-                self.cursor.execute("SELECT query FROM pg_stat_statements LIMIT 1")
-                self.cursor.fetchone()
-                return True, "pg_stat_statements is available and accessible."
-            except Exception as e:
-                return False, f"Cannot access pg_stat_statements: {str(e)}"
+            with self._cursor() as cursor:
+                cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_stat_statements'")
+                if not cursor.fetchone():
+                    return False, "pg_stat_statements extension is not installed. Run 'CREATE EXTENSION pg_stat_statements;' as a superuser."
+                
+                # Check if current user has access to pg_stat_statements
+                try:
+                    cursor.execute("SELECT query FROM pg_stat_statements LIMIT 1")
+                    cursor.fetchone()
+                    return True, "pg_stat_statements is available and accessible."
+                except Exception as e:
+                    return False, f"Cannot access pg_stat_statements: {str(e)}"
                 
         except Exception as e:
             return False, f"Error checking pg_stat_statements: {str(e)}"
     
-    def get_expensive_queries(self, limit=20, min_calls=5, sort_by='total_time'):
+    def get_expensive_queries(self, limit=20, min_calls=5, sort_by='total_time', window_seconds=None):
         """
         Get the most expensive queries from pg_stat_statements.
         
@@ -76,218 +376,564 @@ class PostgresQueryLineage:
             limit (int): Number of queries to return
             min_calls (int): Minimum number of calls to include query
             sort_by (str): Column to sort by ('total_time', 'mean_time', 'calls', etc.)
+            window_seconds (int, optional): Rank by the workload of the last
+                window_seconds. Requires a snapshot store: recent deltas from
+                the background collector are used without querying the
+                server, otherwise stored snapshots are differenced. The
+                cumulative counters are used when the store holds no earlier
+                snapshot for this server.
         
         Returns:
             pandas.DataFrame: DataFrame with query statistics
         """
-        if not self.conn or self.conn.closed:
-            success, msg = self.connect()
-            if not success:
-                return pd.DataFrame()
+        self.workload_window = None
+        if window_seconds and self.snapshot_store is not None:
+            try:
+                df = self._fetch_expensive_queries_collected(limit, min_calls, sort_by, window_seconds)
+                if df is not None:
+                    return self._add_query_metrics(df)
+            except Exception as e:
+                print(f"Warning when reading collected workload: {e}")
+                self.workload_window = None
         
-        # Check for pg_stat_statements
-        success, msg = self.check_pg_stat_statements()
+        for attempt in range(2):
+            try:
+                with self._cursor() as cursor:
+                    return self._fetch_expensive_queries(cursor, limit, min_calls, sort_by, window_seconds)
+            except STALE_PROFILE_ERRORS as e:
+                if attempt:
+                    print(f"Error retrieving expensive queries: {e}")
+                    return pd.DataFrame()
+                print(f"Warning: pg_stat_statements changed, probing the server again: {e}")
+                self.forget_server_profile()
+            except Exception as e:
+                print(f"Error retrieving expensive queries: {e}")
+                return pd.DataFrame()
+    
+    def _fetch_expensive_queries(self, cursor, limit, min_calls, sort_by, window_seconds):
+        """Rank and filter expensive queries on one checked out connection"""
+        # Version, pg_stat_statements columns and system schemas are probed
+        # once per server and reused across analyses
+        success, msg = self.load_server_profile(cursor)
         if not success:
             print(f"WARNING: {msg}")
             return pd.DataFrame()
+        profile = self.server_profile
         
-        # Determine which version of pg_stat_statements we're using
-        self.cursor.execute("SELECT current_setting('server_version_num')::int")
-        pg_version = int(self.cursor.fetchone()[0])
-        
-        # Different columns in different PostgreSQL versions
-        # First check if io_time exists in pg_stat_statements
-        has_io_time = False
+        # Get list of user tables to include
         try:
-            # Try a query that directly tests if the io_time column exists
-            self.cursor.execute("SELECT 1 FROM pg_stat_statements LIMIT 0")
-            column_names = [desc[0] for desc in self.cursor.description]
-            has_io_time = 'io_time' in column_names
-        except Exception as e:
-            print(f"Warning when checking for io_time column: {e}")
-            has_io_time = False
-
-        # First get a list of system schemas to exclude
-        try:
-            self.cursor.execute("""
-            SELECT nspname FROM pg_namespace 
-            WHERE nspname IN ('pg_catalog', 'information_schema', 'pg_toast') 
-               OR nspname LIKE 'pg_%temp_%'
-            """)
-            system_schemas = [row[0] for row in self.cursor.fetchall()]
-            system_schemas_str = ', '.join(f"'{schema}'" for schema in system_schemas)
-            
-            # Get list of user tables to include
-            self.cursor.execute(f"""
+            cursor.execute("""
             SELECT schemaname, tablename
             FROM pg_tables
-            WHERE schemaname NOT IN ({system_schemas_str})
-            """)
-            user_tables = [f"{row[0]}.{row[1]}" for row in self.cursor.fetchall()]
-            
-            # Make sure we have found some user tables
-            if user_tables:
-                # Create regex pattern for user tables
-                # This will match queries that include user table names
-                table_pattern = '|'.join(re.escape(table.split('.')[-1]) for table in user_tables)
-            else:
+            WHERE schemaname <> ALL(%s)
+            """, (profile.system_schemas,))
+            user_tables = [f"{row[0]}.{row[1]}" for row in cursor.fetchall()]
+            if not user_tables:
                 print("No user tables found, falling back to including all tables")
-                table_pattern = '.*'  # Match any table if no user tables were found
-                
-            system_schema_pattern = '|'.join(re.escape(schema) for schema in system_schemas)
         except Exception as e:
             print(f"Warning when getting user tables: {e}")
-            table_pattern = '.*'  # Match any table if we can't get the user tables
-            system_schema_pattern = 'pg_catalog|information_schema'
-            
-        if pg_version >= 130000:  # PostgreSQL 13+
-            if has_io_time:
-                query = f"""
-                SELECT 
-                    query, 
-                    calls, 
-                    total_exec_time as total_time, 
-                    mean_exec_time as mean_time, 
-                    rows, 
-                    shared_blks_hit,
-                    shared_blks_read,
-                    temp_blks_written,
-                    io_time
-                FROM pg_stat_statements
-                WHERE calls >= {min_calls}
-                  AND query ~* '({table_pattern})'
-                  AND query !~* '^(SHOW|SET|BEGIN|COMMIT|ROLLBACK)'
-                  AND query !~* '({system_schema_pattern})\\.'
-                ORDER BY {sort_by} DESC
-                LIMIT {limit}
-                """
+            cursor.connection.rollback()
+            user_tables = []  # Match any table if we can't get the user tables
+        
+        # Queries are kept when an identifier in their text names a user
+        # table; an empty index keeps every query
+        table_index = TableNameIndex(user_tables)
+        
+        df = None
+        if window_seconds and self.snapshot_store is not None:
+            df = self._fetch_expensive_queries_window(
+                cursor, profile, limit, min_calls, sort_by, table_index, window_seconds)
+            if df is None:
+                print("No earlier workload snapshot yet, using cumulative statistics")
+        elif window_seconds:
+            print("Warning: no snapshot store configured, using cumulative statistics")
+        
+        if df is None and self.two_phase_fetch:
+            df = self._fetch_expensive_queries_two_phase(cursor, profile, limit, min_calls, sort_by,
+                                                         table_index)
+        elif df is None:
+            df = self._fetch_expensive_queries_single(cursor, profile, limit, min_calls, sort_by,
+                                                      table_index)
+        return self._add_query_metrics(df)
+    
+    def load_server_profile(self, cursor=None):
+        """
+        Get the capability profile of the connected server, probing it
+        only when no profile is cached for this connection target.
+        
+        Args:
+            cursor (optional): Cursor to probe with; a connection is checked
+                out when not given
+        
+        Returns:
+            tuple: (success, message)
+        """
+        if self.server_profile is not None:
+            return True, "Server profile loaded."
+        
+        if self.server_profiles is not None:
+            profile = self.server_profiles.get(self.connection_params)
+            if profile is not None:
+                self.server_profile = profile
+                return True, "Server profile loaded from cache."
+        
+        try:
+            if cursor is None:
+                with self._cursor() as cursor:
+                    profile, msg = probe_server(cursor)
             else:
-                query = f"""
-                SELECT 
-                    query, 
-                    calls, 
-                    total_exec_time as total_time, 
-                    mean_exec_time as mean_time, 
-                    rows, 
-                    shared_blks_hit,
-                    shared_blks_read,
-                    temp_blks_written,
-                    0 as io_time
-                FROM pg_stat_statements
-                WHERE calls >= {min_calls}
-                  AND query ~* '({table_pattern})'
-                  AND query !~* '^(SHOW|SET|BEGIN|COMMIT|ROLLBACK)'
-                  AND query !~* '({system_schema_pattern})\\.'
-                ORDER BY {sort_by} DESC
-                LIMIT {limit}
-                """
-        else:  # PostgreSQL 9.6 - 12
-            # Check if blk_read_time and blk_write_time exist
-            has_blk_read_time = False
-            has_blk_write_time = False
+                profile, msg = probe_server(cursor)
+        except Exception as e:
+            return False, f"Error checking pg_stat_statements: {str(e)}"
+        if profile is None:
+            return False, msg
+        
+        self.server_profile = profile
+        if self.server_profiles is not None:
+            self.server_profiles.put(self.connection_params, profile)
+        return True, msg
+    
+    def forget_server_profile(self):
+        """Drop the cached profile of this connection target, so it is probed again"""
+        self.server_profile = None
+        if self.server_profiles is not None:
+            self.server_profiles.invalidate(self.connection_params)
+    
+    def capture_snapshot(self):
+        """
+        Store a snapshot of the current pg_stat_statements counters, as a
+        baseline for ranking queries over a later window.
+        
+        Returns:
+            tuple: (success, message)
+        """
+        if self.snapshot_store is None:
+            return False, "No snapshot store configured."
+        
+        for attempt in range(2):
             try:
-                # Try a query that directly tests if these columns exist
-                self.cursor.execute("SELECT 1 FROM pg_stat_statements LIMIT 0")
-                column_names = [desc[0] for desc in self.cursor.description]
-                has_blk_read_time = 'blk_read_time' in column_names
-                has_blk_write_time = 'blk_write_time' in column_names
+                with self._cursor() as cursor:
+                    success, msg = self.load_server_profile(cursor)
+                    if not success:
+                        return False, msg
+                    snapshot = take_snapshot(cursor, self.server_profile)
+                break
+            except STALE_PROFILE_ERRORS as e:
+                if attempt:
+                    return False, f"Error capturing workload snapshot: {str(e)}"
+                self.forget_server_profile()
             except Exception as e:
-                print(f"Warning when checking for blk_read_time/blk_write_time columns: {e}")
-                has_blk_read_time = False
-                has_blk_write_time = False
-            
-            if has_blk_read_time and has_blk_write_time:
-                query = f"""
-                SELECT 
-                    query, 
-                    calls, 
-                    total_time, 
-                    mean_time, 
-                    rows, 
-                    shared_blks_hit,
-                    shared_blks_read,
-                    temp_blks_written,
-                    COALESCE(blk_read_time + blk_write_time, 0) as io_time
-                FROM pg_stat_statements
-                WHERE calls >= {min_calls}
-                  AND query ~* '({table_pattern})'
-                  AND query !~* '^(SHOW|SET|BEGIN|COMMIT|ROLLBACK)'
-                  AND query !~* '({system_schema_pattern})\\.'
-                ORDER BY {sort_by} DESC
-                LIMIT {limit}
-                """
-            else:
-                query = f"""
-                SELECT 
-                    query, 
-                    calls, 
-                    total_time, 
-                    mean_time, 
-                    rows, 
-                    shared_blks_hit,
-                    shared_blks_read,
-                    temp_blks_written,
-                    0 as io_time
-                FROM pg_stat_statements
-                WHERE calls >= {min_calls}
-                  AND query ~* '({table_pattern})'
-                  AND query !~* '^(SHOW|SET|BEGIN|COMMIT|ROLLBACK)'
-                  AND query !~* '({system_schema_pattern})\\.'
-                ORDER BY {sort_by} DESC
-                LIMIT {limit}
-                """
+                return False, f"Error capturing workload snapshot: {str(e)}"
         
         try:
-            self.cursor.execute(query)
-            columns = [desc[0] for desc in self.cursor.description]
-            results = self.cursor.fetchall()
+            self._store_snapshot(connection_target(self.connection_params), snapshot)
+            return True, f"Captured workload snapshot of {len(snapshot.stats)} statements."
+        except Exception as e:
+            return False, f"Error capturing workload snapshot: {str(e)}"
+    
+    def _store_snapshot(self, target, snapshot):
+        """Save a snapshot and prune the target's history past the retention"""
+        self.snapshot_store.save(target, snapshot)
+        self.snapshot_store.prune(target, self.snapshot_retention, now=snapshot.taken_at)
+    
+    def _candidate_window(self, limit):
+        """Number of ranked rows fetched per round before client-side filtering"""
+        return max(limit * self.TWO_PHASE_OVERFETCH, self.TWO_PHASE_MIN_WINDOW)
+    
+    def _filter_candidates(self, df, table_index):
+        """Keep queries that reference a user table and are not system queries"""
+        if df.empty:
+            return df
+        df = df[[table_index.matches(text) for text in df['query']]]
+        # Additional Python-side filtering to exclude system queries
+        # This is a safeguard in case the SQL filters weren't sufficient
+        return self._filter_system_queries(df)
+    
+    def _fetch_expensive_queries_single(self, cursor, profile, limit, min_calls, sort_by, table_index):
+        """
+        Fetch ranked pg_stat_statements rows together with their texts.
+        
+        Rows are read in ranked windows and filtered client-side until limit
+        queries survive or the ranking is exhausted.
+        
+        Returns:
+            pandas.DataFrame: Query statistics in ranking order
+        """
+        query = profile.ranking_query(sort_by, with_text=True)
+        window = self._candidate_window(limit)
+        
+        selected = []
+        offset = 0
+        while True:
+            cursor.execute(query, (min_calls, profile.system_schema_pattern, window, offset))
+            columns = [desc[0] for desc in cursor.description]
+            results = cursor.fetchall()
             
             # Create DataFrame
             df = pd.DataFrame(results, columns=columns)
+            selected.append(self._filter_candidates(df, table_index))
             
-            # Additional Python-side filtering to exclude system queries
-            # This is a safeguard in case the SQL filters weren't sufficient
-            if not df.empty:
-                # Get all system schemas for additional filtering
-                system_schemas = ['pg_catalog', 'information_schema', 'pg_toast']
-                
-                # Filter out queries that are clearly system queries
-                df = df[~df['query'].str.contains('pg_|information_schema|pg_toast', case=False, regex=True)]
-                
-                # Filter out transaction management and administrative commands
-                admin_patterns = [
-                    r'^BEGIN', r'^COMMIT', r'^ROLLBACK', r'^SET ', r'^SHOW ', 
-                    r'^CREATE TEMP', r'^DROP TEMP', r'^VACUUM', r'^ANALYZE'
-                ]
-                for pattern in admin_patterns:
-                    df = df[~df['query'].str.contains(pattern, case=False, regex=True)]
-                
-                # Add additional metrics
-                df['time_per_row'] = df['total_time'] / df['rows'].replace(0, 1)  # Avoid division by zero
-                # Avoid division by zero for io_percentage
-                df['io_percentage'] = df.apply(
-                    lambda row: (row['io_time'] / row['total_time']) * 100 if row['total_time'] > 0 else 0, 
-                    axis=1
-                )
-            
+            if sum(len(frame) for frame in selected) >= limit or len(results) < window:
+                break
+            offset += window
+        
+        return pd.concat(selected, ignore_index=True).head(limit)
+    
+    def _filter_system_queries(self, df):
+        """Drop system catalog queries and administrative commands"""
+        if df.empty:
             return df
-        except Exception as e:
-            print(f"Error retrieving expensive queries: {e}")
+        
+        # Filter out queries that are clearly system queries
+        df = df[~df['query'].str.contains('pg_|information_schema|pg_toast', case=False, regex=True)]
+        
+        # Filter out transaction management and administrative commands
+        admin_patterns = [
+            r'^BEGIN', r'^COMMIT', r'^ROLLBACK', r'^SET ', r'^SHOW ', 
+            r'^CREATE TEMP', r'^DROP TEMP', r'^VACUUM', r'^ANALYZE'
+        ]
+        for pattern in admin_patterns:
+            df = df[~df['query'].str.contains(pattern, case=False, regex=True)]
+        return df
+    
+    def _add_query_metrics(self, df):
+        """Add derived per-query metrics"""
+        if not df.empty:
+            df['time_per_row'] = df['total_time'] / df['rows'].replace(0, 1)  # Avoid division by zero
+            # Avoid division by zero for io_percentage
+            df['io_percentage'] = df.apply(
+                lambda row: (row['io_time'] / row['total_time']) * 100 if row['total_time'] > 0 else 0, 
+                axis=1
+            )
+        return df
+    
+    def _fetch_expensive_queries_two_phase(self, cursor, profile, limit, min_calls, sort_by, table_index):
+        """
+        Rank pg_stat_statements by numeric metrics with showtext := false,
+        then fetch query texts only for the top candidates.
+        
+        Ranking without texts avoids reading the external query text file
+        for every statement. Candidates are ranked in windows; texts are
+        fetched per window and filtered until limit queries survive or the
+        ranking is exhausted.
+        
+        Returns:
+            pandas.DataFrame: Query statistics in ranking order, with the
+                same columns as the single query fetch
+        """
+        rank_query = profile.ranking_query(sort_by, with_text=False)
+        window = self._candidate_window(limit)
+        
+        selected = []
+        offset = 0
+        while True:
+            cursor.execute(rank_query, (min_calls, window, offset))
+            columns = [desc[0] for desc in cursor.description]
+            ranked = pd.DataFrame(cursor.fetchall(), columns=columns)
+            if ranked.empty:
+                break
+            
+            selected.append(self._attach_query_texts(cursor, profile, ranked, table_index))
+            
+            if sum(len(frame) for frame in selected) >= limit or len(ranked) < window:
+                break
+            offset += window
+        
+        return self._ranked_result(selected, limit)
+    
+    def _fetch_expensive_queries_window(self, cursor, profile, limit, min_calls, sort_by, table_index,
+                                        window_seconds):
+        """
+        Rank queries by their workload in a recent window instead of the
+        cumulative counters since the last pg_stat_statements reset.
+        
+        A snapshot of the current counters is stored and differenced against
+        the stored snapshot closest to the start of the window.
+        
+        Returns:
+            pandas.DataFrame: Query statistics for the window in ranking
+                order, or None when no earlier snapshot exists yet
+        """
+        if sort_by not in SORT_COLUMNS:
+            raise ValueError(f"Unsupported sort column '{sort_by}'")
+        
+        target = connection_target(self.connection_params)
+        current = take_snapshot(cursor, profile)
+        baseline = self.snapshot_store.baseline(target, current.taken_at - window_seconds)
+        self._store_snapshot(target, current)
+        if baseline is None:
+            return None
+        
+        self.workload_window = self._describe_window(
+            baseline.taken_at, current.taken_at, window_seconds, 'snapshots')
+        
+        delta = compute_delta(baseline, current)
+        return self._select_from_delta(
+            delta, limit, min_calls, sort_by,
+            lambda ranked: self._attach_query_texts(cursor, profile, ranked, table_index))
+    
+    def _fetch_expensive_queries_collected(self, limit, min_calls, sort_by, window_seconds):
+        """
+        Rank queries of a recent window from the deltas and query texts
+        stored by the background collector, without querying the server.
+        
+        Returns:
+            pandas.DataFrame: Query statistics for the window in ranking
+                order, or None when the collector has no recent data for
+                this server
+        """
+        if sort_by not in SORT_COLUMNS:
+            raise ValueError(f"Unsupported sort column '{sort_by}'")
+        
+        target = connection_target(self.connection_params)
+        coverage = self.snapshot_store.coverage(target)
+        now = time.time()
+        if coverage is None or coverage[1] < now - max(self.COLLECTED_MAX_LAG, window_seconds * 0.1):
+            return None
+        
+        start = now - window_seconds
+        self.workload_window = self._describe_window(
+            max(start, coverage[0]), coverage[1], window_seconds, 'collector')
+        
+        table_index = TableNameIndex(self.snapshot_store.relations(target))
+        
+        def attach_stored_texts(ranked):
+            keys = list(zip(ranked['userid'], ranked['dbid'], ranked['queryid']))
+            texts = self.snapshot_store.texts(target, keys)
+            ranked = ranked.copy()
+            ranked['query'] = [texts.get((int(u), int(d), int(q))) for u, d, q in keys]
+            return self._filter_candidates(ranked[ranked['query'].notna()], table_index)
+        
+        delta = self.snapshot_store.window_delta(target, start, now)
+        return self._select_from_delta(delta, limit, min_calls, sort_by, attach_stored_texts)
+    
+    def _describe_window(self, start, end, requested_seconds, source):
+        """Summarize the period a windowed ranking actually covers"""
+        return {
+            'start': datetime.fromtimestamp(start).isoformat(timespec='seconds'),
+            'end': datetime.fromtimestamp(end).isoformat(timespec='seconds'),
+            'start_ts': start,
+            'end_ts': end,
+            'requested_seconds': requested_seconds,
+            'seconds': round(end - start),
+            'source': source
+        }
+    
+    def _select_from_delta(self, delta, limit, min_calls, sort_by, attach_texts):
+        """
+        Rank workload deltas and attach texts window by window until limit
+        queries survive the text filters.
+        
+        Args:
+            delta (pandas.DataFrame): Per-entry workload of the window
+            limit (int): Number of queries to return
+            min_calls (int): Minimum number of calls in the window
+            sort_by (str): Column to sort by
+            attach_texts (callable): Adds texts to a ranked window and drops
+                the entries that fail the filters
+            
+        Returns:
+            pandas.DataFrame: Query statistics in ranking order
+        """
+        delta = delta[delta['calls'] >= min_calls].sort_values(
+            [sort_by, 'queryid'], ascending=[False, True], kind='stable').reset_index(drop=True)
+        
+        window = self._candidate_window(limit)
+        selected = []
+        for offset in range(0, len(delta), window):
+            ranked = delta.iloc[offset:offset + window].drop(columns=['toplevel'])
+            selected.append(attach_texts(ranked))
+            if sum(len(frame) for frame in selected) >= limit:
+                break
+        
+        return self._ranked_result(selected, limit)
+    
+    def _attach_query_texts(self, cursor, profile, ranked, table_index):
+        """
+        Fetch texts for a window of ranked entries and drop the entries
+        that fail the text filters.
+        
+        Args:
+            cursor: Cursor of the checked out connection
+            profile (ServerProfile): Capabilities of the connected server
+            ranked (pandas.DataFrame): Entries with userid, dbid and queryid
+            table_index (TableNameIndex): User tables a query must reference
+            
+        Returns:
+            pandas.DataFrame: Surviving entries with a query column, in the
+                original order
+        """
+        cursor.execute(profile.text_query(), (
+            [int(v) for v in ranked['userid']],
+            [int(v) for v in ranked['dbid']],
+            [int(v) for v in ranked['queryid']],
+            profile.system_schema_pattern
+        ))
+        texts = {(userid, dbid, queryid): query
+                 for userid, dbid, queryid, query in cursor.fetchall()}
+        
+        ranked = ranked.copy()
+        keys = zip(ranked['userid'], ranked['dbid'], ranked['queryid'])
+        ranked['query'] = [texts.get(key) for key in keys]
+        return self._filter_candidates(ranked[ranked['query'].notna()], table_index)
+    
+    def _ranked_result(self, selected, limit):
+        """Combine ranked windows into the top limit queries, query text first"""
+        if not selected:
             return pd.DataFrame()
+        df = pd.concat(selected, ignore_index=True).head(limit)
+        # dbid is kept last, it identifies the statement's lineage graph node
+        columns = ['queryid', 'query'] + [c for c in df.columns
+                                           if c not in ('userid', 'dbid', 'queryid', 'query')] + ['dbid']
+        return df[columns].reset_index(drop=True)
     
-    def get_table_dependencies(self, query_text):
+    def get_table_dependencies(self, query_text, queryid=None):
         """
         Parse a SQL query to extract source and destination tables.
+        Results are memoized in the parse cache when one is configured, and
+        statements that fell back to the keyword scanner are recorded in
+        parse_fallbacks.
         
         Args:
             query_text (str): SQL query text
+            queryid (int, optional): pg_stat_statements queryid of the query
             
         Returns:
             tuple: (source_tables, destination_tables)
         """
         if not query_text or not isinstance(query_text, str):
             return [], []
+        
+        entry = None
+        if self.parse_cache is not None:
+            entry = self.parse_cache.get_entry(query_text, queryid, variant=self.parser)
+        if entry is None:
+            entry = self._parse_table_dependencies(query_text)
+            if self.parse_cache is not None:
+                self.parse_cache.put(query_text, entry[:2], queryid,
+                                     variant=self.parser, fallback=entry[2])
+        
+        source_tables, destination_tables, fallback = entry
+        self._record_fallback(query_text, queryid, fallback)
+        return source_tables, destination_tables
+    
+    def _record_fallback(self, query_text, queryid, reason):
+        """Remember that a statement got degraded lineage from the scanner"""
+        if reason:
+            self.parse_fallbacks[query_text] = {
+                'queryid': queryid,
+                'reason': reason,
+                'bytes': len(query_text),
+                'query': query_text[:100] + '...' if len(query_text) > 100 else query_text
+            }
+    
+    def extract_dependencies(self, queries):
+        """
+        Extract table dependencies for many queries, fanning uncached
+        statements out over a process pool when there are enough of them.
+        
+        Args:
+            queries (list): (query_text, queryid) tuples
             
+        Returns:
+            list: (source_tables, destination_tables) per query, in input order
+        """
+        if not self.parse_pool.parallel:
+            return [self.get_table_dependencies(text, queryid) for text, queryid in queries]
+        
+        results = [None] * len(queries)
+        pending = []
+        for index, (text, queryid) in enumerate(queries):
+            if not text or not isinstance(text, str):
+                results[index] = ([], [])
+                continue
+            entry = None
+            if self.parse_cache is not None:
+                entry = self.parse_cache.get_entry(text, queryid, variant=self.parser)
+            if entry is not None:
+                results[index] = entry[:2]
+                self._record_fallback(text, queryid, entry[2])
+            else:
+                pending.append(index)
+        
+        if len(pending) < self.PARALLEL_MIN_QUERIES:
+            for index in pending:
+                results[index] = self.get_table_dependencies(*queries[index])
+            return results
+        
+        parsed_entries = {}
+        chunks = [pending[i:i + self.parse_chunk_size]
+                  for i in range(0, len(pending), self.parse_chunk_size)]
+        options = {
+            'parser': self.parser,
+            'max_parse_bytes': self.max_parse_bytes,
+            'max_parse_seconds': self.max_parse_seconds
+        }
+        try:
+            # map() returns chunk results in submission order, so the merge
+            # below is deterministic regardless of which worker finishes first
+            chunk_results = self.parse_pool.map(
+                _parse_dependencies_chunk,
+                [[queries[index][0] for index in chunk] for chunk in chunks],
+                [options] * len(chunks)
+            )
+            for chunk, parsed in zip(chunks, chunk_results):
+                for index, entry in zip(chunk, parsed):
+                    parsed_entries[index] = entry
+        except Exception as e:
+            print(f"Warning: parallel lineage extraction failed, parsing serially: {e}")
+            for index in pending:
+                parsed_entries[index] = self._parse_table_dependencies(queries[index][0])
+        
+        for index in pending:
+            text, queryid = queries[index]
+            entry = parsed_entries[index]
+            results[index] = entry[:2]
+            self._record_fallback(text, queryid, entry[2])
+            if self.parse_cache is not None:
+                self.parse_cache.put(text, entry[:2], queryid,
+                                     variant=self.parser, fallback=entry[2])
+        
+        return results
+    
+    def _parse_table_dependencies(self, query_text):
+        """
+        Extract source and destination tables with the configured parser,
+        falling back to the streaming keyword scanner for statements over
+        the parse budget.
+        
+        Returns:
+            tuple: (source_tables, destination_tables, fallback_reason) where
+                fallback_reason is None unless the scanner was used instead
+        """
+        if self.parser == 'fast':
+            sources, destinations = extract_relations(query_text)
+            return sources, destinations, None
+        
+        if self.max_parse_bytes is not None and len(query_text) > self.max_parse_bytes:
+            sources, destinations = extract_relations(query_text)
+            return sources, destinations, 'max_bytes'
+        
+        if self.max_parse_seconds is None:
+            sources, destinations = self._sqlparse_table_dependencies(query_text)
+            return sources, destinations, None
+        
+        try:
+            if _alarm_available():
+                sources, destinations = _call_with_timeout(
+                    self.max_parse_seconds, self._sqlparse_table_dependencies, query_text)
+            else:
+                # A thread cannot be interrupted, so the statement is parsed
+                # on a worker process that is killed if it runs over budget
+                sources, destinations = self.parse_pool.call(
+                    self.max_parse_seconds, _sqlparse_dependencies, query_text)
+            return sources, destinations, None
+        except ParseTimeout:
+            sources, destinations = extract_relations(query_text)
+            return sources, destinations, 'max_parse_time'
+    
+    def _sqlparse_table_dependencies(self, query_text):
+        """Run sqlparse over a query to extract source and destination tables"""
         # Normalize query text
         query_text = query_text.strip().lower()
         
@@ -429,79 +1075,134 @@ class PostgresQueryLineage:
         
         return table_name
     
-    def build_lineage_graph(self, expensive_queries_df):
+    def build_lineage_graph(self, expensive_queries_df, base_graph=None):
         """
         Build a data lineage graph from the expensive queries
         
+        Query nodes are keyed on (dbid, queryid), so rows of the same
+        statement share a node and its metrics are summed.
+        
         Args:
             expensive_queries_df (pandas.DataFrame): DataFrame with expensive queries
+            base_graph (networkx.DiGraph or ArrayGraph, optional): Graph of an earlier
+                analysis to update instead of starting from scratch. Statements
+                whose text is unchanged keep their edges without being parsed
+                again; statements not seen for merge_max_age seconds are removed.
             
         Returns:
-            networkx.DiGraph: Data lineage graph
+            networkx.DiGraph or ArrayGraph: Data lineage graph, an ArrayGraph
+                with the 'arrays' graph engine
         """
-        if expensive_queries_df.empty:
+        if expensive_queries_df.empty and base_graph is None:
             return nx.DiGraph()
         
-        # Create a new graph
-        G = nx.DiGraph()
+        # Create a new graph, or update a copy of the earlier one
+        if isinstance(base_graph, ArrayGraph):
+            G = base_graph.to_networkx()
+        else:
+            G = base_graph.copy() if base_graph is not None else nx.DiGraph()
+        self.parse_fallbacks = {}
+        now = time.time()
         
-        # Process each query to build the graph
+        # Rows of the same statement (e.g. run by different users) share a node
+        statements = {}
         for _, row in expensive_queries_df.iterrows():
-            query_text = row['query']
-            
-            # Extract tables
-            source_tables, destination_tables = self.get_table_dependencies(query_text)
+            node = query_node_id(row.get('queryid'), row.get('dbid'), row['query'])
+            statements.setdefault(node, []).append(row)
+        
+        # Only statements that are new or whose text changed are parsed
+        digests = {node: statement_digest(rows[0]['query'], self.parser)
+                   for node, rows in statements.items()}
+        changed = [node for node in statements
+                   if node not in G or G.nodes[node].get('text_hash') != digests[node]]
+        
+        # Extract table dependencies for every changed query up front so
+        # parsing can run in parallel and the catalog metadata for all
+        # referenced tables can be fetched in one round trip
+        self._report_progress('parse')
+        extracted = self.extract_dependencies(
+            [(statements[node][0]['query'], statements[node][0].get('queryid')) for node in changed])
+        
+        dependencies = {}
+        referenced_tables = set()
+        for node, (source_tables, destination_tables) in zip(changed, extracted):
+            source_tables = [t for t in source_tables if t]  # Skip empty tables
+            destination_tables = [t for t in destination_tables if t]
+            dependencies[node] = (source_tables, destination_tables)
+            referenced_tables.update(source_tables)
+            referenced_tables.update(destination_tables)
+        
+        self._report_progress('catalog')
+        self.prefetch_table_columns(referenced_tables)
+        
+        # Process each query to build the graph
+        self._report_progress('graph')
+        for node, rows in statements.items():
+            query_text = rows[0]['query']
+            calls = sum(row['calls'] for row in rows)
+            total_time = sum(row['total_time'] for row in rows)
             
             # Add query as node with attributes
-            query_id = f"Query_{hash(query_text) % 10000}"  # Create a shorter hash for display
-            G.add_node(query_id, 
+            G.add_node(node, 
                       type='query',
                       text=query_text[:100] + '...' if len(query_text) > 100 else query_text,
-                      calls=row['calls'],
-                      total_time=row['total_time'],
-                      mean_time=row['mean_time'],
-                      rows=row['rows'])
+                      calls=calls,
+                      total_time=total_time,
+                      mean_time=total_time / calls if calls else rows[0]['mean_time'],
+                      rows=sum(row['rows'] for row in rows),
+                      text_hash=digests[node],
+                      last_seen=now)
+            
+            # Detail pages find the node of a query row by its queryid
+            queryid = rows[0].get('queryid')
+            if queryid is not None and pd.notna(queryid):
+                G.nodes[node]['queryid'] = int(queryid)
+            dbid = rows[0].get('dbid')
+            if dbid is not None and pd.notna(dbid):
+                G.nodes[node]['dbid'] = int(dbid)
+            
+            if node not in dependencies:
+                continue  # Unchanged statement, its edges are still valid
+            
+            # Edges of an earlier version of the statement are replaced
+            G.remove_edges_from(list(G.in_edges(node)) + list(G.out_edges(node)))
+            G.nodes[node].pop('lineage_fallback', None)
+            
+            # Flag statements whose lineage came from the keyword scanner
+            fallback = self.parse_fallbacks.get(query_text)
+            if fallback:
+                G.nodes[node]['lineage_fallback'] = fallback['reason']
+            
+            source_tables, destination_tables = dependencies[node]
             
             # Add source tables as nodes and connect to query
             for table in source_tables:
-                if table and len(table) > 0:  # Skip empty tables
-                    # Only get columns if node doesn't exist yet
-                    if table not in G:
-                        columns = self.get_table_columns(table)
-                        # Get schema name
-                        schema = 'public'
-                        if '.' in table:
-                            schema = table.split('.')[0]
-                        
-                        G.add_node(table, 
-                                 type='table', 
-                                 columns=columns,
-                                 schema=schema,
-                                 display_name=table.split('.')[-1] if '.' in table else table)
-                    G.add_edge(table, query_id)
+                if table not in G:
+                    self._add_table_node(G, table)
+                G.add_edge(table, node)
             
             # Add destination tables as nodes and connect from query
             for table in destination_tables:
-                if table and len(table) > 0:  # Skip empty tables
-                    # Only get columns if node doesn't exist yet
-                    if table not in G:
-                        columns = self.get_table_columns(table)
-                        # Get schema name
-                        schema = 'public'
-                        if '.' in table:
-                            schema = table.split('.')[0]
-                            
-                        G.add_node(table, 
-                                 type='table',
-                                 columns=columns,
-                                 schema=schema,
-                                 display_name=table.split('.')[-1] if '.' in table else table)
-                    G.add_edge(query_id, table)
+                if table not in G:
+                    self._add_table_node(G, table)
+                G.add_edge(node, table)
+        
+        if base_graph is not None:
+            self._expire_statements(G, now - self.merge_max_age)
+        
+        if self.graph_engine == 'arrays':
+            # The array engine derives the table-to-table edges itself
+            G = ArrayGraph.from_networkx(G).with_table_edges()
+            self.lineage_graph = G
+            return G
         
         # Create direct table-to-table relationships for better lineage visualization
-        # This adds edges between tables that are connected through queries
-        # For each query node that has both incoming and outgoing edges
-        for node in G.nodes():
+        # This adds edges between tables that are connected through queries.
+        # They are derived again from scratch, as a merge may have changed
+        # or removed the queries they go through
+        G.remove_edges_from([(u, v) for u, v in G.edges()
+                             if G.nodes[u].get('type') == 'table' and G.nodes[v].get('type') == 'table'])
+        for node in list(G.nodes()):
             # Only process query nodes that act as intermediaries
             if G.nodes[node].get('type') == 'query':
                 # Get source tables (predecessors of the query)
@@ -522,12 +1223,47 @@ class PostgresQueryLineage:
         self.lineage_graph = G
         return G
     
-    def visualize_lineage(self, output_file=None):
+    def _expire_statements(self, G, cutoff):
+        """
+        Remove query nodes last seen before cutoff, and the tables only
+        they referenced.
+        
+        Returns:
+            int: Number of query nodes removed
+        """
+        stale = [node for node, attrs in G.nodes(data=True)
+                 if attrs.get('type') == 'query' and attrs.get('last_seen', 0) < cutoff]
+        G.remove_nodes_from(stale)
+        orphans = [node for node, attrs in G.nodes(data=True)
+                   if attrs.get('type') == 'table'
+                   and not any(G.nodes[n].get('type') == 'query'
+                               for n in list(G.predecessors(node)) + list(G.successors(node)))]
+        G.remove_nodes_from(orphans)
+        return len(stale)
+    
+    def _add_table_node(self, G, table):
+        """Add a table node with its catalog columns to the graph"""
+        schema, table_name = split_table_name(table)
+        G.add_node(table, 
+                   type='table', 
+                   columns=self.get_table_columns(table),
+                   schema=schema,
+                   display_name=table_name)
+    
+    def _networkx_graph(self):
+        """The lineage graph as a networkx DiGraph, converted from an ArrayGraph if needed"""
+        if isinstance(self.lineage_graph, ArrayGraph):
+            return self.lineage_graph.to_networkx()
+        return self.lineage_graph
+    
+    def visualize_lineage(self, output_file=None, positions=None):
         """
         Visualize the data lineage graph
         
         Args:
             output_file (str, optional): File path to save the visualization
+            positions (dict, optional): Node positions; laid out (through
+                the layout cache, if any) when not given
             
         Returns:
             str: Base64 encoded image data if output_file is None
@@ -536,58 +1272,9 @@ class PostgresQueryLineage:
             print("No lineage graph to visualize.")
             return None
         
-        plt.figure(figsize=(15, 10))
-        
-        # Define node colors based on type
-        node_colors = []
-        for node in self.lineage_graph.nodes():
-            if self.lineage_graph.nodes[node].get('type') == 'query':
-                node_colors.append('lightblue')
-            else:
-                node_colors.append('lightgreen')
-        
-        # Define node sizes based on query statistics if available
-        node_sizes = []
-        for node in self.lineage_graph.nodes():
-            if self.lineage_graph.nodes[node].get('type') == 'query':
-                # Scale by total_time
-                total_time = self.lineage_graph.nodes[node].get('total_time', 0)
-                node_sizes.append(100 + min(total_time / 10, 1000))
-            else:
-                node_sizes.append(300)
-        
-        # Create labels
-        labels = {}
-        for node in self.lineage_graph.nodes():
-            if self.lineage_graph.nodes[node].get('type') == 'query':
-                # Short representation for queries
-                text = self.lineage_graph.nodes[node].get('text', '')
-                text = text.replace('\n', ' ')
-                labels[node] = f"{node}\n({text[:30]}...)" if len(text) > 30 else f"{node}\n({text})"
-            else:
-                labels[node] = node
-        
-        # Draw the graph
-        pos = nx.spring_layout(self.lineage_graph, k=0.15, iterations=50)
-        
-        nx.draw_networkx_nodes(self.lineage_graph, pos, node_size=node_sizes, node_color=node_colors, alpha=0.8)
-        nx.draw_networkx_edges(self.lineage_graph, pos, width=1.0, alpha=0.5, edge_color='gray', arrowsize=15)
-        nx.draw_networkx_labels(self.lineage_graph, pos, labels=labels, font_size=8)
-        
-        plt.title("PostgreSQL Data Lineage Graph")
-        plt.axis('off')
-        
-        if output_file:
-            plt.savefig(output_file, bbox_inches='tight')
-            plt.close()
-            return output_file
-        else:
-            # Return as base64 encoded image
-            img_data = BytesIO()
-            plt.savefig(img_data, format='png', bbox_inches='tight')
-            plt.close()
-            img_data.seek(0)
-            return base64.b64encode(img_data.read()).decode('utf-8')
+        if positions is None and self.layout_cache is not None:
+            positions = self.layout_cache.positions(self.lineage_graph)
+        return render_lineage_image(self._networkx_graph(), output_file, positions)
     
     def export_lineage(self, output_file):
         """
@@ -602,7 +1289,7 @@ class PostgresQueryLineage:
         
         try:
             # Create a copy of the graph to modify for export
-            export_graph = self.lineage_graph.copy()
+            export_graph = self._networkx_graph().copy()
             
             # Convert non-serializable attributes to serializable format
             for node, attrs in export_graph.nodes(data=True):
@@ -627,54 +1314,79 @@ class PostgresQueryLineage:
         Returns:
             list: List of column information dictionaries
         """
-        if not self.conn or self.conn.closed:
-            success, msg = self.connect()
-            if not success:
-                return []
-                
+        # Served from the catalog snapshot when the table was prefetched
+        columns = self.catalog.get_columns(table_name)
+        if columns is not None:
+            return columns
+        
         try:
             # Split schema and table
-            if '.' in table_name:
-                schema, table = table_name.split('.', 1)
-            else:
-                schema = 'public'
-                table = table_name
-                
+            schema, table = split_table_name(table_name)
+            
             # Get column information
-            self.cursor.execute("""
-                SELECT 
-                    a.attname as column_name,
-                    pg_catalog.format_type(a.atttypid, a.atttypmod) as data_type,
-                    a.attnotnull as not_null,
-                    CASE 
-                        WHEN (SELECT COUNT(*) FROM pg_constraint
-                            WHERE conrelid = a.attrelid AND conkey[1] = a.attnum AND contype = 'p') > 0 THEN true
-                        ELSE false
-                    END as is_primary_key
-                FROM pg_catalog.pg_attribute a
-                JOIN pg_catalog.pg_class c ON a.attrelid = c.oid
-                JOIN pg_catalog.pg_namespace n ON c.relnamespace = n.oid
-                WHERE c.relname = %s
-                    AND n.nspname = %s
-                    AND a.attnum > 0
-                    AND NOT a.attisdropped
-                ORDER BY a.attnum
-            """, (table, schema))
-            
-            columns = []
-            for row in self.cursor.fetchall():
-                columns.append({
-                    'name': row[0],
-                    'type': row[1],
-                    'not_null': row[2],
-                    'is_primary_key': row[3]
-                })
+            with self._cursor() as cursor:
+                cursor.execute("""
+                    SELECT 
+                        a.attname as column_name,
+                        pg_catalog.format_type(a.atttypid, a.atttypmod) as data_type,
+                        a.attnotnull as not_null,
+                        (i.indrelid IS NOT NULL) as is_primary_key
+                    FROM pg_catalog.pg_attribute a
+                    JOIN pg_catalog.pg_class c ON a.attrelid = c.oid
+                    JOIN pg_catalog.pg_namespace n ON c.relnamespace = n.oid
+                    LEFT JOIN pg_catalog.pg_index i
+                        ON i.indrelid = c.oid AND i.indisprimary AND a.attnum = ANY(i.indkey)
+                    WHERE c.relname = %s
+                        AND n.nspname = %s
+                        AND a.attnum > 0
+                        AND NOT a.attisdropped
+                    ORDER BY a.attnum
+                """, (table, schema))
+                
+                columns = []
+                for row in cursor.fetchall():
+                    columns.append({
+                        'name': row[0],
+                        'type': row[1],
+                        'not_null': row[2],
+                        'is_primary_key': row[3]
+                    })
             
+            self.catalog.set_columns(table_name, columns)
             return columns
             
         except Exception as e:
             print(f"Error getting columns for {table_name}: {e}")
             return []
+    
+    def prefetch_table_columns(self, table_names):
+        """
+        Load column metadata for many tables into the catalog snapshot
+        using a single set-based catalog query. With a catalog cache only
+        relations whose catalog fingerprint changed are fetched.
+        
+        Args:
+            table_names (iterable): Table names in format schema.table or just table
+            
+        Returns:
+            int: Number of tables requested from the catalog
+        """
+        if not self.catalog.missing(table_names):
+            return 0
+        
+        try:
+            with self._cursor() as cursor:
+                if self.catalog_cache is None:
+                    return self.catalog.load(cursor, table_names)
+                
+                if self._database_identity is None:
+                    self._database_identity = self.catalog_cache.database_identity(
+                        cursor, self.connection_params)
+                return self.catalog_cache.load(
+                    cursor, self.catalog, table_names, self._database_identity)
+        except Exception as e:
+            print(f"Error prefetching table columns: {e}")
+            return 0
             
     def get_table_query_stats(self):
         """
@@ -687,8 +1399,21 @@ class PostgresQueryLineage:
             print("No lineage graph to analyze.")
             return pd.DataFrame()
         
+        if isinstance(self.lineage_graph, ArrayGraph):
+            df = self.lineage_graph.table_query_stats()
+            self.prefetch_table_columns(df['table_name'])
+            df['columns'] = [self.get_table_columns(name) for name in df['table_name']]
+            if not df.empty:
+                return df.sort_values('total_time', ascending=False)
+            return df
+        
         table_stats = {}
         
+        # Make sure every table is in the catalog snapshot before the loop
+        table_nodes = [node for node, attrs in self.lineage_graph.nodes(data=True)
+                       if attrs.get('type') == 'table']
+        self.prefetch_table_columns(table_nodes)
+        
         for node in self.lineage_graph.nodes():
             if self.lineage_graph.nodes[node].get('type') == 'table':
                 # Count incoming and outgoing queries
@@ -718,7 +1443,36 @@ class PostgresQueryLineage:
             return df.sort_values('total_time', ascending=False)
         return df
 
-    def run_complete_analysis(self, limit=20, min_calls=5, output_prefix=None):
+    def _add_table_activity(self, table_stats):
+        """
+        Add pg_stat_user_tables activity collected for the analyzed window
+        to the table statistics.
+        
+        Args:
+            table_stats (pandas.DataFrame): Output of get_table_query_stats()
+            
+        Returns:
+            pandas.DataFrame: table_stats with TABLE_COUNTER_COLUMNS added
+                when the window was answered from collected data
+        """
+        window = self.workload_window
+        if table_stats.empty or not window or window.get('source') != 'collector':
+            return table_stats
+        
+        activity = self.snapshot_store.table_activity(
+            connection_target(self.connection_params), window['start_ts'], window['end_ts'])
+        if activity.empty:
+            return table_stats
+        # Table nodes keep the name as written in the SQL, with or without
+        # the schema, so both sides are joined on (schema, table)
+        keys = [split_table_name(name) for name in table_stats['table_name']]
+        table_stats = table_stats.assign(schemaname=[schema for schema, _ in keys],
+                                         relname=[table for _, table in keys])
+        merged = table_stats.merge(activity, on=['schemaname', 'relname'], how='left')
+        return merged.drop(columns=['schemaname', 'relname'])
+    
+    def run_complete_analysis(self, limit=20, min_calls=5, output_prefix=None, window_seconds=None,
+                              progress=None):
         """
         Run a complete analysis and generate reports
         
@@ -726,10 +1480,16 @@ class PostgresQueryLineage:
             limit (int): Number of expensive queries to analyze
             min_calls (int): Minimum number of calls to include query
             output_prefix (str, optional): Prefix for output files
+            window_seconds (int, optional): Analyze the workload of the last
+                window_seconds instead of everything since the stats reset
+            progress (callable, optional): Called with the name of each stage
+                (see app.jobs.ANALYSIS_STAGES) as it starts. JobCancelled
+                raised from it aborts the analysis.
         
         Returns:
             dict: Analysis results
         """
+        self.progress = progress
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         if output_prefix:
             prefix = f"{output_prefix}_{timestamp}"
@@ -741,51 +1501,89 @@ class PostgresQueryLineage:
         if output_dir and not os.path.exists(output_dir):
             os.makedirs(output_dir)
         
-        # Connect to database
-        success, msg = self.connect()
+        # Check the database is reachable; the connection returns to the pool
+        success, msg = self.check_connection()
         if not success:
             return {'error': msg}
         
         try:
             # Get expensive queries
-            expensive_queries = self.get_expensive_queries(limit=limit, min_calls=min_calls)
+            self._report_progress('fetch')
+            expensive_queries = self.get_expensive_queries(limit=limit, min_calls=min_calls,
+                                                           window_seconds=window_seconds)
             
             if expensive_queries.empty:
                 return {'error': "No queries found for analysis. Check pg_stat_statements is enabled and collecting data."}
             
-            # Save expensive queries to CSV
-            queries_file = f"{prefix}_expensive_queries.csv"
-            expensive_queries.to_csv(queries_file, index=False)
+            # Save expensive queries as a columnar artifact
+            queries_file = write_table(expensive_queries, f"{prefix}_expensive_queries")
             
-            # Build lineage graph
-            self.build_lineage_graph(expensive_queries)
+            # Build lineage graph, updating the stored one of this target if any
+            target = connection_target(self.connection_params)
+            base_graph = self.graph_store.load(target) if self.graph_store is not None else None
+            self.build_lineage_graph(expensive_queries, base_graph=base_graph)
+            if self.graph_store is not None:
+                self.graph_store.save(target, self.lineage_graph)
             
             # Get table statistics
-            table_stats = self.get_table_query_stats()
-            table_stats_file = f"{prefix}_table_stats.csv"
+            self._report_progress('stats')
+            table_stats = self._add_table_activity(self.get_table_query_stats())
+            table_stats_file = f"{prefix}_table_stats{artifact_suffix()}"
             if not table_stats.empty:
-                table_stats.to_csv(table_stats_file, index=False)
+                write_table(table_stats, f"{prefix}_table_stats")
             
-            # Visualize lineage
+            # Lay out the graph once, keeping the positions of the previous
+            # layout of this target; the PNG is only drawn when it is first
+            # downloaded (see routes.download)
+            self._report_progress('layout')
+            if self.layout_cache is not None:
+                positions = self.layout_cache.positions(self.lineage_graph, target=target)
+            else:
+                positions = layered_layout(self.lineage_graph)
             lineage_image = f"{prefix}_lineage.png"
-            self.visualize_lineage(lineage_image)
             
             # Export lineage graph
+            self._report_progress('export')
             lineage_graphml = f"{prefix}_lineage.graphml"
             self.export_lineage(lineage_graphml)
             
+            # Compact payload served to the interactive lineage view, with
+            # the node positions so the browser does not lay it out again
+            lineage_payload = f"{prefix}_lineage.json.gz"
+            write_payload(self.lineage_graph, lineage_payload, positions)
+            
+            files = {
+                'expensive_queries': queries_file,
+                'table_stats': table_stats_file,
+                'lineage_image': lineage_image,
+                'lineage_graphml': lineage_graphml,
+                'lineage_payload': lineage_payload
+            }
+            if isinstance(self.lineage_graph, ArrayGraph):
+                # Memory-mapped by AnalysisResult.from_files()
+                files['lineage_arrays'] = f"{prefix}_lineage_arrays"
+                self.lineage_graph.save(files['lineage_arrays'])
+            
+            # Persist parse results for the next analysis
+            parse_cache_stats = None
+            if self.parse_cache is not None:
+                self.parse_cache.save()
+                parse_cache_stats = self.parse_cache.stats()
+            
             return {
                 'expensive_queries': expensive_queries,
                 'table_stats': table_stats,
                 'lineage_graph': self.lineage_graph,
-                'files': {
-                    'expensive_queries': queries_file,
-                    'table_stats': table_stats_file,
-                    'lineage_image': lineage_image,
-                    'lineage_graphml': lineage_graphml
-                }
+                'lineage_positions': positions,
+                'parse_cache_stats': parse_cache_stats,
+                'parse_fallbacks': list(self.parse_fallbacks.values()),
+                'workload_window': self.workload_window,
+                'files': files
             }
         
+        except JobCancelled:
+            raise
+        
         except Exception as e:
             return {'error': f"Error during analysis: {str(e)}"}
         
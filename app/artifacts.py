@@ -0,0 +1,96 @@
+"""
+Columnar storage for tabular analysis artifacts.
+Expensive queries and table statistics are written as uncompressed Arrow
+IPC files, which keep their dtypes (including the nested column lists of
+table statistics) and are read through a memory map without copying their
+buffers. CSV is only rendered when a user downloads a table. Without pyarrow installed, tables fall back to CSV.
+"""
+
+import os
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc  # noqa: F401  (registers pa.ipc)
+except ImportError:
+    pa = None
+
+
+ARROW_SUFFIX = '.arrow'
+CSV_SUFFIX = '.csv'
+
+
+def artifact_suffix():
+    """File suffix tables are written with in this installation"""
+    return ARROW_SUFFIX if pa is not None else CSV_SUFFIX
+
+
+def write_table(df, path_prefix):
+    """
+    Write a table artifact.
+
+    Args:
+        df (pandas.DataFrame): Table to write
+        path_prefix (str): Path without suffix
+
+    Returns:
+        str: Path of the written file
+    """
+    path = path_prefix + artifact_suffix()
+    if pa is None:
+        df.to_csv(path, index=False)
+        return path
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    tmp_path = path + '.tmp'
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _open_arrow(path):
+    """Open an Arrow IPC file through a memory map without copying its buffers"""
+    with pa.memory_map(path, 'r') as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+def _to_pandas(table):
+    """Convert to pandas, keeping nested values as plain lists and dicts"""
+    nested = [field.name for field in table.schema
+              if pa.types.is_nested(field.type)]
+    flat = [name for name in table.column_names if name not in nested]
+    df = table.select(flat).to_pandas() if nested else table.to_pandas()
+    for name in nested:
+        df[name] = table.column(name).to_pylist()
+    return df[table.column_names]
+
+
+def read_table(path, columns=None):
+    """
+    Read a table artifact written by write_table(), or a CSV file written
+    by an earlier version.
+
+    Args:
+        path (str): Artifact path
+        columns (list, optional): Only read these columns
+
+    Returns:
+        pandas.DataFrame: The table
+    """
+    if not path.endswith(ARROW_SUFFIX):
+        return pd.read_csv(path, usecols=columns)
+    if pa is None:
+        raise RuntimeError(f"pyarrow is required to read {path}")
+
+    table = _open_arrow(path)
+    if columns is not None:
+        table = table.select(columns)
+    return _to_pandas(table)
+
+
+def to_csv_bytes(df):
+    """Render a table as CSV for download"""
+    return df.to_csv(index=False).encode('utf-8')
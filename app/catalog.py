@@ -0,0 +1,316 @@
+"""
+Catalog snapshot for PostgreSQL relation metadata.
+Fetches column definitions for many relations with a single set-based query
+so that lineage building does not cost one catalog round trip per table,
+and persists them on disk between analyses.
+"""
+
+import os
+import re
+import json
+import hashlib
+import tempfile
+
+
+# Columns, types, NOT NULL and primary key membership for a batch of
+# (schema, table) pairs. Primary key membership comes from pg_index so every
+# key column is reported, not only the first one.
+BULK_COLUMNS_QUERY = """
+    SELECT
+        n.nspname as schema_name,
+        c.relname as table_name,
+        a.attname as column_name,
+        pg_catalog.format_type(a.atttypid, a.atttypmod) as data_type,
+        a.attnotnull as not_null,
+        (i.indrelid IS NOT NULL) as is_primary_key
+    FROM unnest(%s::text[], %s::text[]) AS r(schema_name, table_name)
+    JOIN pg_catalog.pg_namespace n ON n.nspname = r.schema_name
+    JOIN pg_catalog.pg_class c ON c.relnamespace = n.oid AND c.relname = r.table_name
+    JOIN pg_catalog.pg_attribute a ON a.attrelid = c.oid
+    LEFT JOIN pg_catalog.pg_index i
+        ON i.indrelid = c.oid AND i.indisprimary AND a.attnum = ANY(i.indkey)
+    WHERE a.attnum > 0
+        AND NOT a.attisdropped
+    ORDER BY n.nspname, c.relname, a.attnum
+"""
+
+
+# Cheap per-relation fingerprint. The pg_class row (xmin, relfilenode), the
+# primary key index and the newest pg_attribute row change on any DDL that
+# affects the cached column metadata, so a match means the cache is current.
+FINGERPRINT_QUERY = """
+    SELECT
+        n.nspname as schema_name,
+        c.relname as table_name,
+        c.oid as relid,
+        concat_ws(':',
+            c.xmin::text,
+            c.relfilenode::text,
+            (SELECT i.indexrelid::text FROM pg_catalog.pg_index i
+             WHERE i.indrelid = c.oid AND i.indisprimary),
+            (SELECT max(a.xmin::text::bigint)::text FROM pg_catalog.pg_attribute a
+             WHERE a.attrelid = c.oid)
+        ) as fingerprint
+    FROM unnest(%s::text[], %s::text[]) AS r(schema_name, table_name)
+    JOIN pg_catalog.pg_namespace n ON n.nspname = r.schema_name
+    JOIN pg_catalog.pg_class c ON c.relnamespace = n.oid AND c.relname = r.table_name
+"""
+
+DATABASE_IDENTITY_QUERY = """
+    SELECT d.oid, d.datname
+    FROM pg_catalog.pg_database d
+    WHERE d.datname = current_database()
+"""
+
+
+def split_table_name(table_name):
+    """
+    Split a table reference into schema and table parts.
+
+    Args:
+        table_name (str): Table name in format schema.table or just table
+
+    Returns:
+        tuple: (schema, table), with 'public' as the default schema
+    """
+    if '.' in table_name:
+        schema, table = table_name.split('.', 1)
+    else:
+        schema = 'public'
+        table = table_name
+    return schema, table
+
+
+# Quoted identifiers (group 1) and bare words (group 2) in a query text
+_IDENTIFIER = re.compile(
+    r'"((?:[^"]|"")+)"|([A-Za-z_\u0080-\uffff][A-Za-z0-9_$\u0080-\uffff]*)'
+)
+
+
+class TableNameIndex:
+    """
+    Hash index of user table names for filtering query texts.
+
+    A text matches when any identifier in it names a user table. Each text
+    is scanned once and every identifier costs one set lookup, so filtering
+    time does not grow with the number of tables in the catalog. Names are
+    compared case-insensitively, like the regex filter this replaces.
+    """
+
+    def __init__(self, table_names):
+        """
+        Args:
+            table_names (iterable): Table names in format schema.table or table
+        """
+        self.names = frozenset(split_table_name(name)[1].lower() for name in table_names if name)
+
+    def __len__(self):
+        return len(self.names)
+
+    def identifiers(self, query_text):
+        """Return the set of lower-cased identifiers in a query text"""
+        found = set()
+        for quoted, word in _IDENTIFIER.findall(query_text):
+            found.add((word or quoted.replace('""', '"')).lower())
+        return found
+
+    def matches(self, query_text):
+        """
+        Check whether a query text references any indexed table.
+
+        Args:
+            query_text (str): SQL query text
+
+        Returns:
+            bool: True if an identifier in the text names an indexed table.
+                An empty index matches every text.
+        """
+        if not self.names:
+            return True
+        if not query_text:
+            return False
+        return not self.names.isdisjoint(self.identifiers(query_text))
+
+
+class CatalogSnapshot:
+    """In-memory index of column metadata keyed by (schema, table)"""
+
+    def __init__(self):
+        self.columns = {}
+
+    def __contains__(self, table_name):
+        return split_table_name(table_name) in self.columns
+
+    def __len__(self):
+        return len(self.columns)
+
+    def get_columns(self, table_name):
+        """
+        Get cached columns for a table.
+
+        Args:
+            table_name (str): Table name in format schema.table or just table
+
+        Returns:
+            list: List of column information dictionaries, or None if the
+                table has not been loaded into the snapshot
+        """
+        return self.columns.get(split_table_name(table_name))
+
+    def set_columns(self, table_name, columns):
+        """Store the columns for a single table"""
+        self.columns[split_table_name(table_name)] = columns
+
+    def missing(self, table_names):
+        """Return the (schema, table) keys not yet present in the snapshot"""
+        keys = {split_table_name(name) for name in table_names if name}
+        return sorted(key for key in keys if key not in self.columns)
+
+    def load(self, cursor, table_names):
+        """
+        Load column metadata for every table not already in the snapshot.
+
+        Args:
+            cursor: Open database cursor
+            table_names (iterable): Table names in format schema.table or table
+
+        Returns:
+            int: Number of tables that were requested from the catalog
+        """
+        missing = self.missing(table_names)
+        if not missing:
+            return 0
+
+        schemas = [schema for schema, _ in missing]
+        tables = [table for _, table in missing]
+        cursor.execute(BULK_COLUMNS_QUERY, (schemas, tables))
+
+        # Tables that do not exist (CTE names, aliases the parser picked up)
+        # are recorded with no columns so they are not requested again
+        loaded = {key: [] for key in missing}
+        for row in cursor.fetchall():
+            loaded[(row[0], row[1])].append({
+                'name': row[2],
+                'type': row[3],
+                'not_null': row[4],
+                'is_primary_key': row[5]
+            })
+
+        self.columns.update(loaded)
+        return len(missing)
+
+
+class CatalogCache:
+    """
+    On-disk catalog cache shared between analyses.
+
+    Entries are stored per database identity and keyed by relation OID, each
+    with the fingerprint it was fetched under. A relation is only fetched
+    from the catalog again when its fingerprint no longer matches.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def database_identity(self, cursor, connection_params):
+        """
+        Identify the database the cursor is connected to.
+
+        Args:
+            cursor: Open database cursor
+            connection_params (dict): Connection parameters used for the cursor
+
+        Returns:
+            str: Identity string of the form host:port/datname:datoid
+        """
+        cursor.execute(DATABASE_IDENTITY_QUERY)
+        datoid, datname = cursor.fetchone()
+        host = connection_params.get('host') or 'localhost'
+        port = connection_params.get('port') or 5432
+        return f"{host}:{port}/{datname}:{datoid}"
+
+    def _cache_file(self, identity):
+        digest = hashlib.sha1(identity.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f"catalog_{digest}.json")
+
+    def read(self, identity):
+        """Read the cached relation entries for a database identity"""
+        path = self._cache_file(identity)
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+            if data.get('identity') != identity:
+                return {}
+            return data.get('relations', {})
+        except (OSError, ValueError) as e:
+            print(f"Warning when reading catalog cache {path}: {e}")
+            return {}
+
+    def write(self, identity, relations):
+        """Atomically replace the cached relation entries for a database"""
+        path = self._cache_file(identity)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'identity': identity, 'relations': relations}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Warning when writing catalog cache {path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def load(self, cursor, snapshot, table_names, identity):
+        """
+        Fill a snapshot from the cache, fetching only stale or unknown relations.
+
+        Args:
+            cursor: Open database cursor
+            snapshot (CatalogSnapshot): Snapshot to populate
+            table_names (iterable): Table names in format schema.table or table
+            identity (str): Database identity from database_identity()
+
+        Returns:
+            int: Number of tables whose columns were fetched from the catalog
+        """
+        missing = snapshot.missing(table_names)
+        if not missing:
+            return 0
+
+        schemas = [schema for schema, _ in missing]
+        tables = [table for _, table in missing]
+        cursor.execute(FINGERPRINT_QUERY, (schemas, tables))
+        fingerprints = {(row[0], row[1]): (str(row[2]), row[3]) for row in cursor.fetchall()}
+
+        relations = self.read(identity)
+        stale = []
+        for key in missing:
+            if key not in fingerprints:
+                # Not a relation in this database, nothing to fetch
+                snapshot.columns[key] = []
+                continue
+            relid, fingerprint = fingerprints[key]
+            entry = relations.get(relid)
+            if entry and entry.get('fingerprint') == fingerprint:
+                snapshot.columns[key] = entry['columns']
+            else:
+                stale.append(f"{key[0]}.{key[1]}")
+
+        if not stale:
+            return 0
+
+        fetched = snapshot.load(cursor, stale)
+        for table_name in stale:
+            key = split_table_name(table_name)
+            relid, fingerprint = fingerprints[key]
+            relations[relid] = {
+                'schema': key[0],
+                'table': key[1],
+                'fingerprint': fingerprint,
+                'columns': snapshot.columns[key]
+            }
+        self.write(identity, relations)
+        return fetched
@@ -0,0 +1,263 @@
+"""
+Background workload collector.
+Samples pg_stat_statements and pg_stat_user_tables at a fixed interval and
+writes the per-interval deltas, plus texts of newly seen queries, to the
+local snapshot store. Analyses of a recent window are then answered from
+that store instead of querying the production database on demand.
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+
+import pandas as pd
+
+from app.analyzer import PostgresQueryLineage
+from app.server_profile import STALE_PROFILE_ERRORS, connection_target
+from app.snapshots import (SnapshotStore, TABLE_COUNTER_COLUMNS, TABLE_KEY,
+                           compute_delta, compute_table_delta, take_snapshot)
+
+
+TABLE_STATS_QUERY = f"""
+    SELECT schemaname, relname, {', '.join(f'COALESCE({c}, 0) AS {c}' for c in TABLE_COUNTER_COLUMNS)}
+    FROM pg_stat_user_tables
+"""
+
+
+class WorkloadCollector:
+    """Periodically stores workload deltas for one connection target"""
+
+    def __init__(self, connection_params, store, interval=60, retention_seconds=7 * 86400,
+                 downsample_after=86400, downsample_bucket=3600, server_profiles=None):
+        """
+        Args:
+            connection_params (dict): Connection parameters for PostgreSQL
+            store (SnapshotStore): Local store the deltas are written to
+            interval (int): Seconds between samples
+            retention_seconds (int): Collected data older than this is deleted
+            downsample_after (int): Intervals older than this are merged into
+                buckets of downsample_bucket seconds
+            downsample_bucket (int): Bucket length for downsampled data; also
+                how often a full snapshot is kept as a baseline
+            server_profiles (ServerProfileCache, optional): Shared server
+                capability profiles
+        """
+        self.connection_params = connection_params
+        self.store = store
+        self.interval = interval
+        self.retention_seconds = retention_seconds
+        self.downsample_after = downsample_after
+        self.downsample_bucket = downsample_bucket
+        self.target = connection_target(connection_params)
+        self.samples = 0
+        self.last_error = None
+        self._lineage = PostgresQueryLineage(connection_params, server_profiles=server_profiles,
+                                             snapshot_store=store)
+        self._previous = None
+        self._previous_tables = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start sampling on a daemon thread"""
+        if self.is_running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"collector {self.target}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop sampling and close the database connection"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._lineage.disconnect()
+
+    def _run(self):
+        while not self._stop.is_set():
+            success, msg = self.collect_once()
+            if not success:
+                print(f"Warning: workload collection for {self.target} failed: {msg}")
+            self._stop.wait(self.interval)
+
+    def collect_once(self):
+        """
+        Take one sample and store its delta against the previous sample.
+
+        Returns:
+            tuple: (success, message)
+        """
+        lineage = self._lineage
+        try:
+            if not lineage.conn or lineage.conn.closed:
+                success, msg = lineage.connect()
+                if not success:
+                    self.last_error = msg
+                    return False, msg
+                lineage.conn.autocommit = True
+
+            success, msg = lineage.load_server_profile()
+            if not success:
+                self.last_error = msg
+                return False, msg
+            profile = lineage.server_profile
+
+            snapshot = take_snapshot(lineage.cursor, profile)
+            lineage.cursor.execute(TABLE_STATS_QUERY)
+            columns = [desc[0] for desc in lineage.cursor.description]
+            tables = pd.DataFrame(lineage.cursor.fetchall(), columns=columns)
+        except Exception as e:
+            self.last_error = str(e)
+            if isinstance(e, STALE_PROFILE_ERRORS):
+                # Probe the server again on the next sample
+                lineage.forget_server_profile()
+            lineage.disconnect()
+            lineage.conn = None
+            return False, f"Error sampling workload: {str(e)}"
+
+        # The first sample only sets the baseline; differencing against a
+        # stored snapshot could count intervals a previous run already stored
+        previous = self._previous
+        stored = 0
+        if previous is not None:
+            delta = compute_delta(previous, snapshot)
+            self.store.save_delta(self.target, previous.taken_at, snapshot.taken_at, delta)
+            stored = len(delta)
+            table_delta = compute_table_delta(self._previous_tables, tables)
+            self.store.save_table_delta(self.target, previous.taken_at, snapshot.taken_at, table_delta)
+        self.store.save_relations(self.target, tables[TABLE_KEY].itertuples(index=False, name=None),
+                                  snapshot.taken_at)
+
+        # Query texts are read only for entries the store has not seen yet
+        known = self.store.known_queries(self.target)
+        keys = {(int(u), int(d), int(q)) for u, d, q in
+                zip(snapshot.stats['userid'], snapshot.stats['dbid'], snapshot.stats['queryid'])}
+        new_keys = sorted(keys - known)
+        if new_keys:
+            try:
+                lineage.cursor.execute(profile.text_query(filtered=False), (
+                    [u for u, _, _ in new_keys], [d for _, d, _ in new_keys], [q for _, _, q in new_keys]))
+                self.store.save_texts(self.target, lineage.cursor.fetchall(), snapshot.taken_at)
+            except Exception as e:
+                print(f"Warning when fetching new query texts: {e}")
+
+        # Keep a full snapshot every bucket as a baseline for windowed
+        # analyses of periods without collected deltas
+        latest = self.store.latest_snapshot_time(self.target)
+        if latest is None or snapshot.taken_at - latest >= self.downsample_bucket:
+            self.store.save(self.target, snapshot)
+
+        self.store.prune(self.target, self.retention_seconds, now=snapshot.taken_at)
+        self.store.downsample(self.target, snapshot.taken_at - self.downsample_after,
+                              self.downsample_bucket)
+
+        self._previous = snapshot
+        self._previous_tables = tables
+        self.samples += 1
+        self.last_error = None
+        return True, f"Stored workload of {stored} statements and {len(new_keys)} new query texts."
+
+
+class CollectorRegistry:
+    """Running collectors keyed by connection target"""
+
+    def __init__(self):
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._collectors)
+
+    def ensure(self, connection_params, store, **options):
+        """
+        Start a collector for a connection target unless one is running.
+
+        Returns:
+            WorkloadCollector: The running collector
+        """
+        target = connection_target(connection_params)
+        with self._lock:
+            collector = self._collectors.get(target)
+            if collector is None or not collector.is_running:
+                collector = WorkloadCollector(connection_params, store, **options)
+                collector.start()
+                self._collectors[target] = collector
+            return collector
+
+    def get(self, connection_params):
+        """Return the collector for a connection target, or None"""
+        with self._lock:
+            return self._collectors.get(connection_target(connection_params))
+
+    def stop_all(self, timeout=None):
+        """Stop every running collector"""
+        with self._lock:
+            collectors = list(self._collectors.values())
+            self._collectors.clear()
+        for collector in collectors:
+            collector.stop(timeout)
+
+
+def parse_args(argv=None):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(
+        description='Collect pg_stat_statements workload history for PostgreSQL Query Lineage'
+    )
+    parser.add_argument('--host', default='localhost', help='Database host (default: localhost)')
+    parser.add_argument('--port', type=int, default=5432, help='Database port (default: 5432)')
+    parser.add_argument('--database', required=True, help='Database name')
+    parser.add_argument('--user', required=True, help='Database user; the password is read from PGPASSWORD')
+    parser.add_argument('--store', default=None,
+                        help='SQLite store (default: the web application\'s SNAPSHOT_DB)')
+    parser.add_argument('--interval', type=int, default=60, help='Seconds between samples (default: 60)')
+    parser.add_argument('--retention-days', type=float, default=7,
+                        help='Days of history to keep (default: 7)')
+    parser.add_argument('--once', action='store_true', help='Take a single sample and exit')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Command line entry point for running the collector without the web application"""
+    args = parse_args(argv)
+    if args.store is None:
+        from app import app
+        args.store = app.config['SNAPSHOT_DB']
+
+    connection_params = {
+        'host': args.host,
+        'port': args.port,
+        'database': args.database,
+        'user': args.user
+    }
+    if os.environ.get('PGPASSWORD'):
+        connection_params['password'] = os.environ['PGPASSWORD']
+
+    collector = WorkloadCollector(connection_params, SnapshotStore(args.store), interval=args.interval,
+                                  retention_seconds=int(args.retention_days * 86400))
+    if args.once:
+        success, msg = collector.collect_once()
+        print(msg)
+        collector.stop()
+        return 0 if success else 1
+
+    print(f"Collecting workload of {collector.target} every {args.interval}s into {args.store}")
+    try:
+        while True:
+            success, msg = collector.collect_once()
+            print(msg if success else f"Warning: {msg}")
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        print("Collector stopped")
+    finally:
+        collector.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
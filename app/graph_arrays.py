@@ -0,0 +1,500 @@
+"""
+Array-backed lineage graph for very large workloads.
+A networkx DiGraph keeps a dict of dicts per node for its adjacency and
+another dict for its attributes, including the full column list of every
+table. ArrayGraph keeps node attributes in typed columnar arrays, strings in
+packed UTF-8 buffers and edges in CSR (outgoing) and CSC (incoming) integer
+arrays. It can be saved as .npy files and memory-mapped back, and converts
+to and from networkx for exports and layouts.
+
+It implements the read-only part of the DiGraph interface the result views
+use (nodes, predecessors, successors, degrees, edges), so they work on
+either kind of graph.
+"""
+
+import os
+import json
+
+import numpy as np
+import pandas as pd
+import networkx as nx
+
+from app.catalog import split_table_name
+
+
+TABLE = 0
+QUERY = 1
+
+# Bits of the per-column flags array
+_NOT_NULL = 1
+_PRIMARY_KEY = 2
+
+
+class PackedStrings:
+    """Immutable list of strings stored as one UTF-8 buffer and offsets"""
+
+    def __init__(self, data, offsets):
+        """
+        Args:
+            data (numpy.ndarray): uint8 buffer of the concatenated strings
+            offsets (numpy.ndarray): int64 start of each string, plus the end
+        """
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_list(cls, strings):
+        encoded = [('' if s is None else str(s)).encode('utf-8') for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter((len(b) for b in encoded), dtype=np.int64, count=len(encoded)),
+                  out=offsets[1:])
+        data = np.frombuffer(b''.join(encoded), dtype=np.uint8).copy()
+        return cls(data, offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.data[self.offsets[i]:self.offsets[i + 1]]).decode('utf-8')
+
+    def __iter__(self):
+        buffer = self.data.tobytes()
+        offsets = self.offsets.tolist()
+        for start, end in zip(offsets, offsets[1:]):
+            yield buffer[start:end].decode('utf-8')
+
+    def tolist(self):
+        return list(self)
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + self.offsets.nbytes
+
+
+def _csr(n, heads, tails, values):
+    """Group edges by head node: returns offsets, tails and values in that order"""
+    order = np.lexsort((tails, heads))
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(heads, minlength=n), out=offsets[1:])
+    return offsets, tails[order], values[order]
+
+
+class _NodeView:
+    """Node ids of an ArrayGraph, with attribute dicts built on access like networkx"""
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __iter__(self):
+        return iter(self._graph.ids)
+
+    def __len__(self):
+        return len(self._graph.ids)
+
+    def __contains__(self, node):
+        return node in self._graph
+
+    def __getitem__(self, node):
+        return self._graph.node_attributes(self._graph.node_index(node))
+
+    def __call__(self, data=False):
+        if not data:
+            return iter(self._graph.ids)
+        graph = self._graph
+        return ((node, graph.node_attributes(i)) for i, node in enumerate(graph.ids))
+
+
+class ArrayGraph:
+    """Lineage graph held in columnar node arrays and CSR/CSC edge arrays"""
+
+    # Arrays written by save(); PackedStrings fields are stored as <name>.data/.offsets
+    _NODE_ARRAYS = ('kind', 'calls', 'rows', 'total_time', 'mean_time', 'queryid', 'dbid',
+                    'has_queryid', 'has_dbid', 'last_seen', 'col_offsets', 'col_names',
+                    'col_types', 'col_flags')
+    _EDGE_ARRAYS = ('out_offsets', 'out_targets', 'out_via', 'in_offsets', 'in_sources')
+    _ARRAYS = _NODE_ARRAYS + _EDGE_ARRAYS
+    _STRINGS = ('ids', 'text', 'text_hash', 'fallback', 'col_strings')
+
+    def __init__(self, **fields):
+        for name in self._ARRAYS + self._STRINGS:
+            setattr(self, name, fields[name])
+        self._index = None
+
+    def __getstate__(self):
+        # The id lookup dict is rebuilt on first use
+        state = self.__dict__.copy()
+        state['_index'] = None
+        return state
+
+    # Construction
+
+    @classmethod
+    def from_networkx(cls, G):
+        """
+        Convert a lineage graph built by PostgresQueryLineage.
+
+        Args:
+            G (networkx.DiGraph): Lineage graph
+
+        Returns:
+            ArrayGraph: The same nodes, attributes and edges
+        """
+        ids = list(G.nodes())
+        index = {node: i for i, node in enumerate(ids)}
+        n = len(ids)
+
+        kind = np.zeros(n, dtype=np.uint8)
+        calls = np.zeros(n, dtype=np.int64)
+        rows = np.zeros(n, dtype=np.int64)
+        total_time = np.zeros(n, dtype=np.float64)
+        mean_time = np.zeros(n, dtype=np.float64)
+        queryid = np.zeros(n, dtype=np.int64)
+        dbid = np.zeros(n, dtype=np.int64)
+        has_queryid = np.zeros(n, dtype=bool)
+        has_dbid = np.zeros(n, dtype=bool)
+        last_seen = np.full(n, np.nan)
+        text, text_hash, fallback = [], [], []
+
+        col_strings = {}
+        col_counts = np.zeros(n, dtype=np.int64)
+        col_names, col_types, col_flags = [], [], []
+
+        def intern(value):
+            value = '' if value is None else str(value)
+            return col_strings.setdefault(value, len(col_strings))
+
+        for i, (node, attrs) in enumerate(G.nodes(data=True)):
+            text.append(attrs.get('text', ''))
+            text_hash.append(attrs.get('text_hash', ''))
+            fallback.append(attrs.get('lineage_fallback', ''))
+            if attrs.get('type') == 'query':
+                kind[i] = QUERY
+                calls[i] = attrs.get('calls', 0) or 0
+                rows[i] = attrs.get('rows', 0) or 0
+                total_time[i] = attrs.get('total_time', 0) or 0
+                mean_time[i] = attrs.get('mean_time', 0) or 0
+                if attrs.get('queryid') is not None:
+                    queryid[i], has_queryid[i] = attrs['queryid'], True
+                if attrs.get('dbid') is not None:
+                    dbid[i], has_dbid[i] = attrs['dbid'], True
+                if attrs.get('last_seen') is not None:
+                    last_seen[i] = attrs['last_seen']
+                continue
+
+            columns = attrs.get('columns') or []
+            if isinstance(columns, str):
+                try:
+                    columns = json.loads(columns)
+                except ValueError:
+                    columns = []
+            col_counts[i] = len(columns)
+            for column in columns:
+                col_names.append(intern(column.get('name')))
+                col_types.append(intern(column.get('type')))
+                col_flags.append((_NOT_NULL if column.get('not_null') else 0)
+                                 | (_PRIMARY_KEY if column.get('is_primary_key') else 0))
+
+        col_offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(col_counts, out=col_offsets[1:])
+
+        edges = list(G.edges(data='via_query'))
+        sources = np.fromiter((index[u] for u, _, _ in edges), dtype=np.int32, count=len(edges))
+        targets = np.fromiter((index[v] for _, v, _ in edges), dtype=np.int32, count=len(edges))
+        via = np.fromiter((index.get(q, -1) if q is not None else -1 for _, _, q in edges),
+                          dtype=np.int32, count=len(edges))
+
+        graph = cls._with_edges(
+            dict(ids=PackedStrings.from_list(ids), kind=kind, calls=calls, rows=rows,
+                 total_time=total_time, mean_time=mean_time, queryid=queryid, dbid=dbid,
+                 has_queryid=has_queryid, has_dbid=has_dbid, last_seen=last_seen,
+                 text=PackedStrings.from_list(text), text_hash=PackedStrings.from_list(text_hash),
+                 fallback=PackedStrings.from_list(fallback), col_offsets=col_offsets,
+                 col_names=np.asarray(col_names, dtype=np.int32),
+                 col_types=np.asarray(col_types, dtype=np.int32),
+                 col_flags=np.asarray(col_flags, dtype=np.uint8),
+                 col_strings=PackedStrings.from_list(list(col_strings))),
+            sources, targets, via)
+        graph._index = index
+        return graph
+
+    @classmethod
+    def _with_edges(cls, node_fields, sources, targets, via):
+        """Build a graph from node fields and an edge list"""
+        n = len(node_fields['kind'])
+        out_offsets, out_targets, out_via = _csr(n, sources, targets, via)
+        in_offsets, in_sources, _ = _csr(n, targets, sources, via)
+        return cls(out_offsets=out_offsets, out_targets=out_targets, out_via=out_via,
+                   in_offsets=in_offsets, in_sources=in_sources, **node_fields)
+
+    def _node_fields(self):
+        return {name: getattr(self, name) for name in self._NODE_ARRAYS + self._STRINGS}
+
+    def edge_arrays(self):
+        """
+        Returns:
+            tuple: (sources, targets, via) int32 arrays; via is the query node
+                of a table-to-table edge, -1 for other edges
+        """
+        sources = np.repeat(np.arange(self.number_of_nodes(), dtype=np.int32),
+                            np.diff(self.out_offsets))
+        return sources, np.asarray(self.out_targets), np.asarray(self.out_via)
+
+    # Lineage computations
+
+    def with_table_edges(self):
+        """
+        Derive the direct table-to-table edges: every table a query reads
+        links to every table it writes, through that query. Existing
+        table-to-table edges are replaced. As in the networkx build, a table
+        pair linked through several queries keeps the last of them.
+
+        Returns:
+            ArrayGraph: New graph sharing this graph's node arrays
+        """
+        sources, targets, via = self.edge_arrays()
+        kind = np.asarray(self.kind)
+        keep = ~((kind[sources] == TABLE) & (kind[targets] == TABLE))
+        sources, targets, via = sources[keep], targets[keep], via[keep]
+
+        # Reads: table -> query; writes: query -> table, grouped by query
+        reads = (kind[sources] == TABLE) & (kind[targets] == QUERY)
+        read_tables, read_queries = sources[reads], targets[reads]
+        writes = (kind[sources] == QUERY) & (kind[targets] == TABLE)
+        write_queries, write_tables = sources[writes], targets[writes]
+        order = np.argsort(write_queries, kind='stable')
+        write_queries, write_tables = write_queries[order], write_tables[order]
+        n = self.number_of_nodes()
+        write_offsets = np.searchsorted(write_queries, np.arange(n + 1))
+
+        # Pair every read of a query with every write of the same query
+        counts = write_offsets[read_queries + 1] - write_offsets[read_queries]
+        total = int(counts.sum())
+        pair_src = np.repeat(read_tables, counts)
+        pair_via = np.repeat(read_queries, counts)
+        first = np.repeat(write_offsets[read_queries] - (np.cumsum(counts) - counts), counts)
+        pair_dst = write_tables[first + np.arange(total)] if total else write_tables[:0]
+
+        if total:
+            # One edge per table pair, through the last query in node order
+            order = np.lexsort((pair_via, pair_dst, pair_src))
+            pair_src, pair_dst, pair_via = pair_src[order], pair_dst[order], pair_via[order]
+            last = np.ones(total, dtype=bool)
+            last[:-1] = (pair_src[1:] != pair_src[:-1]) | (pair_dst[1:] != pair_dst[:-1])
+            pair_src, pair_dst, pair_via = pair_src[last], pair_dst[last], pair_via[last]
+
+        graph = self._with_edges(
+            self._node_fields(),
+            np.concatenate([sources, pair_src.astype(np.int32)]),
+            np.concatenate([targets, pair_dst.astype(np.int32)]),
+            np.concatenate([via, pair_via.astype(np.int32)]))
+        graph._index = self._index
+        return graph
+
+    def table_query_stats(self):
+        """
+        Per-table query counts and times, computed like
+        PostgresQueryLineage.get_table_query_stats() on a networkx graph:
+        predecessors count as read queries and successors as write
+        queries, and their total_time is summed.
+
+        Returns:
+            pandas.DataFrame: One row per table in node order, without columns
+        """
+        kind = np.asarray(self.kind)
+        tables = np.flatnonzero(kind == TABLE)
+        node_time = np.where(kind == QUERY, self.total_time, 0.0)
+        sources, targets, _ = self.edge_arrays()
+        n = self.number_of_nodes()
+        read_time = np.bincount(targets, weights=node_time[sources], minlength=n)
+        write_time = np.bincount(sources, weights=node_time[targets], minlength=n)
+        in_degree = np.diff(self.in_offsets)
+        out_degree = np.diff(self.out_offsets)
+
+        return pd.DataFrame({
+            'table_name': [self.ids[i] for i in tables],
+            'read_queries': in_degree[tables],
+            'write_queries': out_degree[tables],
+            'total_queries': in_degree[tables] + out_degree[tables],
+            'total_read_time': read_time[tables],
+            'total_write_time': write_time[tables],
+            'total_time': read_time[tables] + write_time[tables]
+        })
+
+    # DiGraph interface used by the result views
+
+    @property
+    def nodes(self):
+        return _NodeView(self)
+
+    def node_index(self, node):
+        """Position of a node id; raises KeyError for unknown nodes"""
+        if self._index is None:
+            self._index = {node_id: i for i, node_id in enumerate(self.ids)}
+        return self._index[node]
+
+    def node_attributes(self, i):
+        """Attribute dict of the node at position i, as in the networkx graph"""
+        node = self.ids[i]
+        if self.kind[i] == TABLE:
+            schema, table_name = split_table_name(node)
+            start, end = self.col_offsets[i], self.col_offsets[i + 1]
+            columns = [{'name': self.col_strings[int(name)], 'type': self.col_strings[int(col_type)],
+                        'not_null': bool(flags & _NOT_NULL), 'is_primary_key': bool(flags & _PRIMARY_KEY)}
+                       for name, col_type, flags in zip(self.col_names[start:end],
+                                                        self.col_types[start:end],
+                                                        self.col_flags[start:end])]
+            return {'type': 'table', 'columns': columns, 'schema': schema, 'display_name': table_name}
+
+        attrs = {
+            'type': 'query',
+            'text': self.text[i],
+            'calls': int(self.calls[i]),
+            'total_time': float(self.total_time[i]),
+            'mean_time': float(self.mean_time[i]),
+            'rows': int(self.rows[i])
+        }
+        if self.has_queryid[i]:
+            attrs['queryid'] = int(self.queryid[i])
+        if self.has_dbid[i]:
+            attrs['dbid'] = int(self.dbid[i])
+        if self.text_hash[i]:
+            attrs['text_hash'] = self.text_hash[i]
+        if not np.isnan(self.last_seen[i]):
+            attrs['last_seen'] = float(self.last_seen[i])
+        if self.fallback[i]:
+            attrs['lineage_fallback'] = self.fallback[i]
+        return attrs
+
+    def __contains__(self, node):
+        try:
+            self.node_index(node)
+            return True
+        except (KeyError, TypeError):
+            return False
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __len__(self):
+        return self.number_of_nodes()
+
+    def number_of_nodes(self):
+        return len(self.kind)
+
+    def number_of_edges(self):
+        return len(self.out_targets)
+
+    def successors(self, node):
+        i = self.node_index(node)
+        return (self.ids[int(j)] for j in self.out_targets[self.out_offsets[i]:self.out_offsets[i + 1]])
+
+    def predecessors(self, node):
+        i = self.node_index(node)
+        return (self.ids[int(j)] for j in self.in_sources[self.in_offsets[i]:self.in_offsets[i + 1]])
+
+    def out_degree(self, node):
+        i = self.node_index(node)
+        return int(self.out_offsets[i + 1] - self.out_offsets[i])
+
+    def in_degree(self, node):
+        i = self.node_index(node)
+        return int(self.in_offsets[i + 1] - self.in_offsets[i])
+
+    def edges(self):
+        ids = self.ids.tolist()
+        sources, targets, _ = self.edge_arrays()
+        return ((ids[u], ids[v]) for u, v in zip(sources.tolist(), targets.tolist()))
+
+    @property
+    def nbytes(self):
+        """Memory held by the arrays"""
+        total = sum(np.asarray(getattr(self, name)).nbytes for name in self._ARRAYS)
+        return total + sum(getattr(self, name).nbytes for name in self._STRINGS)
+
+    # Conversion and storage
+
+    def to_networkx(self):
+        """
+        Convert to a networkx DiGraph, for GraphML export and layouts.
+
+        Returns:
+            networkx.DiGraph: Graph with the same nodes, attributes and edges
+        """
+        G = nx.DiGraph()
+        ids = self.ids.tolist()
+        for i, node in enumerate(ids):
+            G.add_node(node, **self.node_attributes(i))
+        sources, targets, via = self.edge_arrays()
+        for u, v, q in zip(sources.tolist(), targets.tolist(), via.tolist()):
+            if q >= 0:
+                G.add_edge(ids[u], ids[v], via_query=ids[q])
+            else:
+                G.add_edge(ids[u], ids[v])
+        return G
+
+    def save(self, directory):
+        """Write the arrays as .npy files into a directory"""
+        os.makedirs(directory, exist_ok=True)
+        for name in self._ARRAYS:
+            np.save(os.path.join(directory, f"{name}.npy"), np.asarray(getattr(self, name)))
+        for name in self._STRINGS:
+            strings = getattr(self, name)
+            np.save(os.path.join(directory, f"{name}.data.npy"), strings.data)
+            np.save(os.path.join(directory, f"{name}.offsets.npy"), strings.offsets)
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """
+        Read a graph written by save().
+
+        Args:
+            directory (str): Directory the graph was saved to
+            mmap_mode (str, optional): numpy memory-map mode; 'r' maps the
+                arrays read-only instead of reading them, None reads them
+
+        Returns:
+            ArrayGraph: The graph
+        """
+        def load_array(name):
+            return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+
+        fields = {name: load_array(name) for name in cls._ARRAYS}
+        for name in cls._STRINGS:
+            fields[name] = PackedStrings(load_array(f"{name}.data"), load_array(f"{name}.offsets"))
+        return cls(**fields)
+
+
+def lineage_columns(G):
+    """
+    Integer view of the lineage edges of either kind of graph.
+
+    The direct table -> table edges are left out: they are shortcuts
+    through a query and add nothing to traversals or aggregations.
+
+    Args:
+        G (networkx.DiGraph or ArrayGraph): Lineage graph
+
+    Returns:
+        tuple: (node ids, is_table bool array, query total_time array with 0
+            for tables, edge sources, edge targets), edges as node positions
+    """
+    if isinstance(G, ArrayGraph):
+        nodes = G.ids.tolist()
+        kind = np.asarray(G.kind)
+        is_table = kind == TABLE
+        total_time = np.where(kind == QUERY, G.total_time, 0.0)
+        sources, targets, _ = G.edge_arrays()
+        sources, targets = sources.astype(np.int64), targets.astype(np.int64)
+    else:
+        nodes = list(G.nodes())
+        attrs = [attrs for _, attrs in G.nodes(data=True)]
+        is_table = np.array([a.get('type') == 'table' for a in attrs], dtype=bool)
+        total_time = np.array([0.0 if table else float(a.get('total_time') or 0)
+                               for a, table in zip(attrs, is_table)], dtype=np.float64)
+        position = {node: i for i, node in enumerate(nodes)}
+        edges = [(position[u], position[v]) for u, v in G.edges()]
+        sources = np.array([u for u, _ in edges], dtype=np.int64)
+        targets = np.array([v for _, v in edges], dtype=np.int64)
+
+    lineage = ~(is_table[sources] & is_table[targets])
+    return nodes, is_table, total_time, sources[lineage], targets[lineage]
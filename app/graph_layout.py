@@ -0,0 +1,442 @@
+"""
+Server-side layout of the lineage graph.
+Data flows from the tables a query reads to the tables it writes, so the
+graph is drawn in layers (Sugiyama style): strongly connected components
+are condensed, each component goes one layer right of the furthest one
+feeding it, and the order inside every layer is improved by barycenter
+sweeps to reduce edge crossings. The nodes of a cyclic component are
+spread over a block with a force layout whose repulsion is approximated
+on a grid of cell centroids once the component is large (a one-level
+Barnes-Hut), so no step is quadratic in the size of the graph.
+
+Positions are cached per graph fingerprint, in memory and on disk, so a
+graph is laid out once however often it is drawn. The latest layout of
+each connection target is remembered, and the next graph of that target
+keeps its positions for the nodes the two share.
+"""
+
+import os
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict, deque
+
+import numpy as np
+
+from app.graph_arrays import lineage_columns
+from app.reachability import _csr, _strong_components
+
+
+LAYOUT_VERSION = 1
+
+# Barycenter sweeps over the layers, alternating upstream and downstream
+ORDER_SWEEPS = 8
+
+# Cyclic components up to this size get exact pairwise repulsion
+EXACT_REPULSION_LIMIT = 500
+
+# Share of a graph's nodes an earlier layout must have placed to be reused
+REUSE_MIN_SHARE = 0.5
+
+
+def graph_fingerprint(G):
+    """
+    Hash of the nodes and lineage edges of a graph, the layout cache key.
+
+    Returns:
+        str: Hex digest that changes whenever a node or edge does
+    """
+    nodes, _, _, sources, targets = lineage_columns(G)
+    n = len(nodes)
+    order = sorted(range(n), key=nodes.__getitem__)
+    rank = np.empty(n, dtype=np.int64)
+    rank[order] = np.arange(n)
+    edges = np.unique(rank[sources] * max(n, 1) + rank[targets])
+
+    digest = hashlib.sha1(f"layout-v{LAYOUT_VERSION}\0".encode('utf-8'))
+    for i in order:
+        digest.update(nodes[i].encode('utf-8') + b'\0')
+    digest.update(edges.astype('<i8').tobytes())
+    return digest.hexdigest()
+
+
+def _push(pos, others, k, mass=None):
+    """Repulsion on pos from points (or weighted centroids) at others"""
+    dx = pos[:, 0, None] - others[None, :, 0]
+    dy = pos[:, 1, None] - others[None, :, 1]
+    weight = k * k / np.maximum(dx * dx + dy * dy, 1e-6)
+    if mass is not None:
+        weight *= mass
+    return weight, np.stack([(dx * weight).sum(1), (dy * weight).sum(1)], 1)
+
+
+def _repulsion(pos, k):
+    """Fruchterman-Reingold repulsion on every node"""
+    n = len(pos)
+    if n <= EXACT_REPULSION_LIMIT:
+        return _push(pos, pos, k)[1]
+
+    # Nodes in other cells are replaced by the centroid of their cell
+    grid = min(16, int(np.sqrt(n)))
+    low = pos.min(0)
+    span = float((pos.max(0) - low).max()) or 1.0
+    cell_xy = np.minimum(((pos - low) / span * grid).astype(np.int64), grid - 1)
+    cell = cell_xy[:, 0] * grid + cell_xy[:, 1]
+    mass = np.bincount(cell, minlength=grid * grid)
+    occupied = np.flatnonzero(mass)
+    centroids = np.stack([np.bincount(cell, weights=pos[:, 0], minlength=grid * grid)[occupied],
+                          np.bincount(cell, weights=pos[:, 1], minlength=grid * grid)[occupied]], 1)
+    centroids /= mass[occupied][:, None]
+    own = np.searchsorted(occupied, cell)
+
+    force = np.empty_like(pos)
+    for start in range(0, n, 2048):
+        chunk = slice(start, start + 2048)
+        weight, force[chunk] = _push(pos[chunk], centroids, k, mass[occupied])
+        # Take out the node's own cell, added back exactly below
+        rows = np.arange(len(weight))
+        force[chunk] -= (pos[chunk] - centroids[own[chunk]]) * weight[rows, own[chunk]][:, None]
+
+    # Nodes sharing a cell repel each other exactly
+    by_cell = np.argsort(cell, kind='stable')
+    bounds = np.searchsorted(cell[by_cell], occupied, side='right')
+    begin = 0
+    for end in bounds.tolist():
+        members = by_cell[begin:end]
+        begin = end
+        if len(members) > 1:
+            force[members] += _push(pos[members], pos[members], k)[1]
+    return force
+
+
+def force_layout(n, sources, targets, iterations=50, seed=0):
+    """
+    Fruchterman-Reingold layout of a small graph in the unit square.
+
+    Args:
+        n (int): Number of nodes
+        sources, targets (numpy.ndarray): Edges as node positions
+        iterations (int): Simulation steps
+        seed (int): Seed of the starting positions, so layouts repeat
+
+    Returns:
+        numpy.ndarray: (n, 2) positions
+    """
+    if n < 2:
+        return np.full((n, 2), 0.5)
+    pos = np.random.default_rng(seed).random((n, 2))
+    k = np.sqrt(1.0 / n)
+    step = 0.1
+    cooling = step / (iterations + 1)
+    for _ in range(iterations):
+        disp = _repulsion(pos, k)
+        delta = pos[sources] - pos[targets]
+        dist = np.maximum(np.hypot(delta[:, 0], delta[:, 1]), 1e-3)
+        pull = delta * (dist / k)[:, None]
+        np.add.at(disp, sources, -pull)
+        np.add.at(disp, targets, pull)
+        length = np.maximum(np.hypot(disp[:, 0], disp[:, 1]), 1e-3)
+        pos += disp * (np.minimum(length, step) / length)[:, None]
+        step -= cooling
+
+    low = pos.min(0)
+    span = pos.max(0) - low
+    return (pos - low) / np.where(span > 0, span, 1.0)
+
+
+def _stack(layer, heights, keys):
+    """
+    Centre of every unit when the units of each layer are stacked in key
+    order, each layer centred on 0.
+    """
+    order = np.lexsort((keys, layer))
+    sorted_layer = layer[order]
+    top = np.cumsum(heights[order]) - heights[order]
+    starts = np.searchsorted(sorted_layer, sorted_layer)
+    top -= top[starts]
+    totals = np.bincount(layer, weights=heights)
+    centre = np.empty(len(layer))
+    centre[order] = top + heights[order] / 2 - totals[sorted_layer] / 2
+    return centre
+
+
+def _layered_positions(n, sources, targets):
+    """x and y arrays of the layered layout of n nodes and their edges"""
+    offsets, out = _csr(n, sources, targets)
+    component, count = _strong_components(n, offsets, out)
+
+    # Condensation edges point from a component to a smaller one
+    heads, tails = component[sources], component[targets]
+    between = heads != tails
+    width = max(count, 1)
+    pairs = np.unique(heads[between] * width + tails[between])
+    heads, tails = pairs // width, pairs % width
+    child_offsets, children = _csr(count, heads, tails)
+    child_offsets, children_list = child_offsets.tolist(), children.tolist()
+
+    # Longest path from the sources fixes the sinks; every other component
+    # then moves up next to the earliest component it feeds, so a table
+    # read late in the flow is drawn beside its reader
+    layer = [0] * count
+    for c in range(count - 1, -1, -1):
+        for d in children_list[child_offsets[c]:child_offsets[c + 1]]:
+            if layer[d] <= layer[c]:
+                layer[d] = layer[c] + 1
+    for c in range(count):
+        feeds = children_list[child_offsets[c]:child_offsets[c + 1]]
+        if feeds:
+            layer[c] = min(layer[d] for d in feeds) - 1
+    layer = np.asarray(layer, dtype=np.int64)
+    layer -= layer.min()
+
+    # Cyclic components take a square block
+    members_offsets, members = _csr(count, component, np.arange(n, dtype=np.int64))
+    sizes = np.diff(members_offsets)
+    side = np.ceil(np.sqrt(sizes)).astype(np.float64)
+
+    # Barycenter ordering, alternating between parents and children
+    y = _stack(layer, side, np.arange(count))
+    for sweep in range(ORDER_SWEEPS):
+        if sweep % 2 == 0:
+            anchor, moved = heads, tails
+        else:
+            anchor, moved = tails, heads
+        total = np.bincount(moved, weights=y[anchor], minlength=count)
+        links = np.bincount(moved, minlength=count)
+        barycenter = np.where(links > 0, total / np.maximum(links, 1), y)
+        y = _stack(layer, side, barycenter)
+
+    # Layers are as wide as their widest block
+    layer_width = np.ones(layer.max() + 1)
+    np.maximum.at(layer_width, layer, side)
+    layer_x = np.cumsum(layer_width) - layer_width / 2
+
+    x_of = np.empty(n)
+    y_of = np.empty(n)
+    single = sizes == 1
+    lone = members[members_offsets[:-1][single]]
+    x_of[lone] = layer_x[layer[single]]
+    y_of[lone] = y[single]
+    for c in np.flatnonzero(~single).tolist():
+        block = members[members_offsets[c]:members_offsets[c + 1]]
+        local = np.full(n, -1, dtype=np.int64)
+        local[block] = np.arange(len(block))
+        inside = (component[sources] == c) & (component[targets] == c)
+        pos = force_layout(len(block), local[sources[inside]], local[targets[inside]], seed=c)
+        extent = side[c] - 1
+        x_of[block] = layer_x[layer[c]] + (pos[:, 0] - 0.5) * extent
+        y_of[block] = y[c] + (pos[:, 1] - 0.5) * extent
+
+    return x_of, y_of
+
+
+def layered_layout(G):
+    """
+    Layered left-to-right layout of a lineage graph.
+
+    Args:
+        G (networkx.DiGraph or ArrayGraph): Lineage graph
+
+    Returns:
+        dict: Node id to (x, y). x grows along the data flow, one unit
+            per layer; nodes in a layer are one unit apart.
+    """
+    nodes, _, _, sources, targets = lineage_columns(G)
+    if not nodes:
+        return {}
+    x_of, y_of = _layered_positions(len(nodes), sources, targets)
+    return {node: (float(x), float(y)) for node, x, y in zip(nodes, x_of.tolist(), y_of.tolist())}
+
+
+def incremental_layout(G, previous):
+    """
+    Layout that keeps the positions an earlier layout gave to the nodes
+    still in the graph, so a view of the next analysis looks like the last.
+
+    A new node goes one layer right of the placed nodes it reads from, or
+    left of those it writes to, in the free slot nearest to its placed
+    neighbours. New parts connected to no placed node are laid out on
+    their own below the rest. When fewer than REUSE_MIN_SHARE of the nodes
+    were placed before, the graph is laid out from scratch instead.
+
+    Args:
+        G (networkx.DiGraph or ArrayGraph): Lineage graph
+        previous (dict): Node id to (x, y) from an earlier layout
+
+    Returns:
+        dict: Node id to (x, y)
+    """
+    nodes, _, _, sources, targets = lineage_columns(G)
+    n = len(nodes)
+    placed = {i: tuple(previous[node]) for i, node in enumerate(nodes) if node in previous}
+    if n == 0 or len(placed) < REUSE_MIN_SHARE * n:
+        return layered_layout(G)
+
+    out_offsets, out = (a.tolist() for a in _csr(n, sources, targets))
+    in_offsets, inn = (a.tolist() for a in _csr(n, targets, sources))
+    occupied = {(round(x, 1), round(y)) for x, y in placed.values()}
+
+    def place(v):
+        reads = [placed[u] for u in inn[in_offsets[v]:in_offsets[v + 1]] if u in placed]
+        writes = [placed[w] for w in out[out_offsets[v]:out_offsets[v + 1]] if w in placed]
+        if reads:
+            x = max(px for px, _ in reads) + 1
+        else:
+            x = min(px for px, _ in writes) - 1
+        ys = [py for _, py in reads + writes]
+        wanted = round(sum(ys) / len(ys))
+        column = round(x, 1)
+        step = 0
+        while True:
+            free = [y for y in (wanted + step, wanted - step) if (column, y) not in occupied]
+            if free:
+                break
+            step += 1
+        occupied.add((column, free[0]))
+        placed[v] = (float(x), float(free[0]))
+
+    # Grow outwards from the nodes that keep their positions
+    queue = deque(placed)
+    while queue:
+        u = queue.popleft()
+        for v in out[out_offsets[u]:out_offsets[u + 1]] + inn[in_offsets[u]:in_offsets[u + 1]]:
+            if v not in placed:
+                place(v)
+                queue.append(v)
+
+    rest = np.array([i for i in range(n) if i not in placed], dtype=np.int64)
+    if len(rest):
+        local = np.full(n, -1, dtype=np.int64)
+        local[rest] = np.arange(len(rest))
+        inside = (local[sources] >= 0) & (local[targets] >= 0)
+        x_of, y_of = _layered_positions(len(rest), local[sources[inside]], local[targets[inside]])
+        left = min(x for x, _ in placed.values())
+        below = max(y for _, y in placed.values()) + 2
+        for i, x, y in zip(rest.tolist(), (x_of - x_of.min() + left).tolist(),
+                           (y_of - y_of.min() + below).tolist()):
+            placed[i] = (float(x), float(y))
+
+    return {nodes[i]: placed[i] for i in range(n)}
+
+
+class LayoutCache:
+    """Node positions per graph fingerprint, kept in memory and in a directory"""
+
+    def __init__(self, directory=None, max_entries=16):
+        """
+        Args:
+            directory (str, optional): Directory layouts are written to;
+                without one they are only kept in memory
+            max_entries (int): Layouts kept in memory
+        """
+        self.directory = directory
+        self.max_entries = max_entries
+        self._layouts = OrderedDict()
+        self._latest = {}
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, fingerprint):
+        return os.path.join(self.directory, f"{fingerprint}.npz")
+
+    def _target_path(self, target):
+        name = hashlib.sha256(target.encode('utf-8')).hexdigest()[:32]
+        return os.path.join(self.directory, f"{name}.latest")
+
+    def get(self, fingerprint):
+        """
+        Cached positions of a graph fingerprint.
+
+        Returns:
+            dict: Node id to (x, y), or None if the layout is not cached
+        """
+        with self._lock:
+            if fingerprint in self._layouts:
+                self._layouts.move_to_end(fingerprint)
+                return self._layouts[fingerprint]
+        if not self.directory or not os.path.exists(self._path(fingerprint)):
+            return None
+        try:
+            with np.load(self._path(fingerprint), allow_pickle=False) as data:
+                positions = {node: (float(x), float(y))
+                             for node, (x, y) in zip(data['ids'].tolist(), data['xy'].tolist())}
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Warning when reading cached layout {fingerprint}: {e}")
+            return None
+        self._remember(fingerprint, positions)
+        return positions
+
+    def put(self, fingerprint, positions):
+        """Cache the positions of a graph fingerprint"""
+        self._remember(fingerprint, positions)
+        if not self.directory:
+            return
+        ids = np.array(list(positions), dtype=str)
+        xy = np.array(list(positions.values()), dtype=np.float64).reshape(len(ids), 2)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.npz')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, ids=ids, xy=xy)
+            os.replace(tmp_path, self._path(fingerprint))
+        except OSError as e:
+            print(f"Warning when caching layout {fingerprint}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _remember(self, fingerprint, positions):
+        with self._lock:
+            self._layouts[fingerprint] = positions
+            self._layouts.move_to_end(fingerprint)
+            while len(self._layouts) > self.max_entries:
+                self._layouts.popitem(last=False)
+
+    def latest(self, target):
+        """
+        Positions of the graph last laid out for a connection target.
+
+        Returns:
+            dict: Node id to (x, y), or None if there is none
+        """
+        fingerprint = self._latest.get(target)
+        if fingerprint is None and self.directory and os.path.exists(self._target_path(target)):
+            try:
+                with open(self._target_path(target), encoding='utf-8') as f:
+                    fingerprint = f.read().strip()
+            except OSError as e:
+                print(f"Warning when reading latest layout for {target}: {e}")
+        return self.get(fingerprint) if fingerprint else None
+
+    def _set_latest(self, target, fingerprint):
+        if self._latest.get(target) == fingerprint:
+            return
+        self._latest[target] = fingerprint
+        if self.directory:
+            try:
+                with open(self._target_path(target), 'w', encoding='utf-8') as f:
+                    f.write(fingerprint)
+            except OSError as e:
+                print(f"Warning when storing latest layout for {target}: {e}")
+
+    def positions(self, G, target=None):
+        """
+        Positions of a graph, laid out on the first request.
+
+        Args:
+            G (networkx.DiGraph or ArrayGraph): Lineage graph
+            target (str, optional): Connection target the graph belongs
+                to. A new layout then keeps the positions of the target's
+                previous layout for the nodes it shares with it.
+
+        Returns:
+            dict: Node id to (x, y), see layered_layout()
+        """
+        fingerprint = graph_fingerprint(G)
+        positions = self.get(fingerprint)
+        if positions is None:
+            previous = self.latest(target) if target else None
+            positions = incremental_layout(G, previous) if previous else layered_layout(G)
+            self.put(fingerprint, positions)
+        if target:
+            self._set_latest(target, fingerprint)
+        return positions
@@ -0,0 +1,95 @@
+"""
+Stable query node identity and persisted lineage graphs.
+Query nodes are named after the pg_stat_statements entry they stand for,
+so the same statement has the same node in every analysis. That lets an
+analysis start from the graph of the previous one and only parse the
+statements that are new or whose text changed.
+"""
+
+import os
+import pickle
+import hashlib
+import tempfile
+import threading
+
+
+def query_node_id(queryid=None, dbid=None, query_text=None):
+    """
+    Name the lineage graph node of a statement.
+
+    Statements are identified by (dbid, queryid). Rows without a queryid,
+    such as tables from older analyses, are named after a hash of their
+    text instead.
+
+    Returns:
+        str: Node id such as 'Query_16384_-4417393451094839552'
+    """
+    if queryid is not None and queryid == queryid:  # NaN check
+        if dbid is not None and dbid == dbid:
+            return f"Query_{int(dbid)}_{int(queryid)}"
+        return f"Query_{int(queryid)}"
+    digest = hashlib.sha1((query_text or '').encode('utf-8')).hexdigest()
+    return f"Query_{digest[:16]}"
+
+
+def statement_digest(query_text, variant=''):
+    """Hash of a statement text and the parser that produced its edges"""
+    return hashlib.sha1(f"{variant}\0{query_text}".encode('utf-8')).hexdigest()[:16]
+
+
+class LineageGraphStore:
+    """Lineage graph of the latest analysis per connection target, pickled to a directory"""
+
+    def __init__(self, directory):
+        """
+        Args:
+            directory (str): Directory the graphs are written to
+        """
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, target):
+        name = hashlib.sha256(target.encode('utf-8')).hexdigest()[:32]
+        return os.path.join(self.directory, f"{name}.pkl")
+
+    def load(self, target):
+        """
+        Read the stored graph of a connection target.
+
+        Args:
+            target (str): Connection target, see server_profile.connection_target()
+
+        Returns:
+            networkx.DiGraph: The graph, or None if none is stored or it
+                cannot be read
+        """
+        path = self._path(target)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError) as e:
+            print(f"Warning when reading stored lineage graph for {target}: {e}")
+            return None
+
+    def save(self, target, G):
+        """Replace the stored graph of a connection target"""
+        path = self._path(target)
+        with self._lock:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    pickle.dump(G, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_path, path)
+            except (OSError, pickle.PicklingError) as e:
+                print(f"Warning when storing lineage graph for {target}: {e}")
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    def discard(self, target):
+        """Forget the stored graph of a connection target"""
+        path = self._path(target)
+        if os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,214 @@
+"""
+Background analysis jobs.
+Long-running analyses run on a bounded thread pool instead of inside the
+HTTP request. Each job reports which stage it is in, can be polled or
+streamed by id, and can be cancelled between stages.
+"""
+
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Stages of run_complete_analysis, in order
+ANALYSIS_STAGES = ('fetch', 'parse', 'catalog', 'graph', 'stats', 'layout', 'export')
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when it has been asked to stop"""
+
+
+class Job:
+    """State of one background job"""
+
+    def __init__(self, owner=None, stages=ANALYSIS_STAGES):
+        """
+        Args:
+            owner (str, optional): Token of the session that submitted the job
+            stages (tuple): Stage names reported by the job, in order
+        """
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.stages = stages
+        self.status = QUEUED
+        self.stage = None
+        self.message = 'Waiting for a free worker'
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.future = None
+        self._cancel = threading.Event()
+        self._changed = threading.Condition()
+        self.version = 0
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATES
+
+    @property
+    def progress(self):
+        """Fraction of stages completed, between 0 and 1"""
+        if self.status == SUCCEEDED:
+            return 1.0
+        if self.stage not in self.stages:
+            return 0.0
+        return self.stages.index(self.stage) / len(self.stages)
+
+    def _update(self, **changes):
+        with self._changed:
+            for name, value in changes.items():
+                setattr(self, name, value)
+            self.updated_at = time.time()
+            self.version += 1
+            self._changed.notify_all()
+
+    def report(self, stage, message=None):
+        """
+        Record that the job entered a stage. Raises JobCancelled if the job
+        has been cancelled, so work stops at the next stage boundary.
+
+        Args:
+            stage (str): One of the job's stages
+            message (str, optional): Human readable detail
+        """
+        if self._cancel.is_set():
+            raise JobCancelled()
+        self._update(stage=stage, message=message or f"Running {stage} stage")
+
+    def cancel(self):
+        """
+        Ask the job to stop.
+
+        Returns:
+            bool: False if the job had already finished
+        """
+        if self.finished:
+            return False
+        self._cancel.set()
+        if self.future is not None and self.future.cancel():
+            # Never started, so nothing else will finish it
+            self._update(status=CANCELLED, message='Cancelled before it started')
+        else:
+            self._update(message='Cancelling...')
+        return True
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def wait_for_change(self, version, timeout=None):
+        """
+        Block until the job state changes from version or timeout expires.
+
+        Returns:
+            int: The current version
+        """
+        with self._changed:
+            if self.version == version:
+                self._changed.wait(timeout)
+            return self.version
+
+    def to_dict(self):
+        """JSON-serializable status, without the result payload"""
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'stage': self.stage,
+            'stages': list(self.stages),
+            'progress': round(self.progress, 3),
+            'message': self.message,
+            'error': self.error,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at
+        }
+
+
+class JobManager:
+    """
+    Runs jobs on a bounded thread pool and keeps the most recent ones.
+
+    Finished jobs beyond max_retained are forgotten oldest first.
+    """
+
+    def __init__(self, max_workers=2, max_retained=50):
+        """
+        Args:
+            max_workers (int): Jobs that may run at the same time
+            max_retained (int): Jobs kept for status lookups
+        """
+        self.max_retained = max_retained
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='analysis')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def submit(self, func, *args, owner=None, **kwargs):
+        """
+        Queue func(job, *args, **kwargs) to run in the background.
+
+        func reports progress with job.report(stage) and returns the job's
+        result. JobCancelled raised from it marks the job as cancelled.
+
+        Returns:
+            Job: The queued job
+        """
+        job = Job(owner=owner)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._evict()
+        job.future = self._executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def _run(self, job, func, args, kwargs):
+        if job.cancel_requested:
+            job._update(status=CANCELLED, message='Cancelled before it started')
+            return
+        job._update(status=RUNNING, message='Starting')
+        try:
+            result = func(job, *args, **kwargs)
+        except JobCancelled:
+            job._update(status=CANCELLED, message='Cancelled')
+        except Exception as e:
+            job._update(status=FAILED, error=str(e), message=f"Failed: {str(e)}")
+        else:
+            job._update(status=SUCCEEDED, result=result, message='Completed')
+
+    def _evict(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        while len(self._jobs) > self.max_retained and finished:
+            del self._jobs[finished.pop(0)]
+
+    def get(self, job_id):
+        """Return the job with this id, or None"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """
+        Cancel a job by id.
+
+        Returns:
+            bool: True if a running or queued job was asked to stop
+        """
+        job = self.get(job_id)
+        return job.cancel() if job is not None else False
+
+    def shutdown(self, wait=False):
+        """Cancel outstanding jobs and stop the worker threads"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            job.cancel()
+        self._executor.shutdown(wait=wait)
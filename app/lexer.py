@@ -0,0 +1,383 @@
+"""
+Single-pass lineage lexer for PostgreSQL statements.
+A purpose-built alternative to sqlparse for extracting the relations a
+statement reads from and writes to. Tokens are produced by a generator and
+consumed by a small state machine, so no parse tree is ever built.
+"""
+
+import re
+
+
+# Token kinds produced by tokenize()
+WORD = 'word'          # Unquoted identifier or keyword, folded to lower case
+QUOTED = 'quoted'      # Double-quoted identifier, case preserved
+DOT = 'dot'
+COMMA = 'comma'
+LPAREN = 'lparen'
+RPAREN = 'rparen'
+SEMICOLON = 'semicolon'
+OPERATOR = 'operator'  # Run of operator characters such as =, > or ::
+
+_WORD_START = re.compile(r'[A-Za-z_\u0080-\uffff]')
+_WORD = re.compile(r'[A-Za-z0-9_$\u0080-\uffff]*')
+_NUMBER = re.compile(r'[0-9]*\.?[0-9]+(?:[eE][+-]?[0-9]+)?')
+_DOLLAR_TAG = re.compile(r'\$(?:[A-Za-z_\u0080-\uffff][A-Za-z0-9_\u0080-\uffff]*)?\$')
+_OPERATOR = re.compile(r'[-+*/<>=~!@#%^&|`?:]+')
+
+# Words that can never be a relation name where one is expected. Anything
+# else in FROM/JOIN/INTO position is treated as an identifier, matching how
+# PostgreSQL accepts most non-reserved keywords as names.
+RESERVED = frozenset((
+    'all', 'and', 'any', 'array', 'as', 'asc', 'between', 'by', 'case', 'cast',
+    'check', 'collate', 'column', 'constraint', 'create', 'cross', 'default',
+    'delete', 'desc', 'distinct', 'do', 'else', 'end', 'except', 'exists',
+    'false', 'fetch', 'for', 'foreign', 'from', 'full', 'group', 'having', 'ilike',
+    'in', 'inner', 'insert', 'intersect', 'into', 'is', 'join', 'lateral', 'left',
+    'like', 'limit', 'natural', 'not', 'null', 'offset', 'on', 'only', 'or',
+    'order', 'outer', 'primary', 'references', 'returning', 'right', 'select',
+    'set', 'similar', 'some', 'table', 'then', 'true', 'union', 'unique',
+    'update', 'using', 'values', 'when', 'where', 'window', 'with',
+))
+
+# Keywords that end a FROM/USING list at the current nesting level
+_FROM_TERMINATORS = frozenset((
+    'where', 'group', 'having', 'order', 'limit', 'offset', 'fetch', 'window',
+    'union', 'intersect', 'except', 'returning', 'set', 'values', 'select',
+    'for', 'when', 'do',
+))
+
+# Keywords that may precede a parenthesis holding a subquery rather than
+# function arguments
+_SUBQUERY_PRECEDERS = frozenset((
+    'from', 'join', 'in', 'exists', 'any', 'all', 'some', 'as', 'lateral',
+    'union', 'intersect', 'except', 'select', 'where', 'and', 'or', 'not',
+    'on', 'using', 'then', 'else', 'when', 'values', 'with', 'array', 'copy',
+))
+
+_CREATE_MODIFIERS = frozenset(('or', 'replace', 'global', 'local', 'temp',
+                               'temporary', 'unlogged', 'materialized'))
+
+
+def tokenize(sql):
+    """
+    Yield significant tokens from a SQL string.
+
+    Comments, whitespace, string literals, dollar-quoted bodies, numbers
+    and parameters are skipped without producing tokens. A run of operator
+    characters becomes a single OPERATOR token, so a parenthesis after a
+    comparison or assignment is not mistaken for a function call.
+
+    Args:
+        sql (str): SQL text
+
+    Yields:
+        tuple: (kind, value) where value is the folded or unquoted name for
+            WORD and QUOTED tokens and the punctuation or operator text otherwise
+    """
+    i = 0
+    n = len(sql)
+    while i < n:
+        ch = sql[i]
+
+        if ch.isspace():
+            i += 1
+        elif ch == '-' and sql.startswith('--', i):
+            newline = sql.find('\n', i)
+            i = n if newline == -1 else newline + 1
+        elif ch == '/' and sql.startswith('/*', i):
+            # Block comments nest in PostgreSQL
+            depth = 1
+            i += 2
+            while i < n and depth:
+                if sql.startswith('/*', i):
+                    depth += 1
+                    i += 2
+                elif sql.startswith('*/', i):
+                    depth -= 1
+                    i += 2
+                else:
+                    i += 1
+        elif ch == "'":
+            # String literal, '' escapes a quote and E'' strings allow \'
+            escape = i > 0 and sql[i - 1] in 'eE'
+            i += 1
+            while i < n:
+                if escape and sql[i] == '\\':
+                    i += 2
+                elif sql[i] == "'":
+                    if sql.startswith("''", i):
+                        i += 2
+                    else:
+                        i += 1
+                        break
+                else:
+                    i += 1
+        elif ch == '"':
+            end = i + 1
+            parts = []
+            while True:
+                close = sql.find('"', end)
+                if close == -1:
+                    parts.append(sql[end:])
+                    end = n
+                    break
+                parts.append(sql[end:close])
+                if sql.startswith('""', close):
+                    parts.append('"')
+                    end = close + 2
+                else:
+                    end = close + 1
+                    break
+            yield QUOTED, ''.join(parts)
+            i = end
+        elif ch == '$':
+            tag = _DOLLAR_TAG.match(sql, i)
+            if tag:
+                close = sql.find(tag.group(0), tag.end())
+                i = n if close == -1 else close + len(tag.group(0))
+            else:
+                # Positional parameter such as $1
+                i += 1
+                while i < n and sql[i].isdigit():
+                    i += 1
+        elif _WORD_START.match(ch):
+            end = _WORD.match(sql, i + 1).end()
+            # E'', B'', X'' and U&'' prefixes belong to the string literal
+            if end < n and sql[end] == "'" and end - i == 1 and ch in 'eEbBxXnN':
+                i = end
+                continue
+            yield WORD, sql[i:end].lower()
+            i = end
+        elif ch.isdigit() or (ch == '.' and i + 1 < n and sql[i + 1].isdigit()):
+            i = _NUMBER.match(sql, i).end()
+        elif ch == '.':
+            yield DOT, ch
+            i += 1
+        elif ch == ',':
+            yield COMMA, ch
+            i += 1
+        elif ch == '(':
+            yield LPAREN, ch
+            i += 1
+        elif ch == ')':
+            yield RPAREN, ch
+            i += 1
+        elif ch == ';':
+            yield SEMICOLON, ch
+            i += 1
+        else:
+            operator = _OPERATOR.match(sql, i)
+            if operator:
+                # As in PostgreSQL, -- and /* end an operator and start a comment
+                end = operator.end()
+                for comment in ('--', '/*'):
+                    start = sql.find(comment, i + 1, end)
+                    if start != -1:
+                        end = min(end, start)
+                yield OPERATOR, sql[i:end]
+                i = end
+            else:
+                i += 1
+
+
+class _Frame:
+    """Per-parenthesis state for the extractor"""
+    __slots__ = ('is_call', 'in_from', 'after_join')
+
+    def __init__(self, is_call):
+        self.is_call = is_call
+        self.in_from = False
+        self.after_join = False   # A JOIN was read, so USING names columns
+
+
+def extract_relations(sql):
+    """
+    Extract the relations a statement reads from and writes to.
+
+    Recognises FROM and JOIN lists at any nesting level, including
+    parenthesized join lists, INSERT/SELECT/MERGE INTO, UPDATE, DELETE FROM,
+    the USING list of DELETE and MERGE, CREATE TABLE / VIEW targets and the
+    table of COPY ... FROM (a destination) or COPY ... TO (a source). The
+    column list of JOIN ... USING is skipped. Names defined by WITH are not
+    reported, and names followed by a parenthesis in FROM position are
+    treated as set-returning functions.
+
+    Args:
+        sql (str): SQL text
+
+    Returns:
+        tuple: (source_tables, destination_tables), each in order of first
+            appearance without duplicates. Tables that are written are not
+            repeated as sources.
+    """
+    sources = []
+    destinations = []
+    cte_names = set()
+
+    frames = [_Frame(False)]
+    prev_kind = None      # Kind of the previous token
+    prev_word = None      # Value of the previous token if it was a WORD
+
+    expect = None         # 'source' or 'dest' while a relation name is expected
+    name_parts = None     # Parts of the relation name being read
+    name_role = None
+    after_dot = False
+
+    pending_cte = False   # Next identifier names a common table expression
+    cte_depth = None      # Frame depth of the WITH list being read
+    cte_after_body = False
+    create_seen = False
+    delete_seen = False
+    using_relations = False   # DELETE or MERGE, where USING lists relations
+    copy_seen = False     # Inside a COPY statement before its FROM or TO
+    copy_table = None
+
+    for kind, value in tokenize(sql):
+        frame = frames[-1]
+
+        # Continue or finish a (possibly schema qualified) relation name
+        if name_parts is not None:
+            if kind == DOT and not after_dot:
+                after_dot = True
+                prev_kind, prev_word = kind, None
+                continue
+            if after_dot and kind in (WORD, QUOTED):
+                name_parts.append(value)
+                after_dot = False
+                prev_kind, prev_word = kind, None
+                continue
+            # A name directly followed by ( in FROM position is a function
+            if name_role == 'copy':
+                copy_table = '.'.join(name_parts)
+            elif kind != LPAREN or name_role == 'dest':
+                name = '.'.join(name_parts)
+                target = destinations if name_role == 'dest' else sources
+                if name not in target:
+                    target.append(name)
+            name_parts = None
+            after_dot = False
+
+        # A closed CTE body is followed by a comma and another CTE, or by
+        # the main statement
+        if cte_after_body:
+            cte_after_body = False
+            if kind == COMMA:
+                pending_cte = True
+                prev_kind, prev_word = kind, None
+                continue
+            if not (kind == WORD and value == 'as'):
+                cte_depth = None
+
+        if pending_cte and kind in (WORD, QUOTED):
+            if not (kind == WORD and value == 'recursive'):
+                cte_names.add(value)
+                pending_cte = False
+                cte_depth = len(frames)
+            prev_kind, prev_word = kind, None
+            continue
+
+        if expect is not None and kind in (WORD, QUOTED):
+            if kind == WORD and value in ('only', 'lateral', 'if', 'not', 'exists'):
+                prev_kind, prev_word = kind, value
+                continue
+            if kind == QUOTED or value not in RESERVED:
+                name_parts = [value]
+                name_role = expect
+                expect = None
+                prev_kind, prev_word = kind, None
+                continue
+        # FROM ( or JOIN ( may open a parenthesized join list
+        opens_from = kind == LPAREN and expect == 'source'
+        if kind != WORD:
+            expect = None
+
+        if kind == WORD:
+            word = value
+            if not frame.is_call:
+                if word == 'with' and prev_kind in (None, SEMICOLON, LPAREN):
+                    pending_cte = True
+                elif copy_seen and len(frames) == 1 and word in ('from', 'to'):
+                    # COPY t FROM loads t, COPY t TO reads it. What follows is
+                    # STDIN, STDOUT, PROGRAM or a file name, not a relation.
+                    if copy_table is not None:
+                        target = destinations if word == 'from' else sources
+                        if copy_table not in target:
+                            target.append(copy_table)
+                    copy_seen = False
+                elif word == 'copy' and prev_kind in (None, SEMICOLON):
+                    expect = 'copy'
+                    copy_seen = True
+                elif word == 'using' and (frame.after_join or not using_relations):
+                    # JOIN ... USING (columns)
+                    expect = None
+                elif word in ('from', 'using'):
+                    if delete_seen and word == 'from':
+                        expect = 'dest'
+                    else:
+                        expect = 'source'
+                        frame.in_from = True
+                        frame.after_join = False
+                    delete_seen = False
+                elif word == 'join':
+                    expect = 'source'
+                    frame.in_from = True
+                    frame.after_join = True
+                elif word == 'into':
+                    expect = 'dest'
+                    frame.in_from = False
+                elif word == 'update' and prev_kind in (None, SEMICOLON, LPAREN, RPAREN):
+                    expect = 'dest'
+                elif word == 'delete' and prev_kind in (None, SEMICOLON, LPAREN, RPAREN):
+                    delete_seen = using_relations = True
+                elif word == 'merge' and prev_kind in (None, SEMICOLON, LPAREN, RPAREN):
+                    using_relations = True
+                elif word in ('table', 'view') and create_seen:
+                    expect = 'dest'
+                elif word in _FROM_TERMINATORS:
+                    expect = None
+                    frame.in_from = False
+                create_seen = word == 'create' or (create_seen and word in _CREATE_MODIFIERS)
+            prev_kind, prev_word = kind, word
+        elif kind == LPAREN:
+            is_call = prev_kind == QUOTED or (
+                prev_word is not None
+                and prev_word not in _SUBQUERY_PRECEDERS
+                and prev_word not in RESERVED
+            )
+            frames.append(_Frame(is_call))
+            if opens_from:
+                frames[-1].in_from = True
+                expect = 'source'
+            prev_kind, prev_word = kind, None
+        elif kind == RPAREN:
+            if len(frames) > 1:
+                frames.pop()
+            if cte_depth is not None:
+                if len(frames) == cte_depth:
+                    cte_after_body = True
+                elif len(frames) < cte_depth:
+                    cte_depth = None
+            prev_kind, prev_word = kind, None
+        elif kind == COMMA:
+            if frame.in_from and not frame.is_call:
+                expect = 'source'
+            prev_kind, prev_word = kind, None
+        elif kind == SEMICOLON:
+            frames = [_Frame(False)]
+            cte_depth = None
+            create_seen = delete_seen = pending_cte = cte_after_body = copy_seen = False
+            using_relations = False
+            copy_table = None
+            prev_kind, prev_word = kind, None
+        else:
+            prev_kind, prev_word = kind, None
+
+    if name_parts is not None:
+        name = '.'.join(name_parts)
+        target = destinations if name_role == 'dest' else sources
+        if name not in target:
+            target.append(name)
+
+    sources = [t for t in sources if t not in cte_names and t not in destinations]
+    destinations = [t for t in destinations if t not in cte_names]
+    return sources, destinations
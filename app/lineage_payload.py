@@ -0,0 +1,217 @@
+"""
+Compact node-link payload of a lineage graph for the D3 view.
+The payload is built once when an analysis finishes and stored gzipped, so
+/lineage serves bytes instead of walking the graph per request. Nodes are
+stored column by column and referenced by integer index; repeated strings
+(node types, schemas, column data types) are interned in a string table.
+Node positions from the server-side layout (app.graph_layout) ship with
+the nodes, so the browser draws them instead of simulating a layout.
+"""
+
+import gzip
+import json
+
+import numpy as np
+
+from app.catalog import split_table_name
+from app.graph_arrays import QUERY, ArrayGraph
+
+
+PAYLOAD_VERSION = 2
+
+
+class _StringTable:
+    """Interns strings and hands out their index"""
+
+    def __init__(self):
+        self.strings = []
+        self._index = {}
+
+    def __call__(self, value):
+        value = '' if value is None else str(value)
+        index = self._index.get(value)
+        if index is None:
+            index = self._index[value] = len(self.strings)
+            self.strings.append(value)
+        return index
+
+
+def _number(value, kind=float):
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _add_positions(payload, positions):
+    """Add the x and y columns of the payload nodes, null where unknown"""
+    x, y = [], []
+    for node in payload['nodes']['id']:
+        xy = positions.get(node)
+        x.append(None if xy is None else round(xy[0], 2))
+        y.append(None if xy is None else round(xy[1], 2))
+    payload['nodes']['x'] = x
+    payload['nodes']['y'] = y
+    return payload
+
+
+def build_payload(G, nodes=None, positions=None):
+    """
+    Build the compact payload of a lineage graph.
+
+    Per node the payload has its id, interned type and schema, a label
+    (table name or query preview), in- and out-degree, the query metrics
+    (0 for tables) and, for tables, the columns as
+    [name, interned data type, not_null, is_primary_key] rows. With
+    positions it also has x and y in layout units.
+
+    Args:
+        G (networkx.DiGraph or ArrayGraph): Lineage graph
+        nodes (list, optional): Only include these nodes and the links
+            between them. Degrees still count every edge in G, so a client
+            can tell which nodes have neighbours it has not loaded.
+        positions (dict, optional): Node id to (x, y), see
+            app.graph_layout.LayoutCache.positions()
+
+    Returns:
+        dict: JSON-serializable payload
+    """
+    if isinstance(G, ArrayGraph):
+        payload = _build_payload_arrays(G, None if nodes is None else [G.node_index(n) for n in nodes])
+        return payload if positions is None else _add_positions(payload, positions)
+
+    intern = _StringTable()
+    selected = G.nodes(data=True) if nodes is None else [(node, G.nodes[node]) for node in nodes]
+    index = {node: i for i, (node, _) in enumerate(selected)}
+    nodes = {name: [] for name in ('id', 'type', 'schema', 'label', 'in_degree', 'out_degree',
+                                   'total_time', 'calls', 'mean_time', 'rows', 'columns')}
+
+    for node, attrs in selected:
+        node_type = attrs.get('type', 'unknown')
+        nodes['id'].append(str(node))
+        nodes['type'].append(intern(node_type))
+        nodes['in_degree'].append(G.in_degree(node))
+        nodes['out_degree'].append(G.out_degree(node))
+
+        if node_type == 'table':
+            schema, table_name = split_table_name(str(node))
+            columns = attrs.get('columns') or []
+            if isinstance(columns, str):
+                try:
+                    columns = json.loads(columns)
+                except ValueError:
+                    columns = []
+            nodes['schema'].append(intern(schema))
+            nodes['label'].append(table_name)
+            nodes['columns'].append([[c.get('name'), intern(c.get('type')),
+                                      int(bool(c.get('not_null'))), int(bool(c.get('is_primary_key')))]
+                                     for c in columns])
+            metrics = (0, 0, 0, 0)
+        else:
+            nodes['schema'].append(intern(None))
+            nodes['label'].append(attrs.get('text', 'Query text not available'))
+            nodes['columns'].append(None)
+            metrics = (_number(attrs.get('total_time')), _number(attrs.get('calls'), int),
+                       _number(attrs.get('mean_time')), _number(attrs.get('rows'), int))
+
+        for name, value in zip(('total_time', 'calls', 'mean_time', 'rows'), metrics):
+            nodes[name].append(value)
+
+    links = {'source': [], 'target': []}
+    edges = G.edges() if len(index) == G.number_of_nodes() else (
+        (source, target) for source in index for target in G.successors(source) if target in index)
+    for source, target in edges:
+        links['source'].append(index[source])
+        links['target'].append(index[target])
+
+    payload = {
+        'version': PAYLOAD_VERSION,
+        'strings': intern.strings,
+        'nodes': nodes,
+        'links': links
+    }
+    return payload if positions is None else _add_positions(payload, positions)
+
+
+def _build_payload_arrays(G, indices=None):
+    """build_payload() for an ArrayGraph, reading its columns directly"""
+    intern = _StringTable()
+    table_type, query_type, no_schema = intern('table'), intern('query'), intern(None)
+    n = G.number_of_nodes()
+    indices = np.arange(n) if indices is None else np.asarray(indices, dtype=np.int64)
+    is_query = (np.asarray(G.kind) == QUERY)[indices]
+    col_offsets = G.col_offsets
+    col_flags = np.asarray(G.col_flags)
+
+    ids, types, schemas, labels, columns = [], [], [], [], []
+    for i, query in zip(indices.tolist(), is_query.tolist()):
+        node = G.ids[i]
+        ids.append(node)
+        if query:
+            types.append(query_type)
+            schemas.append(no_schema)
+            labels.append(G.text[i] or 'Query text not available')
+            columns.append(None)
+            continue
+        schema, table_name = split_table_name(node)
+        types.append(table_type)
+        schemas.append(intern(schema))
+        labels.append(table_name)
+        start, end = int(col_offsets[i]), int(col_offsets[i + 1])
+        columns.append([[G.col_strings[int(name)], intern(G.col_strings[int(col_type)]),
+                         int(flags & 1), int((flags >> 1) & 1)]
+                        for name, col_type, flags in zip(G.col_names[start:end],
+                                                         G.col_types[start:end],
+                                                         col_flags[start:end])])
+
+    def metric(values, kind):
+        return np.where(is_query, np.asarray(values)[indices], 0).astype(kind).tolist()
+
+    # Links between the selected nodes, renumbered to payload positions
+    payload_index = np.full(n, -1, dtype=np.int64)
+    payload_index[indices] = np.arange(len(indices))
+    sources, targets, _ = G.edge_arrays()
+    sources, targets = payload_index[sources], payload_index[targets]
+    keep = (sources >= 0) & (targets >= 0)
+    return {
+        'version': PAYLOAD_VERSION,
+        'strings': intern.strings,
+        'nodes': {
+            'id': ids,
+            'type': types,
+            'schema': schemas,
+            'label': labels,
+            'in_degree': np.diff(G.in_offsets)[indices].tolist(),
+            'out_degree': np.diff(G.out_offsets)[indices].tolist(),
+            'total_time': metric(G.total_time, float),
+            'calls': metric(G.calls, int),
+            'mean_time': metric(G.mean_time, float),
+            'rows': metric(G.rows, int),
+            'columns': columns
+        },
+        'links': {'source': sources[keep].tolist(), 'target': targets[keep].tolist()}
+    }
+
+
+def encode_payload(payload):
+    """Serialize a payload as gzipped compact JSON"""
+    data = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+def write_payload(G, output_file, positions=None):
+    """
+    Write the gzipped payload of a lineage graph.
+
+    Args:
+        G (networkx.DiGraph or ArrayGraph): Lineage graph
+        output_file (str): Path of the payload
+        positions (dict, optional): Node positions to include
+
+    Returns:
+        bytes: The gzipped payload that was written
+    """
+    encoded = encode_payload(build_payload(G, positions=positions))
+    with open(output_file, 'wb') as f:
+        f.write(encoded)
+    return encoded
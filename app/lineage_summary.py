@@ -0,0 +1,185 @@
+"""
+Schema and component summaries of the lineage graph.
+Large graphs are first shown as one super-node per schema, or per weakly
+connected component, with links weighted by the number of queries moving
+data between them and their total time. The summary is computed from
+integer edge arrays, so its payload and the first render scale with the
+number of groups rather than tables. A group is expanded on demand into
+its tables and the queries that touch them.
+"""
+
+import numpy as np
+
+from app.catalog import split_table_name
+from app.graph_arrays import lineage_columns
+
+
+GROUPINGS = ('schema', 'component')
+SUMMARY_VERSION = 1
+
+
+def _weak_components(n, sources, targets):
+    """Root node of the weakly connected component of every node (union-find)"""
+    parent = list(range(n))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for u, v in zip(sources.tolist(), targets.tolist()):
+        root_u, root_v = find(u), find(v)
+        if root_u != root_v:
+            parent[root_u] = root_v
+    return np.array([find(x) for x in range(n)], dtype=np.int64)
+
+
+def _unique_pairs(heads, tails, width):
+    """Distinct (head, tail) pairs, sorted by head"""
+    keys = np.unique(heads * width + tails)
+    return keys // width, keys % width
+
+
+class LineageSummary:
+    """Tables of a lineage graph collapsed into schema or component groups"""
+
+    def __init__(self, G, group_by='schema'):
+        """
+        Args:
+            G (networkx.DiGraph or ArrayGraph): Lineage graph
+            group_by (str): 'schema' or 'component'
+
+        Raises:
+            ValueError: For an unknown grouping
+        """
+        if group_by not in GROUPINGS:
+            raise ValueError(f"Unknown grouping '{group_by}', expected one of {GROUPINGS}")
+        self.group_by = group_by
+        self.nodes, self.is_table, self.total_time, sources, targets = lineage_columns(G)
+        n = len(self.nodes)
+        tables = np.flatnonzero(self.is_table)
+        self.degree = np.bincount(sources, minlength=n) + np.bincount(targets, minlength=n)
+
+        # Group of every table, numbered by first appearance for now
+        if group_by == 'schema':
+            keys = [split_table_name(self.nodes[i])[0] for i in tables]
+        else:
+            keys = _weak_components(n, sources, targets)[tables].tolist()
+        first_seen = {}
+        table_group = np.full(n, -1, dtype=np.int64)
+        table_group[tables] = [first_seen.setdefault(key, len(first_seen)) for key in keys]
+
+        # Largest groups first
+        sizes = np.bincount(table_group[tables], minlength=len(first_seen))
+        order = np.argsort(-sizes, kind='stable')
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        table_group[tables] = rank[table_group[tables]]
+        self.table_group = table_group
+        self.group_sizes = sizes[order]
+        group_keys = list(first_seen)
+        group_keys = [group_keys[g] for g in order]
+        count = len(group_keys)
+
+        # The best connected table of each group names components
+        best = {}
+        for i in tables[np.argsort(-self.degree[tables], kind='stable')].tolist():
+            best.setdefault(int(table_group[i]), i)
+        if group_by == 'schema':
+            self.group_ids = [str(key) for key in group_keys]
+            self.group_labels = list(self.group_ids)
+        else:
+            self.group_ids = [f"component-{g}" for g in range(count)]
+            self.group_labels = [self.nodes[best[g]] for g in range(count)]
+        self._group_index = {group_id: g for g, group_id in enumerate(self.group_ids)}
+
+        # (table, query) pairs of every read and write
+        reads = self.is_table[sources]
+        writes = self.is_table[targets]
+        self._touch_tables = np.concatenate([sources[reads], targets[writes]])
+        self._touch_queries = np.concatenate([targets[reads], sources[writes]])
+
+        # Queries touching each group and their time
+        width = max(n, 1)
+        touch_groups, touch_queries = _unique_pairs(
+            table_group[self._touch_tables], self._touch_queries, width)
+        self.group_queries = np.bincount(touch_groups, minlength=count)
+        self.group_time = np.bincount(touch_groups, weights=self.total_time[touch_queries],
+                                      minlength=count)
+
+        # Every group a query reads from links to every group it writes to
+        read_queries, read_groups = _unique_pairs(targets[reads], table_group[sources[reads]], width)
+        write_queries, write_groups = _unique_pairs(sources[writes], table_group[targets[writes]], width)
+        write_offsets = np.searchsorted(write_queries, np.arange(n + 1))
+        counts = write_offsets[read_queries + 1] - write_offsets[read_queries]
+        total = int(counts.sum())
+        link_queries = np.repeat(read_queries, counts)
+        link_sources = np.repeat(read_groups, counts)
+        first = np.repeat(write_offsets[read_queries] - (np.cumsum(counts) - counts), counts)
+        link_targets = write_groups[first + np.arange(total)] if total else write_groups[:0]
+        between = link_sources != link_targets
+        group_width = max(count, 1)
+        link_keys, inverse = np.unique(link_sources[between] * group_width + link_targets[between],
+                                       return_inverse=True)
+        self.link_sources = link_keys // group_width
+        self.link_targets = link_keys % group_width
+        self.link_queries = np.bincount(inverse, minlength=len(link_keys))
+        self.link_time = np.bincount(inverse, weights=self.total_time[link_queries[between]],
+                                     minlength=len(link_keys))
+
+    def __contains__(self, group_id):
+        return group_id in self._group_index
+
+    def __len__(self):
+        return len(self.group_ids)
+
+    def payload(self):
+        """
+        JSON-serializable summary: one entry per group with its table count,
+        the number of queries touching it and their total time, and one
+        link per pair of groups data flows between.
+        """
+        return {
+            'version': SUMMARY_VERSION,
+            'group_by': self.group_by,
+            'groups': {
+                'id': self.group_ids,
+                'label': self.group_labels,
+                'tables': self.group_sizes.tolist(),
+                'queries': self.group_queries.tolist(),
+                'total_time': self.group_time.tolist()
+            },
+            'links': {
+                'source': self.link_sources.tolist(),
+                'target': self.link_targets.tolist(),
+                'queries': self.link_queries.tolist(),
+                'total_time': self.link_time.tolist()
+            }
+        }
+
+    def members(self, group_id, max_nodes=None):
+        """
+        Tables of a group and the queries that read or write them.
+
+        Args:
+            group_id (str): Group id from the payload
+            max_nodes (int, optional): Return at most this many nodes. Half
+                of them go to the best connected tables, the rest to the
+                most expensive queries touching those tables.
+
+        Returns:
+            list: Node ids, tables first, or None for an unknown group
+        """
+        g = self._group_index.get(group_id)
+        if g is None:
+            return None
+        tables = np.flatnonzero(self.table_group == g)
+        tables = tables[np.argsort(-self.degree[tables], kind='stable')]
+        if max_nodes is not None:
+            tables = tables[:max(1, max_nodes // 2)]
+        queries = np.unique(self._touch_queries[np.isin(self._touch_tables, tables)])
+        queries = queries[np.argsort(-self.total_time[queries], kind='stable')]
+        if max_nodes is not None:
+            queries = queries[:max(0, max_nodes - len(tables))]
+        return [self.nodes[i] for i in tables.tolist() + queries.tolist()]
@@ -0,0 +1,174 @@
+"""
+Memoized SQL lineage parse results.
+pg_stat_statements texts are normalized and rarely change between analyses,
+so the (source_tables, destination_tables) extracted from a statement can be
+reused instead of running the SQL parser again.
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+class ParseCache:
+    """
+    Size-bounded LRU cache of table dependency parse results.
+
+    Entries are keyed by queryid plus a hash of the query text, so a reused
+    queryid with a different text never returns a stale result. An optional
+    variant (the parser backend) keeps results from different extractors
+    apart. The cache is safe to share between analyses running in different
+    threads.
+    """
+
+    def __init__(self, max_entries=10000, path=None):
+        """
+        Args:
+            max_entries (int): Maximum number of parse results to keep
+            path (str, optional): JSON file used by load() and save()
+        """
+        self.max_entries = max_entries
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def make_key(query_text, queryid=None, variant=''):
+        """Build the cache key for a query text and optional queryid"""
+        digest = hashlib.sha1(query_text.encode('utf-8')).hexdigest()
+        return f"{variant}:{queryid if queryid is not None else ''}:{digest}"
+
+    def get(self, query_text, queryid=None, variant=''):
+        """
+        Look up a cached parse result.
+
+        Args:
+            query_text (str): SQL query text
+            queryid (int, optional): pg_stat_statements queryid
+            variant (str): Parser backend the result was produced by
+
+        Returns:
+            tuple: (source_tables, destination_tables), or None on a miss
+        """
+        entry = self.get_entry(query_text, queryid, variant)
+        return entry[:2] if entry is not None else None
+
+    def get_entry(self, query_text, queryid=None, variant=''):
+        """
+        Look up a cached parse result together with its fallback reason.
+
+        Returns:
+            tuple: (source_tables, destination_tables, fallback_reason), or
+                None on a miss
+        """
+        key = self.make_key(query_text, queryid, variant)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return list(entry[0]), list(entry[1]), entry[2]
+
+    def put(self, query_text, result, queryid=None, variant='', fallback=None):
+        """
+        Store a parse result, evicting the least recently used entries.
+
+        Args:
+            query_text (str): SQL query text
+            result (tuple): (source_tables, destination_tables)
+            queryid (int, optional): pg_stat_statements queryid
+            variant (str): Parser backend the result was produced by
+            fallback (str, optional): Why the keyword scanner was used
+                instead of the configured parser
+        """
+        key = self.make_key(query_text, queryid, variant)
+        source_tables, destination_tables = result
+        with self._lock:
+            self._entries[key] = (tuple(source_tables), tuple(destination_tables), fallback)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._dirty = True
+
+    def clear(self):
+        """Remove all entries and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+            self._dirty = True
+
+    def stats(self):
+        """Return hit/miss counters and the current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'hit_ratio': self.hits / lookups if lookups else 0.0
+            }
+
+    def load(self):
+        """
+        Load entries from the on-disk store, if one is configured.
+
+        Returns:
+            int: Number of entries loaded
+        """
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        try:
+            with open(self.path, 'r') as f:
+                stored = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Warning when reading parse cache {self.path}: {e}")
+            return 0
+
+        with self._lock:
+            # Stored oldest first, so replaying keeps the LRU order
+            for key, value in stored.get('entries', []):
+                fallback = value[2] if len(value) > 2 else None
+                self._entries[key] = (tuple(value[0]), tuple(value[1]), fallback)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = False
+            return len(self._entries)
+
+    def save(self):
+        """Write the entries to the on-disk store if anything changed"""
+        if not self.path:
+            return False
+        with self._lock:
+            if not self._dirty:
+                return False
+            entries = [[key, [list(value[0]), list(value[1]), value[2]]]
+                       for key, value in self._entries.items()]
+            self._dirty = False
+
+        directory = os.path.dirname(self.path) or '.'
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'entries': entries}, f)
+            os.replace(tmp_path, self.path)
+            return True
+        except OSError as e:
+            print(f"Warning when writing parse cache {self.path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
@@ -0,0 +1,170 @@
+"""
+Long-lived worker processes for lineage parsing.
+Starting a process pool costs more than parsing a typical batch of
+statements, so one pool is started on first use and kept for the life of
+the application. Workers are started with forkserver (spawn where that is
+unavailable) rather than fork: analyses run on job threads while server,
+collector and connection pool threads hold locks, and forking a
+multithreaded process copies those locks in whatever state they are in.
+
+Statements parsed under a time budget outside the main thread, where
+SIGALRM cannot interrupt them, run on a separate single worker process.
+A statement over budget is stopped by killing that process, and a new
+one is started for the next statement.
+"""
+
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+class ParseTimeout(Exception):
+    """Raised when parsing a statement exceeds its time budget"""
+
+
+def _serve_budgeted(connection, func):
+    """Budget worker loop: call func for each argument tuple received"""
+    connection.send('ready')
+    while True:
+        try:
+            args = connection.recv()
+        except EOFError:
+            return
+        try:
+            connection.send((True, func(*args)))
+        except Exception as e:
+            connection.send((False, RuntimeError(f"{type(e).__name__}: {e}")))
+
+
+def _start_method():
+    """Safest available way to start worker processes"""
+    methods = multiprocessing.get_all_start_methods()
+    return 'forkserver' if 'forkserver' in methods else 'spawn'
+
+
+class ParsePool:
+    """Process pool shared by every analysis, started on first use"""
+
+    def __init__(self, max_workers=1):
+        """
+        Args:
+            max_workers (int): Number of worker processes. 1 disables the
+                pool, so statements are parsed serially in the calling
+                process.
+        """
+        self.max_workers = max(1, max_workers or 1)
+        self._executor = None
+        self._lock = threading.Lock()
+        # Budget worker: (process, connection, func) once started
+        self._budget_worker = None
+        self._budget_lock = threading.Lock()
+
+    @property
+    def parallel(self):
+        """Whether statement batches are fanned out to worker processes"""
+        return self.max_workers > 1
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                context = multiprocessing.get_context(_start_method())
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                     mp_context=context)
+            return self._executor
+
+    def map(self, func, *iterables):
+        """
+        Run func over the iterables on the worker processes.
+
+        Args:
+            func (callable): Module-level function, so it can be pickled
+
+        Returns:
+            list: Results in input order
+
+        Raises:
+            BrokenProcessPool: If a worker died. The pool is replaced, so
+                the next call starts fresh workers.
+        """
+        executor = self._get_executor()
+        try:
+            return list(executor.map(func, *iterables))
+        except BrokenProcessPool:
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            executor.shutdown(wait=False)
+            raise
+
+    def _start_budget_worker(self, func):
+        context = multiprocessing.get_context(_start_method())
+        connection, child = context.Pipe()
+        process = context.Process(target=_serve_budgeted, args=(child, func), daemon=True)
+        process.start()
+        child.close()
+        # Wait for the worker's imports outside the budget
+        try:
+            ready = connection.recv()
+        except EOFError:
+            ready = None
+        if ready != 'ready':
+            connection.close()
+            process.kill()
+            process.join()
+            raise RuntimeError("Parse worker failed to start")
+        self._budget_worker = (process, connection, func)
+
+    def _stop_budget_worker(self):
+        if self._budget_worker is None:
+            return
+        process, connection, _ = self._budget_worker
+        self._budget_worker = None
+        connection.close()
+        process.kill()
+        process.join()
+
+    def call(self, seconds, func, *args):
+        """
+        Call func(*args) on the budget worker process, killing it if the
+        call runs longer than seconds. Calls from several threads are run
+        one at a time.
+
+        Args:
+            seconds (float): Time budget for the call
+            func (callable): Module-level function, so it can be pickled
+
+        Returns:
+            The result of func(*args)
+
+        Raises:
+            ParseTimeout: If the call ran over budget. It was stopped.
+            RuntimeError: If func raised, or the worker process died
+        """
+        with self._budget_lock:
+            if self._budget_worker is not None and self._budget_worker[2] is not func:
+                self._stop_budget_worker()
+            if self._budget_worker is None:
+                self._start_budget_worker(func)
+            connection = self._budget_worker[1]
+            try:
+                connection.send(args)
+                if not connection.poll(seconds):
+                    self._stop_budget_worker()
+                    raise ParseTimeout()
+                ok, value = connection.recv()
+            except (EOFError, OSError) as e:
+                self._stop_budget_worker()
+                raise RuntimeError(f"Parse worker exited: {e}") from e
+        if not ok:
+            raise value
+        return value
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        with self._budget_lock:
+            self._stop_budget_worker()
@@ -0,0 +1,279 @@
+"""
+Pooled PostgreSQL connections.
+Opening a connection costs a TCP, TLS and authentication handshake, so
+connections are kept per connection target and borrowed for one operation
+at a time. A borrowed connection belongs to a single thread until it is
+returned, which lets analyses run database work from several threads.
+"""
+
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection became free in time"""
+
+
+class ConnectionPool:
+    """
+    Bounded pool of connections for one set of connection parameters.
+
+    Idle connections are reused most recently returned first. Connections
+    idle longer than idle_timeout are closed, and connections idle longer
+    than health_check_after are checked with a trivial query before they
+    are handed out.
+    """
+
+    def __init__(self, connection_params, max_size=5, idle_timeout=300, health_check_after=30):
+        """
+        Args:
+            connection_params (dict): Connection parameters for PostgreSQL
+            max_size (int): Maximum number of open connections
+            idle_timeout (float): Seconds an unused connection is kept open
+            health_check_after (float): Idle seconds after which a connection
+                is checked before it is reused
+        """
+        self.connection_params = connection_params
+        self.max_size = max(1, max_size)
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+        self._idle = []  # (connection, returned_at), most recent last
+        self._size = 0
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        """Number of open connections, idle or borrowed"""
+        return self._size
+
+    def acquire(self, timeout=None):
+        """
+        Borrow a connection.
+
+        Args:
+            timeout (float, optional): Seconds to wait for a free connection
+                when the pool is at max_size; waits forever if None
+
+        Returns:
+            connection: An open psycopg2 connection
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            conn, returned_at = self._take(deadline)
+            if conn is None:
+                return self._open()
+            if time.monotonic() - returned_at < self.health_check_after or self._is_healthy(conn):
+                with self._cond:
+                    self.reused += 1
+                return conn
+            self._discard(conn)
+
+    def _take(self, deadline):
+        """Pop an idle connection, or reserve a slot for a new one (None)"""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                while self._idle:
+                    conn, returned_at = self._idle.pop()
+                    if now - returned_at > self.idle_timeout or conn.closed:
+                        self._close_quietly(conn)
+                        self._size -= 1
+                        continue
+                    return conn, returned_at
+                if self._size < self.max_size:
+                    self._size += 1
+                    return None, None
+                remaining = None if deadline is None else deadline - now
+                if remaining is not None and remaining <= 0:
+                    raise PoolTimeout(f"No free connection within the pool of {self.max_size}")
+                self._cond.wait(remaining)
+
+    def _open(self):
+        try:
+            conn = psycopg2.connect(**self.connection_params)
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self.created += 1
+        return conn
+
+    @staticmethod
+    def _is_healthy(conn):
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _discard(self, conn):
+        self._close_quietly(conn)
+        with self._cond:
+            self._size -= 1
+            self.discarded += 1
+            self._cond.notify()
+
+    def release(self, conn, discard=False):
+        """
+        Return a borrowed connection. An open transaction is rolled back
+        so the next borrower starts clean.
+
+        Args:
+            conn: Connection obtained from acquire()
+            discard (bool): Close the connection instead of keeping it
+        """
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                discard = True
+        if discard or conn.closed:
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Borrow a connection for the duration of a with block"""
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        except Exception:
+            # A connection that failed at the protocol level is not reused
+            self.release(conn, discard=bool(conn.closed))
+            raise
+        else:
+            self.release(conn)
+
+    def prune(self):
+        """
+        Close connections idle longer than idle_timeout.
+
+        Returns:
+            int: Number of connections closed
+        """
+        now = time.monotonic()
+        with self._cond:
+            stale = [conn for conn, returned_at in self._idle if now - returned_at > self.idle_timeout]
+            self._idle = [(conn, returned_at) for conn, returned_at in self._idle
+                          if now - returned_at <= self.idle_timeout]
+            self._size -= len(stale)
+        for conn in stale:
+            self._close_quietly(conn)
+        return len(stale)
+
+    def close(self):
+        """
+        Close the idle connections. Borrowed connections are kept when
+        they are returned, and the pool opens new ones on demand.
+        """
+        with self._cond:
+            idle = [conn for conn, _ in self._idle]
+            self._idle = []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            self._close_quietly(conn)
+
+    def stats(self):
+        """Return the pool size and reuse counters"""
+        with self._cond:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'max_size': self.max_size,
+                'created': self.created,
+                'reused': self.reused,
+                'discarded': self.discarded
+            }
+
+
+class ConnectionPools:
+    """Connection pools keyed by connection parameters, shared across analyses"""
+
+    def __init__(self, max_size=5, idle_timeout=300, health_check_after=30):
+        """
+        Args:
+            max_size (int): Maximum open connections per pool
+            idle_timeout (float): Seconds an unused connection is kept open
+            health_check_after (float): Idle seconds after which a connection
+                is checked before it is reused
+        """
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self._pools = {}
+        self._lock = threading.Lock()
+        self._last_prune = time.monotonic()
+
+    def __len__(self):
+        return len(self._pools)
+
+    @staticmethod
+    def make_key(connection_params):
+        """
+        Identify a pool by every connection parameter, the password
+        included, so a connection is never handed to a session that did
+        not authenticate with the same credentials.
+        """
+        parts = sorted((str(k), str(v)) for k, v in connection_params.items())
+        return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()
+
+    def get(self, connection_params):
+        """Return the pool for these connection parameters, creating it if needed"""
+        # Pools of targets nobody analyzes any more are closed lazily
+        if time.monotonic() - self._last_prune > self.idle_timeout:
+            self._last_prune = time.monotonic()
+            self.prune()
+
+        key = self.make_key(connection_params)
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                pool = ConnectionPool(connection_params, max_size=self.max_size,
+                                      idle_timeout=self.idle_timeout,
+                                      health_check_after=self.health_check_after)
+                self._pools[key] = pool
+            return pool
+
+    def prune(self):
+        """Close idle connections past their timeout and drop empty pools"""
+        with self._lock:
+            pools = list(self._pools.items())
+        closed = 0
+        for key, pool in pools:
+            closed += pool.prune()
+            if len(pool) == 0:
+                with self._lock:
+                    if self._pools.get(key) is pool and len(pool) == 0:
+                        del self._pools[key]
+        return closed
+
+    def close_all(self):
+        """Close every pool"""
+        with self._lock:
+            pools = list(self._pools.values())
+            self._pools.clear()
+        for pool in pools:
+            pool.close()
@@ -0,0 +1,331 @@
+"""
+Reachability index for impact analysis on the lineage graph.
+Answers "what depends on table X" (downstream) and "where does table Y's
+data come from" (upstream) without traversing the graph per request. The
+graph is condensed into its strongly connected components, which are
+numbered so every component reachable from another has a smaller number,
+and each component gets a bitset of the components it reaches and one of
+the components that reach it. A reachability test is then a shift and a
+mask, and a transitive set is read off a single bitset.
+
+Only table -> query and query -> table edges are indexed. The direct
+table -> table edges of the lineage graph are shortcuts through a query,
+so they add no reachability and lineage paths keep the queries they go
+through.
+"""
+
+import numpy as np
+
+from app.graph_arrays import lineage_columns
+
+
+NODE_KINDS = ('table', 'query')
+DIRECTIONS = ('downstream', 'upstream', 'both')
+
+
+def _csr(n, heads, tails):
+    """Offsets and tails of the edges grouped by head"""
+    order = np.argsort(heads, kind='stable')
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(heads, minlength=n), out=offsets[1:])
+    return offsets, tails[order]
+
+
+def _strong_components(n, offsets, targets):
+    """
+    Tarjan's algorithm without recursion.
+
+    Returns:
+        tuple: (component of every node, number of components). Components
+            are numbered in the order Tarjan completes them, so a component
+            only reaches components with a smaller number.
+    """
+    offsets = offsets.tolist()
+    targets = targets.tolist()
+    index = [-1] * n
+    low = [0] * n
+    on_stack = [False] * n
+    component = [-1] * n
+    stack = []
+    counter = 0
+    count = 0
+
+    for root in range(n):
+        if index[root] != -1:
+            continue
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        work = [[root, offsets[root]]]
+        while work:
+            frame = work[-1]
+            v = frame[0]
+            if frame[1] < offsets[v + 1]:
+                w = targets[frame[1]]
+                frame[1] += 1
+                if index[w] == -1:
+                    index[w] = low[w] = counter
+                    counter += 1
+                    stack.append(w)
+                    on_stack[w] = True
+                    work.append([w, offsets[w]])
+                elif on_stack[w] and index[w] < low[v]:
+                    low[v] = index[w]
+                continue
+
+            work.pop()
+            if work and low[v] < low[work[-1][0]]:
+                low[work[-1][0]] = low[v]
+            if low[v] == index[v]:
+                while True:
+                    w = stack.pop()
+                    on_stack[w] = False
+                    component[w] = count
+                    if w == v:
+                        break
+                count += 1
+
+    return np.asarray(component, dtype=np.int64), count
+
+
+def _bit_positions(bits):
+    """Positions of the set bits of a non-negative int"""
+    if not bits:
+        return np.zeros(0, dtype=np.int64)
+    data = np.frombuffer(bits.to_bytes((bits.bit_length() + 7) // 8, 'little'), dtype=np.uint8)
+    return np.flatnonzero(np.unpackbits(data, bitorder='little'))
+
+
+class ReachabilityIndex:
+    """Transitive upstream/downstream lookups over a lineage graph"""
+
+    def __init__(self, G):
+        """
+        Args:
+            G (networkx.DiGraph or ArrayGraph): Lineage graph built by
+                PostgresQueryLineage.build_lineage_graph()
+        """
+        self.nodes, self.is_table, _, sources, targets = lineage_columns(G)
+        self._position = {node: i for i, node in enumerate(self.nodes)}
+        n = len(self.nodes)
+
+        self._out_offsets, self._out_targets = _csr(n, sources, targets)
+        self._in_offsets, self._in_sources = _csr(n, targets, sources)
+
+        self.component, self.component_count = _strong_components(
+            n, self._out_offsets, self._out_targets)
+        self._members_offsets, self._members = _csr(
+            self.component_count, self.component, np.arange(n, dtype=np.int64))
+
+        # Edges of the condensation, from a component to a smaller one
+        heads, tails = self.component[sources], self.component[targets]
+        between = heads != tails
+        width = max(self.component_count, 1)
+        pairs = np.unique(heads[between] * width + tails[between])
+        heads, tails = pairs // width, pairs % width
+        child_offsets, children = _csr(self.component_count, heads, tails)
+        parent_offsets, parents = _csr(self.component_count, tails, heads)
+        child_offsets, children = child_offsets.tolist(), children.tolist()
+        parent_offsets, parents = parent_offsets.tolist(), parents.tolist()
+
+        # Bit k of _descendants[c] is component c - k, bit k of
+        # _ancestors[c] is component c + k. Keeping the bits relative to c
+        # keeps the ints as short as the span of components they cover.
+        self._descendants = [0] * self.component_count
+        for c in range(self.component_count):
+            bits = 1
+            for d in children[child_offsets[c]:child_offsets[c + 1]]:
+                bits |= self._descendants[d] << (c - d)
+            self._descendants[c] = bits
+        self._ancestors = [0] * self.component_count
+        for c in range(self.component_count - 1, -1, -1):
+            bits = 1
+            for p in parents[parent_offsets[c]:parent_offsets[c + 1]]:
+                bits |= self._ancestors[p] << (p - c)
+            self._ancestors[c] = bits
+
+    def __contains__(self, node):
+        return node in self._position
+
+    def __len__(self):
+        return len(self.nodes)
+
+    @property
+    def nbytes(self):
+        """Approximate memory held by the bitsets and arrays"""
+        bitsets = sum((bits.bit_length() + 7) // 8 + 28 for bits in self._descendants)
+        bitsets += sum((bits.bit_length() + 7) // 8 + 28 for bits in self._ancestors)
+        arrays = (self._out_offsets, self._out_targets, self._in_offsets, self._in_sources,
+                  self.component, self._members_offsets, self._members)
+        return bitsets + sum(a.nbytes for a in arrays)
+
+    def reaches(self, source, target):
+        """
+        Whether data flows from source to target.
+
+        Returns:
+            bool: True if target is source or downstream of it
+        """
+        if source not in self._position or target not in self._position:
+            return False
+        cs = int(self.component[self._position[source]])
+        ct = int(self.component[self._position[target]])
+        return ct <= cs and bool((self._descendants[cs] >> (cs - ct)) & 1)
+
+    def _check_kind(self, kind):
+        if kind is not None and kind not in NODE_KINDS:
+            raise ValueError(f"Unknown node kind '{kind}', expected one of {NODE_KINDS}")
+
+    def _select(self, positions, kind):
+        """Node ids at positions, filtered by kind and sorted"""
+        if kind == 'table':
+            positions = positions[self.is_table[positions]]
+        elif kind == 'query':
+            positions = positions[~self.is_table[positions]]
+        return sorted(self.nodes[int(i)] for i in positions)
+
+    def _closure(self, node, kind, bitsets, sign):
+        self._check_kind(kind)
+        position = self._position.get(node)
+        if position is None:
+            return None
+        c = int(self.component[position])
+        components = c + sign * _bit_positions(bitsets[c])
+        starts, ends = self._members_offsets[components], self._members_offsets[components + 1]
+        positions = np.concatenate([self._members[s:e] for s, e in zip(starts, ends)])
+        return self._select(positions[positions != position], kind)
+
+    def downstream(self, node, kind='table'):
+        """
+        Everything that reads data written from node, transitively.
+
+        Args:
+            node (str): Table or query node id
+            kind (str, optional): 'table' or 'query' to only return those;
+                None returns both
+
+        Returns:
+            list: Sorted node ids, or None if node is not in the graph
+        """
+        return self._closure(node, kind, self._descendants, -1)
+
+    def upstream(self, node, kind='table'):
+        """
+        Everything node's data comes from, transitively.
+
+        Args:
+            node (str): Table or query node id
+            kind (str, optional): 'table' or 'query' to only return those;
+                None returns both
+
+        Returns:
+            list: Sorted node ids, or None if node is not in the graph
+        """
+        return self._closure(node, kind, self._ancestors, 1)
+
+    def _adjacent(self, position, direction):
+        if direction in ('downstream', 'both'):
+            yield from self._out_targets[self._out_offsets[position]:self._out_offsets[position + 1]].tolist()
+        if direction in ('upstream', 'both'):
+            yield from self._in_sources[self._in_offsets[position]:self._in_offsets[position + 1]].tolist()
+
+    def degree(self, node):
+        """Number of lineage edges of a node, or None if it is not in the graph"""
+        position = self._position.get(node)
+        if position is None:
+            return None
+        return int(self._out_offsets[position + 1] - self._out_offsets[position]
+                   + self._in_offsets[position + 1] - self._in_offsets[position])
+
+    def neighbourhood(self, node, depth=1, direction='both', kind=None, max_nodes=None):
+        """
+        Nodes within depth edges of node. A table read by a query that
+        writes another table is two edges away from it.
+
+        Args:
+            node (str): Table or query node id
+            depth (int): Maximum number of edges
+            direction (str): 'downstream', 'upstream' or 'both'
+            kind (str, optional): 'table' or 'query' to only return those
+            max_nodes (int, optional): Stop at this many nodes. Closer nodes
+                are kept first, and of the nodes at the same distance the
+                ones with the most edges.
+
+        Returns:
+            dict: Node id to distance, without node itself, or None if node
+                is not in the graph
+
+        Raises:
+            ValueError: For an unknown direction or kind or a negative depth
+        """
+        self._check_kind(kind)
+        if direction not in DIRECTIONS:
+            raise ValueError(f"Unknown direction '{direction}', expected one of {DIRECTIONS}")
+        if depth < 0:
+            raise ValueError("Depth must not be negative")
+        start = self._position.get(node)
+        if start is None:
+            return None
+
+        distances = {start: 0}
+        frontier = [start]
+        for distance in range(1, depth + 1):
+            reached = []
+            for position in frontier:
+                for neighbour in self._adjacent(position, direction):
+                    if neighbour not in distances:
+                        distances[neighbour] = -1
+                        reached.append(neighbour)
+            if max_nodes is not None and len(distances) - 1 > max_nodes:
+                # Keep the best connected nodes of the last level
+                slots = max(0, max_nodes - (len(distances) - 1 - len(reached)))
+                degrees = (self._out_offsets[np.add(reached, 1)] - self._out_offsets[reached]
+                           + self._in_offsets[np.add(reached, 1)] - self._in_offsets[reached])
+                ranked = [reached[i] for i in np.argsort(-degrees, kind='stable')]
+                for position in ranked[slots:]:
+                    del distances[position]
+                reached = ranked[:slots]
+            for position in reached:
+                distances[position] = distance
+            if not reached or (max_nodes is not None and len(distances) - 1 >= max_nodes):
+                break
+            frontier = reached
+
+        del distances[start]
+        return {self.nodes[i]: d for i, d in distances.items()
+                if kind is None or self.is_table[i] == (kind == 'table')}
+
+    def shortest_path(self, source, target):
+        """
+        Shortest chain of tables and queries data flows through from source
+        to target. Only nodes that can still reach target are expanded.
+
+        Returns:
+            list: Node ids from source to target, or None if target is not
+                downstream of source
+        """
+        if not self.reaches(source, target):
+            return None
+        start, goal = self._position[source], self._position[target]
+        goal_component = int(self.component[goal])
+
+        def leads_to_goal(position):
+            c = int(self.component[position])
+            return goal_component <= c and (self._descendants[c] >> (c - goal_component)) & 1
+
+        previous = {start: None}
+        frontier = [start]
+        while goal not in previous:
+            reached = []
+            for position in frontier:
+                for neighbour in self._adjacent(position, 'downstream'):
+                    if neighbour not in previous and leads_to_goal(neighbour):
+                        previous[neighbour] = position
+                        reached.append(neighbour)
+            frontier = reached
+
+        path = [goal]
+        while previous[path[-1]] is not None:
+            path.append(previous[path[-1]])
+        return [self.nodes[i] for i in reversed(path)]
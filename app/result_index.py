@@ -0,0 +1,154 @@
+"""
+Lookup indexes over a finished analysis.
+The detail pages find a query by row position or pg_stat_statements
+queryid and a table by name. The indexes are built once per analysis, so
+each lookup is a dictionary access instead of a scan of the result table,
+and they link rows to their lineage graph nodes so the detail pages can
+list the tables a query touches and the queries and tables around a table.
+"""
+
+import pandas as pd
+
+from app.graph_store import query_node_id
+
+
+class ResultIndex:
+    """Hash indexes from queryid and table name to rows and graph nodes"""
+
+    def __init__(self, expensive_queries=None, table_stats=None, lineage_graph=None):
+        """
+        Args:
+            expensive_queries (pandas.DataFrame, optional): Ranked queries
+            table_stats (pandas.DataFrame, optional): Per-table statistics
+            lineage_graph (networkx.DiGraph, optional): Lineage graph
+        """
+        self.graph = lineage_graph
+        self.query_count = 0 if expensive_queries is None else len(expensive_queries)
+        self.queryid_rows = {}
+        self.table_rows = {}
+        self.row_nodes = {}
+        self.node_rows = {}
+
+        if expensive_queries is not None and 'queryid' in expensive_queries.columns:
+            for position, queryid in enumerate(expensive_queries['queryid']):
+                if pd.notna(queryid):
+                    # The first row wins if a queryid appears twice
+                    self.queryid_rows.setdefault(str(int(queryid)), position)
+
+        if table_stats is not None and 'table_name' in table_stats.columns:
+            for position, name in enumerate(table_stats['table_name']):
+                self.table_rows.setdefault(name, position)
+
+        if lineage_graph is not None and expensive_queries is not None:
+            self._link_query_nodes(expensive_queries, lineage_graph)
+
+    def _link_query_nodes(self, expensive_queries, G):
+        """
+        Map query rows to query nodes by their node id, or by queryid or
+        query text for graphs of older analyses.
+        """
+        by_queryid = {}
+        by_text = {}
+        for node, attrs in G.nodes(data=True):
+            if attrs.get('type') != 'query':
+                continue
+            if attrs.get('queryid') is not None:
+                by_queryid.setdefault(str(int(attrs['queryid'])), node)
+            if attrs.get('text') is not None:
+                by_text.setdefault(attrs['text'], node)
+
+        queryids = (expensive_queries['queryid'] if 'queryid' in expensive_queries.columns
+                    else [None] * len(expensive_queries))
+        texts = (expensive_queries['query'] if 'query' in expensive_queries.columns
+                 else [None] * len(expensive_queries))
+        dbids = (expensive_queries['dbid'] if 'dbid' in expensive_queries.columns
+                 else [None] * len(expensive_queries))
+        for position, (queryid, dbid, text) in enumerate(zip(queryids, dbids, texts)):
+            node = query_node_id(queryid, dbid, text)
+            if node not in G:
+                node = None
+            if node is None and queryid is not None and pd.notna(queryid):
+                node = by_queryid.get(str(int(queryid)))
+            if node is None and isinstance(text, str):
+                # Query nodes carry the text cut to 100 characters
+                node = by_text.get(text[:100] + '...' if len(text) > 100 else text)
+            if node is not None:
+                self.row_nodes[position] = node
+                self.node_rows.setdefault(node, position)
+
+    def query_position(self, query_id):
+        """
+        Resolve a query reference from a URL.
+
+        Args:
+            query_id (str): Row position in the expensive queries table, a
+                pg_stat_statements queryid or a lineage graph node id
+
+        Returns:
+            int: Row position, or None if nothing matches
+        """
+        if query_id in self.node_rows:
+            return self.node_rows[query_id]
+        try:
+            position = int(query_id)
+        except (TypeError, ValueError):
+            return None
+        if 0 <= position < self.query_count:
+            return position
+        return self.queryid_rows.get(str(position))
+
+    def table_position(self, table_name):
+        """Row of a table in the table statistics, or None"""
+        return self.table_rows.get(table_name)
+
+    def _query_summary(self, node):
+        attrs = self.graph.nodes[node]
+        return {
+            'id': node,
+            'text': attrs.get('text', ''),
+            'total_time': attrs.get('total_time', 0),
+            'position': self.node_rows.get(node)
+        }
+
+    def _neighbours(self, nodes, node_type):
+        return sorted(n for n in nodes if self.graph.nodes[n].get('type') == node_type)
+
+    def query_lineage(self, position):
+        """
+        Tables a query reads and writes.
+
+        Returns:
+            dict: 'node', 'reads' and 'writes', or None if the query has no
+                node in the lineage graph
+        """
+        node = self.row_nodes.get(position)
+        if node is None:
+            return None
+        return {
+            'node': node,
+            'reads': self._neighbours(self.graph.predecessors(node), 'table'),
+            'writes': self._neighbours(self.graph.successors(node), 'table')
+        }
+
+    def table_lineage(self, table_name):
+        """
+        Queries and tables linked to a table in the lineage graph.
+
+        Returns:
+            dict: 'read' and 'write' queries (reading from and writing to the
+                table, most expensive first) and 'upstream' and 'downstream'
+                tables, or None if the table is not in the graph
+        """
+        if self.graph is None or table_name not in self.graph:
+            return None
+
+        def queries(nodes):
+            summaries = [self._query_summary(n) for n in self._neighbours(nodes, 'query')]
+            return sorted(summaries, key=lambda q: -(q['total_time'] or 0))
+
+        return {
+            'read': queries(self.graph.successors(table_name)),
+            'write': queries(self.graph.predecessors(table_name)),
+            'upstream': self._neighbours(self.graph.predecessors(table_name), 'table'),
+            'downstream': self._neighbours(self.graph.successors(table_name), 'table')
+        }
@@ -0,0 +1,405 @@
+"""
+In-memory store of finished analyses.
+Views read the DataFrames and lineage graph of an analysis from here
+instead of re-reading the table artifacts and GraphML file on every page
+load. The
+store is bounded by an estimate of the bytes it holds; the least recently
+used analyses are spilled to disk in pickle format and loaded back on
+demand.
+"""
+
+import os
+import re
+import gzip
+import json
+import time
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+
+import networkx as nx
+
+from app.artifacts import read_table
+from app.graph_arrays import ArrayGraph
+from app.lineage_payload import build_payload, encode_payload
+from app.lineage_summary import LineageSummary
+from app.reachability import ReachabilityIndex
+from app.result_index import ResultIndex
+from app.table_pages import SEARCH_COLUMNS, TableView
+
+
+# Analysis ids are job ids, so they are safe to use as file names
+_ANALYSIS_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+class AnalysisResult:
+    """Tables, lineage graph and output files of one finished analysis"""
+
+    def __init__(self, analysis_id, expensive_queries=None, table_stats=None, lineage_graph=None,
+                 files=None, parse_fallbacks=None, workload_window=None, lineage_positions=None):
+        """
+        Args:
+            analysis_id (str): Id the result is stored under
+            expensive_queries (pandas.DataFrame, optional): Ranked queries
+            table_stats (pandas.DataFrame, optional): Per-table statistics
+            lineage_graph (networkx.DiGraph, optional): Lineage graph
+            files (dict, optional): Output files written by the analysis
+            parse_fallbacks (list, optional): Statements with degraded lineage
+            workload_window (dict, optional): Period a windowed analysis covers
+            lineage_positions (dict, optional): Node id to (x, y) of the
+                server-side layout of the lineage graph
+        """
+        self.analysis_id = analysis_id
+        self.expensive_queries = expensive_queries
+        self.table_stats = table_stats
+        self.lineage_graph = lineage_graph
+        self.files = files or {}
+        self.parse_fallbacks = parse_fallbacks or []
+        self.workload_window = workload_window
+        self.lineage_positions = lineage_positions
+        self.created_at = time.time()
+        self._nbytes = None
+        self._payload = None
+        self._views = {}
+        self._index = None
+        self._reachability = None
+        self._summaries = {}
+
+    def __getstate__(self):
+        # Views only hold derived sort orders, and the reachability index
+        # and summaries are derived from the graph; all are rebuilt after a
+        # reload
+        state = self.__dict__.copy()
+        state['_views'] = {}
+        state['_reachability'] = None
+        state['_summaries'] = {}
+        return state
+
+    @classmethod
+    def from_analysis(cls, analysis_id, results):
+        """Build a result from the dict returned by run_complete_analysis"""
+        result = cls(
+            analysis_id,
+            expensive_queries=results.get('expensive_queries'),
+            table_stats=results.get('table_stats'),
+            lineage_graph=results.get('lineage_graph'),
+            files=results.get('files'),
+            parse_fallbacks=results.get('parse_fallbacks'),
+            workload_window=results.get('workload_window'),
+            lineage_positions=results.get('lineage_positions')
+        )
+        # Detail page lookups and impact queries are indexed while the
+        # analysis job still runs
+        result.index()
+        result.reachability()
+        return result
+
+    @classmethod
+    def from_files(cls, analysis_id, files):
+        """
+        Rebuild a result from the files an analysis wrote, for sessions
+        whose analysis is no longer in the store.
+
+        Returns:
+            AnalysisResult: Result with None for every file that is missing
+        """
+        def read_artifact(key):
+            path = files.get(key)
+            if not path or not os.path.exists(path):
+                return None
+            return read_table(path)
+
+        lineage_graph = None
+        arrays_path = files.get('lineage_arrays')
+        if arrays_path and os.path.isdir(arrays_path):
+            try:
+                lineage_graph = ArrayGraph.load(arrays_path, mmap_mode='r')
+            except Exception as e:
+                print(f"Warning when reading lineage graph {arrays_path}: {e}")
+        graphml_path = files.get('lineage_graphml')
+        if lineage_graph is None and graphml_path and os.path.exists(graphml_path):
+            try:
+                lineage_graph = nx.read_graphml(graphml_path)
+                for _, attrs in lineage_graph.nodes(data=True):
+                    if isinstance(attrs.get('columns'), str):
+                        attrs['columns'] = json.loads(attrs['columns'])
+            except Exception as e:
+                print(f"Warning when reading lineage graph {graphml_path}: {e}")
+
+        return cls(analysis_id, expensive_queries=read_artifact('expensive_queries'),
+                   table_stats=read_artifact('table_stats'), lineage_graph=lineage_graph, files=files)
+
+    def lineage_payload(self):
+        """
+        Gzipped D3 payload of the lineage graph, read from the file the
+        analysis wrote or built from the graph.
+
+        Returns:
+            bytes: The payload, or None without a lineage graph
+        """
+        payload = getattr(self, '_payload', None)
+        if payload is None:
+            path = self.files.get('lineage_payload')
+            if path and os.path.exists(path):
+                with open(path, 'rb') as f:
+                    payload = f.read()
+            elif self.lineage_graph is not None:
+                payload = encode_payload(build_payload(self.lineage_graph,
+                                                       positions=self.positions()))
+            self._payload = payload
+        return payload
+
+    def positions(self):
+        """
+        Node positions of the lineage graph layout. Results rebuilt from
+        files read them back from the payload the analysis wrote.
+
+        Returns:
+            dict: Node id to (x, y), or None if the analysis has no layout
+        """
+        positions = getattr(self, 'lineage_positions', None)
+        path = self.files.get('lineage_payload')
+        if positions is None and path and os.path.exists(path):
+            try:
+                with gzip.open(path, 'rt', encoding='utf-8') as f:
+                    nodes = json.load(f)['nodes']
+                if 'x' in nodes:
+                    positions = {node: (x, y) for node, x, y in zip(nodes['id'], nodes['x'], nodes['y'])
+                                 if x is not None}
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Warning when reading lineage positions {path}: {e}")
+            self.lineage_positions = positions
+        return positions
+
+    def index(self):
+        """
+        Lookup indexes of the tables and lineage graph, built on first use.
+
+        Returns:
+            ResultIndex: The index
+        """
+        index = getattr(self, '_index', None)
+        if index is None:
+            index = self._index = ResultIndex(self.expensive_queries, self.table_stats,
+                                              self.lineage_graph)
+        return index
+
+    def reachability(self):
+        """
+        Upstream/downstream reachability index of the lineage graph, built
+        on first use.
+
+        Returns:
+            ReachabilityIndex: The index, or None without a lineage graph
+        """
+        reachability = getattr(self, '_reachability', None)
+        if reachability is None and self.lineage_graph is not None:
+            reachability = self._reachability = ReachabilityIndex(self.lineage_graph)
+        return reachability
+
+    def summary(self, group_by='schema'):
+        """
+        Schema or component summary of the lineage graph, built on first use.
+
+        Args:
+            group_by (str): 'schema' or 'component'
+
+        Returns:
+            LineageSummary: The summary, or None without a lineage graph
+
+        Raises:
+            ValueError: For an unknown grouping
+        """
+        summaries = getattr(self, '_summaries', None)
+        if summaries is None:
+            summaries = self._summaries = {}
+        summary = summaries.get(group_by)
+        if summary is None and self.lineage_graph is not None:
+            summary = summaries[group_by] = LineageSummary(self.lineage_graph, group_by)
+        return summary
+
+    def table_view(self, name):
+        """
+        Paged view of a result table, kept for the lifetime of the result.
+
+        Args:
+            name (str): 'expensive_queries' or 'table_stats'
+
+        Returns:
+            TableView: The view, or None if the table is missing
+        """
+        views = getattr(self, '_views', None)
+        if views is None:
+            views = self._views = {}
+        view = views.get(name)
+        if view is None:
+            df = getattr(self, name, None) if name in SEARCH_COLUMNS else None
+            if df is None:
+                return None
+            view = views[name] = TableView(df, SEARCH_COLUMNS[name])
+        return view
+
+    @property
+    def nbytes(self):
+        """Estimated memory held by the tables and the graph"""
+        if self._nbytes is None:
+            total = 0
+            for df in (self.expensive_queries, self.table_stats):
+                if df is not None:
+                    total += int(df.memory_usage(index=True, deep=True).sum())
+            if isinstance(self.lineage_graph, ArrayGraph):
+                total += self.lineage_graph.nbytes
+            elif self.lineage_graph is not None:
+                # Node and edge bookkeeping plus the text attributes
+                graph = self.lineage_graph
+                total += 400 * graph.number_of_nodes() + 200 * graph.number_of_edges()
+                total += sum(len(attrs.get('text', '')) for _, attrs in graph.nodes(data=True))
+            if self.lineage_positions:
+                total += 150 * len(self.lineage_positions)
+            self._nbytes = total
+        return self._nbytes
+
+
+class ResultStore:
+    """
+    LRU store of analysis results bounded by estimated bytes.
+
+    The most recently stored or read result always stays in memory, even
+    if it is larger than max_bytes. Evicted results are written to
+    spill_dir and moved back into memory the next time they are read.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, spill_dir=None):
+        """
+        Args:
+            max_bytes (int): Memory budget for results kept in memory
+            spill_dir (str, optional): Directory evicted results are written
+                to; without it evicted results are dropped
+        """
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.hits = 0
+        self.spill_loads = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._spilling = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, analysis_id):
+        return analysis_id in self._entries
+
+    def _spill_path(self, analysis_id):
+        if not self.spill_dir or not _ANALYSIS_ID.match(analysis_id or ''):
+            return None
+        return os.path.join(self.spill_dir, f"{analysis_id}.pkl")
+
+    def put(self, result):
+        """Store a result as the most recently used one"""
+        with self._lock:
+            self._insert(result)
+            victims = self._evict()
+        self._spill(victims)
+
+    def get(self, analysis_id):
+        """
+        Look up a result by analysis id, reading it back from disk if it
+        was spilled.
+
+        Returns:
+            AnalysisResult: The result, or None if it is unknown
+        """
+        with self._lock:
+            result = self._entries.get(analysis_id)
+            if result is not None:
+                self._entries.move_to_end(analysis_id)
+                self.hits += 1
+                return result
+            result = self._spilling.get(analysis_id)
+            if result is not None:
+                self.hits += 1
+                return result
+
+        path = self._spill_path(analysis_id)
+        if path is None or not os.path.exists(path):
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            with open(path, 'rb') as f:
+                result = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            print(f"Warning when reading spilled analysis {analysis_id}: {e}")
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.spill_loads += 1
+            self._insert(result)
+            victims = self._evict()
+        self._spill(victims)
+        return result
+
+    def discard(self, analysis_id):
+        """Forget a result, in memory and on disk"""
+        with self._lock:
+            result = self._entries.pop(analysis_id, None)
+            if result is not None:
+                self._bytes -= result.nbytes
+        path = self._spill_path(analysis_id)
+        if path and os.path.exists(path):
+            os.remove(path)
+
+    def _insert(self, result):
+        previous = self._entries.pop(result.analysis_id, None)
+        if previous is not None:
+            self._bytes -= previous.nbytes
+        self._entries[result.analysis_id] = result
+        self._bytes += result.nbytes
+
+    def _evict(self):
+        """Remove least recently used results over budget; returns them for spilling"""
+        victims = []
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            analysis_id, result = self._entries.popitem(last=False)
+            self._bytes -= result.nbytes
+            if self._spill_path(analysis_id):
+                self._spilling[analysis_id] = result
+                victims.append(result)
+        return victims
+
+    def _spill(self, victims):
+        """Write evicted results to disk outside the lock"""
+        for result in victims:
+            path = self._spill_path(result.analysis_id)
+            if not os.path.exists(path):
+                fd, tmp_path = tempfile.mkstemp(dir=self.spill_dir, suffix='.tmp')
+                try:
+                    with os.fdopen(fd, 'wb') as f:
+                        pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+                    os.replace(tmp_path, path)
+                except (OSError, pickle.PicklingError) as e:
+                    print(f"Warning when spilling analysis {result.analysis_id}: {e}")
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+            with self._lock:
+                self._spilling.pop(result.analysis_id, None)
+
+    def stats(self):
+        """Return the memory use and hit counters"""
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'spill_loads': self.spill_loads,
+                'misses': self.misses
+            }
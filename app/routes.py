@@ -3,13 +3,73 @@ Route definitions for the PostgreSQL Data Lineage application.
 """
 
 import os
+import gzip
 import json
-import base64
-from flask import render_template, request, jsonify, send_file, redirect, url_for, session, flash
-import pandas as pd
+import uuid
+import hashlib
+from io import BytesIO
+from flask import render_template, request, jsonify, send_file, redirect, url_for, session, flash, Response
 
 from app import app
-from app.analyzer import PostgresQueryLineage
+from app.analyzer import PostgresQueryLineage, render_lineage_image
+from app.artifacts import CSV_SUFFIX, read_table, to_csv_bytes
+from app.parse_cache import ParseCache
+from app.parse_pool import ParsePool
+from app.server_profile import ServerProfileCache
+from app.snapshots import SnapshotStore
+from app.collector import CollectorRegistry
+from app.pool import ConnectionPools
+from app.graph_store import LineageGraphStore
+from app.graph_arrays import ArrayGraph
+from app.graph_layout import LayoutCache
+from app.results import AnalysisResult, ResultStore
+from app.lineage_payload import build_payload
+from app.table_pages import DEFAULT_PAGE_SIZE
+from app.jobs import JobManager, SUCCEEDED
+
+# Parse results shared by every analysis run by this process
+parse_cache = ParseCache(
+    max_entries=app.config['PARSE_CACHE_SIZE'],
+    path=app.config['PARSE_CACHE_FILE']
+)
+parse_cache.load()
+
+# Parse worker processes, started on first use and shared by every analysis
+parse_pool = ParsePool(app.config['PARSE_WORKERS'])
+
+# pg_stat_statements capability profiles, probed once per connection target
+server_profiles = ServerProfileCache()
+
+# Workload snapshots for windowed analyses
+snapshot_store = SnapshotStore(app.config['SNAPSHOT_DB'])
+
+# Database connections reused across requests, one pool per connection target
+connection_pools = ConnectionPools(
+    max_size=app.config['POOL_MAX_SIZE'],
+    idle_timeout=app.config['POOL_IDLE_TIMEOUT'],
+    health_check_after=app.config['POOL_HEALTH_CHECK_AFTER']
+)
+
+# Lineage graphs of earlier analyses, updated incrementally when LINEAGE_INCREMENTAL is set
+graph_store = LineageGraphStore(app.config['LINEAGE_GRAPH_DIR'])
+
+# Node positions of laid out lineage graphs, keyed by graph fingerprint
+layout_cache = LayoutCache(app.config['LAYOUT_CACHE_DIR'])
+
+# Background workload collectors, one per connection target
+collectors = CollectorRegistry()
+
+# Finished analyses kept in memory for the result views, spilled to disk over budget
+result_store = ResultStore(
+    max_bytes=app.config['RESULT_STORE_MAX_BYTES'],
+    spill_dir=app.config['RESULT_SPILL_DIR']
+)
+
+# Analyses run as background jobs so requests return immediately
+jobs = JobManager(
+    max_workers=app.config['ANALYSIS_WORKERS'],
+    max_retained=app.config['ANALYSIS_JOBS_RETAINED']
+)
 
 # Dictionary to store analysis results during session
 @app.route('/')
@@ -30,14 +90,27 @@ def connect():
             'port': int(request.form.get('port', 5432))
         }
         
-        # Test connection
-        lineage_tracker = PostgresQueryLineage(connection_params)
-        success, message = lineage_tracker.connect()
+        # Test connection; the pooled connection stays open for the analyses that follow
+        lineage_tracker = PostgresQueryLineage(connection_params, connection_pools=connection_pools)
+        success, message = lineage_tracker.check_connection()
         
         if success:
             # Store connection parameters in session
             session['connection_params'] = connection_params
             session.modified = True
+            
+            # Probe the server again, pg_stat_statements may have been updated
+            server_profiles.invalidate(connection_params)
+            
+            if app.config['COLLECTOR_INTERVAL']:
+                collectors.ensure(
+                    connection_params, snapshot_store,
+                    interval=app.config['COLLECTOR_INTERVAL'],
+                    retention_seconds=app.config['COLLECTOR_RETENTION_SECONDS'],
+                    downsample_after=app.config['COLLECTOR_DOWNSAMPLE_AFTER'],
+                    downsample_bucket=app.config['COLLECTOR_DOWNSAMPLE_BUCKET'],
+                    server_profiles=server_profiles
+                )
             return jsonify({'success': True, 'message': message})
         else:
             return jsonify({'success': False, 'message': message})
@@ -45,9 +118,51 @@ def connect():
     except Exception as e:
         return jsonify({'success': False, 'message': f'Connection error: {str(e)}'})
 
+def _session_token():
+    """Identify this browser session as the owner of the jobs it submits"""
+    if 'job_owner' not in session:
+        session['job_owner'] = uuid.uuid4().hex
+        session.modified = True
+    return session['job_owner']
+
+def _run_analysis_job(job, lineage_tracker, limit, min_calls, window_seconds):
+    """Run an analysis on a job worker and summarize the results"""
+    results = lineage_tracker.run_complete_analysis(
+        limit=limit,
+        min_calls=min_calls,
+        output_prefix=os.path.join(app.config['UPLOAD_FOLDER'], f'analysis_{job.id[:8]}'),
+        window_seconds=window_seconds,
+        progress=job.report
+    )
+    
+    if 'error' in results:
+        raise RuntimeError(results['error'])
+    
+    # Views read the tables and graph from memory instead of the files
+    result_store.put(AnalysisResult.from_analysis(job.id, results))
+    
+    return {
+        'analysis_id': job.id,
+        'files': results.get('files', {}),
+        'summary': {
+            'message': 'Analysis completed successfully',
+            'queries_count': len(results['expensive_queries']),
+            'tables_count': len(results['table_stats']) if not results['table_stats'].empty else 0,
+            'degraded_queries': results.get('parse_fallbacks', []),
+            'workload_window': results.get('workload_window')
+        }
+    }
+
+def _owned_job(job_id):
+    """Return the job if it exists and belongs to this session, else None"""
+    job = jobs.get(job_id)
+    if job is None or job.owner != session.get('job_owner'):
+        return None
+    return job
+
 @app.route('/analyze', methods=['POST'])
 def analyze():
-    """Run the lineage analysis"""
+    """Start the lineage analysis as a background job"""
     if 'connection_params' not in session:
         return jsonify({'success': False, 'message': 'Not connected to a database'})
     
@@ -55,265 +170,530 @@ def analyze():
         # Get analysis parameters
         limit = int(request.form.get('limit', 20))
         min_calls = int(request.form.get('min_calls', 5))
+        parser = request.form.get('parser', app.config['LINEAGE_PARSER'])
+        window_minutes = int(request.form.get('window') or 0)
         
         # Create lineage tracker
-        lineage_tracker = PostgresQueryLineage(session['connection_params'])
-        
-        # Run analysis
-        results = lineage_tracker.run_complete_analysis(
-            limit=limit,
-            min_calls=min_calls,
-            output_prefix=os.path.join(app.config['UPLOAD_FOLDER'], 'analysis')
+        lineage_tracker = PostgresQueryLineage(
+            session['connection_params'],
+            catalog_cache_dir=app.config['CATALOG_CACHE_DIR'],
+            parse_cache=parse_cache,
+            parse_pool=parse_pool,
+            parser=parser,
+            max_parse_bytes=app.config['PARSE_MAX_BYTES'],
+            max_parse_seconds=app.config['PARSE_MAX_SECONDS'],
+            two_phase_fetch=app.config['TWO_PHASE_FETCH'],
+            server_profiles=server_profiles,
+            snapshot_store=snapshot_store,
+            snapshot_retention=app.config['COLLECTOR_RETENTION_SECONDS'],
+            connection_pools=connection_pools,
+            graph_store=graph_store if app.config['LINEAGE_INCREMENTAL'] else None,
+            merge_max_age=app.config['LINEAGE_MERGE_MAX_AGE'],
+            graph_engine=app.config['LINEAGE_GRAPH_ENGINE'],
+            layout_cache=layout_cache
         )
         
-        if 'error' in results:
-            return jsonify({'success': False, 'message': results['error']})
-        
-        # Store results in session (store file paths only)
-        session['analysis_files'] = results.get('files', {})
-        session['has_results'] = True
-        session.modified = True
-        
-        # Create base64 image of the lineage graph for display
-        img_data = None
-        if 'lineage_image' in results['files'] and os.path.exists(results['files']['lineage_image']):
-            with open(results['files']['lineage_image'], 'rb') as img_file:
-                img_data = base64.b64encode(img_file.read()).decode('utf-8')
+        # Run analysis on a job worker so the request returns immediately
+        job = jobs.submit(_run_analysis_job, lineage_tracker, limit, min_calls,
+                          window_minutes * 60 or None, owner=_session_token())
         
         return jsonify({
             'success': True,
-            'message': 'Analysis completed successfully',
-            'queries_count': len(results['expensive_queries']),
-            'tables_count': len(results['table_stats']) if not results['table_stats'].empty else 0,
-            'lineage_image': img_data
+            'message': 'Analysis started',
+            'job_id': job.id,
+            'status_url': url_for('job_status', job_id=job.id),
+            'events_url': url_for('job_events', job_id=job.id),
+            'cancel_url': url_for('cancel_job', job_id=job.id)
         })
     except Exception as e:
         return jsonify({'success': False, 'message': f'Analysis error: {str(e)}'})
 
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Report the progress of an analysis job, and its results once it succeeded"""
+    job = _owned_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Unknown analysis job'}), 404
+    
+    data = job.to_dict()
+    data['success'] = True
+    if job.status == SUCCEEDED:
+        data.update(job.result['summary'])
+        # Store results in session (analysis id and file paths only)
+        if session.get('analysis_id') != job.result['analysis_id']:
+            session['analysis_id'] = job.result['analysis_id']
+            session['analysis_files'] = job.result['files']
+            session['has_results'] = True
+            session.modified = True
+    return jsonify(data)
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """Stream job progress as Server-Sent Events until the job finishes"""
+    job = _owned_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Unknown analysis job'}), 404
+    
+    def stream():
+        version = None
+        while True:
+            # Re-send the state at least every 15s to keep proxies from timing out
+            version = job.wait_for_change(version, timeout=15)
+            yield f"data: {json.dumps(job.to_dict())}\n\n"
+            if job.finished:
+                break
+    
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """Cancel a queued or running analysis job"""
+    job = _owned_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Unknown analysis job'}), 404
+    
+    if not job.cancel():
+        return jsonify({'success': False, 'message': f'Job already {job.status}'})
+    return jsonify({'success': True, 'message': 'Cancellation requested'})
+
+@app.route('/snapshot', methods=['POST'])
+def snapshot():
+    """Capture a workload snapshot to use as the baseline of later windowed analyses"""
+    if 'connection_params' not in session:
+        return jsonify({'success': False, 'message': 'Not connected to a database'})
+    
+    lineage_tracker = PostgresQueryLineage(
+        session['connection_params'],
+        server_profiles=server_profiles,
+        snapshot_store=snapshot_store,
+        snapshot_retention=app.config['COLLECTOR_RETENTION_SECONDS'],
+        connection_pools=connection_pools
+    )
+    success, msg = lineage_tracker.capture_snapshot()
+    return jsonify({'success': success, 'message': msg})
+
+def _current_result():
+    """
+    Return the session's latest analysis from the result store, rebuilding
+    it from the analysis files when it is no longer stored.
+    
+    Returns:
+        AnalysisResult: The analysis, or None if the session has none
+    """
+    if 'has_results' not in session or 'analysis_files' not in session:
+        return None
+    
+    analysis_id = session.get('analysis_id')
+    result = result_store.get(analysis_id) if analysis_id else None
+    if result is None:
+        result = AnalysisResult.from_files(analysis_id, session['analysis_files'])
+        if analysis_id:
+            result_store.put(result)
+    return result
+
+# Columns the list pages display; the full rows are on the details pages
+EXPENSIVE_QUERY_COLUMNS = ['queryid', 'calls', 'total_time', 'mean_time', 'rows', 'time_per_row', 'query']
+TABLE_STATS_COLUMNS = ['table_name', 'total_queries', 'read_queries', 'write_queries',
+                       'total_time', 'total_read_time', 'total_write_time']
+# Query text sent to the list page, enough for its preview
+QUERY_PREVIEW_CHARS = 80
+
+def _page_columns(df, columns):
+    return [c for c in columns if c in df.columns]
+
+def _table_page(name):
+    """
+    Answer a page request for one of the session's result tables.
+    
+    Query parameters: offset, limit, sort, order (asc/desc), q (text filter),
+    columns (comma-separated) and truncate (characters per string value).
+    """
+    result = _current_result()
+    view = result.table_view(name) if result is not None else None
+    if view is None:
+        return jsonify({'success': False, 'message': 'No analysis results available'}), 404
+    
+    args = request.args
+    columns = args.get('columns')
+    try:
+        page = view.page(
+            offset=args.get('offset', 0, type=int),
+            limit=args.get('limit', DEFAULT_PAGE_SIZE, type=int),
+            sort=args.get('sort') or None,
+            order=args.get('order', 'desc'),
+            q=args.get('q'),
+            columns=columns.split(',') if columns else None,
+            truncate=args.get('truncate', None, type=int)
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    page['success'] = True
+    return jsonify(page)
+
 @app.route('/expensive_queries')
 def expensive_queries():
     """Display expensive queries data"""
-    if 'has_results' not in session or 'analysis_files' not in session:
+    result = _current_result()
+    if result is None:
         flash('No analysis results available. Please run an analysis first.', 'warning')
         return redirect(url_for('index'))
     
-    # Read the CSV file
-    file_path = session['analysis_files'].get('expensive_queries')
-    if not file_path or not os.path.exists(file_path):
+    df = result.expensive_queries
+    if df is None:
         flash('Expensive queries data not found.', 'danger')
         return redirect(url_for('index'))
     
-    # Load data from CSV
-    df = pd.read_csv(file_path)
-    
+    # Rows are fetched page by page from /expensive_queries/data; the first
+    # page is embedded so the table renders without a round trip
     return render_template(
         'expensive_queries.html',
-        queries=df.to_dict('records'),
+        initial_page=result.table_view('expensive_queries').page(
+            limit=DEFAULT_PAGE_SIZE, columns=_page_columns(df, EXPENSIVE_QUERY_COLUMNS),
+            truncate=QUERY_PREVIEW_CHARS),
+        page_columns=_page_columns(df, EXPENSIVE_QUERY_COLUMNS),
+        preview_chars=QUERY_PREVIEW_CHARS,
+        data_url=url_for('expensive_queries_data'),
         columns=df.columns.tolist()
     )
 
+@app.route('/expensive_queries/data')
+def expensive_queries_data():
+    """Serve a page of expensive queries as JSON"""
+    return _table_page('expensive_queries')
+
 @app.route('/table_stats')
 def table_stats():
     """Display table statistics data"""
-    if 'has_results' not in session or 'analysis_files' not in session:
+    result = _current_result()
+    if result is None:
         flash('No analysis results available. Please run an analysis first.', 'warning')
         return redirect(url_for('index'))
     
-    # Read the CSV file
-    file_path = session['analysis_files'].get('table_stats')
-    if not file_path or not os.path.exists(file_path):
+    df = result.table_stats
+    if df is None:
         flash('Table statistics data not found.', 'danger')
         return redirect(url_for('index'))
     
-    # Load data from CSV
-    df = pd.read_csv(file_path)
-    
     return render_template(
         'table_stats.html',
-        stats=df.to_dict('records'),
+        initial_page=result.table_view('table_stats').page(
+            limit=DEFAULT_PAGE_SIZE, columns=_page_columns(df, TABLE_STATS_COLUMNS)),
+        page_columns=_page_columns(df, TABLE_STATS_COLUMNS),
+        data_url=url_for('table_stats_data'),
         columns=df.columns.tolist()
     )
 
+@app.route('/table_stats/data')
+def table_stats_data():
+    """Serve a page of table statistics as JSON"""
+    return _table_page('table_stats')
+
 @app.route('/lineage')
 def lineage():
     """Display the lineage graph"""
-    if 'has_results' not in session or 'analysis_files' not in session:
+    result = _current_result()
+    if result is None:
         flash('No lineage data available. Please run an analysis from the home page first.', 'warning')
         return redirect(url_for('index'))
     
-    # Get the GraphML file path
-    graphml_path = session['analysis_files'].get('lineage_graphml')
+    # Large graphs start from a schema summary, or from a focus node when
+    # one is given, instead of being loaded whole
+    focus = request.args.get('focus')
+    graph = result.lineage_graph
+    large = graph is not None and graph.number_of_nodes() > app.config['LINEAGE_FOCUS_THRESHOLD']
+    start_with_summary = not focus and (large or request.args.get('view') == 'summary')
+    
+    # The graph itself is fetched from /lineage/data by the page
+    return render_template(
+        'lineage.html', 
+        lineage_image_url=url_for('download', file_type='lineage_image'),
+        lineage_data_url=url_for('lineage_data', analysis=result.analysis_id),
+        lineage_neighbourhood_url=url_for('lineage_neighbourhood'),
+        lineage_summary_url=url_for('lineage_summary'),
+        lineage_group_url=url_for('lineage_group'),
+        lineage_focus=focus,
+        start_with_summary=start_with_summary
+    )
+
+@app.route('/lineage/data')
+def lineage_data():
+    """Serve the compact lineage payload of the session's analysis, gzipped"""
+    result = _current_result()
+    payload = result.lineage_payload() if result is not None else None
+    if payload is None:
+        return jsonify({'success': False, 'message': 'No lineage data available'}), 404
+    
+    etag = result.analysis_id or hashlib.sha1(payload).hexdigest()
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    elif 'gzip' in request.accept_encodings:
+        response = Response(payload, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(gzip.decompress(payload), mimetype='application/json')
     
-    # Also keep the image as a fallback
-    img_path = session['analysis_files'].get('lineage_image')
-    img_data = None
-    if img_path and os.path.exists(img_path):
-        with open(img_path, 'rb') as f:
-            img_data = base64.b64encode(f.read()).decode('utf-8')
+    response.set_etag(etag)
+    response.vary.add('Accept-Encoding')
+    # A URL naming the analysis always returns the same bytes
+    if result.analysis_id and request.args.get('analysis') == result.analysis_id:
+        response.headers['Cache-Control'] = 'private, max-age=86400, immutable'
+    else:
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def _reachability_or_404():
+    result = _current_result()
+    reachability = result.reachability() if result is not None else None
+    if reachability is None:
+        return None, (jsonify({'success': False, 'message': 'No lineage data available'}), 404)
+    return reachability, None
+
+def _default_focus(result):
+    """Node the lineage view opens on: the busiest table, or the best connected node"""
+    reachability = result.reachability()
+    if reachability is None or len(reachability) == 0:
+        return None
+    table_stats = result.table_stats
+    if table_stats is not None and not table_stats.empty and 'total_time' in table_stats.columns:
+        busiest = table_stats.sort_values('total_time', ascending=False)['table_name'].iloc[0]
+        if busiest in reachability:
+            return busiest
+    return max(reachability.nodes, key=reachability.degree)
+
+@app.route('/lineage/neighbourhood')
+def lineage_neighbourhood():
+    """
+    Lineage payload of the neighbourhood of one node, for exploring large
+    graphs a piece at a time.
     
-    # Initialize D3 visualization data
-    d3_data = {
-        'nodes': [],
-        'links': []
-    }
+    Query parameters: node (default: the busiest table), depth (edges from
+    the node, default 2) and max_nodes (capped by
+    LINEAGE_NEIGHBOURHOOD_MAX_NODES). When the cap is hit the best
+    connected nodes of the farthest level are kept.
+    """
+    result = _current_result()
+    reachability, error = _reachability_or_404()
+    if error:
+        return error
+    node = request.args.get('node') or _default_focus(result)
+    if node not in reachability:
+        return jsonify({'success': False, 'message': f'Unknown lineage node: {node}'}), 404
     
+    cap = app.config['LINEAGE_NEIGHBOURHOOD_MAX_NODES']
+    depth = request.args.get('depth', 2, type=int)
+    max_nodes = min(request.args.get('max_nodes', cap, type=int), cap)
     try:
-        # Read expensive queries data
-        queries_file = session['analysis_files'].get('expensive_queries')
-        if queries_file and os.path.exists(queries_file):
-            df_queries = pd.read_csv(queries_file)
-            
-            # Load the GraphML file to get the graph structure
-            if graphml_path and os.path.exists(graphml_path):
-                import networkx as nx
-                G = nx.read_graphml(graphml_path)
-                
-                # Create D3 nodes and links
-                for node_id, attrs in G.nodes(data=True):
-                    node_type = attrs.get('type', 'unknown')
-                    node_data = {
-                        'id': node_id,
-                        'type': node_type
-                    }
-                    
-                    if node_type == 'table':
-                        # Extract schema and table name
-                        if '.' in node_id:
-                            schema, table_name = node_id.split('.', 1)
-                        else:
-                            schema = 'public'
-                            table_name = node_id
-                        
-                        # Count connected queries
-                        in_queries = list(G.predecessors(node_id))  # queries that write to this table
-                        out_queries = list(G.successors(node_id))   # queries that read from this table
-                        
-                        # Parse columns if they exist as JSON string
-                        columns = []
-                        if 'columns' in attrs:
-                            try:
-                                if isinstance(attrs['columns'], str):
-                                    import json
-                                    columns = json.loads(attrs['columns'])
-                                else:
-                                    columns = attrs.get('columns', [])
-                            except:
-                                # If parsing fails, use empty list
-                                pass
-                        
-                        # Add table-specific attributes
-                        node_data.update({
-                            'display_name': table_name,
-                            'schema': schema,
-                            'read_queries': len(out_queries),
-                            'write_queries': len(in_queries),
-                            'total_queries': len(in_queries) + len(out_queries),
-                            'columns': columns
-                        })
-                    
-                    elif node_type == 'query':
-                        # Add query-specific attributes
-                        total_time = float(attrs.get('total_time', 0))
-                        calls = int(attrs.get('calls', 0))
-                        mean_time = float(attrs.get('mean_time', 0))
-                        rows = int(attrs.get('rows', 0)) if 'rows' in attrs else 0
-                        
-                        # Get query preview text
-                        preview = attrs.get('text', 'Query text not available')
-                        
-                        node_data.update({
-                            'preview': preview,
-                            'total_time': total_time,
-                            'calls': calls,
-                            'mean_time': mean_time,
-                            'rows': rows
-                        })
-                    
-                    # Add node to D3 data
-                    d3_data['nodes'].append(node_data)
-                
-                # Add links to D3 data
-                for source, target in G.edges():
-                    d3_data['links'].append({
-                        'source': source,
-                        'target': target
-                    })
-    except Exception as e:
-        print(f"Error preparing D3 lineage data: {e}")
-        flash(f'Error processing lineage data: {str(e)}', 'danger')
+        if max_nodes < 1:
+            raise ValueError("max_nodes must be positive")
+        distances = reachability.neighbourhood(node, depth=depth, max_nodes=max_nodes)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     
-    # Convert the data to a JSON string for embedding in the template
-    import json
-    lineage_data_json = json.dumps(d3_data)
+    nodes = [node] + sorted(distances, key=lambda n: (distances[n], n))
+    payload = build_payload(result.lineage_graph, nodes, positions=result.positions())
+    payload.update({'success': True, 'focus': node, 'depth': depth})
+    return jsonify(payload)
+
+@app.route('/lineage/summary')
+def lineage_summary():
+    """
+    Lineage graph collapsed into one node per schema or connected component.
     
-    return render_template(
-        'lineage.html', 
-        lineage_image=img_data,
-        lineage_data_json=lineage_data_json
-    )
+    Query parameters: group_by (schema or component; default schema).
+    """
+    result = _current_result()
+    if result is None or result.lineage_graph is None:
+        return jsonify({'success': False, 'message': 'No lineage data available'}), 404
+    try:
+        summary = result.summary(request.args.get('group_by', 'schema'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    payload = summary.payload()
+    payload['success'] = True
+    return jsonify(payload)
+
+@app.route('/lineage/group')
+def lineage_group():
+    """
+    Lineage payload of the tables of one summary group and the queries
+    touching them.
+    
+    Query parameters: group (group id from /lineage/summary), group_by and
+    max_nodes (capped by LINEAGE_NEIGHBOURHOOD_MAX_NODES).
+    """
+    result = _current_result()
+    if result is None or result.lineage_graph is None:
+        return jsonify({'success': False, 'message': 'No lineage data available'}), 404
+    group_by = request.args.get('group_by', 'schema')
+    cap = app.config['LINEAGE_NEIGHBOURHOOD_MAX_NODES']
+    max_nodes = min(request.args.get('max_nodes', cap, type=int), cap)
+    try:
+        if max_nodes < 1:
+            raise ValueError("max_nodes must be positive")
+        summary = result.summary(group_by)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    group = request.args.get('group')
+    nodes = summary.members(group, max_nodes=max_nodes)
+    if nodes is None:
+        return jsonify({'success': False, 'message': f'Unknown lineage group: {group}'}), 404
+    
+    payload = build_payload(result.lineage_graph, nodes, positions=result.positions())
+    payload.update({'success': True, 'group': group, 'group_by': group_by})
+    return jsonify(payload)
+
+@app.route('/lineage/impact/<path:node>')
+def lineage_impact(node):
+    """
+    Tables and queries upstream or downstream of a lineage graph node.
+    
+    Query parameters: direction (downstream, upstream or both; default
+    downstream), kind (table, query or all; default table) and depth. Without
+    depth every transitively reachable node is returned; with it only the
+    nodes within depth edges, with their distances.
+    """
+    reachability, error = _reachability_or_404()
+    if error:
+        return error
+    if node not in reachability:
+        return jsonify({'success': False, 'message': f'Unknown lineage node: {node}'}), 404
+    
+    direction = request.args.get('direction', 'downstream')
+    kind = request.args.get('kind', 'table')
+    kind = None if kind == 'all' else kind
+    depth = request.args.get('depth', None, type=int)
+    try:
+        if depth is not None:
+            distances = reachability.neighbourhood(node, depth=depth, direction=direction, kind=kind)
+            nodes = sorted(distances, key=lambda n: (distances[n], n))
+        elif direction == 'both':
+            distances = None
+            nodes = sorted(set(reachability.upstream(node, kind)) | set(reachability.downstream(node, kind)))
+        elif direction in ('downstream', 'upstream'):
+            distances = None
+            nodes = getattr(reachability, direction)(node, kind)
+        else:
+            raise ValueError(f"Unknown direction '{direction}'")
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    response = {
+        'success': True,
+        'node': node,
+        'direction': direction,
+        'kind': kind or 'all',
+        'depth': depth,
+        'count': len(nodes),
+        'nodes': nodes
+    }
+    if distances is not None:
+        response['distances'] = distances
+    return jsonify(response)
+
+@app.route('/lineage/path')
+def lineage_path():
+    """
+    Shortest lineage path between two nodes, through the queries that move
+    the data. If no data flows from source to target, the path from target
+    to source is returned with direction 'upstream'.
+    """
+    reachability, error = _reachability_or_404()
+    if error:
+        return error
+    source, target = request.args.get('source'), request.args.get('target')
+    unknown = [name for name in (source, target) if name not in reachability]
+    if unknown:
+        return jsonify({'success': False, 'message': f'Unknown lineage node: {unknown[0]}'}), 404
+    
+    direction = 'downstream'
+    path = reachability.shortest_path(source, target)
+    if path is None:
+        path = reachability.shortest_path(target, source)
+        direction = 'upstream' if path is not None else None
+    return jsonify({'success': True, 'source': source, 'target': target,
+                    'direction': direction, 'path': path})
 
 @app.route('/query_details/<query_id>')
 def query_details(query_id):
     """Display details for a specific query"""
-    if 'has_results' not in session or 'analysis_files' not in session:
+    result = _current_result()
+    if result is None:
         flash('No analysis results available. Please run an analysis first.', 'warning')
         return redirect(url_for('index'))
     
-    # Read the CSV file
-    file_path = session['analysis_files'].get('expensive_queries')
-    if not file_path or not os.path.exists(file_path):
+    df = result.expensive_queries
+    if df is None:
         flash('Query data not found.', 'danger')
         return redirect(url_for('index'))
     
-    # Load data from CSV
-    df = pd.read_csv(file_path)
+    # Row positions and queryids are resolved through the analysis index
+    index = result.index()
+    query_index = index.query_position(query_id)
+    if query_index is None:
+        flash('Query not found.', 'danger')
+        return redirect(url_for('expensive_queries'))
+    query = df.iloc[query_index]
     
-    # Try to convert query_id to an integer index
-    try:
-        query_index = int(query_id)
-        if query_index >= len(df):
-            flash('Query not found.', 'danger')
-            return redirect(url_for('expensive_queries'))
-        query = df.iloc[query_index]
-    except ValueError:
-        # If query_id is not an integer, it might be a hash or identifier
-        # Look for matching queries in the dataframe
-        matching_queries = df[df['queryid'].astype(str) == query_id]
-        if matching_queries.empty:
-            flash('Query not found.', 'danger')
-            return redirect(url_for('expensive_queries'))
-        query = matching_queries.iloc[0]
-        query_index = df.index[df['queryid'].astype(str) == query_id][0]
-    
-    # We cannot directly access the lineage graph from CSV
-    # Instead, we'll display the query and its metrics
-    return render_template('query_details.html', query=query, query_id=query_index)
+    return render_template('query_details.html', query=query, query_id=query_index,
+                           lineage=index.query_lineage(query_index))
 
 @app.route('/table_details/<table_name>')
 def table_details(table_name):
     """Display details for a specific table"""
-    if 'has_results' not in session or 'analysis_files' not in session:
+    result = _current_result()
+    if result is None:
         flash('No analysis results available. Please run an analysis first.', 'warning')
         return redirect(url_for('index'))
     
-    # Read the CSV file
-    file_path = session['analysis_files'].get('table_stats')
-    if not file_path or not os.path.exists(file_path):
+    df = result.table_stats
+    if df is None:
         flash('Table data not found.', 'danger')
         return redirect(url_for('index'))
     
-    # Load data from CSV
-    df = pd.read_csv(file_path)
-    
-    # Get table stats
-    table_data = df[df['table_name'] == table_name]
-    if table_data.empty:
+    index = result.index()
+    position = index.table_position(table_name)
+    if position is None:
         flash('Table not found.', 'danger')
         return redirect(url_for('table_stats'))
     
-    table_stats = table_data.iloc[0].to_dict()
+    table_stats = df.iloc[position].to_dict()
+    
+    # Transitive impact, answered from the reachability index
+    impact = None
+    reachability = result.reachability()
+    if reachability is not None and table_name in reachability:
+        impact = {
+            'upstream': len(reachability.upstream(table_name)),
+            'downstream': len(reachability.downstream(table_name))
+        }
     
-    return render_template('table_details.html', table=table_stats)
+    return render_template('table_details.html', table=table_stats,
+                           queries=index.table_lineage(table_name), impact=impact)
+
+def _render_lineage_image(path):
+    """Draw the PNG of the session's lineage graph with its server-side layout"""
+    result = _current_result()
+    graph = result.lineage_graph if result is not None else None
+    if graph is None or graph.number_of_nodes() == 0:
+        return
+    positions = result.positions() or layout_cache.positions(graph)
+    if isinstance(graph, ArrayGraph):
+        graph = graph.to_networkx()
+    # Written under a temporary name so a concurrent download never sends
+    # half a file; the extension tells matplotlib the format
+    root, ext = os.path.splitext(path)
+    tmp_path = f"{root}.{uuid.uuid4().hex}{ext}"
+    try:
+        render_lineage_image(graph, tmp_path, positions)
+        os.replace(tmp_path, path)
+    except (OSError, ValueError) as e:
+        print(f"Warning when drawing lineage image: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
 
 @app.route('/download/<file_type>')
 def download(file_type):
@@ -334,10 +714,24 @@ def download(file_type):
         return redirect(url_for('index'))
     
     file_path = session['analysis_files'][file_mapping[file_type]]
+    if file_type == 'lineage_image' and not os.path.exists(file_path):
+        _render_lineage_image(file_path)
     if not os.path.exists(file_path):
         flash(f'File not found on disk: {file_type}', 'danger')
         return redirect(url_for('index'))
     
+    # Tables are stored as columnar artifacts and rendered as CSV on demand;
+    # ?format=arrow downloads the artifact itself
+    if (file_type in ('expensive_queries', 'table_stats') and not file_path.endswith(CSV_SUFFIX)
+            and request.args.get('format') != 'arrow'):
+        result = _current_result()
+        df = getattr(result, file_type, None) if result is not None else None
+        if df is None:
+            df = read_table(file_path)
+        csv_name = os.path.splitext(os.path.basename(file_path))[0] + CSV_SUFFIX
+        return send_file(BytesIO(to_csv_bytes(df)), mimetype='text/csv',
+                         as_attachment=True, download_name=csv_name)
+    
     return send_file(file_path, as_attachment=True)
 
 @app.route('/reset')
@@ -347,6 +741,7 @@ def reset():
         del session['has_results']
     if 'analysis_files' in session:
         del session['analysis_files']
+    session.pop('analysis_id', None)
     session.modified = True
     
     flash('Analysis results have been reset.', 'info')
@@ -361,6 +756,7 @@ def disconnect():
         del session['has_results']
     if 'analysis_files' in session:
         del session['analysis_files']
+    session.pop('analysis_id', None)
     session.modified = True
     
     flash('Disconnected from database.', 'info')
@@ -0,0 +1,283 @@
+"""
+Server capability profile for pg_stat_statements analysis.
+Probes the server version, the pg_stat_statements extension and the columns
+it exposes once per connection target, and builds the parameterized
+statements used to rank and fetch expensive queries from that profile.
+"""
+
+import re
+import threading
+
+from psycopg2 import errors
+
+
+# One round trip for the server version and the installed extension version
+VERSION_QUERY = """
+    SELECT current_setting('server_version_num')::int,
+           (SELECT extversion FROM pg_catalog.pg_extension
+            WHERE extname = 'pg_stat_statements')
+"""
+
+SYSTEM_SCHEMAS_QUERY = """
+    SELECT nspname FROM pg_namespace
+    WHERE nspname IN ('pg_catalog', 'information_schema', 'pg_toast')
+       OR nspname LIKE 'pg_%temp_%'
+"""
+
+# Statements that are never part of data lineage
+ADMIN_STATEMENT_PATTERN = '^(SHOW|SET|BEGIN|COMMIT|ROLLBACK)'
+
+# Errors meaning a cached profile no longer matches the server, for example
+# after ALTER EXTENSION pg_stat_statements UPDATE or a server upgrade
+STALE_PROFILE_ERRORS = (errors.UndefinedColumn, errors.UndefinedFunction)
+
+# Columns that may be used to rank queries
+SORT_COLUMNS = ('total_time', 'mean_time', 'calls', 'rows', 'shared_blks_hit',
+                'shared_blks_read', 'temp_blks_written', 'io_time', 'wal_bytes',
+                'total_plan_time')
+
+
+class ServerProfile:
+    """
+    What a PostgreSQL server's pg_stat_statements can report.
+
+    The metric select list and the ranking statements depend only on the
+    profile, so they are built once and reused for every analysis against
+    the same server.
+    """
+
+    def __init__(self, server_version, extension_version, columns, system_schemas):
+        """
+        Args:
+            server_version (int): server_version_num
+            extension_version (str): Installed pg_stat_statements version
+            columns (iterable): Columns exposed by the pg_stat_statements view
+            system_schemas (list): Schemas whose queries are excluded
+        """
+        self.server_version = server_version
+        self.extension_version = extension_version
+        self.columns = frozenset(columns)
+        self.system_schemas = list(system_schemas)
+        self._statements = {}
+
+    @property
+    def has_stats_info(self):
+        """pg_stat_statements 1.9+ reports its last reset in pg_stat_statements_info"""
+        try:
+            version = tuple(int(part) for part in str(self.extension_version).split('.'))
+        except ValueError:
+            return False
+        return version >= (1, 9)
+
+    @property
+    def has_toplevel(self):
+        """pg_stat_statements 1.9+ tracks nested statements separately"""
+        return 'toplevel' in self.columns
+
+    @property
+    def system_schema_pattern(self):
+        """Regex matching schema-qualified references to system schemas"""
+        schemas = self.system_schemas or ['pg_catalog', 'information_schema']
+        return '(' + '|'.join(re.escape(schema) for schema in schemas) + ')\\.'
+
+    def metric_columns(self):
+        """
+        Build the metric select list for this server.
+
+        Metrics the server does not track are reported as 0 so every
+        profile produces the same result columns.
+
+        Returns:
+            str: Comma separated select expressions
+        """
+        if 'total_exec_time' in self.columns:  # PostgreSQL 13+
+            times = "total_exec_time as total_time, mean_exec_time as mean_time"
+        else:  # PostgreSQL 9.6 - 12
+            times = "total_time, mean_time"
+
+        if 'io_time' in self.columns:
+            io_time = "io_time"
+        elif {'shared_blk_read_time', 'shared_blk_write_time'} <= self.columns:  # PostgreSQL 17+
+            io_time = "COALESCE(shared_blk_read_time + shared_blk_write_time, 0) as io_time"
+        elif {'blk_read_time', 'blk_write_time'} <= self.columns:
+            io_time = "COALESCE(blk_read_time + blk_write_time, 0) as io_time"
+        else:
+            io_time = "0 as io_time"
+
+        wal_bytes = "wal_bytes" if 'wal_bytes' in self.columns else "0 as wal_bytes"
+        plan_time = "total_plan_time" if 'total_plan_time' in self.columns else "0 as total_plan_time"
+
+        return (f"calls, {times}, rows, shared_blks_hit, shared_blks_read, "
+                f"temp_blks_written, {io_time}, {wal_bytes}, {plan_time}")
+
+    def ranking_query(self, sort_by, with_text=True):
+        """
+        Get the parameterized statement ranking pg_stat_statements entries.
+
+        Parameters, in order: min_calls, the system schema pattern (only
+        with_text), the window size and the offset.
+
+        Args:
+            sort_by (str): Column to sort by, one of SORT_COLUMNS
+            with_text (bool): Select query texts; without them the ranking
+                uses pg_stat_statements(showtext := false)
+
+        Returns:
+            str: SQL statement
+        """
+        if sort_by not in SORT_COLUMNS:
+            raise ValueError(f"Unsupported sort column '{sort_by}'")
+
+        key = ('rank', sort_by, with_text)
+        if key not in self._statements:
+            if with_text:
+                self._statements[key] = f"""
+                SELECT queryid, query, {self.metric_columns()}, dbid
+                FROM pg_stat_statements
+                WHERE calls >= %s
+                  AND query !~* '{ADMIN_STATEMENT_PATTERN}'
+                  AND query !~* %s
+                ORDER BY {sort_by} DESC, queryid
+                LIMIT %s OFFSET %s
+                """
+            else:
+                self._statements[key] = f"""
+                SELECT userid, dbid, queryid, {self.metric_columns()}
+                FROM pg_stat_statements(showtext := false)
+                WHERE calls >= %s AND queryid IS NOT NULL
+                ORDER BY {sort_by} DESC, queryid
+                LIMIT %s OFFSET %s
+                """
+        return self._statements[key]
+
+    def snapshot_query(self):
+        """
+        Get the statement capturing every entry's counters without texts.
+
+        Servers that do not track nested statements separately report
+        every entry as top level.
+
+        Returns:
+            str: SQL statement
+        """
+        key = ('snapshot',)
+        if key not in self._statements:
+            toplevel = "toplevel" if self.has_toplevel else "true as toplevel"
+            self._statements[key] = f"""
+            SELECT userid, dbid, queryid, {toplevel}, {self.metric_columns()}
+            FROM pg_stat_statements(showtext := false)
+            WHERE queryid IS NOT NULL
+            """
+        return self._statements[key]
+
+    def text_query(self, filtered=True):
+        """
+        Get the parameterized statement fetching texts for ranked entries.
+
+        Parameters, in order: userid, dbid and queryid arrays and, when
+        filtered, the system schema pattern. The join runs in a subquery
+        fenced with OFFSET 0, so the filters are applied to the fetched
+        texts only and the planner cannot push them down into the scan of
+        every pg_stat_statements entry.
+
+        Args:
+            filtered (bool): Leave out administrative commands and queries
+                on system schemas
+
+        Returns:
+            str: SQL statement
+        """
+        key = ('text', filtered)
+        if key not in self._statements:
+            filters = f"""
+            WHERE t.query !~* '{ADMIN_STATEMENT_PATTERN}'
+              AND t.query !~* %s""" if filtered else ""
+            self._statements[key] = f"""
+            SELECT t.userid, t.dbid, t.queryid, t.query
+            FROM (
+                SELECT s.userid, s.dbid, s.queryid, s.query
+                FROM unnest(%s::oid[], %s::oid[], %s::bigint[]) AS c(userid, dbid, queryid)
+                JOIN pg_stat_statements(showtext := true) s USING (userid, dbid, queryid)
+                OFFSET 0
+            ) t{filters}
+            """
+        return self._statements[key]
+
+
+def probe_server(cursor):
+    """
+    Build the capability profile of the server behind a cursor.
+
+    Args:
+        cursor: Open database cursor
+
+    Returns:
+        tuple: (ServerProfile, message), with None instead of a profile
+            when pg_stat_statements is missing or not accessible
+    """
+    cursor.execute(VERSION_QUERY)
+    server_version, extension_version = cursor.fetchone()
+    if extension_version is None:
+        return None, ("pg_stat_statements extension is not installed. "
+                      "Run 'CREATE EXTENSION pg_stat_statements;' as a superuser.")
+
+    try:
+        cursor.execute("SELECT * FROM pg_stat_statements LIMIT 0")
+        columns = [desc[0] for desc in cursor.description]
+    except Exception as e:
+        return None, f"Cannot access pg_stat_statements: {str(e)}"
+
+    cursor.execute(SYSTEM_SCHEMAS_QUERY)
+    system_schemas = [row[0] for row in cursor.fetchall()]
+
+    profile = ServerProfile(int(server_version), extension_version, columns, system_schemas)
+    return profile, "pg_stat_statements is available and accessible."
+
+
+def connection_target(connection_params):
+    """
+    Identify a connection target by host, port, database and user.
+
+    Returns:
+        str: Target in the form user@host:port/database
+    """
+    return "{}@{}:{}/{}".format(
+        connection_params.get('user') or '',
+        connection_params.get('host') or '',
+        connection_params.get('port') or '',
+        connection_params.get('database') or connection_params.get('dbname') or ''
+    )
+
+
+class ServerProfileCache:
+    """Capability profiles keyed by connection target, shared across analyses"""
+
+    def __init__(self):
+        self._profiles = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._profiles)
+
+    @staticmethod
+    def make_key(connection_params):
+        """Identify a connection target by host, port, database and user"""
+        return connection_target(connection_params)
+
+    def get(self, connection_params):
+        """Return the cached profile for a connection target, or None"""
+        with self._lock:
+            return self._profiles.get(self.make_key(connection_params))
+
+    def put(self, connection_params, profile):
+        """Store the profile for a connection target"""
+        with self._lock:
+            self._profiles[self.make_key(connection_params)] = profile
+
+    def invalidate(self, connection_params=None):
+        """Forget one connection target's profile, or all of them"""
+        with self._lock:
+            if connection_params is None:
+                self._profiles.clear()
+            else:
+                self._profiles.pop(self.make_key(connection_params), None)
@@ -0,0 +1,534 @@
+"""
+Workload snapshots of pg_stat_statements.
+pg_stat_statements counters are cumulative since the last reset, so a
+ranking taken straight from the view describes an arbitrary period.
+Snapshots capture the counters at a point in time; the difference between
+two snapshots describes the workload of the interval between them. The
+background collector stores those differences, together with query texts
+and pg_stat_user_tables activity, as a local time series.
+"""
+
+import os
+import time
+import sqlite3
+import threading
+
+import pandas as pd
+
+
+# Identity of a pg_stat_statements entry
+SNAPSHOT_KEY = ['userid', 'dbid', 'queryid', 'toplevel']
+
+# Cumulative counters that are differenced between snapshots
+COUNTER_COLUMNS = ['calls', 'total_time', 'rows', 'shared_blks_hit', 'shared_blks_read',
+                   'temp_blks_written', 'io_time', 'wal_bytes', 'total_plan_time']
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS snapshots (
+        id INTEGER PRIMARY KEY,
+        target TEXT NOT NULL,
+        taken_at REAL NOT NULL,
+        stats_reset REAL
+    );
+    CREATE INDEX IF NOT EXISTS snapshots_target_taken_at ON snapshots (target, taken_at);
+    CREATE TABLE IF NOT EXISTS snapshot_stats (
+        snapshot_id INTEGER NOT NULL REFERENCES snapshots (id) ON DELETE CASCADE,
+        userid INTEGER NOT NULL,
+        dbid INTEGER NOT NULL,
+        queryid INTEGER NOT NULL,
+        toplevel INTEGER NOT NULL,
+        calls INTEGER,
+        total_time REAL,
+        rows INTEGER,
+        shared_blks_hit INTEGER,
+        shared_blks_read INTEGER,
+        temp_blks_written INTEGER,
+        io_time REAL,
+        wal_bytes REAL,
+        total_plan_time REAL
+    );
+    CREATE INDEX IF NOT EXISTS snapshot_stats_snapshot ON snapshot_stats (snapshot_id);
+    CREATE TABLE IF NOT EXISTS deltas (
+        target TEXT NOT NULL,
+        period_start REAL NOT NULL,
+        period_end REAL NOT NULL,
+        resolution INTEGER NOT NULL DEFAULT 0,
+        userid INTEGER NOT NULL,
+        dbid INTEGER NOT NULL,
+        queryid INTEGER NOT NULL,
+        toplevel INTEGER NOT NULL,
+        calls INTEGER,
+        total_time REAL,
+        rows INTEGER,
+        shared_blks_hit INTEGER,
+        shared_blks_read INTEGER,
+        temp_blks_written INTEGER,
+        io_time REAL,
+        wal_bytes REAL,
+        total_plan_time REAL
+    );
+    CREATE INDEX IF NOT EXISTS deltas_target_period ON deltas (target, period_end);
+    CREATE TABLE IF NOT EXISTS query_texts (
+        target TEXT NOT NULL,
+        userid INTEGER NOT NULL,
+        dbid INTEGER NOT NULL,
+        queryid INTEGER NOT NULL,
+        query TEXT NOT NULL,
+        first_seen REAL NOT NULL,
+        PRIMARY KEY (target, userid, dbid, queryid)
+    );
+    CREATE TABLE IF NOT EXISTS table_deltas (
+        target TEXT NOT NULL,
+        period_start REAL NOT NULL,
+        period_end REAL NOT NULL,
+        resolution INTEGER NOT NULL DEFAULT 0,
+        schemaname TEXT NOT NULL,
+        relname TEXT NOT NULL,
+        seq_scan INTEGER,
+        seq_tup_read INTEGER,
+        idx_scan INTEGER,
+        idx_tup_fetch INTEGER,
+        n_tup_ins INTEGER,
+        n_tup_upd INTEGER,
+        n_tup_del INTEGER
+    );
+    CREATE INDEX IF NOT EXISTS table_deltas_target_period ON table_deltas (target, period_end);
+    CREATE TABLE IF NOT EXISTS relations (
+        target TEXT NOT NULL,
+        schemaname TEXT NOT NULL,
+        relname TEXT NOT NULL,
+        last_seen REAL NOT NULL,
+        PRIMARY KEY (target, schemaname, relname)
+    );
+"""
+
+# Cumulative pg_stat_user_tables counters sampled by the collector
+TABLE_KEY = ['schemaname', 'relname']
+TABLE_COUNTER_COLUMNS = ['seq_scan', 'seq_tup_read', 'idx_scan', 'idx_tup_fetch',
+                         'n_tup_ins', 'n_tup_upd', 'n_tup_del']
+
+
+class WorkloadSnapshot:
+    """Cumulative pg_stat_statements counters captured at one point in time"""
+
+    def __init__(self, taken_at, stats, stats_reset=None, snapshot_id=None):
+        """
+        Args:
+            taken_at (float): Capture time as a Unix timestamp
+            stats (pandas.DataFrame): SNAPSHOT_KEY and COUNTER_COLUMNS per entry
+            stats_reset (float, optional): Last pg_stat_statements reset as a
+                Unix timestamp, when the server reports it
+            snapshot_id (int, optional): Row id once stored
+        """
+        self.taken_at = taken_at
+        self.stats = stats
+        self.stats_reset = stats_reset
+        self.snapshot_id = snapshot_id
+
+
+def take_snapshot(cursor, profile):
+    """
+    Capture the current pg_stat_statements counters without query texts.
+
+    Args:
+        cursor: Open database cursor
+        profile (ServerProfile): Capabilities of the connected server
+
+    Returns:
+        WorkloadSnapshot: The captured snapshot
+    """
+    stats_reset = None
+    if profile.has_stats_info:
+        cursor.execute("SELECT extract(epoch FROM stats_reset) FROM pg_stat_statements_info")
+        row = cursor.fetchone()
+        if row and row[0] is not None:
+            stats_reset = float(row[0])
+
+    cursor.execute(profile.snapshot_query())
+    columns = [desc[0] for desc in cursor.description]
+    stats = pd.DataFrame(cursor.fetchall(), columns=columns)
+    stats['toplevel'] = stats['toplevel'].astype(bool)
+    return WorkloadSnapshot(time.time(), stats[SNAPSHOT_KEY + COUNTER_COLUMNS], stats_reset)
+
+
+def compute_delta(older, newer):
+    """
+    Compute the workload between two snapshots.
+
+    Entries that are new in the newer snapshot, or whose counters went
+    backwards because they were deallocated and re-added, contribute their
+    full newer counters. After a reset of pg_stat_statements every entry
+    does. Entries that disappeared are dropped, as are entries with no
+    calls in the interval.
+
+    Args:
+        older (WorkloadSnapshot): Snapshot at the start of the interval
+        newer (WorkloadSnapshot): Snapshot at the end of the interval
+
+    Returns:
+        pandas.DataFrame: SNAPSHOT_KEY, the counter deltas and mean_time
+    """
+    current = newer.stats
+    if current.empty:
+        return pd.DataFrame(columns=SNAPSHOT_KEY + COUNTER_COLUMNS + ['mean_time'])
+
+    was_reset = (newer.stats_reset is not None and older.stats_reset is not None
+                 and newer.stats_reset != older.stats_reset)
+    if was_reset or older.stats.empty:
+        delta = current.copy()
+    else:
+        merged = current.merge(older.stats, on=SNAPSHOT_KEY, how='left', suffixes=('', '_old'))
+        restarted = merged['calls_old'].isna() | (merged['calls'] < merged['calls_old'])
+        delta = merged[SNAPSHOT_KEY].copy()
+        for column in COUNTER_COLUMNS:
+            old = merged[f'{column}_old'].where(~restarted, 0).fillna(0)
+            delta[column] = merged[column] - old
+
+    delta = delta[delta['calls'] > 0].reset_index(drop=True)
+    delta['mean_time'] = delta['total_time'] / delta['calls']
+    return delta
+
+
+def compute_table_delta(older, newer):
+    """
+    Compute pg_stat_user_tables activity between two samples.
+
+    Args:
+        older (pandas.DataFrame): TABLE_KEY and TABLE_COUNTER_COLUMNS
+        newer (pandas.DataFrame): Later sample with the same columns
+
+    Returns:
+        pandas.DataFrame: Tables with any activity in the interval. Tables
+            whose counters went backwards (stats reset) count from zero.
+    """
+    merged = newer.merge(older, on=TABLE_KEY, how='left', suffixes=('', '_old'))
+    counters = merged[TABLE_COUNTER_COLUMNS].fillna(0)
+    previous = merged[[f'{column}_old' for column in TABLE_COUNTER_COLUMNS]].fillna(0)
+    previous.columns = TABLE_COUNTER_COLUMNS
+    restarted = (counters < previous).any(axis=1)
+    delta = merged[TABLE_KEY].copy()
+    for column in TABLE_COUNTER_COLUMNS:
+        delta[column] = counters[column] - previous[column].where(~restarted, 0)
+    return delta[(delta[TABLE_COUNTER_COLUMNS] > 0).any(axis=1)].reset_index(drop=True)
+
+
+def _sql_rows(df, columns):
+    """Rows of a DataFrame as plain Python values for sqlite3"""
+    return df[columns].astype(object).where(df[columns].notna(), None).itertuples(index=False, name=None)
+
+
+class SnapshotStore:
+    """
+    SQLite store of workload snapshots for any number of connection targets.
+
+    Connections are opened per call, so one store can be shared between
+    request threads.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): SQLite database file
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    def save(self, target, snapshot):
+        """
+        Store a snapshot for a connection target.
+
+        Args:
+            target (str): Connection target, see connection_target()
+            snapshot (WorkloadSnapshot): Snapshot to store
+
+        Returns:
+            int: Id of the stored snapshot
+        """
+        rows = _sql_rows(snapshot.stats, SNAPSHOT_KEY + COUNTER_COLUMNS)
+        placeholders = ', '.join(['?'] * (len(SNAPSHOT_KEY) + len(COUNTER_COLUMNS)))
+        with self._lock, self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO snapshots (target, taken_at, stats_reset) VALUES (?, ?, ?)",
+                (target, snapshot.taken_at, snapshot.stats_reset))
+            snapshot.snapshot_id = cursor.lastrowid
+            conn.executemany(
+                f"INSERT INTO snapshot_stats (snapshot_id, {', '.join(SNAPSHOT_KEY + COUNTER_COLUMNS)}) "
+                f"VALUES (?, {placeholders})",
+                ((snapshot.snapshot_id,) + tuple(row) for row in rows))
+        return snapshot.snapshot_id
+
+    def load(self, snapshot_id):
+        """Load a stored snapshot by id, or None if it does not exist"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT taken_at, stats_reset FROM snapshots WHERE id = ?", (snapshot_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            stats = pd.read_sql_query(
+                f"SELECT {', '.join(SNAPSHOT_KEY + COUNTER_COLUMNS)} FROM snapshot_stats "
+                f"WHERE snapshot_id = ?", conn, params=(snapshot_id,))
+        stats['toplevel'] = stats['toplevel'].astype(bool)
+        return WorkloadSnapshot(row[0], stats, row[1], snapshot_id)
+
+    def list(self, target):
+        """
+        List the snapshots stored for a connection target.
+
+        Returns:
+            list: (snapshot_id, taken_at) tuples, oldest first
+        """
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT id, taken_at FROM snapshots WHERE target = ? ORDER BY taken_at",
+                (target,)).fetchall()
+
+    def baseline(self, target, start, before=None):
+        """
+        Find the snapshot to difference against for a window starting at start.
+
+        The newest snapshot taken at or before start is preferred; if every
+        snapshot is younger than that, the oldest one is used and the window
+        is shorter than requested.
+
+        Args:
+            target (str): Connection target
+            start (float): Desired start of the window as a Unix timestamp
+            before (float, optional): Only consider snapshots taken before this
+
+        Returns:
+            WorkloadSnapshot: The baseline snapshot, or None if there is none
+        """
+        snapshots = [(snapshot_id, taken_at) for snapshot_id, taken_at in self.list(target)
+                     if before is None or taken_at < before]
+        if not snapshots:
+            return None
+        candidates = [snapshot_id for snapshot_id, taken_at in snapshots if taken_at <= start]
+        return self.load(candidates[-1] if candidates else snapshots[0][0])
+
+    def latest_snapshot_time(self, target):
+        """Capture time of the newest stored snapshot, or None"""
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT MAX(taken_at) FROM snapshots WHERE target = ?", (target,)).fetchone()[0]
+
+    def prune(self, target, keep_seconds, now=None):
+        """
+        Delete snapshots, collected deltas and relations older than
+        keep_seconds for a connection target, and the query texts of
+        statements that no remaining snapshot or delta refers to.
+
+        Returns:
+            int: Number of snapshots deleted
+        """
+        cutoff = (now or time.time()) - keep_seconds
+        with self._lock, self._connect() as conn:
+            cursor = conn.execute(
+                "DELETE FROM snapshots WHERE target = ? AND taken_at < ?", (target, cutoff))
+            for table in ('deltas', 'table_deltas'):
+                conn.execute(f"DELETE FROM {table} WHERE target = ? AND period_end < ?", (target, cutoff))
+            conn.execute("DELETE FROM relations WHERE target = ? AND last_seen < ?", (target, cutoff))
+            # Texts stored before the cutoff of statements that were since deallocated
+            conn.execute(
+                "DELETE FROM query_texts WHERE target = ? AND first_seen < ? "
+                "AND (userid, dbid, queryid) NOT IN ("
+                "SELECT userid, dbid, queryid FROM deltas WHERE target = ? "
+                "UNION SELECT st.userid, st.dbid, st.queryid FROM snapshot_stats st "
+                "JOIN snapshots s ON s.id = st.snapshot_id WHERE s.target = ?)",
+                (target, cutoff, target, target))
+            return cursor.rowcount
+
+    def save_delta(self, target, period_start, period_end, delta):
+        """
+        Store the pg_stat_statements workload of one collection interval.
+
+        Args:
+            target (str): Connection target
+            period_start (float): Start of the interval as a Unix timestamp
+            period_end (float): End of the interval as a Unix timestamp
+            delta (pandas.DataFrame): Output of compute_delta()
+        """
+        columns = SNAPSHOT_KEY + COUNTER_COLUMNS
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                f"INSERT INTO deltas (target, period_start, period_end, {', '.join(columns)}) "
+                f"VALUES (?, ?, ?, {', '.join(['?'] * len(columns))})",
+                ((target, period_start, period_end) + tuple(row) for row in _sql_rows(delta, columns)))
+
+    def save_table_delta(self, target, period_start, period_end, delta):
+        """Store the pg_stat_user_tables activity of one collection interval"""
+        columns = TABLE_KEY + TABLE_COUNTER_COLUMNS
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                f"INSERT INTO table_deltas (target, period_start, period_end, {', '.join(columns)}) "
+                f"VALUES (?, ?, ?, {', '.join(['?'] * len(columns))})",
+                ((target, period_start, period_end) + tuple(row) for row in _sql_rows(delta, columns)))
+
+    def coverage(self, target):
+        """
+        Time span covered by collected deltas for a connection target.
+
+        Returns:
+            tuple: (first period_start, last period_end), or None when
+                nothing has been collected
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT MIN(period_start), MAX(period_end) FROM deltas WHERE target = ?",
+                (target,)).fetchone()
+        return row if row[0] is not None else None
+
+    def window_delta(self, target, start, end=None):
+        """
+        Sum the collected workload of every interval ending after start.
+
+        Args:
+            target (str): Connection target
+            start (float): Start of the window as a Unix timestamp
+            end (float, optional): End of the window, defaults to now
+
+        Returns:
+            pandas.DataFrame: Same columns as compute_delta()
+        """
+        sums = ', '.join(f"SUM({column}) AS {column}" for column in COUNTER_COLUMNS)
+        with self._connect() as conn:
+            delta = pd.read_sql_query(
+                f"SELECT {', '.join(SNAPSHOT_KEY)}, {sums} FROM deltas "
+                f"WHERE target = ? AND period_end > ? AND period_end <= ? "
+                f"GROUP BY {', '.join(SNAPSHOT_KEY)}",
+                conn, params=(target, start, end or time.time()))
+        delta['toplevel'] = delta['toplevel'].astype(bool)
+        delta = delta[delta['calls'] > 0].reset_index(drop=True)
+        delta['mean_time'] = delta['total_time'] / delta['calls']
+        return delta
+
+    def table_activity(self, target, start, end=None):
+        """
+        Sum the collected pg_stat_user_tables activity of a window.
+
+        Returns:
+            pandas.DataFrame: TABLE_KEY and TABLE_COUNTER_COLUMNS per table
+        """
+        sums = ', '.join(f"SUM({column}) AS {column}" for column in TABLE_COUNTER_COLUMNS)
+        with self._connect() as conn:
+            return pd.read_sql_query(
+                f"SELECT schemaname, relname, {sums} FROM table_deltas "
+                f"WHERE target = ? AND period_end > ? AND period_end <= ? "
+                f"GROUP BY schemaname, relname",
+                conn, params=(target, start, end or time.time()))
+
+    def known_queries(self, target):
+        """Set of (userid, dbid, queryid) whose text is already stored"""
+        with self._connect() as conn:
+            return set(conn.execute(
+                "SELECT userid, dbid, queryid FROM query_texts WHERE target = ?", (target,)))
+
+    def save_texts(self, target, texts, seen_at=None):
+        """
+        Store query texts for newly seen entries.
+
+        Args:
+            target (str): Connection target
+            texts (iterable): (userid, dbid, queryid, query) tuples
+            seen_at (float, optional): First seen time, defaults to now
+        """
+        seen_at = seen_at or time.time()
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO query_texts (target, userid, dbid, queryid, query, first_seen) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                ((target, int(u), int(d), int(q), text, seen_at) for u, d, q, text in texts))
+
+    def texts(self, target, keys):
+        """
+        Look up stored query texts.
+
+        Args:
+            target (str): Connection target
+            keys (iterable): (userid, dbid, queryid) tuples
+
+        Returns:
+            dict: Query text per (userid, dbid, queryid) for stored keys
+        """
+        wanted = {(int(u), int(d), int(q)) for u, d, q in keys}
+        if not wanted:
+            return {}
+        queryids = sorted({q for _, _, q in wanted})
+        found = {}
+        with self._connect() as conn:
+            # Bounded IN lists keep within SQLite's host parameter limit
+            for i in range(0, len(queryids), 500):
+                chunk = queryids[i:i + 500]
+                for u, d, q, text in conn.execute(
+                        f"SELECT userid, dbid, queryid, query FROM query_texts "
+                        f"WHERE target = ? AND queryid IN ({', '.join(['?'] * len(chunk))})",
+                        [target] + chunk):
+                    if (u, d, q) in wanted:
+                        found[(u, d, q)] = text
+        return found
+
+    def save_relations(self, target, relations, seen_at=None):
+        """Record the (schemaname, relname) pairs present on the server"""
+        seen_at = seen_at or time.time()
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO relations (target, schemaname, relname, last_seen) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (target, schemaname, relname) DO UPDATE SET last_seen = excluded.last_seen",
+                ((target, schema, table, seen_at) for schema, table in relations))
+
+    def relations(self, target):
+        """
+        List the user tables last seen on the server.
+
+        Returns:
+            list: Table names in format schema.table
+        """
+        with self._connect() as conn:
+            return [f"{schema}.{table}" for schema, table in conn.execute(
+                "SELECT schemaname, relname FROM relations WHERE target = ?", (target,))]
+
+    def downsample(self, target, older_than, bucket_seconds):
+        """
+        Merge collected intervals that ended before older_than into buckets
+        of bucket_seconds, so long retention stays compact.
+
+        Args:
+            target (str): Connection target
+            older_than (float): Only intervals ending before this are merged
+            bucket_seconds (int): Bucket length in seconds
+
+        Returns:
+            int: Number of rows removed by merging
+        """
+        removed = 0
+        with self._lock, self._connect() as conn:
+            for table, key, counters in (('deltas', SNAPSHOT_KEY, COUNTER_COLUMNS),
+                                         ('table_deltas', TABLE_KEY, TABLE_COUNTER_COLUMNS)):
+                condition = "target = ? AND period_end < ? AND resolution < ?"
+                params = (target, older_than, bucket_seconds)
+                before = conn.execute(f"SELECT COUNT(*) FROM {table} WHERE {condition}", params).fetchone()[0]
+                if not before:
+                    continue
+                bucket = f"CAST(period_start / {int(bucket_seconds)} AS INTEGER) * {int(bucket_seconds)}"
+                rows = conn.execute(
+                    f"SELECT {bucket}, MAX(period_end), {', '.join(key)}, "
+                    f"{', '.join(f'SUM({c})' for c in counters)} FROM {table} WHERE {condition} "
+                    f"GROUP BY {bucket}, {', '.join(key)}", params).fetchall()
+                conn.execute(f"DELETE FROM {table} WHERE {condition}", params)
+                conn.executemany(
+                    f"INSERT INTO {table} (target, period_start, period_end, resolution, "
+                    f"{', '.join(key + counters)}) "
+                    f"VALUES (?, ?, ?, ?, {', '.join(['?'] * (len(key) + len(counters)))})",
+                    ((target, row[0], row[1], bucket_seconds) + tuple(row[2:]) for row in rows))
+                removed += before - len(rows)
+        return removed
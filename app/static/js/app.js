@@ -373,35 +373,126 @@ document.addEventListener('DOMContentLoaded', function() {
             const loader = document.getElementById('loader');
             const analyzeBtn = document.getElementById('analyzeBtn');
             
+            const finish = () => {
+                loader.style.display = 'none';
+                analyzeBtn.disabled = false;
+            };
+            
+            const showResults = data => {
+                analysisStatus.innerHTML = `<div class="alert alert-success">${data.message}</div>`;
+                
+                // Statements over the parse budget only got scanner-based lineage
+                const degraded = data.degraded_queries || [];
+                if (degraded.length > 0) {
+                    analysisStatus.innerHTML += `<div class="alert alert-warning">
+                        ${degraded.length} statement${degraded.length !== 1 ? 's' : ''} exceeded the parse budget
+                        and got degraded lineage from the keyword scanner.</div>`;
+                }
+                
+                // A window needs an earlier snapshot, otherwise cumulative stats were used
+                if (formData.get('window')) {
+                    const span = data.workload_window;
+                    analysisStatus.innerHTML += span
+                        ? `<div class="alert alert-info">Workload window: ${span.start} to ${span.end}</div>`
+                        : `<div class="alert alert-warning">No earlier snapshot for this server yet, so
+                            cumulative statistics were analyzed. A snapshot has been stored for next time.</div>`;
+                }
+                
+                // Redirect directly to lineage page after analysis
+                setTimeout(() => {
+                    window.location.href = '/lineage';
+                }, 1500);
+            };
+            
+            const showProgress = (job, cancelUrl) => {
+                const percent = Math.round(job.progress * 100);
+                analysisStatus.innerHTML = `
+                    <div class="alert alert-info">
+                        <div class="d-flex justify-content-between align-items-center mb-2">
+                            <span>${job.message}</span>
+                            <button type="button" class="btn btn-sm btn-outline-secondary" id="cancelAnalysisBtn">Cancel</button>
+                        </div>
+                        <div class="progress">
+                            <div class="progress-bar" role="progressbar" style="width: ${percent}%"
+                                 aria-valuenow="${percent}" aria-valuemin="0" aria-valuemax="100">${job.stage || job.status}</div>
+                        </div>
+                    </div>`;
+                document.getElementById('cancelAnalysisBtn').addEventListener('click', function() {
+                    this.disabled = true;
+                    fetch(cancelUrl, { method: 'POST' });
+                });
+            };
+            
+            // Poll the job until it finishes; the final poll also stores the results in the session
+            const poll = (statusUrl, cancelUrl) => {
+                fetch(statusUrl)
+                .then(response => response.json())
+                .then(job => {
+                    if (!job.success) {
+                        finish();
+                        analysisStatus.innerHTML = `<div class="alert alert-danger">${job.message}</div>`;
+                    } else if (job.status === 'succeeded') {
+                        finish();
+                        showResults(job);
+                    } else if (job.status === 'failed') {
+                        finish();
+                        analysisStatus.innerHTML = `<div class="alert alert-danger">${job.error}</div>`;
+                    } else if (job.status === 'cancelled') {
+                        finish();
+                        analysisStatus.innerHTML = '<div class="alert alert-warning">Analysis cancelled.</div>';
+                    } else {
+                        showProgress(job, cancelUrl);
+                        setTimeout(() => poll(statusUrl, cancelUrl), 1000);
+                    }
+                })
+                .catch(error => {
+                    finish();
+                    analysisStatus.innerHTML = `<div class="alert alert-danger">Error: ${error}</div>`;
+                });
+            };
+            
             // Clear previous status, show loading spinner, and disable button
-            analysisStatus.innerHTML = '<div class="alert alert-info">Running analysis... This may take a few moments.</div>';
+            analysisStatus.innerHTML = '<div class="alert alert-info">Starting analysis...</div>';
             loader.style.display = 'block';
             analyzeBtn.disabled = true;
             
-            // Send analysis request
+            // Start the analysis job
             fetch('/analyze', {
                 method: 'POST',
                 body: formData
             })
             .then(response => response.json())
             .then(data => {
-                loader.style.display = 'none';
-                analyzeBtn.disabled = false;
-                
                 if (data.success) {
-                    analysisStatus.innerHTML = `<div class="alert alert-success">${data.message}</div>`;
-                    
-                    // Redirect directly to lineage page after analysis
-                    setTimeout(() => {
-                        window.location.href = '/lineage';
-                    }, 1500);
+                    poll(data.status_url, data.cancel_url);
                 } else {
+                    finish();
                     analysisStatus.innerHTML = `<div class="alert alert-danger">${data.message}</div>`;
                 }
             })
             .catch(error => {
-                loader.style.display = 'none';
-                analyzeBtn.disabled = false;
+                finish();
+                analysisStatus.innerHTML = `<div class="alert alert-danger">Error: ${error}</div>`;
+            });
+        });
+    }
+    
+    // Capture a workload snapshot as the baseline for windowed analyses
+    const snapshotBtn = document.getElementById('snapshotBtn');
+    if (snapshotBtn) {
+        snapshotBtn.addEventListener('click', function() {
+            const analysisStatus = document.getElementById('analysisStatus');
+            snapshotBtn.disabled = true;
+            
+            fetch('/snapshot', { method: 'POST' })
+            .then(response => response.json())
+            .then(data => {
+                snapshotBtn.disabled = false;
+                const alertClass = data.success ? 'alert-success' : 'alert-danger';
+                analysisStatus.innerHTML = `<div class="alert ${alertClass}">${data.message}</div>`;
+            })
+            .catch(error => {
+                snapshotBtn.disabled = false;
                 analysisStatus.innerHTML = `<div class="alert alert-danger">Error: ${error}</div>`;
             });
         });
@@ -9,22 +9,202 @@ let lineageZoom;
 let lineageSvg;
 let lineageGraph;
 let topNodes; // Store important nodes that always need labels
+let exploredNodes = null; // Nodes loaded so far when exploring from a focus node
+let exploredLinks = null;
+
+// Pixels per unit of the server-side layout: one layer, one row
+const LAYOUT_SPACING = { x: 180, y: 60 };
 
 // Initialize the visualization when DOM is ready
 document.addEventListener('DOMContentLoaded', function() {
-    initializeLineageGraph();
+    // Large graphs open on the schema summary (lineage-summary.js)
+    if (window.lineageStartWithSummary && typeof showLineageSummary === 'function') {
+        showLineageSummary('schema');
+        return;
+    }
+    const loading = window.lineageFocus ? loadNeighbourhood(window.lineageFocus) : loadLineageData();
+    loading
+        .then(data => {
+            window.lineageData = data;
+            initializeLineageGraph();
+        })
+        .catch(error => {
+            console.error('Error loading lineage data:', error);
+            initializeLineageGraph();
+        });
 });
 
+/**
+ * Fetch the compact lineage payload and expand it into D3 nodes and links
+ */
+function loadLineageData() {
+    if (!window.lineageDataUrl) {
+        return Promise.resolve(window.lineageData);
+    }
+    return fetch(window.lineageDataUrl)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
+            return response.json();
+        })
+        .then(expandLineagePayload);
+}
+
+/**
+ * Fetch the neighbourhood of a node and merge it into the nodes loaded so far
+ *
+ * @param {string} nodeId - Node to load the neighbourhood of
+ * @param {Object} [origin] - Already drawn node new nodes start next to
+ */
+function loadNeighbourhood(nodeId, origin) {
+    const params = new URLSearchParams({node: nodeId});
+    return fetch(window.lineageNeighbourhoodUrl + '?' + params.toString(), {credentials: 'same-origin'})
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
+            return response.json();
+        })
+        .then(payload => mergeNeighbourhood(expandLineagePayload(payload), origin));
+}
+
+/**
+ * Add newly loaded nodes and links to the explored graph. Nodes already
+ * drawn keep their objects, and so their positions.
+ */
+function mergeNeighbourhood(data, origin) {
+    if (!exploredNodes) {
+        exploredNodes = new Map();
+        exploredLinks = new Map();
+    }
+    data.nodes.forEach(node => {
+        if (!exploredNodes.has(node.id)) {
+            if (!node.laidOut && origin && origin.x !== undefined) {
+                node.x = origin.x + (Math.random() - 0.5) * 40;
+                node.y = origin.y + (Math.random() - 0.5) * 40;
+            }
+            exploredNodes.set(node.id, node);
+        }
+    });
+    data.links.forEach(link => {
+        exploredLinks.set(link.source + '\u0000' + link.target, link);
+    });
+    
+    // The force simulation replaces link ends with node objects; a new
+    // simulation needs plain ids again
+    const endId = end => typeof end === 'object' ? end.id : end;
+    const links = Array.from(exploredLinks.values()).map(link => ({
+        source: endId(link.source),
+        target: endId(link.target)
+    }));
+    
+    // Nodes with more edges than loaded links can be expanded
+    const loaded = new Map();
+    links.forEach(link => {
+        loaded.set(link.source, (loaded.get(link.source) || 0) + 1);
+        loaded.set(link.target, (loaded.get(link.target) || 0) + 1);
+    });
+    const nodes = Array.from(exploredNodes.values());
+    nodes.forEach(node => {
+        node.hiddenConnections = Math.max(0, node.connectionCount - (loaded.get(node.id) || 0));
+    });
+    
+    return { nodes: nodes, links: links };
+}
+
+/**
+ * Load the neighbourhood of a node and redraw, keeping the current zoom
+ */
+function expandNode(d) {
+    loadNeighbourhood(d.id, d)
+        .then(data => {
+            const transform = lineageSvg ? d3.zoomTransform(lineageSvg.node()) : null;
+            if (lineageSimulation) {
+                lineageSimulation.stop();
+            }
+            d3.selectAll('.lineage-tooltip').remove();
+            document.getElementById('lineage-graph').innerHTML = '';
+            window.lineageData = data;
+            initializeLineageGraph(transform);
+        })
+        .catch(error => console.error('Error expanding lineage node:', error));
+}
+
+/**
+ * Expand the column-oriented payload (integer node indices, interned
+ * strings, precomputed degrees) into the node and link objects D3 uses
+ */
+function expandLineagePayload(payload) {
+    const strings = payload.strings;
+    const n = payload.nodes;
+    
+    const nodes = n.id.map((id, i) => {
+        const type = strings[n.type[i]];
+        const node = {
+            id: id,
+            type: type,
+            connectionCount: n.in_degree[i] + n.out_degree[i]
+        };
+        
+        // Position from the server-side layout, when the payload has one
+        if (n.x && n.x[i] !== null) {
+            node.x = n.x[i] * LAYOUT_SPACING.x;
+            node.y = n.y[i] * LAYOUT_SPACING.y;
+            node.laidOut = true;
+        }
+        
+        if (type === 'table') {
+            node.display_name = n.label[i];
+            node.schema = strings[n.schema[i]];
+            node.read_queries = n.out_degree[i];
+            node.write_queries = n.in_degree[i];
+            node.total_queries = n.in_degree[i] + n.out_degree[i];
+            node.columns = (n.columns[i] || []).map(col => ({
+                name: col[0],
+                type: strings[col[1]],
+                not_null: col[2] === 1,
+                is_primary_key: col[3] === 1
+            }));
+        } else if (type === 'query') {
+            node.preview = n.label[i];
+            node.total_time = n.total_time[i];
+            node.calls = n.calls[i];
+            node.mean_time = n.mean_time[i];
+            node.rows = n.rows[i];
+        }
+        return node;
+    });
+    
+    const links = payload.links.source.map((source, k) => ({
+        source: nodes[source].id,
+        target: nodes[payload.links.target[k]].id
+    }));
+    
+    return { nodes: nodes, links: links };
+}
+
 /**
  * Initialize the D3 force-directed graph
+ *
+ * @param {Object} [transform] - Zoom transform to keep instead of zooming to fit
  */
-function initializeLineageGraph() {
+function initializeLineageGraph(transform) {
     // Check if we have lineage data
     const lineageData = window.lineageData;
     if (!lineageData || !lineageData.nodes || !lineageData.links) {
         console.error('Lineage data not available');
         document.getElementById('lineage-graph').innerHTML = 
             '<div class="alert alert-warning"><i class="bi bi-exclamation-triangle me-2"></i>Lineage data not available</div>';
+        // Fall back to the static image, which the server draws on request
+        if (window.lineageImageUrl) {
+            const img = document.createElement('img');
+            img.className = 'img-fluid';
+            img.alt = 'Lineage graph';
+            img.src = window.lineageImageUrl;
+            img.onerror = () => img.remove();
+            document.getElementById('lineage-graph').appendChild(img);
+        }
         return;
     }
 
@@ -105,21 +285,8 @@ function initializeLineageGraph() {
     // Convert schemas to array for indexing
     const schemaArray = Array.from(schemas);
     
-    // Calculate connection count for each node
-    lineageData.nodes.forEach(node => {
-        node.connectionCount = 0;
-    });
-    
-    lineageData.links.forEach(link => {
-        const source = typeof link.source === 'object' ? link.source.id : link.source;
-        const target = typeof link.target === 'object' ? link.target.id : link.target;
-        
-        const sourceNode = lineageData.nodes.find(n => n.id === source);
-        const targetNode = lineageData.nodes.find(n => n.id === target);
-        
-        if (sourceNode) sourceNode.connectionCount = (sourceNode.connectionCount || 0) + 1;
-        if (targetNode) targetNode.connectionCount = (targetNode.connectionCount || 0) + 1;
-    });
+    // Connection counts come precomputed with the payload
+    const nodeById = new Map(lineageData.nodes.map(node => [node.id, node]));
     
     // Create the force simulation for layout
     const simulation = d3.forceSimulation(lineageData.nodes)
@@ -150,7 +317,7 @@ function initializeLineageGraph() {
                     if ((link.source === d.id || link.target === d.id)) {
                         // Get the other node in the link
                         const otherNodeId = link.source === d.id ? link.target : link.source;
-                        const otherNode = lineageData.nodes.find(n => n.id === otherNodeId);
+                        const otherNode = nodeById.get(otherNodeId);
                         
                         // If it's a table, increment its schema count
                         if (otherNode && otherNode.type === 'table') {
@@ -205,16 +372,22 @@ function initializeLineageGraph() {
             return 300; // Default radius for unconnected nodes
         }, width / 2, height / 2).strength(0.1)); // Reduced strength to prioritize schema grouping
 
-    // Classify links into direct table-to-table links and query links
-    const tableToTableLinks = lineageData.links.filter(link => 
-        (lineageData.nodes.find(n => n.id === link.source)?.type === 'table' && 
-         lineageData.nodes.find(n => n.id === link.target)?.type === 'table')
-    );
+    // Nodes laid out by the server are drawn where they are: the layout
+    // forces are dropped and the simulation only runs while a node is dragged
+    const laidOut = lineageData.nodes.length > 0 && lineageData.nodes.every(d => d.laidOut);
+    if (laidOut) {
+        ['charge', 'center', 'x', 'y', 'connectivity'].forEach(name => simulation.force(name, null));
+        simulation.force('link').strength(0);
+        simulation.stop();
+        document.getElementById('schema-grouping').checked = false;
+        document.getElementById('connectivity-layout').checked = false;
+    }
     
-    const queryLinks = lineageData.links.filter(link => 
-        !(lineageData.nodes.find(n => n.id === link.source)?.type === 'table' && 
-          lineageData.nodes.find(n => n.id === link.target)?.type === 'table')
-    );
+    // Classify links into direct table-to-table links and query links
+    const isTableToTable = link => 
+        nodeById.get(link.source)?.type === 'table' && nodeById.get(link.target)?.type === 'table';
+    const tableToTableLinks = lineageData.links.filter(isTableToTable);
+    const queryLinks = lineageData.links.filter(link => !isTableToTable(link));
     
     // Create regular query links
     const queryLink = g.append('g')
@@ -317,7 +490,8 @@ function initializeLineageGraph() {
         .data(lineageData.nodes)
         .enter()
         .append('g')
-        .attr('class', d => 'lineage-node lineage-node-' + d.type)
+        .attr('class', d => 'lineage-node lineage-node-' + d.type +
+            (d.hiddenConnections ? ' lineage-node-expandable' : ''))
         .call(d3.drag()
             .on('start', dragStarted)
             .on('drag', dragging)
@@ -453,23 +627,23 @@ function initializeLineageGraph() {
         resetHighlights();
     })
     .on('click', (event, d) => {
+        // While exploring from a focus node, a click loads the node's
+        // neighbours until all of them are shown
+        if (exploredNodes && d.hiddenConnections && !(event.ctrlKey || event.metaKey)) {
+            expandNode(d);
+            return;
+        }
         // Handle node click - navigate to details page
         if (d.type === 'table') {
             window.location.href = '/table_details/' + d.id;
         } else if (d.type === 'query') {
-            // Extract the numeric index from the query's position in the data
-            const queryIndex = lineageData.nodes
-                .filter(node => node.type === 'query')
-                .findIndex(node => node.id === d.id);
-            
-            if (queryIndex !== -1) {
-                window.location.href = '/query_details/' + queryIndex;
-            }
+            // Query node ids are stable and resolved by the details page
+            window.location.href = '/query_details/' + encodeURIComponent(d.id);
         }
     });
     
     // Simulation tick function to update positions
-    simulation.on('tick', () => {
+    function ticked() {
         // Update query links positions
         d3.selectAll('.query-link')
             .attr('x1', d => d.source.x)
@@ -487,7 +661,11 @@ function initializeLineageGraph() {
         // Update node positions
         node
             .attr('transform', d => `translate(${d.x},${d.y})`);
-    });
+    }
+    simulation.on('tick', ticked);
+    if (laidOut) {
+        ticked();
+    }
     
     // Add schema regions and labels when grouping by schema
     if (schemas.size > 1) {
@@ -589,6 +767,13 @@ function initializeLineageGraph() {
         }
     }
     
+    // Schema columns do not apply to the server-side layout
+    if (laidOut) {
+        d3.selectAll('.schema-regions, .schema-separators').style('opacity', 0);
+        d3.select('.schema-overlay').style('display', 'none');
+        document.getElementById('floating-labels').checked = false;
+    }
+    
     // Setup toggle handlers for layout options
     setupLayoutToggles(simulation, schemas, schemaArray, tableNodesBySchema, width, height);
     
@@ -598,8 +783,12 @@ function initializeLineageGraph() {
     lineageSvg = svg;
     lineageGraph = g;
     
-    // Initially center and zoom to fit content
-    zoomToFit();
+    // Initially center and zoom to fit content, unless redrawn after an expansion
+    if (transform) {
+        svg.call(zoom.transform, transform);
+    } else {
+        zoomToFit();
+    }
     
     // Drag functions
     function dragStarted(event, d) {
@@ -690,6 +879,17 @@ function getNodeLabel(d) {
     }
 }
 
+/**
+ * What clicking a node does
+ */
+function getClickHint(d) {
+    if (exploredNodes && d.hiddenConnections) {
+        const count = d.hiddenConnections;
+        return `Click to show ${count} more connection${count !== 1 ? 's' : ''}, Ctrl+click for details`;
+    }
+    return 'Click for details';
+}
+
 /**
  * Get tooltip content for a node
  */
@@ -747,7 +947,7 @@ function getTooltipContent(d) {
             <div class="tooltip-stat">Total queries: ${d.total_queries || 0}</div>
             ${columnsHTML}
             ${relationshipsHTML}
-            <div class="tooltip-footer">Click for details</div>
+            <div class="tooltip-footer">${getClickHint(d)}</div>
         `;
     } else {
         return `
@@ -756,7 +956,7 @@ function getTooltipContent(d) {
             <div class="tooltip-stat">Total time: ${d.total_time.toFixed(2)} ms</div>
             <div class="tooltip-stat">Calls: ${d.calls}</div>
             <div class="tooltip-stat">Rows: ${d.rows}</div>
-            <div class="tooltip-footer">Click for details</div>
+            <div class="tooltip-footer">${getClickHint(d)}</div>
         `;
     }
 }
@@ -961,13 +1161,14 @@ function addZoomControls(svg, zoom) {
  * Setup toggle handlers for layout options
  */
 function setupLayoutToggles(simulation, schemas, schemaArray, tableNodesBySchema, width, height) {
+    // Handlers are set with d3 so a redraw replaces those of the previous graph
     const schemaGroupingToggle = document.getElementById('schema-grouping');
     const connectivityLayoutToggle = document.getElementById('connectivity-layout');
     const floatingLabelsToggle = document.getElementById('floating-labels');
     
     // Handler for schema grouping toggle
     if (schemaGroupingToggle) {
-        schemaGroupingToggle.addEventListener('change', function() {
+        d3.select(schemaGroupingToggle).on('change', function() {
             const useSchemaGrouping = this.checked;
             
             // Update schema visual elements visibility - excluding the overlay labels
@@ -1066,7 +1267,7 @@ function setupLayoutToggles(simulation, schemas, schemaArray, tableNodesBySchema
     
     // Handler for connectivity layout toggle
     if (connectivityLayoutToggle) {
-        connectivityLayoutToggle.addEventListener('change', function() {
+        d3.select(connectivityLayoutToggle).on('change', function() {
             const useConnectivityLayout = this.checked;
             
             if (useConnectivityLayout) {
@@ -1091,7 +1292,7 @@ function setupLayoutToggles(simulation, schemas, schemaArray, tableNodesBySchema
     
     // Handler for floating labels toggle
     if (floatingLabelsToggle) {
-        floatingLabelsToggle.addEventListener('change', function() {
+        d3.select(floatingLabelsToggle).on('change', function() {
             const useFloatingLabels = this.checked;
             
             // Toggle visibility of floating schema labels
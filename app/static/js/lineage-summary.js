@@ -0,0 +1,234 @@
+/**
+ * PostgreSQL Data Lineage Tool - Lineage summary view
+ *
+ * Large lineage graphs open on a summary with one node per schema or
+ * connected component, linked by the queries that move data between them.
+ * Clicking a group loads its tables and queries into the detailed graph,
+ * which can then be expanded node by node (see d3-lineage.js).
+ */
+
+let summarySimulation = null;
+let summaryGroupBy = 'schema';
+
+document.addEventListener('DOMContentLoaded', function() {
+    const groupBySelect = document.getElementById('summary-group-by');
+    if (groupBySelect) {
+        groupBySelect.addEventListener('change', () => showLineageSummary(groupBySelect.value));
+    }
+    const backButton = document.getElementById('summary-back');
+    if (backButton) {
+        backButton.addEventListener('click', () => showLineageSummary());
+    }
+});
+
+/**
+ * Stop any running simulation and empty the graph container
+ */
+function clearLineageView() {
+    if (summarySimulation) {
+        summarySimulation.stop();
+        summarySimulation = null;
+    }
+    if (lineageSimulation) {
+        lineageSimulation.stop();
+    }
+    d3.selectAll('.lineage-tooltip').remove();
+    document.getElementById('lineage-graph').innerHTML = '';
+}
+
+/**
+ * Show the summary controls, or the button leading back to the summary
+ */
+function setSummaryControls(inSummary) {
+    document.getElementById('summary-controls').classList.toggle('d-none', !inSummary);
+    document.getElementById('summary-back').classList.toggle('d-none', inSummary);
+}
+
+/**
+ * Fetch and draw the summary graph
+ *
+ * @param {string} [groupBy] - 'schema' or 'component'; keeps the current grouping if omitted
+ */
+function showLineageSummary(groupBy) {
+    summaryGroupBy = groupBy || summaryGroupBy;
+    const params = new URLSearchParams({group_by: summaryGroupBy});
+    return fetch(window.lineageSummaryUrl + '?' + params.toString(), {credentials: 'same-origin'})
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
+            return response.json();
+        })
+        .then(summary => {
+            clearLineageView();
+            exploredNodes = null;
+            exploredLinks = null;
+            setSummaryControls(true);
+            renderLineageSummary(summary);
+        })
+        .catch(error => {
+            console.error('Error loading lineage summary:', error);
+            document.getElementById('lineage-graph').innerHTML =
+                '<div class="alert alert-warning"><i class="bi bi-exclamation-triangle me-2"></i>Lineage summary not available</div>';
+        });
+}
+
+/**
+ * Replace the summary with the tables and queries of one group
+ */
+function openLineageGroup(groupId) {
+    const params = new URLSearchParams({group: groupId, group_by: summaryGroupBy});
+    fetch(window.lineageGroupUrl + '?' + params.toString(), {credentials: 'same-origin'})
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`HTTP ${response.status}`);
+            }
+            return response.json();
+        })
+        .then(payload => {
+            clearLineageView();
+            exploredNodes = null;
+            exploredLinks = null;
+            window.lineageData = mergeNeighbourhood(expandLineagePayload(payload));
+            setSummaryControls(false);
+            initializeLineageGraph();
+        })
+        .catch(error => console.error('Error loading lineage group:', error));
+}
+
+/**
+ * Draw the groups as super-nodes sized by their table count and the links
+ * between them weighted by query count
+ */
+function renderLineageSummary(summary) {
+    const container = document.getElementById('lineage-graph');
+    const width = container.clientWidth;
+    const height = 600;
+
+    const g = summary.groups;
+    const groups = g.id.map((id, i) => ({
+        id: id,
+        label: g.label[i],
+        tables: g.tables[i],
+        queries: g.queries[i],
+        total_time: g.total_time[i]
+    }));
+    const links = summary.links.source.map((source, k) => ({
+        source: groups[source].id,
+        target: groups[summary.links.target[k]].id,
+        queries: summary.links.queries[k],
+        total_time: summary.links.total_time[k]
+    }));
+    const radius = d => 10 + 4 * Math.sqrt(d.tables);
+
+    const svg = d3.select('#lineage-graph')
+        .append('svg')
+        .attr('width', width)
+        .attr('height', height)
+        .attr('class', 'lineage-svg');
+    const layer = svg.append('g').attr('class', 'lineage-container');
+    const zoom = d3.zoom()
+        .scaleExtent([0.1, 4])
+        .on('zoom', event => layer.attr('transform', event.transform));
+    svg.call(zoom);
+    addZoomControls(svg, zoom);
+
+    svg.append('defs').append('marker')
+        .attr('id', 'summary-arrowhead')
+        .attr('viewBox', '0 -5 10 10')
+        .attr('refX', 10)
+        .attr('markerWidth', 6)
+        .attr('markerHeight', 6)
+        .attr('orient', 'auto')
+        .append('path')
+        .attr('d', 'M0,-5L10,0L0,5')
+        .attr('fill', '#a8a8a8');
+
+    const tooltip = d3.select('body')
+        .append('div')
+        .attr('class', 'lineage-tooltip')
+        .style('opacity', 0);
+
+    const link = layer.append('g')
+        .attr('class', 'links')
+        .selectAll('line')
+        .data(links)
+        .enter()
+        .append('line')
+        .attr('class', 'lineage-link summary-link')
+        .attr('stroke', '#a8a8a8')
+        .attr('stroke-width', d => 1 + Math.log2(1 + d.queries))
+        .attr('marker-end', 'url(#summary-arrowhead)');
+    link.append('title')
+        .text(d => `${d.queries} quer${d.queries !== 1 ? 'ies' : 'y'}, ${d.total_time.toFixed(2)} ms`);
+
+    const node = layer.append('g')
+        .attr('class', 'nodes')
+        .selectAll('g')
+        .data(groups)
+        .enter()
+        .append('g')
+        .attr('class', 'lineage-node lineage-node-group')
+        .style('cursor', 'pointer');
+    node.append('circle')
+        .attr('r', radius)
+        .attr('fill', '#28C76F')
+        .attr('fill-opacity', 0.8)
+        .attr('stroke', '#1a5e1a')
+        .attr('stroke-width', 1.5);
+    node.append('text')
+        .attr('text-anchor', 'middle')
+        .attr('dy', d => -radius(d) - 6)
+        .attr('font-size', '12px')
+        .attr('font-weight', 'bold')
+        .attr('fill', '#333')
+        .text(d => d.label);
+    node.append('text')
+        .attr('text-anchor', 'middle')
+        .attr('dy', '0.35em')
+        .attr('font-size', '10px')
+        .attr('fill', '#fff')
+        .text(d => d.tables);
+
+    node.on('mouseover', (event, d) => {
+        tooltip.transition().duration(200).style('opacity', .9);
+        tooltip.html(`
+                <div class="tooltip-header">${d.label}</div>
+                <div class="tooltip-stat">Tables: ${d.tables}</div>
+                <div class="tooltip-stat">Queries: ${d.queries}</div>
+                <div class="tooltip-stat">Total time: ${d.total_time.toFixed(2)} ms</div>
+                <div class="tooltip-footer">Click to show its tables</div>
+            `)
+            .style('left', (event.pageX + 10) + 'px')
+            .style('top', (event.pageY - 28) + 'px');
+    })
+    .on('mouseout', () => tooltip.transition().duration(500).style('opacity', 0))
+    .on('click', (event, d) => openLineageGroup(d.id));
+
+    summarySimulation = d3.forceSimulation(groups)
+        .force('link', d3.forceLink(links).id(d => d.id).distance(150))
+        .force('charge', d3.forceManyBody().strength(-400))
+        .force('collide', d3.forceCollide(d => radius(d) + 20))
+        .force('center', d3.forceCenter(width / 2, height / 2))
+        .on('tick', () => {
+            // Links end at the edge of the target circle so the arrow shows
+            link.each(function(d) {
+                const dx = d.target.x - d.source.x;
+                const dy = d.target.y - d.source.y;
+                const length = Math.sqrt(dx * dx + dy * dy) || 1;
+                const r = radius(d.target);
+                d3.select(this)
+                    .attr('x1', d.source.x)
+                    .attr('y1', d.source.y)
+                    .attr('x2', d.target.x - dx / length * r)
+                    .attr('y2', d.target.y - dy / length * r);
+            });
+            node.attr('transform', d => `translate(${d.x},${d.y})`);
+        })
+        .on('end', () => zoomToFit());
+
+    // zoomToFit() and the zoom buttons work on the summary as well
+    lineageSvg = svg;
+    lineageZoom = zoom;
+    lineageGraph = layer;
+}
@@ -410,7 +410,7 @@ function updateInfoPanel(type, id) {
                     <div class="me-3 mb-2"><strong>Avg Time:</strong> ${meanTime}ms</div>
                     <div class="mb-2"><strong>Rows:</strong> ${rows}</div>
                 </div>
-                <a href="/query_details/${id.replace('Query_', '')}" class="btn btn-sm btn-primary">
+                <a href="/query_details/${encodeURIComponent(id)}" class="btn btn-sm btn-primary">
                     <i class="bi bi-info-circle me-1"></i>View Query Details
                 </a>
             </div>
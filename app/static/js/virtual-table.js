@@ -0,0 +1,240 @@
+/**
+ * PostgreSQL Data Lineage Tool - Virtualized result tables
+ *
+ * Rows are fetched from a paged JSON endpoint as they scroll into view and
+ * only the visible rows (plus a small overscan) are in the DOM. Sorting and
+ * filtering are done by the server; changing either starts over from the
+ * first page.
+ */
+class VirtualTable {
+    /**
+     * @param {Object} options
+     * @param {HTMLElement} options.container - Scrolling element around the table
+     * @param {HTMLTableElement} options.table - Table whose tbody is rendered
+     * @param {string} options.dataUrl - Endpoint serving pages of rows
+     * @param {Array} options.columns - Cells as {render: (row, position) => Node|string}
+     * @param {Array} [options.fields] - Columns to request from the endpoint
+     * @param {Object} [options.initialPage] - First page embedded in the page
+     * @param {HTMLInputElement} [options.filterInput] - Text filter input
+     * @param {HTMLElement} [options.countElement] - Shows the number of matching rows
+     * @param {number} [options.truncate] - Characters kept per string value
+     */
+    constructor(options) {
+        this.container = options.container;
+        this.table = options.table;
+        this.tbody = this.table.tBodies[0] || this.table.createTBody();
+        this.dataUrl = options.dataUrl;
+        this.columns = options.columns;
+        this.fields = options.fields || null;
+        this.truncate = options.truncate || null;
+        this.filterInput = options.filterInput || null;
+        this.countElement = options.countElement || null;
+        this.rowHeight = options.rowHeight || 41;
+        this.pageSize = options.pageSize || 100;
+        this.overscan = options.overscan || 10;
+
+        this.sort = null;
+        this.order = 'desc';
+        this.query = '';
+        this.generation = 0;
+        this.pages = new Map();
+        this.pending = new Set();
+        this.rowCount = 0;
+        this.renderScheduled = false;
+
+        if (options.initialPage && options.initialPage.offset === 0) {
+            this.rowCount = options.initialPage.filtered;
+            this.pages.set(0, options.initialPage.rows);
+            this.pageSize = Math.max(this.pageSize, options.initialPage.limit);
+        }
+
+        this.container.addEventListener('scroll', () => this.scheduleRender());
+        window.addEventListener('resize', () => this.scheduleRender());
+        this.table.querySelectorAll('th[data-sort]').forEach(th => {
+            th.classList.add('sortable');
+            th.addEventListener('click', () => this.toggleSort(th.dataset.sort));
+        });
+        if (this.filterInput) {
+            let timer = null;
+            this.filterInput.addEventListener('input', () => {
+                clearTimeout(timer);
+                timer = setTimeout(() => this.setFilter(this.filterInput.value), 250);
+            });
+        }
+
+        this.render();
+        if (!this.pages.has(0)) {
+            this.loadPage(0);
+        }
+    }
+
+    toggleSort(column) {
+        if (this.sort === column) {
+            this.order = this.order === 'desc' ? 'asc' : 'desc';
+        } else {
+            this.sort = column;
+            this.order = 'desc';
+        }
+        this.table.querySelectorAll('th[data-sort]').forEach(th => {
+            th.classList.remove('sorted-asc', 'sorted-desc');
+            if (th.dataset.sort === this.sort) {
+                th.classList.add('sorted-' + this.order);
+            }
+        });
+        this.reset();
+    }
+
+    setFilter(text) {
+        text = text.trim();
+        if (text === this.query) {
+            return;
+        }
+        this.query = text;
+        this.reset();
+    }
+
+    /**
+     * Drop the loaded pages and fetch the first page for the new sort or filter
+     */
+    reset() {
+        this.generation += 1;
+        this.pages.clear();
+        this.pending.clear();
+        this.container.scrollTop = 0;
+        this.loadPage(0);
+    }
+
+    pageUrl(page) {
+        const params = new URLSearchParams({
+            offset: page * this.pageSize,
+            limit: this.pageSize,
+            order: this.order
+        });
+        if (this.sort) params.set('sort', this.sort);
+        if (this.query) params.set('q', this.query);
+        if (this.fields) params.set('columns', this.fields.join(','));
+        if (this.truncate) params.set('truncate', this.truncate);
+        return this.dataUrl + '?' + params.toString();
+    }
+
+    loadPage(page) {
+        if (this.pages.has(page) || this.pending.has(page)) {
+            return;
+        }
+        const generation = this.generation;
+        this.pending.add(page);
+        fetch(this.pageUrl(page), {credentials: 'same-origin'})
+            .then(response => response.json())
+            .then(data => {
+                // Responses for an earlier sort or filter are ignored
+                if (generation !== this.generation) {
+                    return;
+                }
+                this.pending.delete(page);
+                if (!data.success) {
+                    throw new Error(data.message || 'Failed to load rows');
+                }
+                this.rowCount = data.filtered;
+                this.pages.set(page, data.rows);
+                this.scheduleRender();
+            })
+            .catch(error => {
+                if (generation === this.generation) {
+                    this.pending.delete(page);
+                    console.error('Error loading table rows:', error);
+                }
+            });
+    }
+
+    scheduleRender() {
+        if (!this.renderScheduled) {
+            this.renderScheduled = true;
+            requestAnimationFrame(() => {
+                this.renderScheduled = false;
+                this.render();
+            });
+        }
+    }
+
+    rowAt(position) {
+        const rows = this.pages.get(Math.floor(position / this.pageSize));
+        return rows ? rows[position % this.pageSize] : undefined;
+    }
+
+    spacer(height) {
+        const tr = document.createElement('tr');
+        tr.className = 'virtual-spacer';
+        const td = document.createElement('td');
+        td.colSpan = this.columns.length;
+        td.style.height = height + 'px';
+        tr.appendChild(td);
+        return tr;
+    }
+
+    render() {
+        if (this.countElement) {
+            this.countElement.textContent = this.rowCount;
+        }
+
+        const visible = Math.ceil(this.container.clientHeight / this.rowHeight) || 20;
+        const first = Math.max(0, Math.floor(this.container.scrollTop / this.rowHeight) - this.overscan);
+        const last = Math.min(this.rowCount, first + visible + 2 * this.overscan);
+
+        for (let page = Math.floor(first / this.pageSize); page * this.pageSize < last; page++) {
+            this.loadPage(page);
+        }
+
+        const fragment = document.createDocumentFragment();
+        fragment.appendChild(this.spacer(first * this.rowHeight));
+        for (let position = first; position < last; position++) {
+            const row = this.rowAt(position);
+            const tr = document.createElement('tr');
+            this.columns.forEach(column => {
+                const td = document.createElement('td');
+                if (row !== undefined) {
+                    const content = column.render(row, position);
+                    if (content instanceof Node) {
+                        td.appendChild(content);
+                    } else {
+                        td.textContent = content === null || content === undefined ? '' : content;
+                    }
+                } else if (column === this.columns[0]) {
+                    td.textContent = '…';
+                }
+                tr.appendChild(td);
+            });
+            fragment.appendChild(tr);
+        }
+        fragment.appendChild(this.spacer((this.rowCount - last) * this.rowHeight));
+
+        this.tbody.replaceChildren(fragment);
+    }
+}
+
+/**
+ * Formatting helpers for table cells
+ */
+const TableFormat = {
+    number: function(value, digits) {
+        return typeof value === 'number' ? value.toFixed(digits) : '';
+    },
+
+    preview: function(text, length) {
+        const div = document.createElement('div');
+        div.className = 'query-preview';
+        text = text || '';
+        div.textContent = text.length > length ? text.substring(0, length) + '...' : text;
+        return div;
+    },
+
+    link: function(href, label) {
+        const a = document.createElement('a');
+        a.href = href;
+        a.className = 'btn btn-sm btn-primary';
+        const icon = document.createElement('i');
+        icon.className = 'bi bi-search';
+        a.appendChild(icon);
+        a.appendChild(document.createTextNode(' ' + label));
+        return a;
+    }
+};
@@ -0,0 +1,176 @@
+"""
+Paged access to the result tables.
+The query and table pages fetch their rows from JSON endpoints a page at a
+time instead of rendering every row into the HTML. A TableView keeps the
+sort orders and the lowercased search text of one DataFrame, so paging
+through a sorted or filtered table does not sort or scan it again.
+"""
+
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Columns the text filter searches, per result table
+SEARCH_COLUMNS = {
+    'expensive_queries': ['query', 'queryid'],
+    'table_stats': ['table_name']
+}
+
+
+class TableView:
+    """Sorted, filtered and paged view of a result DataFrame"""
+
+    def __init__(self, df, search_columns=None, max_cached_orders=8):
+        """
+        Args:
+            df (pandas.DataFrame): Result table
+            search_columns (list, optional): Columns the text filter searches;
+                all string columns if None
+            max_cached_orders (int): Number of sort/filter combinations whose
+                row order is kept
+        """
+        if not isinstance(df.index, pd.RangeIndex) or df.index.start != 0 or df.index.step != 1:
+            df = df.reset_index(drop=True)
+        self.df = df
+        if search_columns is None:
+            search_columns = [c for c in self.df.columns if c in self.sortable_columns()
+                              and not pd.api.types.is_numeric_dtype(self.df[c])]
+        self.search_columns = [c for c in search_columns if c in self.df.columns]
+        self.max_cached_orders = max_cached_orders
+        self._search_text = None
+        self._sort_orders = {}
+        self._orders = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.df)
+
+    def sortable_columns(self):
+        """Columns holding scalars; nested columns such as column lists are not sortable"""
+        sortable = []
+        for name in self.df.columns:
+            series = self.df[name]
+            if pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+                sortable.append(name)
+                continue
+            sample = series.dropna()
+            if sample.empty or not isinstance(sample.iloc[0], (list, dict, tuple, np.ndarray)):
+                sortable.append(name)
+        return sortable
+
+    def _sort_order(self, sort, ascending):
+        """Row positions in sort order, computed once per column and direction"""
+        key = (sort, ascending)
+        order = self._sort_orders.get(key)
+        if order is None:
+            if sort is None:
+                order = np.arange(len(self.df))
+            else:
+                series = self.df[sort]
+                sort_key = None
+                if not pd.api.types.is_numeric_dtype(series):
+                    sort_key = lambda s: s.astype(str).str.lower()
+                # Stable, with missing values last in either direction
+                order = series.sort_values(ascending=ascending, kind='stable', na_position='last',
+                                           key=sort_key).index.to_numpy()
+            self._sort_orders[key] = order
+        return order
+
+    def _matches(self, text):
+        """Boolean mask of rows whose search columns contain text"""
+        if self._search_text is None:
+            if self.search_columns:
+                parts = [self.df[c].fillna('').astype(str) for c in self.search_columns]
+                joined = parts[0]
+                for part in parts[1:]:
+                    joined = joined + '\x1f' + part
+                self._search_text = joined.str.lower()
+            else:
+                self._search_text = pd.Series([''] * len(self.df))
+        return self._search_text.str.contains(text.lower(), regex=False).to_numpy()
+
+    def _order(self, sort, ascending, text):
+        key = (sort, ascending, text)
+        order = self._orders.get(key)
+        if order is not None:
+            self._orders.move_to_end(key)
+            return order
+        order = self._sort_order(sort, ascending)
+        if text:
+            order = order[self._matches(text)[order]]
+        self._orders[key] = order
+        if len(self._orders) > self.max_cached_orders:
+            self._orders.popitem(last=False)
+        return order
+
+    def page(self, offset=0, limit=DEFAULT_PAGE_SIZE, sort=None, order='desc', q=None,
+             columns=None, truncate=None):
+        """
+        Return one page of rows.
+
+        Args:
+            offset (int): Position of the first row in the sorted, filtered table
+            limit (int): Maximum number of rows, capped at MAX_PAGE_SIZE
+            sort (str, optional): Column to sort by; table order if None
+            order (str): 'asc' or 'desc'
+            q (str, optional): Case-insensitive text the search columns must contain
+            columns (list, optional): Only return these columns
+            truncate (int, optional): Cut string values to this many characters
+
+        Returns:
+            dict: Rows plus the counts and offsets needed to page further. Each
+                row has '_index', its position in the unsorted table.
+
+        Raises:
+            ValueError: If sort, order or columns name something the table
+                does not have
+        """
+        if sort is not None and sort not in self.sortable_columns():
+            raise ValueError(f"Cannot sort by column: {sort}")
+        if order not in ('asc', 'desc'):
+            raise ValueError(f"Invalid sort order: {order}")
+        if columns is not None:
+            unknown = [c for c in columns if c not in self.df.columns]
+            if unknown:
+                raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+        offset = max(0, int(offset))
+        limit = min(max(0, int(limit)), MAX_PAGE_SIZE)
+        q = (q or '').strip()
+
+        with self._lock:
+            positions = self._order(sort, order == 'asc', q)
+        selected = positions[offset:offset + limit]
+        rows_df = self.df.iloc[selected]
+        if columns is not None:
+            rows_df = rows_df[list(columns)]
+        if truncate:
+            rows_df = rows_df.copy()
+            for name in rows_df.columns:
+                if not pd.api.types.is_numeric_dtype(rows_df[name]):
+                    rows_df[name] = rows_df[name].map(
+                        lambda v: v[:truncate] if isinstance(v, str) else v)
+
+        # to_json turns numpy scalars and NaN into plain JSON values
+        rows = json.loads(rows_df.to_json(orient='records')) if len(rows_df) else []
+        for row, position in zip(rows, selected):
+            row['_index'] = int(position)
+
+        end = offset + len(rows)
+        return {
+            'total': len(self.df),
+            'filtered': int(len(positions)),
+            'offset': offset,
+            'limit': limit,
+            'next_offset': end if end < len(positions) else None,
+            'sort': sort,
+            'order': order,
+            'q': q,
+            'rows': rows
+        }
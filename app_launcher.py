@@ -32,13 +32,28 @@ def open_browser(url):
     logger.info(f"Opening browser at {url}")
     webbrowser.open(url)
 
-def start_server(host='127.0.0.1', port=5000, open_browser_flag=True):
+def start_server(host='127.0.0.1', port=5000, open_browser_flag=True, collect_interval=0,
+                 incremental=False, graph_engine=None):
     """Start the production server"""
     url = f'http://{host}:{port}'
     
     logger.info(f"Starting PostgreSQL Data Lineage application on {host}:{port}")
     logger.info("Press Ctrl+C to exit")
     
+    if collect_interval:
+        # Databases are sampled in the background once a user connects to them
+        app.config['COLLECTOR_INTERVAL'] = collect_interval
+        logger.info(f"Collecting workload history every {collect_interval}s for connected databases")
+    
+    if incremental:
+        # Each analysis updates the lineage graph of the previous one
+        app.config['LINEAGE_INCREMENTAL'] = True
+        logger.info("Updating lineage graphs incrementally between analyses")
+    
+    if graph_engine:
+        app.config['LINEAGE_GRAPH_ENGINE'] = graph_engine
+        logger.info(f"Using the {graph_engine} lineage graph engine")
+    
     if open_browser_flag:
         # Start browser in a separate thread
         browser_thread = threading.Thread(target=open_browser, args=(url,))
@@ -52,6 +67,11 @@ def start_server(host='127.0.0.1', port=5000, open_browser_flag=True):
         logger.info("Server shutdown requested")
     except Exception as e:
         logger.error(f"Error starting server: {e}")
+    finally:
+        from app.routes import collectors, connection_pools, jobs
+        collectors.stop_all(timeout=5)
+        jobs.shutdown()
+        connection_pools.close_all()
     
     logger.info("Server stopped")
 
@@ -76,6 +96,23 @@ def parse_args():
         action='store_true',
         help='Do not open browser automatically'
     )
+    parser.add_argument(
+        '--collect-interval',
+        type=int,
+        default=0,
+        help='Sample workload history of connected databases every N seconds (default: off)'
+    )
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        help='Update the lineage graph of the previous analysis instead of rebuilding it'
+    )
+    parser.add_argument(
+        '--graph-engine',
+        choices=['networkx', 'arrays'],
+        default=None,
+        help='Lineage graph representation; arrays is compact for very large workloads (default: networkx)'
+    )
     parser.add_argument(
         '--version', 
         action='version', 
@@ -89,7 +126,10 @@ def main():
     start_server(
         host=args.host, 
         port=args.port, 
-        open_browser_flag=not args.no_browser
+        open_browser_flag=not args.no_browser,
+        collect_interval=args.collect_interval,
+        incremental=args.incremental,
+        graph_engine=args.graph_engine
     )
 
 if __name__ == '__main__':
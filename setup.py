@@ -44,11 +44,13 @@ setup(
         "matplotlib>=3.4.0",
         "sqlparse>=0.4.0",
         "waitress>=2.0.0",
+        "pyarrow>=10.0.0",
     ],
     py_modules=["app_launcher"],
     entry_points={
         "console_scripts": [
             "pg_lineagelens=app_launcher:main",
+            "pg_lineagelens_collector=app.collector:main",
         ],
     },
     classifiers=[
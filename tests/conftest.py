@@ -6,6 +6,7 @@ import sys
 import time
 import socket
 import pytest
+import networkx as nx
 try:
     import docker
 except ImportError:
@@ -19,6 +20,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 
 from app import routes
 from app.analyzer import PostgresQueryLineage
+from app.graph_arrays import ArrayGraph
 
 # Check if we can use docker for integration tests
 DOCKER_AVAILABLE = docker is not None
@@ -141,6 +143,36 @@ def mock_lineage_analyzer():
         yield mock_analyzer
 
 
+@pytest.fixture
+def lineage_graph():
+    """orders -> Q1 -> sales -> Q2 -> report, with a cycle through Q3 on sales"""
+    G = nx.DiGraph()
+    for table in ('orders', 'sales', 'report', 'unrelated'):
+        G.add_node(table, type='table')
+    for query in ('Q1', 'Q2', 'Q3'):
+        G.add_node(query, type='query')
+    G.add_edges_from([('orders', 'Q1'), ('Q1', 'sales'), ('sales', 'Q2'), ('Q2', 'report'),
+                      ('sales', 'Q3'), ('Q3', 'sales')])
+    # Derived table-to-table shortcuts, which paths and layouts ignore
+    G.add_edge('orders', 'sales', via_query='Q1')
+    G.add_edge('sales', 'report', via_query='Q2')
+    return G
+
+
+@pytest.fixture(params=['networkx', 'arrays'])
+def graph_engine(request):
+    """Convert a networkx lineage graph to each graph engine in turn"""
+    if request.param == 'arrays':
+        return ArrayGraph.from_networkx
+    return lambda G: G
+
+
+@pytest.fixture
+def graph(lineage_graph, graph_engine):
+    """The sample lineage graph in each graph engine in turn"""
+    return graph_engine(lineage_graph)
+
+
 @pytest.fixture
 def sample_queries():
     """Sample query data for testing."""
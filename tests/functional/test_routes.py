@@ -10,6 +10,8 @@ from unittest.mock import patch, MagicMock
 from flask import session
 
 from app import app
+from app import routes
+from app.routes import jobs
 
 
 class TestRoutes:
@@ -44,7 +46,9 @@ class TestRoutes:
         # Configure mock
         mock_lineage = MagicMock()
         mock_lineage_class.return_value = mock_lineage
-        mock_lineage.connect.return_value = (True, "Successfully connected to database")
+        mock_lineage.check_connection.return_value = (True, "Successfully connected to database")
+        params = {'host': 'localhost', 'database': 'testdb', 'user': 'postgres', 'port': 5432}
+        routes.server_profiles.put(params, MagicMock())
         
         # Submit connection form via AJAX
         response = client.post('/connect', data={
@@ -65,6 +69,8 @@ class TestRoutes:
             assert 'connection_params' in sess
             assert sess['connection_params']['database'] == 'testdb'
             assert sess['connection_params']['host'] == 'localhost'
+        # The server is probed again by the next analysis
+        assert routes.server_profiles.get(params) is None
 
     @patch('app.routes.PostgresQueryLineage')
     def test_connect_route_post_failure(self, mock_lineage_class, client):
@@ -72,7 +78,7 @@ class TestRoutes:
         # Configure mock
         mock_lineage = MagicMock()
         mock_lineage_class.return_value = mock_lineage
-        mock_lineage.connect.return_value = (False, "Error connecting to database")
+        mock_lineage.check_connection.return_value = (False, "Error connecting to database")
         
         # Submit connection form via AJAX
         response = client.post('/connect', data={
@@ -100,7 +106,10 @@ class TestRoutes:
                 'queryid': 1, 
                 'query': 'SELECT * FROM users',
                 'calls': 100,
-                'total_time': 1000.0
+                'total_time': 1000.0,
+                'mean_time': 10.0,
+                'rows': 100,
+                'time_per_row': 10.0
             }]),
             'table_stats': pd.DataFrame(),
             'files': {
@@ -125,11 +134,54 @@ class TestRoutes:
             'min_calls': '5'
         })
         
-        # Check JSON response
+        # The analysis runs as a background job
         assert response.status_code == 200
         json_data = json.loads(response.data)
         assert json_data['success'] is True
-        assert 'queries_count' in json_data
+        assert 'job_id' in json_data
+        jobs.get(json_data['job_id']).future.result(timeout=10)
+        
+        # Polling the finished job returns the results and stores them in the session
+        response = client.get(json_data['status_url'])
+        assert response.status_code == 200
+        status = json.loads(response.data)
+        assert status['status'] == 'succeeded'
+        assert status['queries_count'] == 1
+        assert mock_lineage.run_complete_analysis.call_args[1]['progress'] is not None
+        with client.session_transaction() as sess:
+            assert sess['has_results'] is True
+            assert sess['analysis_files']['expensive_queries'] == '/tmp/queries.csv'
+        
+        # Result views are served from the result store, not the CSV files
+        response = client.get('/expensive_queries')
+        assert response.status_code == 200
+        assert b'SELECT * FROM users' in response.data
+
+    @patch('app.routes.PostgresQueryLineage')
+    def test_analyze_job_failure(self, mock_lineage_class, client):
+        """Test that a failed analysis is reported by the job status."""
+        mock_lineage_class.return_value.run_complete_analysis.return_value = {
+            'error': 'Failed to fetch expensive queries'
+        }
+        with client.session_transaction() as sess:
+            sess['connection_params'] = {'host': 'localhost', 'database': 'testdb', 'user': 'postgres'}
+        
+        json_data = json.loads(client.post('/analyze', data={'limit': '20', 'min_calls': '5'}).data)
+        jobs.get(json_data['job_id']).future.result(timeout=10)
+        
+        status = json.loads(client.get(f"/jobs/{json_data['job_id']}").data)
+        assert status['status'] == 'failed'
+        assert 'Failed to fetch expensive queries' in status['error']
+
+    def test_job_status_other_session(self, client):
+        """Test that jobs of other sessions are not visible."""
+        job = jobs.submit(lambda job: None, owner='someone-else')
+        job.future.result(timeout=10)
+        
+        response = client.get(f'/jobs/{job.id}')
+        assert response.status_code == 404
+        response = client.post(f'/jobs/{job.id}/cancel')
+        assert response.status_code == 404
 
     def test_analyze_post_not_connected(self, client):
         """Test analyze endpoint when not connected."""
@@ -248,7 +300,285 @@ class TestRoutes:
         # Check response
         assert response.status_code == 200
 
-    @patch('app.routes.pd.read_csv')
+    def test_lineage_data_is_served_gzipped_and_cacheable(self, client):
+        """Test the compact lineage payload endpoint."""
+        import gzip
+        import uuid
+        import networkx as nx
+        from app.routes import result_store
+        from app.results import AnalysisResult
+        
+        graph = nx.DiGraph()
+        graph.add_node('users', type='table', columns=[])
+        graph.add_node('Query_1', type='query', text='SELECT * FROM users', calls=1,
+                       total_time=1.0, mean_time=1.0, rows=1)
+        graph.add_edge('users', 'Query_1')
+        analysis_id = uuid.uuid4().hex
+        result_store.put(AnalysisResult(analysis_id, lineage_graph=graph))
+        
+        with client.session_transaction() as sess:
+            sess['has_results'] = True
+            sess['analysis_id'] = analysis_id
+            sess['analysis_files'] = {}
+        
+        response = client.get(f'/lineage/data?analysis={analysis_id}',
+                              headers={'Accept-Encoding': 'gzip'})
+        assert response.status_code == 200
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'immutable' in response.headers['Cache-Control']
+        payload = json.loads(gzip.decompress(response.data))
+        assert payload['nodes']['id'] == ['users', 'Query_1']
+        assert payload['links'] == {'source': [0], 'target': [1]}
+        
+        # Clients without gzip get plain JSON; revalidation is answered with 304
+        response = client.get('/lineage/data')
+        assert json.loads(response.data) == payload
+        response = client.get('/lineage/data', headers={'If-None-Match': response.headers['ETag']})
+        assert response.status_code == 304
+
+    def test_expensive_queries_data_pages(self, client):
+        """Test the paged JSON endpoint behind the queries page."""
+        import uuid
+        from app.routes import result_store
+        from app.results import AnalysisResult
+        
+        df = pd.DataFrame({
+            'queryid': range(250),
+            'query': [f'SELECT * FROM t{i}' for i in range(250)],
+            'calls': range(250),
+            'total_time': [float(i % 7) for i in range(250)]
+        })
+        analysis_id = uuid.uuid4().hex
+        result_store.put(AnalysisResult(analysis_id, expensive_queries=df))
+        with client.session_transaction() as sess:
+            sess['has_results'] = True
+            sess['analysis_id'] = analysis_id
+            sess['analysis_files'] = {}
+        
+        # The page embeds only the first page of rows
+        response = client.get('/expensive_queries')
+        assert b'SELECT * FROM t0' in response.data
+        assert b'SELECT * FROM t249' not in response.data
+        
+        response = client.get('/expensive_queries/data?offset=100&limit=50&sort=calls&order=asc')
+        page = json.loads(response.data)
+        assert page['success'] is True
+        assert page['filtered'] == 250
+        assert [row['queryid'] for row in page['rows']] == list(range(100, 150))
+        assert page['next_offset'] == 150
+        
+        response = client.get('/expensive_queries/data?q=t24&columns=queryid&sort=calls')
+        page = json.loads(response.data)
+        assert [row['queryid'] for row in page['rows']] == [249, 248, 247, 246, 245, 244, 243, 242, 241, 240, 24]
+        assert set(page['rows'][0]) == {'queryid', '_index'}
+        
+        response = client.get('/expensive_queries/data?sort=nope')
+        assert response.status_code == 400
+
+    def test_details_pages_link_lineage_neighbours(self, client):
+        """Test that detail pages resolve queryids and list lineage neighbours."""
+        import uuid
+        import networkx as nx
+        from app.routes import result_store
+        from app.results import AnalysisResult
+        
+        queries = pd.DataFrame([{
+            'queryid': 123456789, 'query': 'INSERT INTO sales SELECT * FROM orders', 'calls': 3,
+            'total_time': 30.0, 'mean_time': 10.0, 'rows': 3, 'time_per_row': 10.0,
+            'shared_blks_hit': 1, 'shared_blks_read': 1, 'temp_blks_written': 0,
+            'io_time': 0.0, 'io_percentage': 0.0
+        }])
+        stats = pd.DataFrame([{
+            'table_name': 'orders', 'read_queries': 1, 'write_queries': 0, 'total_queries': 1,
+            'total_read_time': 30.0, 'total_write_time': 0.0, 'total_time': 30.0
+        }])
+        graph = nx.DiGraph()
+        graph.add_node('orders', type='table')
+        graph.add_node('sales', type='table')
+        graph.add_node('Query_1', type='query', queryid=123456789, text=queries['query'][0],
+                       total_time=30.0)
+        graph.add_edge('orders', 'Query_1')
+        graph.add_edge('Query_1', 'sales')
+        graph.add_edge('orders', 'sales', via_query='Query_1')
+        analysis_id = uuid.uuid4().hex
+        result_store.put(AnalysisResult.from_analysis(analysis_id, {
+            'expensive_queries': queries, 'table_stats': stats, 'lineage_graph': graph}))
+        with client.session_transaction() as sess:
+            sess['has_results'] = True
+            sess['analysis_id'] = analysis_id
+            sess['analysis_files'] = {}
+        
+        response = client.get('/query_details/123456789')
+        assert response.status_code == 200
+        assert b'Reads From' in response.data
+        assert b'/table_details/sales' in response.data
+        
+        response = client.get('/table_details/orders')
+        assert response.status_code == 200
+        assert b'Query_1' in response.data
+        assert b'/query_details/0' in response.data
+        assert b'Downstream Tables' in response.data
+
+    def test_lineage_impact_and_path(self, client):
+        """Test the transitive impact and lineage path endpoints."""
+        import uuid
+        import networkx as nx
+        from app.routes import result_store
+        from app.results import AnalysisResult
+        
+        graph = nx.DiGraph()
+        for table in ('orders', 'sales', 'report'):
+            graph.add_node(table, type='table')
+        graph.add_node('Query_1', type='query', total_time=1.0)
+        graph.add_node('Query_2', type='query', total_time=2.0)
+        graph.add_edges_from([('orders', 'Query_1'), ('Query_1', 'sales'),
+                              ('sales', 'Query_2'), ('Query_2', 'report')])
+        analysis_id = uuid.uuid4().hex
+        result_store.put(AnalysisResult.from_analysis(analysis_id, {'lineage_graph': graph}))
+        with client.session_transaction() as sess:
+            sess['has_results'] = True
+            sess['analysis_id'] = analysis_id
+            sess['analysis_files'] = {}
+        
+        data = client.get('/lineage/impact/orders').get_json()
+        assert data['nodes'] == ['report', 'sales']
+        data = client.get('/lineage/impact/report?direction=upstream&kind=all').get_json()
+        assert data['nodes'] == ['Query_1', 'Query_2', 'orders', 'sales']
+        data = client.get('/lineage/impact/orders?depth=2').get_json()
+        assert data['distances'] == {'sales': 2}
+        assert client.get('/lineage/impact/orders?kind=view').status_code == 400
+        assert client.get('/lineage/impact/missing').status_code == 404
+        
+        data = client.get('/lineage/path?source=report&target=orders').get_json()
+        assert data['direction'] == 'upstream'
+        assert data['path'] == ['orders', 'Query_1', 'sales', 'Query_2', 'report']
+
+    def test_lineage_neighbourhood(self, client, monkeypatch):
+        """Test that large graphs are explored from a focus node a neighbourhood at a time."""
+        import uuid
+        import networkx as nx
+        from app import app as flask_app
+        from app.routes import result_store
+        from app.results import AnalysisResult
+        
+        graph = nx.DiGraph()
+        graph.add_node('hub', type='table')
+        for i in range(10):
+            graph.add_node(f'Query_{i}', type='query', total_time=float(i))
+            graph.add_node(f't{i}', type='table')
+            graph.add_edges_from([('hub', f'Query_{i}'), (f'Query_{i}', f't{i}')])
+        stats = pd.DataFrame([{'table_name': 'hub', 'total_time': 45.0},
+                              {'table_name': 't1', 'total_time': 1.0}])
+        analysis_id = uuid.uuid4().hex
+        result_store.put(AnalysisResult.from_analysis(analysis_id, {
+            'lineage_graph': graph, 'table_stats': stats}))
+        with client.session_transaction() as sess:
+            sess['has_results'] = True
+            sess['analysis_id'] = analysis_id
+            sess['analysis_files'] = {}
+        monkeypatch.setitem(flask_app.config, 'LINEAGE_FOCUS_THRESHOLD', 5)
+        monkeypatch.setitem(flask_app.config, 'LINEAGE_NEIGHBOURHOOD_MAX_NODES', 4)
+        
+        response = client.get('/lineage?focus=hub')
+        assert b'window.lineageFocus = "hub"' in response.data
+        
+        data = client.get('/lineage/neighbourhood').get_json()
+        assert data['focus'] == 'hub'
+        # Capped at four nodes besides the focus; degrees count every edge
+        assert len(data['nodes']['id']) == 5
+        assert data['nodes']['out_degree'][0] == 10
+        
+        data = client.get('/lineage/neighbourhood?node=t3&depth=1').get_json()
+        assert data['nodes']['id'] == ['t3', 'Query_3']
+        assert data['links'] == {'source': [1], 'target': [0]}
+        assert client.get('/lineage/neighbourhood?node=t3&depth=-1').status_code == 400
+        assert client.get('/lineage/neighbourhood?node=nope').status_code == 404
+
+    def test_lineage_summary_and_group(self, client, monkeypatch):
+        """Test that large graphs open on a schema summary that drills down into groups."""
+        import uuid
+        import networkx as nx
+        from app import app as flask_app
+        from app.routes import result_store
+        from app.results import AnalysisResult
+        
+        graph = nx.DiGraph()
+        for table in ('sales.orders', 'sales.customers', 'reporting.daily'):
+            graph.add_node(table, type='table')
+        graph.add_node('Query_5_1', type='query', total_time=3.0)
+        graph.add_edges_from([('sales.orders', 'Query_5_1'), ('sales.customers', 'Query_5_1'),
+                              ('Query_5_1', 'reporting.daily')])
+        analysis_id = uuid.uuid4().hex
+        result_store.put(AnalysisResult.from_analysis(analysis_id, {'lineage_graph': graph}))
+        with client.session_transaction() as sess:
+            sess['has_results'] = True
+            sess['analysis_id'] = analysis_id
+            sess['analysis_files'] = {}
+        monkeypatch.setitem(flask_app.config, 'LINEAGE_FOCUS_THRESHOLD', 3)
+        
+        assert b'window.lineageStartWithSummary = true' in client.get('/lineage').data
+        assert b'window.lineageStartWithSummary = false' in client.get('/lineage?focus=sales.orders').data
+        
+        data = client.get('/lineage/summary').get_json()
+        assert data['groups']['id'] == ['sales', 'reporting']
+        assert data['links'] == {'source': [0], 'target': [1], 'queries': [1], 'total_time': [3.0]}
+        assert client.get('/lineage/summary?group_by=database').status_code == 400
+        
+        data = client.get('/lineage/group?group=sales').get_json()
+        assert data['group'] == 'sales'
+        assert data['nodes']['id'] == ['sales.orders', 'sales.customers', 'Query_5_1']
+        assert client.get('/lineage/group?group=component-0&group_by=component').status_code == 200
+        assert client.get('/lineage/group?group=nope').status_code == 404
+
+    def test_download_renders_csv_from_artifact(self, client, tmp_path):
+        """Test that table artifacts are downloaded as CSV rendered on demand."""
+        pytest.importorskip('pyarrow')
+        from app.artifacts import write_table
+        path = write_table(pd.DataFrame({'queryid': [7], 'query': ['SELECT 1']}),
+                           str(tmp_path / 'analysis_expensive_queries'))
+        
+        with client.session_transaction() as sess:
+            sess['has_results'] = True
+            sess['analysis_files'] = {'expensive_queries': path}
+        
+        response = client.get('/download/expensive_queries')
+        assert response.status_code == 200
+        assert response.mimetype == 'text/csv'
+        assert 'analysis_expensive_queries.csv' in response.headers['Content-Disposition']
+        assert response.data.splitlines() == [b'queryid,query', b'7,SELECT 1']
+        
+        response = client.get('/download/expensive_queries?format=arrow')
+        assert response.status_code == 200
+        assert response.mimetype != 'text/csv'
+
+    def test_download_draws_lineage_image_on_first_request(self, client, tmp_path):
+        """Test that the lineage PNG is only drawn when it is downloaded."""
+        import uuid
+        import networkx as nx
+        from app.routes import result_store
+        from app.results import AnalysisResult
+        
+        graph = nx.DiGraph()
+        graph.add_node('users', type='table')
+        graph.add_node('Query_5_1', type='query', text='SELECT * FROM users', total_time=1.0)
+        graph.add_edge('users', 'Query_5_1')
+        analysis_id = uuid.uuid4().hex
+        result_store.put(AnalysisResult.from_analysis(analysis_id, {'lineage_graph': graph}))
+        image = tmp_path / 'analysis_lineage.png'
+        with client.session_transaction() as sess:
+            sess['has_results'] = True
+            sess['analysis_id'] = analysis_id
+            sess['analysis_files'] = {'lineage_image': str(image)}
+        
+        assert b'window.lineageImageUrl = "/download/lineage_image"' in client.get('/lineage').data
+        assert not image.exists()
+        response = client.get('/download/lineage_image')
+        assert response.status_code == 200
+        assert response.data.startswith(b'\x89PNG')
+        assert image.exists()
+        assert [p.name for p in tmp_path.iterdir()] == ['analysis_lineage.png']
+
+    @patch('app.artifacts.pd.read_csv')
     def test_table_details_page(self, mock_read_csv, client):
         """Test table details page."""
         # Mock the pandas read_csv function to return test data
@@ -269,7 +599,7 @@ class TestRoutes:
         assert response.status_code == 200
             
     @patch('app.routes.os.path.exists')
-    @patch('app.routes.pd.read_csv')
+    @patch('app.artifacts.pd.read_csv')
     def test_table_stats_page(self, mock_read_csv, mock_exists, client):
         """Test table stats page."""
         # Mock file existence check
@@ -305,7 +635,7 @@ class TestRoutes:
         assert b'Table Statistics' in response.data
         assert b'users' in response.data  # Should show our mock table name
     
-    @patch('app.routes.pd.read_csv')
+    @patch('app.artifacts.pd.read_csv')
     def test_query_details_page(self, mock_read_csv, client):
         """Test query details page."""
         # Mock the pandas read_csv function to return test data
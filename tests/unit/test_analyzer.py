@@ -5,7 +5,7 @@ import pytest
 import networkx as nx
 import pandas as pd
 import tempfile
-from unittest.mock import patch, MagicMock, call
+from unittest.mock import patch, MagicMock, PropertyMock, call
 
 from app.analyzer import PostgresQueryLineage
 from sqlparse import tokens
@@ -148,8 +148,8 @@ class TestPostgresQueryLineage:
         analyzer.cursor = mock_db_connection.cursor.return_value
         cursor_mock = mock_db_connection.cursor.return_value
         
-        # Mock the fetchone result for version check
-        cursor_mock.fetchone.side_effect = [(120000,), (1,)]
+        # Mock the fetchone result for the server version and extension version
+        cursor_mock.fetchone.side_effect = [(120000, '1.8')]
         
         # Set up description for column names check
         cursor_mock.description = [('query',), ('calls',), ('total_time',), ('mean_time',), ('rows',)]
@@ -176,6 +176,48 @@ class TestPostgresQueryLineage:
                 assert 'query' in result.columns
                 assert 'calls' in result.columns
 
+    def test_get_expensive_queries_two_phase(self):
+        """Test ranking without query texts and fetching texts for the top candidates only."""
+        analyzer = PostgresQueryLineage({}, two_phase_fetch=True)
+        analyzer.conn = MagicMock(closed=False)
+        cursor = analyzer.cursor = MagicMock()
+        
+        metric_names = ['calls', 'total_time', 'mean_time', 'rows', 'shared_blks_hit',
+                        'shared_blks_read', 'temp_blks_written', 'io_time', 'wal_bytes',
+                        'total_plan_time']
+        type(cursor).description = PropertyMock(side_effect=[
+            [('query',), ('calls',), ('io_time',)],  # Column check
+            [(name,) for name in ['userid', 'dbid', 'queryid'] + metric_names]  # Ranking
+        ])
+        cursor.fetchone.return_value = (160000, '1.10')
+        cursor.fetchall.side_effect = [
+            [('pg_catalog',), ('information_schema',)],  # System schemas
+            [('public', 'users'), ('public', 'orders')],  # User tables
+            [  # Ranked candidates, no texts
+                (10, 1, 111, 100, 900.0, 9.0, 100, 0, 0, 0, 0.0, 0, 0.0),
+                (10, 1, 222, 50, 500.0, 10.0, 50, 0, 0, 0, 0.0, 0, 0.0),
+                (10, 1, 333, 200, 100.0, 0.5, 10, 0, 0, 0, 0.0, 0, 0.0),
+            ],
+            [  # Texts for candidates that passed the server-side filters
+                (10, 1, 111, 'SELECT * FROM users JOIN orders ON users.id = orders.user_id'),
+                (10, 1, 222, 'SELECT * FROM users_archive'),
+                (10, 1, 333, 'INSERT INTO orders SELECT * FROM users'),
+            ],
+        ]
+        
+        result = analyzer.get_expensive_queries(limit=2)
+        
+        assert list(result['queryid']) == [111, 333]
+        assert list(result.columns[:3]) == ['queryid', 'query', 'calls']
+        assert 'io_percentage' in result.columns
+        
+        executed = [c[0][0] for c in cursor.execute.call_args_list]
+        rank_sql = next(sql for sql in executed if 'showtext := false' in sql)
+        select_list = rank_sql.split('FROM')[0].replace('SELECT', '')
+        assert 'query' not in [item.strip() for item in select_list.split(',')]
+        text_call = next(c for c in cursor.execute.call_args_list if 'unnest' in c[0][0])
+        assert text_call[0][1][2] == [111, 222, 333]
+    
     @patch('app.analyzer.parse')
     def test_get_table_dependencies(self, mock_parse, sample_queries):
         """Test extracting table dependencies from queries."""
@@ -388,4 +430,129 @@ class TestPostgresQueryLineage:
             assert columns[1]["name"] == "name"
             assert columns[1]["type"] == "character varying"
             assert columns[3]["name"] == "created_at"
-            assert columns[3]["type"] == "timestamp"
\ No newline at end of file
+            assert columns[3]["type"] == "timestamp"
+
+    def test_build_lineage_graph_prefetches_catalog(self):
+        """Test that table columns are fetched in one bulk catalog query."""
+        connection_params = {
+            "host": "localhost",
+            "database": "testdb",
+            "user": "postgres",
+            "password": "password",
+            "port": 5432
+        }
+        analyzer = PostgresQueryLineage(connection_params)
+        analyzer.conn = MagicMock()
+        analyzer.conn.closed = False
+        analyzer.cursor = analyzer.conn.cursor.return_value
+        analyzer.cursor.fetchall.return_value = [
+            ("public", "users", "id", "integer", True, True),
+            ("public", "audit_log", "user_id", "integer", False, False),
+        ]
+        
+        sample_df = pd.DataFrame([
+            {"query": "SELECT * FROM users JOIN orders ON users.id = orders.user_id", 
+             "calls": 100, "total_time": 1000.0, "mean_time": 10.0, "rows": 1000},
+            {"query": "INSERT INTO audit_log SELECT id FROM users", 
+             "calls": 50, "total_time": 500.0, "mean_time": 10.0, "rows": 500}
+        ])
+        
+        with patch.object(analyzer, 'get_table_dependencies') as mock_get_deps:
+            mock_get_deps.side_effect = [
+                (["users", "orders"], []),
+                (["users"], ["audit_log"])
+            ]
+            graph = analyzer.build_lineage_graph(sample_df)
+        
+        # One catalog query covers every referenced table
+        assert analyzer.cursor.execute.call_count == 1
+        assert graph.nodes["users"]["columns"][0]["name"] == "id"
+        assert graph.nodes["orders"]["columns"] == []
+        
+        # Table statistics read from the same snapshot
+        stats = analyzer.get_table_query_stats()
+        assert analyzer.cursor.execute.call_count == 1
+        assert len(stats) == 3
+
+    def test_build_lineage_graph_stable_query_nodes(self):
+        """Test that query nodes are keyed on (dbid, queryid) and rows of one statement merge."""
+        analyzer = PostgresQueryLineage({})
+        sample_df = pd.DataFrame([
+            {"queryid": 7, "dbid": 5, "query": "INSERT INTO audit_log SELECT id FROM users",
+             "calls": 10, "total_time": 100.0, "mean_time": 10.0, "rows": 10},
+            {"queryid": 7, "dbid": 5, "query": "INSERT INTO audit_log SELECT id FROM users",
+             "calls": 30, "total_time": 100.0, "mean_time": 3.3, "rows": 30},
+            {"queryid": 7, "dbid": 6, "query": "INSERT INTO audit_log SELECT id FROM users",
+             "calls": 1, "total_time": 1.0, "mean_time": 1.0, "rows": 1},
+        ])
+        
+        with patch.object(analyzer, 'prefetch_table_columns'), \
+                patch.object(analyzer, 'get_table_columns', return_value=[]):
+            graph = analyzer.build_lineage_graph(sample_df)
+        
+        assert graph.nodes["Query_5_7"]["calls"] == 40
+        assert graph.nodes["Query_5_7"]["mean_time"] == 5.0
+        assert graph.nodes["Query_5_7"]["queryid"] == 7
+        assert "Query_6_7" in graph
+        assert graph.has_edge("users", "audit_log")
+
+    def test_build_lineage_graph_incremental_merge(self):
+        """Test that a merge only parses new or changed statements and expires stale ones."""
+        analyzer = PostgresQueryLineage({}, merge_max_age=3600)
+        first = pd.DataFrame([
+            {"queryid": 1, "dbid": 5, "query": "INSERT INTO audit_log SELECT id FROM users",
+             "calls": 1, "total_time": 1.0, "mean_time": 1.0, "rows": 1},
+            {"queryid": 2, "dbid": 5, "query": "SELECT * FROM orders",
+             "calls": 1, "total_time": 1.0, "mean_time": 1.0, "rows": 1},
+            {"queryid": 3, "dbid": 5, "query": "SELECT * FROM legacy",
+             "calls": 1, "total_time": 1.0, "mean_time": 1.0, "rows": 1},
+        ])
+        with patch.object(analyzer, 'prefetch_table_columns'), \
+                patch.object(analyzer, 'get_table_columns', return_value=[]):
+            base = analyzer.build_lineage_graph(first)
+        base.nodes["Query_5_3"]["last_seen"] -= 7200  # Not seen for two hours
+        
+        second = pd.DataFrame([
+            {"queryid": 1, "dbid": 5, "query": "INSERT INTO audit_log SELECT id FROM users",
+             "calls": 9, "total_time": 9.0, "mean_time": 1.0, "rows": 9},
+            {"queryid": 2, "dbid": 5, "query": "INSERT INTO order_history SELECT * FROM orders",
+             "calls": 1, "total_time": 1.0, "mean_time": 1.0, "rows": 1},
+        ])
+        with patch.object(analyzer, 'prefetch_table_columns'), \
+                patch.object(analyzer, 'get_table_columns', return_value=[]), \
+                patch.object(analyzer, 'extract_dependencies',
+                             wraps=analyzer.extract_dependencies) as extract:
+            merged = analyzer.build_lineage_graph(second, base_graph=base)
+        
+        # Only the statement whose text changed was parsed
+        assert [text for text, _ in extract.call_args[0][0]] == ["INSERT INTO order_history SELECT * FROM orders"]
+        assert merged.nodes["Query_5_1"]["calls"] == 9
+        assert merged.has_edge("users", "audit_log")
+        assert merged.has_edge("orders", "order_history")
+        # The stale statement and the table only it read are gone
+        assert "Query_5_3" not in merged and "legacy" not in merged
+        # The earlier graph is not modified
+        assert "Query_5_3" in base
+
+    def test_extract_dependencies_parallel_matches_serial(self):
+        """Test that process pool extraction returns serial results in input order."""
+        queries = [
+            ("SELECT * FROM users JOIN orders ON users.id = orders.user_id", 1),
+            ("INSERT INTO audit_log SELECT id FROM users", 2),
+            ("UPDATE products SET stock = 0 FROM order_items WHERE id = 1", 3),
+            (None, 4),
+            ("SELECT a.x FROM public.users a, sales.orders o WHERE a.id = o.id", 5),
+        ] * 3
+        
+        serial = PostgresQueryLineage({}).extract_dependencies(queries)
+        
+        analyzer = PostgresQueryLineage({}, parse_workers=2, parse_chunk_size=4)
+        analyzer.PARALLEL_MIN_QUERIES = 1
+        try:
+            parallel = analyzer.extract_dependencies(queries)
+        finally:
+            analyzer.disconnect()
+        
+        assert [tuple(map(list, r)) for r in parallel] == [tuple(map(list, r)) for r in serial]
+        assert parallel[1] == (["users"], ["audit_log"])
+        assert parallel[3] == ([], [])
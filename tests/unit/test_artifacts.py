@@ -0,0 +1,54 @@
+"""
+Unit tests for columnar analysis artifacts.
+"""
+import pandas as pd
+import pytest
+
+from app import artifacts
+from app.artifacts import read_table, to_csv_bytes, write_table
+
+pytest.importorskip('pyarrow')
+
+
+@pytest.fixture
+def table_stats():
+    return pd.DataFrame([
+        {'table_name': 'users', 'read_queries': 3, 'total_time': 12.5,
+         'columns': [{'name': 'id', 'type': 'integer', 'not_null': True, 'is_primary_key': True}]},
+        {'table_name': 'orders', 'read_queries': 1, 'total_time': 2.0, 'columns': []},
+    ])
+
+
+class TestArtifacts:
+    """Test cases for Arrow table artifacts."""
+
+    def test_round_trip_keeps_dtypes_and_nested_columns(self, tmp_path, table_stats):
+        path = write_table(table_stats, str(tmp_path / 'stats'))
+        assert path.endswith('.arrow')
+
+        df = read_table(path)
+        assert df['read_queries'].dtype == table_stats['read_queries'].dtype
+        assert df['total_time'].dtype == table_stats['total_time'].dtype
+        # Not a repr string as with CSV
+        assert df['columns'][0] == [{'name': 'id', 'type': 'integer', 'not_null': True,
+                                     'is_primary_key': True}]
+        assert df['columns'][1] == []
+        assert list(df.columns) == list(table_stats.columns)
+
+    def test_read_selected_columns(self, tmp_path, table_stats):
+        path = write_table(table_stats, str(tmp_path / 'stats'))
+
+        df = read_table(path, columns=['table_name', 'columns'])
+        assert list(df.columns) == ['table_name', 'columns']
+        assert df['columns'][1] == []
+
+    def test_csv_files_are_still_readable(self, tmp_path):
+        path = tmp_path / 'old_expensive_queries.csv'
+        pd.DataFrame({'queryid': [1, 2]}).to_csv(path, index=False)
+        assert list(read_table(str(path))['queryid']) == [1, 2]
+
+    def test_csv_fallback_without_pyarrow(self, tmp_path, table_stats, monkeypatch):
+        monkeypatch.setattr(artifacts, 'pa', None)
+        path = write_table(table_stats, str(tmp_path / 'stats'))
+        assert path.endswith('.csv')
+        assert to_csv_bytes(table_stats).startswith(b'table_name,read_queries')
@@ -0,0 +1,118 @@
+"""
+Unit tests for the catalog snapshot and persistent catalog cache.
+"""
+from unittest.mock import MagicMock
+
+from app.catalog import CatalogCache, CatalogSnapshot, TableNameIndex, split_table_name
+
+
+class TestCatalogSnapshot:
+    """Test cases for the CatalogSnapshot class."""
+
+    def test_split_table_name(self):
+        """Test splitting schema qualified and bare table names."""
+        assert split_table_name("sales.orders") == ("sales", "orders")
+        assert split_table_name("users") == ("public", "users")
+
+    def test_load_single_query(self):
+        """Test that all missing tables are fetched with one query."""
+        snapshot = CatalogSnapshot()
+        cursor = MagicMock()
+        cursor.fetchall.return_value = [
+            ("public", "users", "id", "integer", True, True),
+            ("public", "users", "name", "text", False, False),
+            ("sales", "orders", "id", "bigint", True, True),
+        ]
+
+        requested = snapshot.load(cursor, ["users", "sales.orders", "missing_cte"])
+
+        assert requested == 3
+        cursor.execute.assert_called_once()
+        schemas, tables = cursor.execute.call_args[0][1]
+        assert sorted(zip(schemas, tables)) == [
+            ("public", "missing_cte"), ("public", "users"), ("sales", "orders")
+        ]
+
+        columns = snapshot.get_columns("public.users")
+        assert [c["name"] for c in columns] == ["id", "name"]
+        assert columns[0]["is_primary_key"] is True
+        assert snapshot.get_columns("sales.orders")[0]["type"] == "bigint"
+        # Unknown relations are cached as empty so they are not requested again
+        assert snapshot.get_columns("missing_cte") == []
+
+    def test_load_skips_known_tables(self):
+        """Test that tables already in the snapshot are not requested again."""
+        snapshot = CatalogSnapshot()
+        snapshot.set_columns("users", [])
+        cursor = MagicMock()
+
+        assert snapshot.load(cursor, ["public.users"]) == 0
+        cursor.execute.assert_not_called()
+        assert "users" in snapshot
+        assert snapshot.get_columns("orders") is None
+
+
+class TestCatalogCache:
+    """Test cases for the persistent CatalogCache class."""
+
+    def test_reuses_entries_with_matching_fingerprint(self, tmp_path):
+        """Test that a stable schema needs no column queries on the second run."""
+        cache = CatalogCache(str(tmp_path))
+        identity = "localhost:5432/testdb:16384"
+
+        cursor = MagicMock()
+        cursor.fetchall.side_effect = [
+            [("public", "users", 16400, "100:16400::100")],  # Fingerprints
+            [("public", "users", "id", "integer", True, True)],  # Columns
+        ]
+        fetched = cache.load(cursor, CatalogSnapshot(), ["users"], identity)
+        assert fetched == 1
+        assert cursor.execute.call_count == 2
+
+        # Second analysis with the same fingerprint only runs the fingerprint query
+        cursor = MagicMock()
+        cursor.fetchall.return_value = [("public", "users", 16400, "100:16400::100")]
+        snapshot = CatalogSnapshot()
+        fetched = cache.load(cursor, snapshot, ["users", "not_a_table"], identity)
+        assert fetched == 0
+        assert cursor.execute.call_count == 1
+        assert snapshot.get_columns("users")[0]["name"] == "id"
+        assert snapshot.get_columns("not_a_table") == []
+
+    def test_refetches_changed_relation(self, tmp_path):
+        """Test that a changed fingerprint invalidates the cached entry."""
+        cache = CatalogCache(str(tmp_path))
+        identity = "localhost:5432/testdb:16384"
+        cache.write(identity, {
+            "16400": {"schema": "public", "table": "users", "fingerprint": "100:16400::100",
+                      "columns": [{"name": "id", "type": "integer",
+                                   "not_null": True, "is_primary_key": True}]}
+        })
+
+        cursor = MagicMock()
+        cursor.fetchall.side_effect = [
+            [("public", "users", 16400, "205:16400::205")],
+            [("public", "users", "id", "integer", True, True),
+             ("public", "users", "email", "text", False, False)],
+        ]
+        snapshot = CatalogSnapshot()
+        assert cache.load(cursor, snapshot, ["users"], identity) == 1
+        assert len(snapshot.get_columns("users")) == 2
+        assert cache.read(identity)["16400"]["fingerprint"] == "205:16400::205"
+
+
+class TestTableNameIndex:
+    """Test cases for the TableNameIndex query filter."""
+
+    def test_matches_whole_identifiers(self):
+        """Test that table names match identifiers, not substrings."""
+        index = TableNameIndex(["public.users", "sales.Orders"])
+        assert index.matches("SELECT * FROM users WHERE id = $1")
+        assert index.matches("SELECT * FROM sales.orders o")
+        assert index.matches('SELECT * FROM "Orders"')
+        assert not index.matches("SELECT * FROM users_archive")
+        assert not index.matches("SELECT * FROM superusers")
+
+    def test_empty_index_matches_everything(self):
+        """Test that an empty catalog does not filter any query."""
+        assert TableNameIndex([]).matches("SELECT 1")
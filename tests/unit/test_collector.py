@@ -0,0 +1,169 @@
+"""
+Unit tests for the background workload collector and collected windows.
+"""
+import time
+
+import pytest
+import pandas as pd
+from unittest.mock import MagicMock
+
+from app.analyzer import PostgresQueryLineage
+from app.collector import WorkloadCollector
+from app.server_profile import ServerProfile
+from app.snapshots import COUNTER_COLUMNS, SnapshotStore, TABLE_COUNTER_COLUMNS
+
+
+PARAMS = {"host": "h", "port": 5432, "database": "db", "user": "u"}
+TARGET = "u@h:5432/db"
+PG16_COLUMNS = ['userid', 'dbid', 'toplevel', 'queryid', 'query', 'calls',
+                'total_exec_time', 'mean_exec_time', 'total_plan_time', 'rows',
+                'shared_blks_hit', 'shared_blks_read', 'temp_blks_written',
+                'blk_read_time', 'blk_write_time', 'wal_bytes']
+
+
+class FakeCursor:
+    """Answers the collector's statements from in-memory counters."""
+
+    def __init__(self):
+        self.statements = {}   # queryid -> (calls, total_time, text)
+        self.tables = {}       # relname -> seq_scan
+        self.text_requests = []
+        self.description = None
+        self._rows = []
+
+    def execute(self, sql, params=None):
+        if 'pg_stat_statements_info' in sql:
+            self._rows = [(1000.0,)]
+        elif 'showtext := false' in sql:
+            columns = ['userid', 'dbid', 'queryid', 'toplevel'] + COUNTER_COLUMNS
+            self.description = [(c,) for c in columns]
+            self._rows = [(10, 1, queryid, True, calls, total_time) + (0,) * (len(COUNTER_COLUMNS) - 2)
+                          for queryid, (calls, total_time, _) in self.statements.items()]
+        elif 'pg_stat_user_tables' in sql:
+            self.description = [(c,) for c in ['schemaname', 'relname'] + TABLE_COUNTER_COLUMNS]
+            self._rows = [('public', name, seq_scan) + (0,) * (len(TABLE_COUNTER_COLUMNS) - 1)
+                          for name, seq_scan in self.tables.items()]
+        elif 'showtext := true' in sql:
+            self.text_requests.append(list(params[2]))
+            self._rows = [(10, 1, q, self.statements[q][2]) for q in params[2]]
+        else:
+            raise AssertionError(f"Unexpected statement: {sql}")
+
+    def fetchone(self):
+        return self._rows[0]
+
+    def fetchall(self):
+        return self._rows
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def collector(tmp_path):
+    store = SnapshotStore(str(tmp_path / "workload.sqlite3"))
+    collector = WorkloadCollector(PARAMS, store, interval=1)
+    collector._lineage.conn = MagicMock(closed=False)
+    collector._lineage.cursor = FakeCursor()
+    collector._lineage.server_profile = ServerProfile(160000, '1.10', PG16_COLUMNS, ['pg_catalog'])
+    return collector
+
+
+class TestWorkloadCollector:
+    """Test cases for the WorkloadCollector class."""
+
+    def test_stores_deltas_and_new_texts_only(self, collector):
+        """Test that each sample stores the interval delta and fetches unseen texts once."""
+        cursor = collector._lineage.cursor
+        cursor.statements = {1: (100, 1000.0, 'SELECT * FROM users')}
+        cursor.tables = {'users': 5}
+        assert collector.collect_once()[0] is True
+        assert cursor.text_requests == [[1]]
+
+        cursor.statements = {1: (130, 1600.0, 'SELECT * FROM users'),
+                             2: (4, 40.0, 'INSERT INTO orders SELECT * FROM users')}
+        cursor.tables = {'users': 9, 'orders': 1}
+        assert collector.collect_once()[0] is True
+        # Only the new statement's text is read from the server
+        assert cursor.text_requests == [[1], [2]]
+
+        delta = collector.store.window_delta(TARGET, 0).set_index('queryid')
+        assert delta.loc[1, 'calls'] == 30
+        assert delta.loc[1, 'total_time'] == 600.0
+        assert delta.loc[2, 'calls'] == 4
+
+        activity = collector.store.table_activity(TARGET, 0).set_index('relname')
+        assert activity.loc['users', 'seq_scan'] == 4
+        assert activity.loc['orders', 'seq_scan'] == 1
+        assert sorted(collector.store.relations(TARGET)) == ['public.orders', 'public.users']
+
+    def test_downsample_merges_old_intervals(self, tmp_path):
+        """Test that old intervals are merged into one bucket per entry."""
+        store = SnapshotStore(str(tmp_path / "workload.sqlite3"))
+        row = dict.fromkeys(COUNTER_COLUMNS, 0)
+        row.update(userid=10, dbid=1, queryid=1, toplevel=True, calls=10, total_time=100.0)
+        for start in (0, 60, 120):
+            store.save_delta(TARGET, start, start + 60, pd.DataFrame([row]))
+
+        assert store.downsample(TARGET, older_than=1000, bucket_seconds=3600) == 2
+        merged = store.window_delta(TARGET, -1, 1000)
+        assert merged.loc[0, 'calls'] == 30
+        # Already downsampled rows are left alone
+        assert store.downsample(TARGET, older_than=1000, bucket_seconds=3600) == 0
+
+    def test_prune_forgets_deallocated_texts_and_dropped_tables(self, tmp_path):
+        """Test that texts and relations go once nothing recent refers to them."""
+        store = SnapshotStore(str(tmp_path / "workload.sqlite3"))
+        store.save_texts(TARGET, [(10, 1, 1, 'SELECT 1'), (10, 1, 2, 'SELECT 2')], seen_at=100)
+        store.save_relations(TARGET, [('public', 'orders')], seen_at=100)
+        store.save_relations(TARGET, [('public', 'users')], seen_at=2000)
+        row = dict.fromkeys(COUNTER_COLUMNS, 0)
+        row.update(userid=10, dbid=1, queryid=1, toplevel=True, calls=1, total_time=1.0)
+        store.save_delta(TARGET, 1900, 2000, pd.DataFrame([row]))
+
+        store.prune(TARGET, keep_seconds=1000, now=2500)
+
+        assert store.known_queries(TARGET) == {(10, 1, 1)}
+        assert store.relations(TARGET) == ['public.users']
+
+
+class TestCollectedWindow:
+    """Test cases for answering windowed analyses from collected data."""
+
+    def test_window_is_read_from_store(self, collector):
+        """Test that a recent collected window needs no database connection."""
+        cursor = collector._lineage.cursor
+        cursor.statements = {1: (100, 1000.0, 'SELECT * FROM users'),
+                             2: (5, 5.0, 'SELECT * FROM pg_class')}
+        cursor.tables = {'users': 5}
+        collector.collect_once()
+        cursor.statements = {1: (150, 3000.0, 'SELECT * FROM users'),
+                             2: (50, 50.0, 'SELECT * FROM pg_class')}
+        collector.collect_once()
+
+        analyzer = PostgresQueryLineage(PARAMS, snapshot_store=collector.store)
+        analyzer.connect = MagicMock(side_effect=AssertionError("must not connect"))
+        result = analyzer.get_expensive_queries(limit=5, min_calls=1, window_seconds=3600)
+
+        assert list(result['queryid']) == [1]
+        assert result.loc[0, 'calls'] == 50
+        assert analyzer.workload_window['source'] == 'collector'
+
+    def test_table_activity_joins_qualified_and_bare_names(self, collector):
+        """Test that activity reaches tables written with or without public."""
+        cursor = collector._lineage.cursor
+        cursor.tables = {'orders': 1, 'users': 1}
+        collector.collect_once()
+        cursor.tables = {'orders': 4, 'users': 3}
+        collector.collect_once()
+
+        analyzer = PostgresQueryLineage(PARAMS, snapshot_store=collector.store)
+        analyzer.workload_window = {'source': 'collector', 'start_ts': 0, 'end_ts': time.time() + 1}
+        table_stats = pd.DataFrame({'table_name': ['public.orders', 'users', 'sales.daily'],
+                                    'read_queries': [1, 2, 3]})
+        result = analyzer._add_table_activity(table_stats)
+
+        assert list(result['table_name']) == ['public.orders', 'users', 'sales.daily']
+        assert list(result['seq_scan'][:2]) == [3, 2]
+        assert pd.isna(result.loc[2, 'seq_scan'])
+        assert 'schemaname' not in result.columns
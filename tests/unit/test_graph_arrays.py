@@ -0,0 +1,122 @@
+"""
+Unit tests for the array-backed lineage graph.
+"""
+import networkx as nx
+import pandas as pd
+import pytest
+from unittest.mock import patch
+
+from app.analyzer import PostgresQueryLineage
+from app.graph_arrays import ArrayGraph, PackedStrings
+from app.lineage_payload import build_payload
+from app.result_index import ResultIndex
+
+
+QUERIES = pd.DataFrame([
+    {"queryid": 1, "dbid": 5, "query": "INSERT INTO audit_log SELECT id FROM users",
+     "calls": 2, "total_time": 4.0, "mean_time": 2.0, "rows": 2},
+    {"queryid": 2, "dbid": 5, "query": "INSERT INTO order_history SELECT * FROM orders, users",
+     "calls": 1, "total_time": 1.5, "mean_time": 1.5, "rows": 1},
+    {"queryid": 3, "dbid": 5, "query": "SELECT * FROM orders",
+     "calls": 10, "total_time": 30.0, "mean_time": 3.0, "rows": 100},
+])
+
+COLUMNS = {
+    'users': [{'name': 'id', 'type': 'integer', 'not_null': True, 'is_primary_key': True},
+              {'name': 'name', 'type': 'text', 'not_null': False, 'is_primary_key': False}],
+}
+
+
+def build(engine):
+    analyzer = PostgresQueryLineage({}, graph_engine=engine)
+    with patch.object(analyzer, 'prefetch_table_columns'), \
+            patch.object(analyzer, 'get_table_columns', side_effect=lambda t: COLUMNS.get(t, [])):
+        analyzer.build_lineage_graph(QUERIES)
+        stats = analyzer.get_table_query_stats()
+    return analyzer, stats
+
+
+class TestPackedStrings:
+    """Test cases for PackedStrings."""
+
+    def test_round_trip(self):
+        strings = PackedStrings.from_list(['users', '', 'sales.orders', 'ünïcode'])
+        assert strings.tolist() == ['users', '', 'sales.orders', 'ünïcode']
+        assert strings[2] == 'sales.orders'
+        assert len(PackedStrings.from_list([])) == 0
+
+
+class TestArrayGraph:
+    """Test cases for ArrayGraph."""
+
+    def test_arrays_engine_matches_networkx(self):
+        nx_analyzer, nx_stats = build('networkx')
+        array_analyzer, array_stats = build('arrays')
+        G, A = nx_analyzer.lineage_graph, array_analyzer.lineage_graph
+
+        assert isinstance(A, ArrayGraph)
+        assert sorted(A.nodes()) == sorted(G.nodes())
+        assert sorted(A.edges()) == sorted(G.edges())
+        assert sorted(A.successors('users')) == sorted(G.successors('users'))
+        assert A.in_degree('orders') == G.in_degree('orders')
+        assert A.nodes['Query_5_1']['calls'] == 2
+        assert A.nodes['users']['columns'] == COLUMNS['users']
+
+        # Same table statistics, including the columns
+        pd.testing.assert_frame_equal(array_stats.reset_index(drop=True),
+                                      nx_stats.reset_index(drop=True), check_dtype=False)
+
+    def test_to_networkx_restores_table_edges(self):
+        G = build('networkx')[0].lineage_graph
+        restored = ArrayGraph.from_networkx(G).with_table_edges().to_networkx()
+
+        assert sorted(restored.edges()) == sorted(G.edges())
+        assert restored.edges['users', 'order_history']['via_query'] == 'Query_5_2'
+        assert restored.nodes['Query_5_3']['text'] == 'SELECT * FROM orders'
+
+    def test_save_and_memory_map(self, tmp_path):
+        A = build('arrays')[0].lineage_graph
+        A.save(str(tmp_path / 'arrays'))
+        loaded = ArrayGraph.load(str(tmp_path / 'arrays'), mmap_mode='r')
+
+        assert sorted(loaded.edges()) == sorted(A.edges())
+        assert loaded.nodes['Query_5_2']['total_time'] == pytest.approx(1.5)
+        assert build_payload(loaded) == build_payload(A)
+
+    def test_payload_matches_networkx(self):
+        G = build('networkx')[0].lineage_graph
+        A = ArrayGraph.from_networkx(G).with_table_edges()
+
+        def decoded(payload):
+            nodes = payload['nodes']
+            strings = payload['strings']
+            by_id = {}
+            for i, node in enumerate(nodes['id']):
+                by_id[node] = (strings[nodes['type'][i]], nodes['label'][i], nodes['in_degree'][i],
+                               nodes['out_degree'][i], nodes['total_time'][i], nodes['calls'][i],
+                               str(nodes['columns'][i] and [c[:1] + [strings[c[1]]] + c[2:]
+                                                            for c in nodes['columns'][i]]))
+            links = {(nodes['id'][s], nodes['id'][t])
+                     for s, t in zip(payload['links']['source'], payload['links']['target'])}
+            return by_id, links
+
+        assert decoded(build_payload(A)) == decoded(build_payload(G))
+
+    def test_result_index_on_array_graph(self):
+        A = build('arrays')[0].lineage_graph
+        index = ResultIndex(QUERIES, None, A)
+
+        assert index.query_lineage(1) == {'node': 'Query_5_2', 'reads': ['orders', 'users'],
+                                          'writes': ['order_history']}
+        lineage = index.table_lineage('users')
+        assert [q['id'] for q in lineage['read']] == ['Query_5_1', 'Query_5_2']
+        assert lineage['downstream'] == ['audit_log', 'order_history']
+
+    def test_empty_graph(self):
+        A = ArrayGraph.from_networkx(nx.DiGraph()).with_table_edges()
+        assert A.number_of_nodes() == 0
+        assert A.table_query_stats().empty
+
+    def test_unknown_engine_is_rejected(self):
+        with pytest.raises(ValueError):
+            PostgresQueryLineage({}, graph_engine='igraph')
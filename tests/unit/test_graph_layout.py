@@ -0,0 +1,128 @@
+"""
+Unit tests for the server-side lineage graph layout.
+"""
+import networkx as nx
+import numpy as np
+from unittest.mock import patch
+
+from app.graph_arrays import ArrayGraph
+from app.graph_layout import (LayoutCache, force_layout, graph_fingerprint, incremental_layout,
+                              layered_layout)
+
+
+class TestLayeredLayout:
+    """Test cases for layered_layout."""
+
+    def test_layers_follow_the_data_flow(self, graph, lineage_graph):
+        pos = layered_layout(graph)
+
+        assert set(pos) == set(lineage_graph.nodes())
+        x = {node: xy[0] for node, xy in pos.items()}
+        assert x['orders'] < x['Q1'] < x['sales'] < x['Q2'] < x['report']
+        assert x['Q3'] < x['Q2']
+        # No two nodes share a position
+        assert len(set(pos.values())) == len(pos)
+
+    def test_sources_sit_next_to_their_first_reader(self, lineage_graph):
+        G = lineage_graph
+        G.add_node('lookup', type='table')
+        G.add_node('Q4', type='query')
+        G.add_edges_from([('lookup', 'Q4'), ('Q4', 'report')])
+        pos = layered_layout(G)
+
+        assert pos['Q4'][0] == pos['Q2'][0]
+        assert pos['lookup'][0] < pos['Q4'][0]
+        assert pos['lookup'][0] > pos['orders'][0]
+
+    def test_large_cycle_uses_the_grid_approximation(self):
+        rng = np.random.default_rng(0)
+        sources, targets = rng.integers(0, 600, 1800), rng.integers(0, 600, 1800)
+        pos = force_layout(600, sources, targets, iterations=5)
+
+        assert pos.shape == (600, 2)
+        assert np.isfinite(pos).all()
+        assert pos.min() == 0.0 and pos.max() == 1.0
+
+    def test_empty_graph(self):
+        assert layered_layout(nx.DiGraph()) == {}
+
+
+class TestIncrementalLayout:
+    """Test cases for incremental_layout."""
+
+    def grown_graph(self, lineage_graph):
+        """lineage_graph with report archived by a new query and a new unconnected part"""
+        G = lineage_graph.copy()
+        G.remove_node('unrelated')
+        G.add_node('archive', type='table')
+        G.add_node('Q9', type='query')
+        G.add_edges_from([('report', 'Q9'), ('Q9', 'archive')])
+        G.add_node('staging', type='table')
+        G.add_node('Q8', type='query')
+        G.add_edge('staging', 'Q8')
+        return G
+
+    def test_unchanged_nodes_keep_their_positions(self, lineage_graph):
+        previous = layered_layout(lineage_graph)
+        G = self.grown_graph(lineage_graph)
+        pos = incremental_layout(G, previous)
+
+        assert set(pos) == set(G.nodes())
+        for node in ('orders', 'Q1', 'sales', 'Q3', 'Q2', 'report'):
+            assert pos[node] == previous[node]
+        # New nodes follow the flow from the nodes they read
+        assert pos['Q9'][0] == previous['report'][0] + 1
+        assert pos['archive'][0] == pos['Q9'][0] + 1
+        # Unconnected new parts go below the rest
+        assert pos['staging'][1] > max(y for _, y in previous.values())
+        assert pos['staging'][0] < pos['Q8'][0]
+        assert len(set(pos.values())) == len(pos)
+
+    def test_mostly_new_graph_is_laid_out_again(self, lineage_graph):
+        G = self.grown_graph(lineage_graph)
+        previous = {'orders': (40.0, 40.0)}
+        assert incremental_layout(G, previous) == layered_layout(G)
+
+
+class TestLayoutCache:
+    """Test cases for graph fingerprints and LayoutCache."""
+
+    def test_fingerprint(self, lineage_graph):
+        G = lineage_graph
+        reordered = nx.DiGraph()
+        reordered.add_nodes_from(reversed(list(G.nodes(data=True))))
+        reordered.add_edges_from(reversed(list(G.edges(data=True))))
+
+        assert graph_fingerprint(reordered) == graph_fingerprint(G)
+        assert graph_fingerprint(ArrayGraph.from_networkx(G)) == graph_fingerprint(G)
+        G.add_edge('report', 'Q3')
+        assert graph_fingerprint(G) != graph_fingerprint(reordered)
+
+    def test_positions_are_laid_out_once(self, tmp_path, lineage_graph):
+        cache = LayoutCache(str(tmp_path))
+        with patch('app.graph_layout.layered_layout', wraps=layered_layout) as layout:
+            first = cache.positions(lineage_graph)
+            assert cache.positions(lineage_graph.copy()) is first
+            # A new process reads the layout from disk
+            assert LayoutCache(str(tmp_path)).positions(lineage_graph.copy()) == first
+        assert layout.call_count == 1
+
+    def test_memory_only_cache_is_bounded(self):
+        cache = LayoutCache(max_entries=1)
+        cache.put('a', {'t': (0.0, 0.0)})
+        cache.put('b', {'t': (1.0, 0.0)})
+
+        assert cache.get('a') is None
+        assert cache.get('b') == {'t': (1.0, 0.0)}
+
+    def test_target_layouts_are_reused_for_the_next_graph(self, tmp_path, lineage_graph):
+        first = LayoutCache(str(tmp_path)).positions(lineage_graph, target='db1')
+        G = lineage_graph.copy()
+        G.add_node('Q9', type='query')
+        G.add_edge('report', 'Q9')
+
+        # Another process, or a restart, still finds the target's layout
+        pos = LayoutCache(str(tmp_path)).positions(G, target='db1')
+        assert all(pos[node] == xy for node, xy in first.items())
+        assert LayoutCache(str(tmp_path)).latest('db1') == pos
+        assert LayoutCache(str(tmp_path)).latest('db2') is None
@@ -0,0 +1,42 @@
+"""
+Unit tests for query node identity and stored lineage graphs.
+"""
+import networkx as nx
+
+from app.graph_store import LineageGraphStore, query_node_id, statement_digest
+
+
+class TestQueryNodeId:
+    """Test cases for query_node_id."""
+
+    def test_keyed_on_dbid_and_queryid(self):
+        assert query_node_id(-42, 16384, 'SELECT 1') == 'Query_16384_-42'
+        assert query_node_id(42) == 'Query_42'
+        assert query_node_id(42.0, float('nan')) == 'Query_42'
+
+    def test_text_hash_without_queryid_is_stable(self):
+        first = query_node_id(None, None, 'SELECT * FROM users')
+        assert first == query_node_id(float('nan'), 1, 'SELECT * FROM users')
+        assert first != query_node_id(None, None, 'SELECT * FROM orders')
+        assert first.startswith('Query_')
+
+    def test_statement_digest_depends_on_parser(self):
+        assert statement_digest('SELECT 1', 'fast') != statement_digest('SELECT 1', 'sqlparse')
+
+
+class TestLineageGraphStore:
+    """Test cases for LineageGraphStore."""
+
+    def test_save_load_discard(self, tmp_path):
+        store = LineageGraphStore(str(tmp_path / 'graphs'))
+        G = nx.DiGraph()
+        G.add_edge('users', 'Query_1_2')
+
+        assert store.load('postgres@db:5432/app') is None
+        store.save('postgres@db:5432/app', G)
+        loaded = store.load('postgres@db:5432/app')
+
+        assert list(loaded.edges()) == [('users', 'Query_1_2')]
+        assert store.load('postgres@db:5432/other') is None
+        store.discard('postgres@db:5432/app')
+        assert store.load('postgres@db:5432/app') is None
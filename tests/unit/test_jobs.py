@@ -0,0 +1,111 @@
+"""
+Unit tests for background analysis jobs.
+"""
+import threading
+import pytest
+
+from app.jobs import (ANALYSIS_STAGES, CANCELLED, FAILED, SUCCEEDED, JobCancelled,
+                      JobManager)
+
+
+@pytest.fixture
+def manager():
+    manager = JobManager(max_workers=1, max_retained=3)
+    yield manager
+    manager.shutdown(wait=True)
+
+
+class TestJobManager:
+    """Test cases for JobManager."""
+
+    def test_job_reports_stages_and_result(self, manager):
+        seen = []
+
+        def work(job, value):
+            for stage in ANALYSIS_STAGES[:3]:
+                job.report(stage)
+                seen.append((job.stage, job.progress))
+            return value * 2
+
+        job = manager.submit(work, 21, owner='me')
+        job.future.result(timeout=10)
+
+        assert job.status == SUCCEEDED
+        assert job.result == 42
+        assert job.owner == 'me'
+        assert job.progress == 1.0
+        assert [stage for stage, _ in seen] == list(ANALYSIS_STAGES[:3])
+        assert seen[0][1] == 0.0 and seen[2][1] > seen[1][1]
+        assert manager.get(job.id) is job
+
+    def test_failure_is_recorded(self, manager):
+        def work(job):
+            raise RuntimeError("connection refused")
+
+        job = manager.submit(work)
+        job.future.result(timeout=10)
+
+        assert job.status == FAILED
+        assert job.error == "connection refused"
+        assert job.to_dict()['error'] == "connection refused"
+
+    def test_cancel_stops_at_next_stage(self, manager):
+        started = threading.Event()
+        release = threading.Event()
+        stages = []
+
+        def work(job):
+            job.report('fetch')
+            stages.append('fetch')
+            started.set()
+            release.wait(10)
+            job.report('parse')
+            stages.append('parse')
+
+        job = manager.submit(work)
+        assert started.wait(10)
+        assert manager.cancel(job.id) is True
+        release.set()
+        job.future.result(timeout=10)
+
+        assert job.status == CANCELLED
+        assert stages == ['fetch']
+        assert job.cancel() is False
+
+    def test_cancel_queued_job(self, manager):
+        release = threading.Event()
+        blocker = manager.submit(lambda job: release.wait(10))
+        queued = manager.submit(lambda job: 'never')
+
+        assert queued.cancel() is True
+        release.set()
+        blocker.future.result(timeout=10)
+
+        assert queued.status == CANCELLED
+        assert queued.result is None
+
+    def test_wait_for_change(self, manager):
+        release = threading.Event()
+        job = manager.submit(lambda job: release.wait(10))
+        version = job.wait_for_change(None)
+        release.set()
+        while not job.finished:
+            version = job.wait_for_change(version, timeout=5)
+        assert job.status == SUCCEEDED
+
+    def test_finished_jobs_are_evicted(self, manager):
+        submitted = [manager.submit(lambda job: None) for _ in range(5)]
+        submitted[-1].future.result(timeout=10)
+        manager.submit(lambda job: None).future.result(timeout=10)
+
+        assert len(manager) <= 3
+        assert manager.get(submitted[0].id) is None
+
+    def test_job_cancelled_is_not_a_failure(self, manager):
+        def work(job):
+            raise JobCancelled()
+
+        job = manager.submit(work)
+        job.future.result(timeout=10)
+        assert job.status == CANCELLED
+        assert job.error is None
@@ -0,0 +1,77 @@
+"""
+Unit tests for the compact lineage payload.
+"""
+import gzip
+import json
+import networkx as nx
+import numpy as np
+
+from app.graph_arrays import ArrayGraph
+from app.lineage_payload import build_payload, encode_payload
+
+
+def payload_graph():
+    G = nx.DiGraph()
+    G.add_node('users', type='table', columns=[
+        {'name': 'id', 'type': 'integer', 'not_null': True, 'is_primary_key': True},
+        {'name': 'name', 'type': 'text', 'not_null': False, 'is_primary_key': False}])
+    G.add_node('sales.orders', type='table', columns='[{"name": "id", "type": "integer"}]')
+    G.add_node('Query_1', type='query', text='INSERT INTO sales.orders SELECT * FROM users',
+               calls=np.int64(5), total_time=np.float64(12.5), mean_time=2.5, rows=10)
+    G.add_edge('users', 'Query_1')
+    G.add_edge('Query_1', 'sales.orders')
+    G.add_edge('users', 'sales.orders', via_query='Query_1')
+    return G
+
+
+class TestLineagePayload:
+    """Test cases for build_payload."""
+
+    def test_nodes_are_columns_with_interned_strings(self):
+        payload = build_payload(payload_graph())
+        strings = payload['strings']
+        nodes = payload['nodes']
+
+        assert nodes['id'] == ['users', 'sales.orders', 'Query_1']
+        assert [strings[t] for t in nodes['type']] == ['table', 'table', 'query']
+        assert [strings[s] for s in nodes['schema'][:2]] == ['public', 'sales']
+        assert nodes['label'][:2] == ['users', 'orders']
+        # 'integer' is stored once however many columns use it
+        assert strings.count('integer') == 1
+        assert nodes['columns'][0][0] == ['id', strings.index('integer'), 1, 1]
+        assert nodes['columns'][1] == [['id', strings.index('integer'), 0, 0]]
+        assert nodes['columns'][2] is None
+
+    def test_links_use_node_indices_and_degrees_are_precomputed(self):
+        payload = build_payload(payload_graph())
+        links = list(zip(payload['links']['source'], payload['links']['target']))
+
+        assert sorted(links) == [(0, 1), (0, 2), (2, 1)]
+        assert payload['nodes']['out_degree'] == [2, 0, 1]
+        assert payload['nodes']['in_degree'] == [0, 2, 1]
+
+    def test_subset_keeps_full_degrees(self):
+        payload = build_payload(payload_graph(), nodes=['Query_1', 'users'])
+
+        assert payload['nodes']['id'] == ['Query_1', 'users']
+        assert payload['links'] == {'source': [1], 'target': [0]}
+        assert payload['nodes']['out_degree'] == [1, 2]
+
+    def test_encoded_payload_is_gzipped_json(self):
+        payload = build_payload(payload_graph())
+        encoded = encode_payload(payload)
+
+        assert json.loads(gzip.decompress(encoded)) == payload
+        assert payload['nodes']['calls'][2] == 5
+        assert encode_payload(payload) == encoded  # Stable bytes for caching
+
+    def test_positions_ship_with_the_nodes(self):
+        positions = {'users': (0.5, -0.25), 'Query_1': (1.5, 1 / 3)}
+        payload = build_payload(payload_graph(), positions=positions)
+
+        assert payload['nodes']['x'] == [0.5, None, 1.5]
+        assert payload['nodes']['y'] == [-0.25, None, 0.33]
+        assert 'x' not in build_payload(payload_graph())['nodes']
+        subset = build_payload(ArrayGraph.from_networkx(payload_graph()).with_table_edges(),
+                               nodes=['Query_1'], positions=positions)
+        assert (subset['nodes']['x'], subset['nodes']['y']) == ([1.5], [0.33])
@@ -0,0 +1,74 @@
+"""
+Unit tests for the schema and component lineage summaries.
+"""
+import networkx as nx
+import pytest
+
+from app.lineage_summary import LineageSummary
+
+
+def schema_graph():
+    """sales feeds reporting through Q1 and Q2, users is read on its own"""
+    G = nx.DiGraph()
+    for table in ('sales.orders', 'sales.customers', 'reporting.daily', 'reporting.weekly', 'users'):
+        G.add_node(table, type='table')
+    for query, total_time in (('Q1', 10.0), ('Q2', 5.0), ('Q3', 2.0), ('Q4', 1.0)):
+        G.add_node(query, type='query', total_time=total_time)
+    G.add_edges_from([('sales.orders', 'Q1'), ('sales.customers', 'Q1'), ('Q1', 'reporting.daily'),
+                      ('sales.orders', 'Q2'), ('Q2', 'reporting.daily'),
+                      ('reporting.daily', 'Q3'), ('Q3', 'reporting.weekly'),
+                      ('users', 'Q4')])
+    # Derived table-to-table shortcuts do not count as links
+    G.add_edge('sales.orders', 'reporting.daily', via_query='Q1')
+    return G
+
+
+def links(payload):
+    ids = payload['groups']['id']
+    links = payload['links']
+    return {(ids[s], ids[t]): (q, time) for s, t, q, time in
+            zip(links['source'], links['target'], links['queries'], links['total_time'])}
+
+
+class TestLineageSummary:
+    """Test cases for LineageSummary."""
+
+    def test_schema_groups_and_links(self, graph_engine):
+        payload = LineageSummary(graph_engine(schema_graph()), 'schema').payload()
+        groups = payload['groups']
+
+        assert payload['group_by'] == 'schema'
+        assert groups['id'] == ['sales', 'reporting', 'public']
+        assert groups['tables'] == [2, 2, 1]
+        assert groups['queries'] == [2, 3, 1]
+        assert groups['total_time'] == pytest.approx([15.0, 17.0, 1.0])
+        # Q3 stays inside reporting, so only one link
+        assert links(payload) == {('sales', 'reporting'): (2, pytest.approx(15.0))}
+
+    def test_component_groups(self):
+        summary = LineageSummary(schema_graph(), 'component')
+        payload = summary.payload()
+
+        assert payload['groups']['id'] == ['component-0', 'component-1']
+        assert payload['groups']['label'] == ['reporting.daily', 'users']
+        assert payload['groups']['tables'] == [4, 1]
+        assert links(payload) == {}
+        assert 'component-1' in summary and len(summary) == 2
+
+    def test_members(self):
+        summary = LineageSummary(schema_graph(), 'schema')
+
+        assert summary.members('sales') == ['sales.orders', 'sales.customers', 'Q1', 'Q2']
+        # Half the cap for the best connected tables, the rest for the
+        # most expensive queries
+        assert summary.members('reporting', max_nodes=3) == ['reporting.daily', 'Q1', 'Q2']
+        assert summary.members('missing') is None
+
+    def test_empty_graph(self):
+        payload = LineageSummary(nx.DiGraph(), 'component').payload()
+        assert payload['groups']['id'] == []
+        assert payload['links']['source'] == []
+
+    def test_unknown_grouping_is_rejected(self):
+        with pytest.raises(ValueError):
+            LineageSummary(schema_graph(), 'database')
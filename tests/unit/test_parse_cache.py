@@ -0,0 +1,64 @@
+"""
+Unit tests for the lineage parse cache.
+"""
+from unittest.mock import patch
+
+from app.analyzer import PostgresQueryLineage
+from app.parse_cache import ParseCache
+
+
+class TestParseCache:
+    """Test cases for the ParseCache class."""
+
+    def test_hit_and_miss_counters(self):
+        """Test that lookups are counted as hits and misses."""
+        cache = ParseCache(max_entries=10)
+        assert cache.get("SELECT * FROM users", 1) is None
+
+        cache.put("SELECT * FROM users", (["users"], []), 1)
+        assert cache.get("SELECT * FROM users", 1) == (["users"], [])
+        # Same queryid with a different text is a different entry
+        assert cache.get("SELECT * FROM orders", 1) is None
+
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 2
+        assert stats["size"] == 1
+
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted first."""
+        cache = ParseCache(max_entries=2)
+        cache.put("q1", (["a"], []))
+        cache.put("q2", (["b"], []))
+        cache.get("q1")
+        cache.put("q3", (["c"], []))
+
+        assert len(cache) == 2
+        assert cache.get("q2") is None
+        assert cache.get("q1") == (["a"], [])
+        assert cache.stats()["evictions"] == 1
+
+    def test_save_and_load(self, tmp_path):
+        """Test round-tripping entries through the on-disk store."""
+        path = str(tmp_path / "parse_cache.json")
+        cache = ParseCache(path=path)
+        cache.put("INSERT INTO t SELECT * FROM s", (["s"], ["t"]), 42)
+        assert cache.save() is True
+        # Nothing changed since the last save
+        assert cache.save() is False
+
+        restored = ParseCache(path=path)
+        assert restored.load() == 1
+        assert restored.get("INSERT INTO t SELECT * FROM s", 42) == (["s"], ["t"])
+
+    def test_analyzer_skips_parser_on_hit(self):
+        """Test that a cached statement is not parsed again."""
+        analyzer = PostgresQueryLineage({}, parse_cache=ParseCache())
+        query = "SELECT * FROM users"
+
+        first = analyzer.get_table_dependencies(query, queryid=7)
+        with patch('app.analyzer.parse') as mock_parse:
+            second = analyzer.get_table_dependencies(query, queryid=7)
+            mock_parse.assert_not_called()
+
+        assert first == second == (["users"], [])
@@ -0,0 +1,54 @@
+"""
+Unit tests for the long-lived parse worker pool.
+"""
+import time
+import operator
+
+import pytest
+
+from app.parse_pool import ParsePool, ParseTimeout
+
+
+class TestParsePool:
+    """Test cases for ParsePool."""
+
+    def test_serial_pool_starts_no_processes(self):
+        pool = ParsePool(1)
+        assert not pool.parallel
+        assert pool._executor is None
+
+    def test_workers_are_reused_between_calls(self):
+        pool = ParsePool(2)
+        try:
+            assert pool.map(operator.add, [1, 2, 3], [10, 20, 30]) == [11, 22, 33]
+            executor = pool._executor
+            assert pool.map(operator.neg, [4, 5]) == [-4, -5]
+            assert pool._executor is executor
+            assert executor._mp_context.get_start_method() != 'fork'
+        finally:
+            pool.shutdown()
+        assert pool._executor is None
+
+    def test_call_over_budget_kills_the_worker(self):
+        pool = ParsePool(1)
+        try:
+            assert pool.call(5, operator.add, 1, 2) == 3
+            process = pool._budget_worker[0]
+            # The same worker serves the next call
+            assert pool.call(5, operator.add, 3, 4) == 7
+            assert pool._budget_worker[0] is process
+
+            started = time.time()
+            with pytest.raises(ParseTimeout):
+                pool.call(0.1, time.sleep, 10)
+            assert time.time() - started < 5
+            assert not process.is_alive()
+            assert pool._budget_worker is None
+
+            # A new worker is started for the next call
+            assert pool.call(5, operator.add, 5, 6) == 11
+            with pytest.raises(RuntimeError):
+                pool.call(5, operator.truediv, 1, 0)
+        finally:
+            pool.shutdown()
+        assert pool._budget_worker is None
@@ -0,0 +1,116 @@
+"""
+Unit tests for pooled database connections.
+"""
+import threading
+import pytest
+from unittest.mock import MagicMock, patch
+
+from app.analyzer import PostgresQueryLineage
+from app.pool import ConnectionPool, ConnectionPools, PoolTimeout
+
+
+PARAMS = {"host": "localhost", "port": 5432, "database": "testdb", "user": "postgres",
+          "password": "secret"}
+
+
+def fake_connection():
+    conn = MagicMock(closed=0)
+    conn.get_transaction_status.return_value = 0  # TRANSACTION_STATUS_IDLE
+    return conn
+
+
+@patch('app.pool.psycopg2.connect')
+class TestConnectionPool:
+    """Test cases for ConnectionPool."""
+
+    def test_connections_are_reused(self, mock_connect):
+        mock_connect.side_effect = lambda **params: fake_connection()
+        pool = ConnectionPool(PARAMS, max_size=2)
+
+        with pool.connection() as first:
+            pass
+        with pool.connection() as second:
+            pass
+
+        assert first is second
+        assert mock_connect.call_count == 1
+        assert pool.stats()['reused'] == 1
+
+    def test_open_transaction_is_rolled_back(self, mock_connect):
+        conn = fake_connection()
+        conn.get_transaction_status.return_value = 2  # TRANSACTION_STATUS_INTRANS
+        mock_connect.return_value = conn
+        pool = ConnectionPool(PARAMS)
+
+        with pool.connection():
+            pass
+        conn.rollback.assert_called_once()
+
+    def test_max_size_bounds_open_connections(self, mock_connect):
+        mock_connect.side_effect = lambda **params: fake_connection()
+        pool = ConnectionPool(PARAMS, max_size=1)
+
+        conn = pool.acquire()
+        with pytest.raises(PoolTimeout):
+            pool.acquire(timeout=0.05)
+
+        # A waiting borrower gets the connection once it is returned
+        borrowed = []
+        waiter = threading.Thread(target=lambda: borrowed.append(pool.acquire(timeout=5)))
+        waiter.start()
+        pool.release(conn)
+        waiter.join(5)
+        assert borrowed == [conn]
+        assert len(pool) == 1
+
+    def test_broken_connection_is_replaced(self, mock_connect):
+        broken, fresh = fake_connection(), fake_connection()
+        broken.cursor.side_effect = Exception("server closed the connection unexpectedly")
+        mock_connect.side_effect = [broken, fresh]
+        pool = ConnectionPool(PARAMS, health_check_after=0)
+
+        pool.release(pool.acquire())
+        assert pool.acquire() is fresh
+        broken.close.assert_called_once()
+        assert pool.stats()['discarded'] == 1
+
+    def test_idle_connections_expire(self, mock_connect):
+        conn = fake_connection()
+        mock_connect.return_value = conn
+        pool = ConnectionPool(PARAMS, idle_timeout=0)
+
+        pool.release(pool.acquire())
+        assert pool.prune() == 1
+        conn.close.assert_called_once()
+        assert len(pool) == 0
+
+    def test_failed_connect_frees_the_slot(self, mock_connect):
+        mock_connect.side_effect = [Exception("password authentication failed"), fake_connection()]
+        pool = ConnectionPool(PARAMS, max_size=1)
+
+        with pytest.raises(Exception):
+            pool.acquire()
+        assert pool.acquire(timeout=0.05) is not None
+
+
+class TestConnectionPools:
+    """Test cases for sharing pools between analyses."""
+
+    def test_pools_are_keyed_by_credentials(self):
+        pools = ConnectionPools()
+        assert pools.get(PARAMS) is pools.get(dict(PARAMS))
+        assert pools.get(PARAMS) is not pools.get(dict(PARAMS, password="other"))
+        assert len(pools) == 2
+
+    @patch('app.pool.psycopg2.connect')
+    def test_analyzers_share_connections(self, mock_connect):
+        mock_connect.side_effect = lambda **params: fake_connection()
+        pools = ConnectionPools()
+
+        for _ in range(3):
+            analyzer = PostgresQueryLineage(PARAMS, connection_pools=pools)
+            assert analyzer.check_connection()[0] is True
+            analyzer.disconnect()
+
+        assert mock_connect.call_count == 1
+        assert pools.get(PARAMS).stats()['idle'] == 1
@@ -0,0 +1,71 @@
+"""
+Unit tests for the lineage reachability index.
+"""
+import random
+
+import networkx as nx
+import pytest
+
+from app.reachability import ReachabilityIndex
+
+
+class TestReachabilityIndex:
+    """Test cases for ReachabilityIndex."""
+
+    def test_transitive_sets(self, graph):
+        index = ReachabilityIndex(graph)
+
+        assert index.downstream('orders') == ['report', 'sales']
+        assert index.downstream('orders', kind='query') == ['Q1', 'Q2', 'Q3']
+        assert index.upstream('report') == ['orders', 'sales']
+        # A table in a cycle is upstream of itself only through the cycle
+        assert index.upstream('sales', kind=None) == ['Q1', 'Q3', 'orders']
+        assert index.downstream('unrelated') == []
+        assert index.downstream('missing') is None
+        with pytest.raises(ValueError):
+            index.downstream('orders', kind='view')
+
+    def test_reaches_and_shortest_path(self, lineage_graph):
+        index = ReachabilityIndex(lineage_graph)
+
+        assert index.reaches('orders', 'report')
+        assert not index.reaches('report', 'orders')
+        assert index.shortest_path('orders', 'report') == ['orders', 'Q1', 'sales', 'Q2', 'report']
+        assert index.shortest_path('report', 'orders') is None
+
+    def test_neighbourhood(self, lineage_graph):
+        index = ReachabilityIndex(lineage_graph)
+
+        assert index.neighbourhood('sales', depth=1, direction='upstream') == {'Q1': 1, 'Q3': 1}
+        assert index.neighbourhood('sales', depth=2, kind='table') == {'orders': 2, 'report': 2}
+        with pytest.raises(ValueError):
+            index.neighbourhood('sales', direction='sideways')
+
+    def test_neighbourhood_cap_keeps_best_connected_nodes(self, lineage_graph):
+        G = lineage_graph
+        G.add_edge('Q2', 'unrelated')
+        G.add_edge('unrelated', 'Q1')
+        index = ReachabilityIndex(G)
+
+        # Q3 has the fewest edges of the three queries around sales
+        assert index.neighbourhood('sales', depth=3, max_nodes=2) == {'Q1': 1, 'Q2': 1}
+        assert len(index.neighbourhood('sales', depth=3, max_nodes=4)) == 4
+        assert index.degree('Q2') == 3
+
+    def test_matches_networkx_traversal(self):
+        rng = random.Random(7)
+        G = nx.DiGraph()
+        G.add_nodes_from((f"t{i}" for i in range(200)), type='table')
+        for q in range(300):
+            G.add_node(f"q{q}", type='query')
+            G.add_edges_from((f"t{rng.randrange(200)}", f"q{q}") for _ in range(rng.randint(0, 3)))
+            G.add_edges_from((f"q{q}", f"t{rng.randrange(200)}") for _ in range(rng.randint(0, 2)))
+        index = ReachabilityIndex(G)
+
+        for node in rng.sample(list(G.nodes()), 40):
+            assert index.downstream(node, kind=None) == sorted(nx.descendants(G, node))
+            assert index.upstream(node, kind=None) == sorted(nx.ancestors(G, node))
+
+    def test_empty_graph(self):
+        index = ReachabilityIndex(nx.DiGraph())
+        assert len(index) == 0 and index.component_count == 0
@@ -0,0 +1,69 @@
+"""
+Unit tests for the analysis lookup indexes.
+"""
+import networkx as nx
+import pandas as pd
+
+from app.result_index import ResultIndex
+
+
+def make_index():
+    queries = pd.DataFrame({
+        'queryid': [9001, -42, 9001, 777],
+        'query': ['INSERT INTO sales SELECT * FROM orders', 'SELECT * FROM orders', 'SELECT 1', 'SELECT 2'],
+        'total_time': [30.0, 10.0, 1.0, 1.0]
+    })
+    stats = pd.DataFrame({'table_name': ['orders', 'sales'], 'total_time': [40.0, 31.0]})
+
+    G = nx.DiGraph()
+    G.add_node('orders', type='table')
+    G.add_node('sales', type='table')
+    G.add_node('Query_a', type='query', queryid=9001, text=queries['query'][0], total_time=30.0)
+    # A graph from an older analysis without queryid attributes
+    G.add_node('Query_b', type='query', text=queries['query'][1], total_time=10.0)
+    G.add_edge('orders', 'Query_a')
+    G.add_edge('Query_a', 'sales')
+    G.add_edge('orders', 'sales', via_query='Query_a')
+    G.add_edge('orders', 'Query_b')
+    return ResultIndex(queries, stats, G)
+
+
+class TestResultIndex:
+    """Test cases for ResultIndex."""
+
+    def test_query_position_by_row_or_queryid(self):
+        index = make_index()
+
+        assert index.query_position('1') == 1
+        assert index.query_position('9001') == 0  # First row with the queryid
+        assert index.query_position('-42') == 1
+        assert index.query_position('7') is None
+        assert index.query_position('777') == 3
+        assert index.query_position('abc') is None
+        assert index.query_position('Query_b') == 1
+
+    def test_table_position(self):
+        index = make_index()
+
+        assert index.table_position('sales') == 1
+        assert index.table_position('missing') is None
+
+    def test_query_lineage(self):
+        index = make_index()
+
+        assert index.query_lineage(0) == {'node': 'Query_a', 'reads': ['orders'], 'writes': ['sales']}
+        # Matched by query text when the node has no queryid
+        assert index.query_lineage(1)['node'] == 'Query_b'
+        assert index.query_lineage(2)['node'] == 'Query_a'
+        assert index.query_lineage(3) is None
+
+    def test_table_lineage(self):
+        index = make_index()
+        lineage = index.table_lineage('orders')
+
+        assert [q['id'] for q in lineage['read']] == ['Query_a', 'Query_b']
+        assert lineage['read'][1]['position'] == 1
+        assert lineage['write'] == []
+        assert lineage['downstream'] == ['sales']
+        assert index.table_lineage('sales')['upstream'] == ['orders']
+        assert index.table_lineage('missing') is None
@@ -0,0 +1,84 @@
+"""
+Unit tests for the in-memory analysis result store.
+"""
+import uuid
+import pandas as pd
+import networkx as nx
+
+from app.results import AnalysisResult, ResultStore
+
+
+def make_result(rows=100):
+    graph = nx.DiGraph()
+    graph.add_node('users', type='table', columns=[{'name': 'id', 'type': 'integer'}])
+    graph.add_node('Query_1', type='query', text='SELECT * FROM users', calls=3)
+    graph.add_edge('users', 'Query_1')
+    queries = pd.DataFrame({'queryid': range(rows), 'query': ['SELECT * FROM users'] * rows,
+                            'total_time': [1.0] * rows})
+    table_stats = pd.DataFrame([{'table_name': 'users', 'total_time': 1.0,
+                                 'columns': [{'name': 'id', 'type': 'integer'}]}])
+    return AnalysisResult(uuid.uuid4().hex, expensive_queries=queries, table_stats=table_stats,
+                          lineage_graph=graph, files={})
+
+
+class TestResultStore:
+    """Test cases for ResultStore."""
+
+    def test_get_returns_stored_objects(self):
+        store = ResultStore()
+        result = make_result()
+        store.put(result)
+
+        assert store.get(result.analysis_id) is result
+        assert store.get(uuid.uuid4().hex) is None
+        assert store.stats()['hits'] == 1
+
+    def test_over_budget_results_spill_and_reload(self, tmp_path):
+        first, second = make_result(), make_result()
+        store = ResultStore(max_bytes=first.nbytes + 1, spill_dir=str(tmp_path))
+        store.put(first)
+        store.put(second)
+
+        # The older result left memory for disk
+        assert first.analysis_id not in store
+        assert (tmp_path / f"{first.analysis_id}.pkl").exists()
+
+        reloaded = store.get(first.analysis_id)
+        assert list(reloaded.expensive_queries['queryid']) == list(range(100))
+        assert reloaded.table_stats['columns'][0] == [{'name': 'id', 'type': 'integer'}]
+        assert reloaded.lineage_graph.nodes['Query_1']['calls'] == 3
+        assert first.analysis_id in store and second.analysis_id not in store
+        assert store.stats()['spill_loads'] == 1
+
+    def test_without_spill_dir_evicted_results_are_dropped(self):
+        first, second = make_result(), make_result()
+        store = ResultStore(max_bytes=1)
+        store.put(first)
+        store.put(second)
+
+        assert store.get(first.analysis_id) is None
+        assert store.get(second.analysis_id) is second
+
+    def test_ids_are_not_used_as_paths(self, tmp_path):
+        store = ResultStore(spill_dir=str(tmp_path))
+        assert store.get('../../etc/passwd') is None
+
+    def test_rebuild_from_files(self, tmp_path):
+        queries_file = tmp_path / 'queries.csv'
+        pd.DataFrame({'queryid': [1], 'query': ['SELECT 1']}).to_csv(queries_file, index=False)
+
+        result = AnalysisResult.from_files(None, {'expensive_queries': str(queries_file),
+                                                  'table_stats': str(tmp_path / 'missing.csv')})
+        assert list(result.expensive_queries['queryid']) == [1]
+        assert result.table_stats is None
+        assert result.lineage_graph is None
+
+    def test_positions_are_read_back_from_the_payload(self, tmp_path):
+        from app.lineage_payload import write_payload
+        graph = make_result().lineage_graph
+        payload_file = tmp_path / 'lineage.json.gz'
+        write_payload(graph, str(payload_file), {'users': (0.5, 0.0), 'Query_1': (1.5, 0.0)})
+
+        result = AnalysisResult.from_files(None, {'lineage_payload': str(payload_file)})
+        assert result.positions() == {'users': (0.5, 0.0), 'Query_1': (1.5, 0.0)}
+        assert AnalysisResult.from_files(None, {}).positions() is None
@@ -0,0 +1,112 @@
+"""
+Unit tests for the server capability profile and statement builder.
+"""
+import pandas as pd
+import pytest
+from psycopg2 import errors
+from unittest.mock import MagicMock, patch
+
+from app.analyzer import PostgresQueryLineage
+from app.server_profile import ServerProfile, ServerProfileCache, probe_server
+
+
+PG16_COLUMNS = ['userid', 'dbid', 'toplevel', 'queryid', 'query', 'calls',
+                'total_exec_time', 'mean_exec_time', 'total_plan_time', 'rows',
+                'shared_blks_hit', 'shared_blks_read', 'temp_blks_written',
+                'blk_read_time', 'blk_write_time', 'wal_bytes']
+
+
+class TestServerProfile:
+    """Test cases for the ServerProfile class."""
+
+    def test_metric_columns_follow_capabilities(self):
+        """Test that the select list uses what each server version offers."""
+        modern = ServerProfile(160000, '1.10', PG16_COLUMNS, ['pg_catalog'])
+        columns = modern.metric_columns()
+        assert "total_exec_time as total_time" in columns
+        assert "COALESCE(blk_read_time + blk_write_time, 0) as io_time" in columns
+        assert "wal_bytes" in columns and "0 as wal_bytes" not in columns
+        assert modern.has_toplevel
+
+        legacy = ServerProfile(110000, '1.6', ['queryid', 'query', 'calls', 'total_time',
+                                               'mean_time', 'rows'], [])
+        columns = legacy.metric_columns()
+        assert "total_time, mean_time" in columns
+        assert "0 as io_time" in columns
+        assert "0 as wal_bytes" in columns
+        assert not legacy.has_toplevel
+
+    def test_ranking_query_is_built_once(self):
+        """Test that statements are compiled once per sort column."""
+        profile = ServerProfile(160000, '1.10', PG16_COLUMNS, ['pg_catalog'])
+        first = profile.ranking_query('total_time', with_text=False)
+        assert first is profile.ranking_query('total_time', with_text=False)
+        assert "showtext := false" in first
+        assert "ORDER BY calls DESC" in profile.ranking_query('calls')
+
+        with pytest.raises(ValueError):
+            profile.ranking_query('total_time; DROP TABLE users')
+
+    def test_text_filters_apply_to_fetched_rows(self):
+        """Test that text filters sit outside the fenced join."""
+        profile = ServerProfile(160000, '1.10', PG16_COLUMNS, ['pg_catalog'])
+        query = profile.text_query()
+        fence = query.index("OFFSET 0")
+        assert query.index("JOIN pg_stat_statements(showtext := true)") < fence
+        assert fence < query.index("!~*")
+        assert query.count("%s") == 4
+        assert "!~*" not in profile.text_query(filtered=False)
+
+    def test_probe_reports_missing_extension(self):
+        """Test that a server without pg_stat_statements yields no profile."""
+        cursor = MagicMock()
+        cursor.fetchone.return_value = (160000, None)
+        profile, msg = probe_server(cursor)
+        assert profile is None
+        assert "not installed" in msg
+
+
+class TestServerProfileCache:
+    """Test cases for sharing profiles between analyses."""
+
+    def test_server_is_probed_once(self):
+        """Test that a second analyzer for the same target skips the probe."""
+        profiles = ServerProfileCache()
+        params = {"host": "localhost", "port": 5432, "database": "testdb", "user": "postgres"}
+
+        first = PostgresQueryLineage(params, server_profiles=profiles)
+        first.cursor = MagicMock()
+        first.cursor.fetchone.return_value = (160000, '1.10')
+        first.cursor.description = [(name,) for name in PG16_COLUMNS]
+        first.cursor.fetchall.return_value = [('pg_catalog',)]
+        assert first.load_server_profile()[0] is True
+        assert len(profiles) == 1
+
+        second = PostgresQueryLineage(dict(params), server_profiles=profiles)
+        second.cursor = MagicMock()
+        assert second.load_server_profile()[0] is True
+        second.cursor.execute.assert_not_called()
+        assert second.server_profile.server_version == 160000
+
+    def test_stale_profile_is_probed_again(self):
+        """Test that a missing column drops the cached profile and retries once."""
+        profiles = ServerProfileCache()
+        params = {"host": "localhost", "port": 5432, "database": "testdb", "user": "postgres"}
+        stale = ServerProfile(130000, '1.8', PG16_COLUMNS, [])
+        profiles.put(params, stale)
+
+        lineage = PostgresQueryLineage(params, server_profiles=profiles)
+        lineage.cursor = MagicMock()
+        lineage.server_profile = stale
+        fetched = pd.DataFrame({'queryid': [1], 'query': ['SELECT 1']})
+        failure = errors.UndefinedColumn('column "blk_read_time" does not exist')
+        with patch.object(lineage, '_fetch_expensive_queries', side_effect=[failure, fetched]) as fetch:
+            assert lineage.get_expensive_queries() is fetched
+        assert fetch.call_count == 2
+        assert lineage.server_profile is None
+        assert profiles.get(params) is None
+
+        # A second failure gives up
+        with patch.object(lineage, '_fetch_expensive_queries', side_effect=failure) as fetch:
+            assert lineage.get_expensive_queries().empty
+        assert fetch.call_count == 2
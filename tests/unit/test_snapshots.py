@@ -0,0 +1,114 @@
+"""
+Unit tests for workload snapshots and interval deltas.
+"""
+import time
+
+import pandas as pd
+from unittest.mock import MagicMock
+
+from app.analyzer import PostgresQueryLineage
+from app.snapshots import COUNTER_COLUMNS, SNAPSHOT_KEY, SnapshotStore, WorkloadSnapshot, compute_delta
+
+
+def make_snapshot(taken_at, entries, stats_reset=None):
+    """Build a snapshot from (queryid, calls, total_time) tuples."""
+    rows = []
+    for queryid, calls, total_time in entries:
+        row = dict.fromkeys(COUNTER_COLUMNS, 0)
+        row.update(userid=10, dbid=1, queryid=queryid, toplevel=True,
+                   calls=calls, total_time=total_time, rows=calls)
+        rows.append(row)
+    stats = pd.DataFrame(rows, columns=SNAPSHOT_KEY + COUNTER_COLUMNS)
+    return WorkloadSnapshot(taken_at, stats, stats_reset)
+
+
+class TestComputeDelta:
+    """Test cases for differencing two snapshots."""
+
+    def test_counters_are_differenced(self):
+        """Test per-interval deltas, new entries and idle entries."""
+        older = make_snapshot(1000, [(1, 100, 500.0), (2, 10, 50.0)])
+        newer = make_snapshot(2000, [(1, 150, 800.0), (2, 10, 50.0), (3, 5, 20.0)])
+
+        delta = compute_delta(older, newer).set_index('queryid')
+        assert list(delta.index) == [1, 3]  # Query 2 had no calls in the interval
+        assert delta.loc[1, 'calls'] == 50
+        assert delta.loc[1, 'total_time'] == 300.0
+        assert delta.loc[1, 'mean_time'] == 6.0
+        assert delta.loc[3, 'calls'] == 5
+
+    def test_deallocated_entry_restarts(self):
+        """Test that an entry whose counters went backwards counts from zero."""
+        older = make_snapshot(1000, [(1, 100, 500.0)])
+        newer = make_snapshot(2000, [(1, 7, 14.0)])
+        delta = compute_delta(older, newer)
+        assert delta.loc[0, 'calls'] == 7
+        assert delta.loc[0, 'total_time'] == 14.0
+
+    def test_reset_uses_newer_counters(self):
+        """Test that a pg_stat_statements reset invalidates the baseline."""
+        older = make_snapshot(1000, [(1, 100, 500.0)], stats_reset=10.0)
+        newer = make_snapshot(2000, [(1, 120, 600.0)], stats_reset=1500.0)
+        assert compute_delta(older, newer).loc[0, 'calls'] == 120
+
+
+class TestSnapshotStore:
+    """Test cases for the SQLite snapshot store."""
+
+    def test_save_load_and_baseline(self, tmp_path):
+        """Test round-tripping snapshots and choosing a window baseline."""
+        store = SnapshotStore(str(tmp_path / "workload.sqlite3"))
+        for taken_at in (1000, 2000, 3000):
+            store.save("u@h:5432/db", make_snapshot(taken_at, [(1, taken_at // 10, 1.0)]))
+        store.save("u@other:5432/db", make_snapshot(2500, [(9, 1, 1.0)]))
+
+        baseline = store.baseline("u@h:5432/db", start=2500)
+        assert baseline.taken_at == 2000
+        assert baseline.stats.loc[0, 'calls'] == 200
+        assert bool(baseline.stats.loc[0, 'toplevel']) is True
+
+        # Every snapshot is younger than the window, so the oldest is used
+        assert store.baseline("u@h:5432/db", start=500).taken_at == 1000
+        assert store.baseline("u@none:5432/db", start=500) is None
+
+        assert store.prune("u@h:5432/db", keep_seconds=1500, now=3000) == 1
+        assert [taken_at for _, taken_at in store.list("u@h:5432/db")] == [2000, 3000]
+
+
+class TestWindowedAnalysis:
+    """Test cases for ranking queries over a snapshot window."""
+
+    def test_ranks_by_interval_workload(self, tmp_path):
+        """Test that the ranking follows the window, not the cumulative counters."""
+        params = {"host": "h", "port": 5432, "database": "db", "user": "u"}
+        store = SnapshotStore(str(tmp_path / "workload.sqlite3"))
+        # Query 1 dominated before the window, query 2 dominates inside it
+        started = time.time() - 7200
+        store.save("u@h:5432/db", make_snapshot(started, [(1, 1000, 90000.0), (2, 10, 100.0)]))
+        # Past the retention
+        store.save("u@h:5432/db", make_snapshot(0, [(1, 1, 1.0)]))
+
+        analyzer = PostgresQueryLineage(params, snapshot_store=store)
+        analyzer.conn = MagicMock(closed=False)
+        cursor = analyzer.cursor = MagicMock()
+        analyzer.server_profile = MagicMock(
+            has_stats_info=False, system_schema_pattern='(pg_catalog)\\.',
+            snapshot_query=MagicMock(return_value="SNAPSHOT"),
+            text_query=MagicMock(return_value="TEXTS"))
+        current = make_snapshot(0, [(1, 1010, 90010.0), (2, 60, 5100.0)]).stats
+        cursor.description = [(name,) for name in current.columns]
+        cursor.fetchall.side_effect = [
+            [],  # User tables
+            list(current.itertuples(index=False, name=None)),  # Snapshot
+            [(10, 1, 1, 'SELECT * FROM users'), (10, 1, 2, 'SELECT * FROM orders')],  # Texts
+        ]
+
+        result = analyzer.get_expensive_queries(limit=5, min_calls=5, window_seconds=3600)
+
+        assert list(result['queryid']) == [2, 1]
+        assert result.loc[0, 'calls'] == 50
+        assert result.loc[0, 'total_time'] == 5000.0
+        assert analyzer.workload_window['requested_seconds'] == 3600
+        # The new snapshot is stored and the expired one pruned
+        taken = [taken_at for _, taken_at in store.list("u@h:5432/db")]
+        assert len(taken) == 2 and taken[0] == started
@@ -0,0 +1,69 @@
+"""
+Unit tests for paged result tables.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.table_pages import TableView
+
+
+@pytest.fixture
+def view():
+    df = pd.DataFrame({
+        'queryid': [11, 12, 13, 14, 15],
+        'query': ['SELECT * FROM users', 'UPDATE orders SET x = 1', 'select id from Users',
+                  'DELETE FROM logs', None],
+        'total_time': [5.0, 50.0, np.nan, 20.0, 1.0],
+        'columns': [[{'name': 'id'}], [], [], [], []]
+    })
+    return TableView(df, ['query', 'queryid'])
+
+
+class TestTableView:
+    """Test cases for TableView."""
+
+    def test_pages_in_table_order(self, view):
+        page = view.page(offset=0, limit=2)
+
+        assert page['total'] == 5
+        assert page['filtered'] == 5
+        assert page['next_offset'] == 2
+        assert [row['_index'] for row in page['rows']] == [0, 1]
+        assert page['rows'][0]['columns'] == [{'name': 'id'}]
+
+        last = view.page(offset=4, limit=2)
+        assert [row['_index'] for row in last['rows']] == [4]
+        assert last['next_offset'] is None
+        assert last['rows'][0]['query'] is None
+
+    def test_sort_keeps_missing_values_last(self, view):
+        desc = view.page(sort='total_time', order='desc')
+        asc = view.page(sort='total_time', order='asc')
+
+        assert [row['queryid'] for row in desc['rows']] == [12, 14, 11, 15, 13]
+        assert [row['queryid'] for row in asc['rows']] == [15, 11, 14, 12, 13]
+        assert desc['rows'][-1]['total_time'] is None
+
+    def test_filter_is_case_insensitive_and_pages_sorted_rows(self, view):
+        page = view.page(sort='total_time', order='asc', q='USERS', limit=1)
+
+        assert page['filtered'] == 2
+        assert page['rows'][0]['queryid'] == 11
+        assert page['next_offset'] == 1
+        assert view.page(q='14')['rows'][0]['query'] == 'DELETE FROM logs'
+
+    def test_columns_and_truncate(self, view):
+        page = view.page(limit=1, columns=['query'], truncate=6)
+
+        assert page['rows'] == [{'query': 'SELECT', '_index': 0}]
+
+    def test_invalid_requests(self, view):
+        with pytest.raises(ValueError):
+            view.page(sort='columns')
+        with pytest.raises(ValueError):
+            view.page(sort='missing')
+        with pytest.raises(ValueError):
+            view.page(order='sideways')
+        with pytest.raises(ValueError):
+            view.page(columns=['missing'])